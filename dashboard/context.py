@@ -1,58 +1,118 @@
 """Dashboard context: phase-gated navigation state computed from backend."""
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
 from fiscal.models import FiscalDevice, Receipt
+from fiscal.services.cache_utils import bump_generation_on_commit, get_generation, get_or_compute
 
+CONTEXT_CACHE_NAMESPACE = "context"
+_REQUEST_ATTR = "_fdms_context_snapshot"
 
-def get_offline_status() -> dict:
-    """Offline mode status: is_offline, queue_size, last_submission_at."""
-    device = FiscalDevice.objects.filter(is_registered=True).first()
-    if not device:
-        return {"is_offline": False, "queue_size": 0, "last_submission_at": None, "device": None}
 
+def _build_snapshot() -> dict:
+    """
+    Everything the global context processors need, in at most three queries:
+    registered devices, (Receipt.exists only when there are none), and queue stats.
+    """
+    devices = list(
+        FiscalDevice.objects.filter(is_registered=True).defer("private_key_pem").order_by("device_id")
+    )
+    primary = min(devices, key=lambda d: d.pk) if devices else None
+    snapshot = {
+        "devices": devices,
+        "primary_device": primary,
+        "has_activity": bool(devices) or Receipt.objects.exists(),
+        "queue_size": 0,
+        "last_submission_at": None,
+    }
+    if primary is None:
+        return snapshot
     try:
-        from offline.services.offline_detector import OfflineDetector
-        from offline.services.queue_manager import QueueManager
         from offline.models import OfflineReceiptQueue
 
-        is_offline, _ = OfflineDetector.is_offline(device)
-        queue_size = QueueManager.queue_size(device=device)
-        last_sub = (
-            OfflineReceiptQueue.objects.filter(receipt__device=device, state="SUBMITTED")
-            .order_by("-updated_at")
-            .values_list("updated_at", flat=True)
-            .first()
+        stats = OfflineReceiptQueue.objects.filter(receipt__device=primary).aggregate(
+            queued=Count("pk", filter=Q(state="QUEUED")),
+            last_sub=Max("updated_at", filter=Q(state="SUBMITTED")),
         )
-        return {
-            "is_offline": is_offline,
-            "queue_size": queue_size,
-            "last_submission_at": last_sub,
-            "device": device,
-        }
+        snapshot["queue_size"] = stats["queued"] or 0
+        snapshot["last_submission_at"] = stats["last_sub"]
+    except Exception:
+        pass
+    return snapshot
+
+
+def get_context_snapshot(request=None) -> dict:
+    """
+    Shared device/queue snapshot for templates. Memoised on the request, and cached
+    across requests for FDMS_CONTEXT_CACHE_TTL seconds; invalidated when a FiscalDevice
+    or OfflineReceiptQueue row commits (see dashboard.signals).
+    """
+    if request is not None:
+        snapshot = getattr(request, _REQUEST_ATTR, None)
+        if snapshot is not None:
+            return snapshot
+    key = "fdms:ctx:%s" % get_generation(CONTEXT_CACHE_NAMESPACE)
+    snapshot = get_or_compute(key, _build_snapshot, ttl=getattr(settings, "FDMS_CONTEXT_CACHE_TTL", 15))
+    if request is not None:
+        setattr(request, _REQUEST_ATTR, snapshot)
+    return snapshot
+
+
+def invalidate_context_cache() -> None:
+    bump_generation_on_commit(CONTEXT_CACHE_NAMESPACE)
+
+
+def _is_offline_cached(device) -> bool:
+    """OfflineDetector.is_offline is a live GetStatus call; reuse its result for a short TTL."""
+    key = "fdms:offline:%s" % device.device_id
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    from offline.services.offline_detector import OfflineDetector
+
+    is_offline, _ = OfflineDetector.is_offline(device)
+    cache.set(key, is_offline, timeout=getattr(settings, "FDMS_OFFLINE_CHECK_TTL", 60))
+    return is_offline
+
+
+def get_offline_status(request=None) -> dict:
+    """Offline mode status: is_offline, queue_size, last_submission_at."""
+    snapshot = get_context_snapshot(request)
+    device = snapshot["primary_device"]
+    if not device:
+        return {"is_offline": False, "queue_size": 0, "last_submission_at": None, "device": None}
+
+    try:
+        is_offline = _is_offline_cached(device)
     except Exception:
         return {"is_offline": False, "queue_size": 0, "last_submission_at": None, "device": device}
+    return {
+        "is_offline": is_offline,
+        "queue_size": snapshot["queue_size"],
+        "last_submission_at": snapshot["last_submission_at"],
+        "device": device,
+    }
 
 
-def get_navigation_state() -> dict:
+def get_navigation_state(request=None) -> dict:
     """
     Compute phase-gated sidebar state from backend device state.
     Returns dict with menu item enabled flags and device info.
     """
-    device = FiscalDevice.objects.filter(is_registered=True).first()
+    snapshot = get_context_snapshot(request)
+    device = snapshot["primary_device"]
     has_device = device is not None and device.is_registered
 
     fiscal_day_open = False
     if device and device.fiscal_day_status:
         fiscal_day_open = device.fiscal_day_status == "FiscalDayOpened"
 
-    has_activity = (
-        Receipt.objects.exists() or
-        FiscalDevice.objects.filter(is_registered=True).exists()
-    )
-
     return {
         "has_device": has_device,
         "fiscal_day_open": fiscal_day_open,
-        "has_activity": has_activity,
+        "has_activity": snapshot["has_activity"],
         "device": device,
         "device_id": device.device_id if device else None,
         "certificate_status": "Stored" if (device and device.certificate_pem) else "None",
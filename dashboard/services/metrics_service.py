@@ -7,10 +7,11 @@ from datetime import timedelta
 from decimal import Decimal
 from collections import defaultdict
 
-from django.db.models import Sum, Count, Q
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from fiscal.models import FDMSApiLog, FiscalDevice, Receipt
+from fiscal.models import FDMSApiLog, FiscalDevice, Receipt, ReceiptTaxLine
 
 
 def get_metrics(device_id: int | None = None) -> dict:
@@ -69,16 +70,34 @@ def get_metrics(device_id: int | None = None) -> dict:
         avg_latency_ms = 0
 
     sales_by_currency = defaultdict(Decimal)
+    sales_rows = (
+        fiscalised_today.exclude(receipt_total__isnull=True)
+        .values("currency")
+        .annotate(total=Sum("receipt_total"))
+        .order_by()
+    )
+    for row in sales_rows:
+        sales_by_currency[row["currency"] or "USD"] += row["total"] or Decimal("0")
+
+    # Band amount is taxAmount, falling back to salesAmountWithTax for zero-tax bands.
     tax_breakdown = defaultdict(Decimal)
-    for r in fiscalised_today:
-        curr = r.currency or "USD"
-        if r.receipt_total:
-            sales_by_currency[curr] += r.receipt_total
-        for t in r.receipt_taxes or []:
-            pct = t.get("taxPercent") or t.get("fiscalCounterTaxPercent") or 0
-            amt = t.get("taxAmount") or t.get("salesAmountWithTax") or t.get("fiscalCounterValue") or 0
-            key = f"{pct}%"
-            tax_breakdown[key] = tax_breakdown.get(key, Decimal("0")) + Decimal(str(amt))
+    band_rows = (
+        ReceiptTaxLine.objects.filter(receipt__in=fiscalised_today)
+        .annotate(pct=Coalesce("tax_percent", Value(Decimal("0"))))
+        .values("pct")
+        .annotate(
+            cents=Sum(
+                Case(
+                    When(tax_amount_cents=0, then=F("sales_amount_with_tax_cents")),
+                    default=F("tax_amount_cents"),
+                )
+            )
+        )
+        .order_by()
+    )
+    for row in band_rows:
+        key = f"{float(row['pct']):g}%"
+        tax_breakdown[key] += Decimal(row["cents"] or 0) / 100
 
     queue_depth = 0
     try:
@@ -0,0 +1,29 @@
+"""Invalidate the cached template context snapshot (and fleet queue depth) on device and queue changes."""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from fiscal.models import FiscalDevice
+from offline.models import OfflineReceiptQueue
+
+from .context import invalidate_context_cache
+
+
+@receiver(post_save, sender=FiscalDevice)
+@receiver(post_delete, sender=FiscalDevice)
+@receiver(post_save, sender=OfflineReceiptQueue)
+@receiver(post_delete, sender=OfflineReceiptQueue)
+def invalidate_context_on_change(sender, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_context_cache()
+
+
+@receiver(post_save, sender=OfflineReceiptQueue)
+@receiver(post_delete, sender=OfflineReceiptQueue)
+def invalidate_fleet_queue_depth(sender, raw=False, **kwargs):
+    if raw:
+        return
+    from fiscal.services.dashboard_cache import invalidate_dashboard_cache
+
+    invalidate_dashboard_cache()
@@ -9,6 +9,6 @@ from .context import get_navigation_state
 @staff_member_required
 def home(request):
     """Dashboard home. Main content area."""
-    ctx = get_navigation_state()
+    ctx = get_navigation_state(request)
     ctx["page_title"] = "Operator Dashboard"
     return render(request, "dashboard/home.html", ctx)
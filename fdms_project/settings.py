@@ -90,6 +90,115 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true"
+CELERY_BEAT_SCHEDULE = {
+    "resume-close-day-trackers": {
+        "task": "fiscal.resume_close_day_trackers_task",
+        "schedule": 120.0,
+    },
+    "refresh-fdms-configs": {
+        "task": "fiscal.refresh_configs_task",
+        "schedule": 600.0,
+    },
+    "qb-sync": {
+        "task": "fiscal.qb_sync_task",
+        "schedule": 300.0,
+    },
+    "apply-retention": {
+        "task": "fiscal.apply_retention_task",
+        "schedule": 86400.0,
+    },
+}
+
+# CloseDay completion tracking: GetStatus re-checks are Celery countdowns backing off from
+# INITIAL to MAX seconds (x FACTOR per check) until closed/failed or TIMEOUT seconds pass.
+FDMS_CLOSE_DAY_POLL_INITIAL = int(os.environ.get("FDMS_CLOSE_DAY_POLL_INITIAL", "5"))
+FDMS_CLOSE_DAY_POLL_MAX = int(os.environ.get("FDMS_CLOSE_DAY_POLL_MAX", "60"))
+FDMS_CLOSE_DAY_POLL_FACTOR = float(os.environ.get("FDMS_CLOSE_DAY_POLL_FACTOR", "1.5"))
+FDMS_CLOSE_DAY_POLL_TIMEOUT = int(os.environ.get("FDMS_CLOSE_DAY_POLL_TIMEOUT", "900"))
+
+# Fleet end-of-day runs (close_fleet_day / fiscal.fleet_close_day_task): devices closed at
+# once, close retries (RETRY_DELAY x attempt seconds apart), and when an active device is
+# reported as a straggler on the dashboard.
+FDMS_FLEET_CLOSE_CONCURRENCY = int(os.environ.get("FDMS_FLEET_CLOSE_CONCURRENCY", "10"))
+FDMS_FLEET_CLOSE_MAX_RETRIES = int(os.environ.get("FDMS_FLEET_CLOSE_MAX_RETRIES", "2"))
+FDMS_FLEET_CLOSE_RETRY_DELAY = int(os.environ.get("FDMS_FLEET_CLOSE_RETRY_DELAY", "60"))
+FDMS_FLEET_CLOSE_STRAGGLER_SECONDS = int(os.environ.get("FDMS_FLEET_CLOSE_STRAGGLER_SECONDS", "600"))
+
+# Scheduled GetConfig refresh (fiscal.refresh_configs_task): devices are refreshed once
+# configs are AGE seconds old (submissions block at 24h), CONCURRENCY per wave, waves
+# SPACING seconds apart (>= the 30s GetConfig timeout keeps at most CONCURRENCY calls in
+# flight) plus up to JITTER seconds. Failures retry after RETRY_DELAY doubling up to
+# RETRY_MAX seconds and alert after ALERT_AFTER consecutive failures.
+FDMS_CONFIG_REFRESH_AGE = int(os.environ.get("FDMS_CONFIG_REFRESH_AGE", "43200"))
+FDMS_CONFIG_REFRESH_CONCURRENCY = int(os.environ.get("FDMS_CONFIG_REFRESH_CONCURRENCY", "5"))
+FDMS_CONFIG_REFRESH_SPACING = int(os.environ.get("FDMS_CONFIG_REFRESH_SPACING", "30"))
+FDMS_CONFIG_REFRESH_JITTER = int(os.environ.get("FDMS_CONFIG_REFRESH_JITTER", "20"))
+FDMS_CONFIG_REFRESH_RETRY_DELAY = int(os.environ.get("FDMS_CONFIG_REFRESH_RETRY_DELAY", "300"))
+FDMS_CONFIG_REFRESH_RETRY_MAX = int(os.environ.get("FDMS_CONFIG_REFRESH_RETRY_MAX", "3600"))
+FDMS_CONFIG_REFRESH_ALERT_AFTER = int(os.environ.get("FDMS_CONFIG_REFRESH_ALERT_AFTER", "3"))
+
+# QuickBooks incremental sync (qb_sync): rows per QB query (max 1000), pages per entity
+# per run, re-read window before the stored cursor, how far back the first run starts, and
+# how many failed/unclaimed snapshots each run retries before fetching.
+FDMS_QB_SYNC_PAGE_SIZE = int(os.environ.get("FDMS_QB_SYNC_PAGE_SIZE", "100"))
+FDMS_QB_SYNC_MAX_PAGES = int(os.environ.get("FDMS_QB_SYNC_MAX_PAGES", "50"))
+FDMS_QB_SYNC_OVERLAP_SECONDS = int(os.environ.get("FDMS_QB_SYNC_OVERLAP_SECONDS", "300"))
+FDMS_QB_SYNC_INITIAL_LOOKBACK_DAYS = int(os.environ.get("FDMS_QB_SYNC_INITIAL_LOOKBACK_DAYS", "7"))
+FDMS_QB_SYNC_RETRY_LIMIT = int(os.environ.get("FDMS_QB_SYNC_RETRY_LIMIT", "100"))
+
+# QuickBooks webhook fiscalisation (fiscal.fiscalise_qb_invoice_task): repeat webhooks for
+# an invoice within DEDUPE seconds are not re-queued; a PROCESSING claim older than STALE
+# seconds (crashed worker) may be taken over.
+FDMS_QB_FISCALISE_DEDUPE_SECONDS = int(os.environ.get("FDMS_QB_FISCALISE_DEDUPE_SECONDS", "300"))
+FDMS_QB_FISCALISE_STALE_SECONDS = int(os.environ.get("FDMS_QB_FISCALISE_STALE_SECONDS", "600"))
+# Ids per `Id IN (...)` query when fetching the entities of a webhook notification.
+FDMS_QB_WEBHOOK_FETCH_BATCH = int(os.environ.get("FDMS_QB_WEBHOOK_FETCH_BATCH", "50"))
+
+# QuickBooks OAuth tokens: refresh this many seconds before expiry; one refresh per realm
+# at a time under a row lock on its QuickBooksConnection (SQLite: a cache lock when
+# CACHE_REDIS_URL is set, else the database write lock).
+FDMS_QB_TOKEN_REFRESH_MARGIN = int(os.environ.get("FDMS_QB_TOKEN_REFRESH_MARGIN", "300"))
+
+# QuickBooks API throttling per realm, shared by all processes (fiscal.services.qb_rate_limit).
+# Intuit allows about 500 requests/minute and 10 concurrent requests per realm. Throttled
+# (429/503) requests pause the realm for Retry-After seconds, or back off exponentially
+# from FDMS_QB_BACKOFF_BASE up to FDMS_QB_BACKOFF_MAX, and are retried FDMS_QB_MAX_RETRIES times.
+FDMS_QB_RATE_PER_MINUTE = int(os.environ.get("FDMS_QB_RATE_PER_MINUTE", "450"))
+FDMS_QB_RATE_WINDOW_SECONDS = int(os.environ.get("FDMS_QB_RATE_WINDOW_SECONDS", "10"))
+FDMS_QB_MAX_CONCURRENCY = int(os.environ.get("FDMS_QB_MAX_CONCURRENCY", "4"))
+FDMS_QB_MAX_RETRIES = int(os.environ.get("FDMS_QB_MAX_RETRIES", "5"))
+FDMS_QB_BACKOFF_BASE = float(os.environ.get("FDMS_QB_BACKOFF_BASE", "1.0"))
+FDMS_QB_BACKOFF_MAX = int(os.environ.get("FDMS_QB_BACKOFF_MAX", "60"))
+FDMS_QB_ACQUIRE_TIMEOUT = int(os.environ.get("FDMS_QB_ACQUIRE_TIMEOUT", "120"))
+# Where the limits are kept: "redis" (shared by every process) or "cache" (Django's cache,
+# only shared when CACHE_REDIS_URL is set).
+FDMS_QB_RATE_LIMIT_BACKEND = os.environ.get("FDMS_QB_RATE_LIMIT_BACKEND", "redis")
+FDMS_QB_RATE_LIMIT_REDIS_URL = os.environ.get(
+    "FDMS_QB_RATE_LIMIT_REDIS_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+)
+
+# Retention of event/log tables (fiscal.services.retention; daily apply-retention beat and
+# `manage.py apply_retention`): rows older than the given days are exported to
+# FDMS_RETENTION_ARCHIVE_DIR as NDJSON.gz with a sha256, rolled up into daily summaries
+# and deleted FDMS_RETENTION_BATCH_SIZE rows per transaction, at most MAX_BATCHES per
+# table per run. 0 days keeps a table forever. The latest ReceiptSubmissionResponse of a
+# receipt is kept while it holds validation errors (they are shown on the invoice).
+FDMS_RETENTION_DAYS = {
+    "QuickBooksEvent": int(os.environ.get("FDMS_RETENTION_QB_EVENT_DAYS", "90")),
+    "ActivityEvent": int(os.environ.get("FDMS_RETENTION_ACTIVITY_EVENT_DAYS", "90")),
+    "AuditEvent": int(os.environ.get("FDMS_RETENTION_AUDIT_EVENT_DAYS", "2555")),
+    "ReceiptSubmissionResponse": int(os.environ.get("FDMS_RETENTION_SUBMISSION_RESPONSE_DAYS", "365")),
+    "FDMSApiLog": int(os.environ.get("FDMS_RETENTION_API_LOG_DAYS", "90")),
+}
+FDMS_RETENTION_ARCHIVE = os.environ.get("FDMS_RETENTION_ARCHIVE", "1") == "1"
+FDMS_RETENTION_ARCHIVE_DIR = os.environ.get("FDMS_RETENTION_ARCHIVE_DIR", str(BASE_DIR / "archives"))
+FDMS_RETENTION_BATCH_SIZE = int(os.environ.get("FDMS_RETENTION_BATCH_SIZE", "500"))
+FDMS_RETENTION_MAX_BATCHES = int(os.environ.get("FDMS_RETENTION_MAX_BATCHES", "200"))
+
+# Integrity audit: receipts fetched per cursor round-trip, and findings kept in memory per
+# category (the rest are only counted; audit_fiscal_integrity --report writes all of them).
+FDMS_AUDIT_FETCH_CHUNK = int(os.environ.get("FDMS_AUDIT_FETCH_CHUNK", "2000"))
+FDMS_AUDIT_MAX_FINDINGS = int(os.environ.get("FDMS_AUDIT_MAX_FINDINGS", "1000"))
 
 # Channels (WebSocket) - use InMemoryChannelLayer when Redis not configured
 _REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
@@ -101,6 +210,46 @@ CHANNEL_LAYERS = {
 }
 
 
+# Cache - shared Redis cache when configured (needed for cross-worker dashboard caching);
+# falls back to Django's per-process LocMemCache.
+_CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+if _CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": _CACHE_REDIS_URL,
+        }
+    }
+
+# Dashboard API response cache TTL (seconds). Entries are also invalidated on Receipt,
+# FiscalDevice and FDMSApiLog commits, so the TTL only bounds time-relative drift.
+FDMS_DASHBOARD_CACHE_TTL = int(os.environ.get("FDMS_DASHBOARD_CACHE_TTL", "30"))
+
+# In-process FDMS config / TaxMapping snapshot reuse (seconds). Snapshots are also
+# invalidated on FDMSConfigs / TaxMapping commits through the shared cache generation.
+FDMS_CONFIG_CACHE_TTL = int(os.environ.get("FDMS_CONFIG_CACHE_TTL", "300"))
+
+# Global template context (device list, nav state, offline queue) cache TTL (seconds);
+# invalidated on FiscalDevice / OfflineReceiptQueue commits. The offline check is a live
+# GetStatus call, cached separately.
+FDMS_CONTEXT_CACHE_TTL = int(os.environ.get("FDMS_CONTEXT_CACHE_TTL", "15"))
+FDMS_OFFLINE_CHECK_TTL = int(os.environ.get("FDMS_OFFLINE_CHECK_TTL", "60"))
+
+
+# WebSocket event emitter: events are queued in-process and sent by a background thread
+# in per-group batches. Intermediate receipt.progress frames are coalesced/dropped when full.
+FDMS_EVENT_EMITTER_ASYNC = os.environ.get("FDMS_EVENT_EMITTER_ASYNC", "true").lower() == "true"
+FDMS_EVENT_QUEUE_SIZE = int(os.environ.get("FDMS_EVENT_QUEUE_SIZE", "1000"))
+FDMS_EVENT_FLUSH_INTERVAL = float(os.environ.get("FDMS_EVENT_FLUSH_INTERVAL", "0.05"))
+
+# Resumable WebSocket streams: per-group sequence numbers and a replay buffer of the last
+# FDMS_EVENT_REPLAY_SIZE events. "redis" shares them across workers; "memory" is per-process.
+FDMS_EVENT_STREAM_BACKEND = os.environ.get("FDMS_EVENT_STREAM_BACKEND", "redis")
+FDMS_EVENT_STREAM_REDIS_URL = os.environ.get("FDMS_EVENT_STREAM_REDIS_URL", _REDIS_URL)
+FDMS_EVENT_REPLAY_SIZE = int(os.environ.get("FDMS_EVENT_REPLAY_SIZE", "500"))
+FDMS_EVENT_REPLAY_TTL = int(os.environ.get("FDMS_EVENT_REPLAY_TTL", "86400"))
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
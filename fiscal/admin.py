@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.contrib import admin
 
-from .models import Company, CreditNoteImport, Customer, FDMSApiLog, FDMSConfigs, FiscalDay, FiscalDevice, FiscalEditAttempt, InvoiceImport, Product, QuickBooksConnection, QuickBooksEvent, QuickBooksInvoice, Receipt, TaxMapping
+from .models import AuditCheckpoint, CloseDayTracker, Company, ConfigRefreshState, CreditNoteImport, Customer, FDMSApiLog, FDMSConfigs, FiscalDay, FiscalDevice, FiscalEditAttempt, FleetCloseItem, FleetCloseRun, InvoiceImport, Product, QuickBooksConnection, QuickBooksEvent, QuickBooksInvoice, Receipt, RetentionArchive, RetentionDailySummary, TaxMapping
 
 
 @admin.register(Company)
@@ -53,6 +53,68 @@ class FiscalDeviceAdmin(admin.ModelAdmin):
 class FiscalDayAdmin(admin.ModelAdmin):
     list_display = ("device", "fiscal_day_no", "status", "opened_at", "closed_at")
     list_filter = ("status",)
+    readonly_fields = (
+        "merkle_root",
+        "merkle_leaf_count",
+        "merkle_computed_at",
+        "close_receipt_counter",
+        "close_counters",
+        "close_canonical",
+        "close_hash",
+        "close_signature",
+        "close_operation_id",
+        "close_submitted_at",
+    )
+
+
+@admin.register(AuditCheckpoint)
+class AuditCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("device", "fiscal_day_no", "receipt_counter", "receipt_global_no", "receipts_verified", "verified_at")
+    readonly_fields = ("verified_at",)
+
+
+@admin.register(ConfigRefreshState)
+class ConfigRefreshStateAdmin(admin.ModelAdmin):
+    list_display = ("device", "consecutive_failures", "last_success_at", "last_attempt_at", "next_attempt_at", "alerted_at")
+    list_filter = ("alerted_at",)
+    readonly_fields = ("updated_at",)
+
+
+@admin.register(RetentionDailySummary)
+class RetentionDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ("table", "day", "device", "key", "count", "first_at", "last_at")
+    list_filter = ("table",)
+    search_fields = ("key",)
+    date_hierarchy = "day"
+
+
+@admin.register(RetentionArchive)
+class RetentionArchiveAdmin(admin.ModelAdmin):
+    list_display = ("table", "first_id", "last_id", "row_count", "size_bytes", "oldest_at", "newest_at", "created_at")
+    list_filter = ("table",)
+    readonly_fields = ("path", "sha256", "created_at")
+
+
+@admin.register(CloseDayTracker)
+class CloseDayTrackerAdmin(admin.ModelAdmin):
+    list_display = ("device", "fiscal_day_no", "state", "attempts", "last_status", "next_check_at", "finished_at")
+    list_filter = ("state",)
+    readonly_fields = ("started_at", "updated_at")
+
+
+class FleetCloseItemInline(admin.TabularInline):
+    model = FleetCloseItem
+    extra = 0
+    fields = ("device", "state", "close_attempts", "closed_fiscal_day_no", "opened_fiscal_day_no", "last_error")
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(FleetCloseRun)
+class FleetCloseRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "concurrency", "reopen", "started_at", "finished_at")
+    list_filter = ("status",)
+    inlines = [FleetCloseItemInline]
 
 
 class ReceiptAdjustmentInline(admin.TabularInline):
@@ -162,8 +224,8 @@ class QuickBooksEventAdmin(admin.ModelAdmin):
 
 @admin.register(QuickBooksInvoice)
 class QuickBooksInvoiceAdmin(admin.ModelAdmin):
-    list_display = ("id", "qb_invoice_id", "fiscalised", "fiscal_receipt", "fiscal_error", "created_at")
-    list_filter = ("fiscalised",)
+    list_display = ("id", "qb_invoice_id", "fiscal_status", "fiscalised", "fiscal_receipt", "fiscal_error", "created_at")
+    list_filter = ("fiscal_status", "fiscalised")
     search_fields = ("qb_invoice_id",)
     readonly_fields = ("qb_invoice_id", "qb_customer_id", "currency", "total_amount", "raw_payload", "fiscal_receipt", "fiscal_error", "created_at", "updated_at")
 
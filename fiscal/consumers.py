@@ -1,13 +1,99 @@
 """WebSocket consumers for real-time FDMS updates."""
 
 import logging
+from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from fiscal.services.event_stream import get_event_stream
+
 logger = logging.getLogger("fiscal")
 
 
-class FDMSDeviceConsumer(AsyncJsonWebsocketConsumer):
+class ResumableStreamMixin:
+    """
+    Sequenced group stream. Connect with ?resume_from=<seq> to replay missed events;
+    a stream.reset frame means the cursor is too old and state must be refetched.
+    Without a cursor the client gets stream.hello with the current seq. Live frames are
+    sent in seq order: gaps are filled from the replay buffer (see _fill_gap).
+    """
+
+    last_seq = 0
+
+    def _resume_cursor(self):
+        qs = parse_qs(self.scope.get("query_string", b"").decode())
+        values = qs.get("resume_from")
+        if not values:
+            return None
+        try:
+            return max(0, int(values[0]))
+        except (TypeError, ValueError):
+            return None
+
+    async def start_stream(self):
+        stream = get_event_stream()
+        cursor = self._resume_cursor()
+        try:
+            if cursor is None:
+                self.last_seq = await sync_to_async(stream.current)(self.room_group_name)
+                await self.send_json({"type": "stream.hello", "seq": self.last_seq})
+                return
+            events, ok = await sync_to_async(stream.since)(self.room_group_name, cursor)
+        except Exception as e:
+            logger.warning("Event stream unavailable for %s: %s", self.room_group_name, e)
+            return
+        if not ok:
+            self.last_seq = await sync_to_async(stream.current)(self.room_group_name)
+            await self.send_json({"type": "stream.reset", "seq": self.last_seq})
+            return
+        self.last_seq = cursor
+        for data in events:
+            await self.send_event(data)
+
+    async def send_event(self, data):
+        seq = data.get("seq")
+        if seq is None:
+            await self.send_json(data)
+            return
+        if seq <= self.last_seq:
+            return  # already delivered by a replay or gap fill
+        if seq > self.last_seq + 1 and await self._fill_gap(seq):
+            return
+        self.last_seq = seq
+        await self.send_json(data)
+
+    async def _fill_gap(self, seq):
+        """
+        Producers stamp seq and group_send in separate steps, so frames from different
+        processes can arrive out of order. Deliver the missing events from the replay
+        buffer, in order, through `seq`; their live frames are then dropped as delivered.
+        Returns False (after a stream.reset) when the buffer no longer holds them.
+        """
+        try:
+            events, ok = await sync_to_async(get_event_stream().since)(self.room_group_name, self.last_seq)
+        except Exception as e:
+            logger.warning("Event stream unavailable for %s: %s", self.room_group_name, e)
+            events, ok = [], False
+        if not ok or not any(e.get("seq") == seq for e in events):
+            await self.send_json({"type": "stream.reset", "seq": seq - 1})
+            return False
+        for data in events:
+            if data["seq"] > seq:
+                break
+            self.last_seq = data["seq"]
+            await self.send_json(data)
+        return True
+
+    async def fdms_event(self, event):
+        await self.send_event(event.get("data", {}))
+
+    async def fdms_event_batch(self, event):
+        for data in event.get("events", []):
+            await self.send_event(data)
+
+
+class FDMSDeviceConsumer(ResumableStreamMixin, AsyncJsonWebsocketConsumer):
     """Consumes device group fdms_device_<device_id>. Staff only."""
 
     async def connect(self):
@@ -19,6 +105,7 @@ class FDMSDeviceConsumer(AsyncJsonWebsocketConsumer):
             return
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        await self.start_stream()
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
@@ -26,11 +113,8 @@ class FDMSDeviceConsumer(AsyncJsonWebsocketConsumer):
     async def receive_json(self, content):
         pass
 
-    async def fdms_event(self, event):
-        await self.send_json(event.get("data", {}))
-
 
-class FDMSDashboardConsumer(AsyncJsonWebsocketConsumer):
+class FDMSDashboardConsumer(ResumableStreamMixin, AsyncJsonWebsocketConsumer):
     """Consumes fdms_dashboard group for real-time KPI metrics. Staff only."""
 
     async def connect(self):
@@ -41,12 +125,10 @@ class FDMSDashboardConsumer(AsyncJsonWebsocketConsumer):
             return
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        await self.start_stream()
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     async def receive_json(self, content):
         pass
-
-    async def fdms_event(self, event):
-        await self.send_json(event.get("data", {}))
@@ -1,15 +1,22 @@
 """Context processors for fiscal app."""
 
-from fiscal.models import FiscalDevice
-from fiscal.views import SESSION_DEVICE_KEY, get_device_for_request
+from dashboard.context import get_context_snapshot
+from fiscal.views import get_selected_device_id
 
 
 def fdms_device(request):
     """Add FDMS device list and selected device for system-wide device selector."""
     if not request:
         return {}
-    devices = list(FiscalDevice.objects.filter(is_registered=True).order_by("device_id"))
-    device = get_device_for_request(request) if devices else None
+    snapshot = get_context_snapshot(request)
+    devices = snapshot["devices"]
+    device = None
+    if devices:
+        device_id = get_selected_device_id(request)
+        if device_id is None:
+            device = snapshot["primary_device"]
+        else:
+            device = next((d for d in devices if d.device_id == device_id), None)
     return {
         "fdms_devices": devices,
         "fdms_selected_device_id": device.device_id if device else None,
@@ -0,0 +1,79 @@
+"""
+Management command: Apply retention to the event and log tables.
+Archives expired rows to NDJSON.gz, rolls them up into daily summaries and deletes them
+(see fiscal.services.retention). --dry-run only counts; --verify checks stored archives.
+"""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from fiscal.models import RetentionArchive
+from fiscal.services.retention import RETENTION_TABLES, apply_retention, verify_archive
+
+logger = logging.getLogger("fiscal")
+
+
+class Command(BaseCommand):
+    help = "Archive, summarise and delete event/log rows older than FDMS_RETENTION_DAYS, or verify archives."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table",
+            action="append",
+            choices=sorted(RETENTION_TABLES),
+            default=None,
+            help="Limit to this table (repeatable; default: all).",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Batches per table (default: FDMS_RETENTION_MAX_BATCHES).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count expired rows without archiving or deleting.",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Check archive files against their recorded sha256 and row counts.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            self._verify(options["table"])
+            return
+
+        results = apply_retention(tables=options["table"], max_batches=options["max_batches"], dry_run=options["dry_run"])
+        if "error" in results:
+            self.stderr.write(self.style.ERROR(results["error"]))
+            return
+        for table, result in results.items():
+            if result.get("error"):
+                self.stdout.write(self.style.ERROR(f"{table}: {result['error']}"))
+            elif not result["days"]:
+                self.stdout.write(f"{table}: kept forever")
+            elif options["dry_run"]:
+                self.stdout.write(f"{table}: {result['expired']} row(s) older than {result['days']} days")
+            else:
+                more = " (more remaining)" if result["more"] else ""
+                self.stdout.write(self.style.SUCCESS(
+                    f"{table}: {result['deleted']} deleted, {result['archives']} archive(s){more}"
+                ))
+
+    def _verify(self, tables):
+        archives = RetentionArchive.objects.order_by("table", "first_id")
+        if tables:
+            archives = archives.filter(table__in=tables)
+        failed = 0
+        for archive in archives.iterator():
+            ok, err = verify_archive(archive)
+            if not ok:
+                failed += 1
+                self.stdout.write(self.style.ERROR(err))
+        logger.info("Retention archive verification: %s failed", failed)
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"{archives.count()} archive(s) checked, {failed} failed."))
@@ -1,12 +1,14 @@
 """
 Management command: Audit fiscal integrity.
 Recalculates hashes, validates receipt chains, verifies signatures.
+Incremental by default: resumes from each device's AuditCheckpoint; --full re-verifies all.
+--report writes every finding as NDJSON (the console shows at most FDMS_AUDIT_MAX_FINDINGS per category).
 """
 
 from django.core.management.base import BaseCommand
 
 from fiscal.models import FiscalDevice
-from fiscal.services.audit_integrity import run_full_audit
+from fiscal.services.audit_integrity import run_audit
 
 
 class Command(BaseCommand):
@@ -21,6 +23,25 @@ class Command(BaseCommand):
             action="store_true",
             help="Verbose output",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Worker processes for (device, fiscal day) units (default: 1 = in-process). "
+                "Each worker opens its own DB connection; size to the database, not the CPU count."
+            ),
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Re-verify every receipt from genesis instead of resuming from the audit checkpoint.",
+        )
+        parser.add_argument(
+            "--report",
+            metavar="PATH",
+            help="Write all findings (and a summary line) to PATH as NDJSON.",
+        )
 
     def handle(self, *args, **options):
         verbose = options["verbose"]
@@ -30,8 +51,12 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("No registered devices. Nothing to audit."))
             return
 
-        self.stdout.write(f"Auditing {devices} device(s)...")
-        result = run_full_audit()
+        workers = max(1, options["workers"])
+        mode = "full" if options["full"] else "incremental"
+        self.stdout.write(f"Auditing {devices} device(s) ({mode}) with {workers} worker(s)...")
+        result = run_audit(workers=workers, full=options["full"], report_path=options["report"])
+        if options["report"]:
+            self.stdout.write(f"Findings report: {options['report']}")
 
         self.stdout.write(
             f"Checked: {result.devices_checked} devices, "
@@ -64,3 +89,9 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("\nFiscal day counter errors:"))
             for msg in result.fiscal_day_counter_errors:
                 self.stderr.write(f"  - {msg}")
+
+        if result.findings_omitted:
+            self.stdout.write(self.style.WARNING(
+                f"\n{result.findings_omitted} more finding(s) not shown"
+                + (" (see report)." if options["report"] else "; use --report to write all of them.")
+            ))
@@ -0,0 +1,89 @@
+"""
+Management command: Backfill ReceiptTaxLine / ReceiptPaymentLine from Receipt JSON.
+Run once after migration 0030, and any time the normalised lines are suspected stale.
+"""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from fiscal.models import Receipt, ReceiptTaxLine
+from fiscal.services.receipt_lines import bulk_sync_receipt_lines
+
+logger = logging.getLogger("fiscal")
+
+
+class Command(BaseCommand):
+    help = "Populate normalised receipt tax/payment lines from receipt_taxes and receipt_payments JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many receipts would be processed; do not write.",
+        )
+        parser.add_argument(
+            "--device",
+            type=int,
+            default=None,
+            help="Limit to receipts for this FDMS device_id (optional).",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild lines for every receipt, not only receipts without tax lines.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Receipts per write batch (default 500).",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        device_id = options.get("device")
+        batch_size = max(1, options["batch_size"])
+
+        qs = Receipt.objects.order_by("pk")
+        if device_id is not None:
+            qs = qs.filter(device__device_id=device_id)
+        if not options["all"]:
+            qs = qs.exclude(pk__in=ReceiptTaxLine.objects.values("receipt_id"))
+
+        total = qs.count()
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("No receipts need line backfill."))
+            return
+
+        self.stdout.write(f"Found {total} receipt(s) to backfill.")
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: not saving. Run without --dry-run to backfill."))
+            return
+
+        processed = 0
+        tax_lines = 0
+        pay_lines = 0
+        batch = []
+        qs = qs.only("pk", "device_id", "fiscal_day_no", "receipt_type", "currency", "receipt_taxes", "receipt_payments")
+        for receipt in qs.iterator(chunk_size=batch_size):
+            batch.append(receipt)
+            if len(batch) >= batch_size:
+                t, p = bulk_sync_receipt_lines(batch)
+                tax_lines += t
+                pay_lines += p
+                processed += len(batch)
+                batch = []
+                self.stdout.write(f"  {processed}/{total} receipts")
+        if batch:
+            t, p = bulk_sync_receipt_lines(batch)
+            tax_lines += t
+            pay_lines += p
+            processed += len(batch)
+
+        logger.info("Backfill receipt lines: %s receipts, %s tax lines, %s payment lines", processed, tax_lines, pay_lines)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfill complete: {processed} receipts, {tax_lines} tax lines, {pay_lines} payment lines."
+            )
+        )
@@ -0,0 +1,86 @@
+"""
+Management command: Close (and reopen) the fiscal day across many devices.
+Starts a FleetCloseRun; devices are closed by Celery workers with a concurrency limit,
+tracked to completion, reopened after FiscalDayClosed and retried on close failure.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fiscal.models import FiscalDevice, FleetCloseRun
+from fiscal.services.fleet_close import get_fleet_close_status, start_fleet_close
+
+
+class Command(BaseCommand):
+    help = "Run end-of-day CloseDay (and OpenDay) across registered devices with a concurrency limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--device",
+            type=int,
+            action="append",
+            default=None,
+            help="FDMS device_id to include (repeatable). Default: all registered devices.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Devices closing at once (default FDMS_FLEET_CLOSE_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--max-retries",
+            type=int,
+            default=None,
+            help="Close retries per device (default FDMS_FLEET_CLOSE_MAX_RETRIES).",
+        )
+        parser.add_argument(
+            "--no-reopen",
+            action="store_true",
+            help="Only close; do not open the next fiscal day.",
+        )
+        parser.add_argument(
+            "--wait",
+            action="store_true",
+            help="Print progress until the run finishes.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=10,
+            help="Seconds between progress lines with --wait (default 10).",
+        )
+
+    def handle(self, *args, **options):
+        devices = FiscalDevice.objects.filter(is_registered=True).order_by("device_id")
+        if options["device"]:
+            devices = devices.filter(device_id__in=options["device"])
+        if not devices.exists():
+            raise CommandError("No registered devices selected.")
+
+        run = start_fleet_close(
+            devices,
+            concurrency=options["concurrency"],
+            reopen=not options["no_reopen"],
+            max_retries=options["max_retries"],
+            requested_by="manage.py close_fleet_day",
+        )
+        self.stdout.write(f"Fleet close run #{run.pk} started for {devices.count()} device(s).")
+        if not options["wait"]:
+            return
+
+        while True:
+            status = get_fleet_close_status(run.pk)
+            self.stdout.write(
+                f"  {status['completed']}/{status['total']} done ({status['progress']}%) "
+                f"counts={status['counts']} stragglers={len(status['stragglers'])}"
+            )
+            if status["status"] != FleetCloseRun.STATUS_RUNNING:
+                break
+            time.sleep(max(1, options["interval"]))
+
+        for row in status["failed"]:
+            self.stdout.write(self.style.ERROR(f"  device {row['deviceId']}: {row['lastError']}"))
+        style = self.style.SUCCESS if status["status"] == FleetCloseRun.STATUS_COMPLETED else self.style.WARNING
+        self.stdout.write(style(f"Fleet close run #{run.pk}: {status['status']}"))
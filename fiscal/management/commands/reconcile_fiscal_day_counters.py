@@ -0,0 +1,70 @@
+"""
+Management command: Reconcile FiscalDayCounter rows against a full rebuild from receipts.
+Reports every counter whose stored value differs; --fix replaces the day's rows.
+"""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from fiscal.models import FiscalDayCounter, Receipt
+from fiscal.services.fiscal_day_counters import reconcile_day_counters
+
+logger = logging.getLogger("fiscal")
+
+
+class Command(BaseCommand):
+    help = "Check running fiscal day counters against a full rebuild from receipt JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--device",
+            type=int,
+            default=None,
+            help="Limit to this FDMS device_id (optional).",
+        )
+        parser.add_argument(
+            "--day",
+            type=int,
+            default=None,
+            help="Limit to this fiscal day number (optional).",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Replace mismatching days with the rebuilt counters.",
+        )
+
+    def handle(self, *args, **options):
+        device_id = options.get("device")
+        day = options.get("day")
+        fix = options["fix"]
+
+        receipts = Receipt.objects.exclude(fdms_receipt_id__isnull=True).exclude(fdms_receipt_id=0)
+        counters = FiscalDayCounter.objects.all()
+        if device_id is not None:
+            receipts = receipts.filter(device__device_id=device_id)
+            counters = counters.filter(device__device_id=device_id)
+        if day is not None:
+            receipts = receipts.filter(fiscal_day_no=day)
+            counters = counters.filter(fiscal_day_no=day)
+        days = set(receipts.values_list("device_id", "fiscal_day_no").distinct())
+        days |= set(counters.values_list("device_id", "fiscal_day_no").distinct())
+
+        bad_days = 0
+        for device_pk, fiscal_day_no in sorted(days):
+            mismatches = reconcile_day_counters(device_pk, fiscal_day_no, fix=fix)
+            if not mismatches:
+                continue
+            bad_days += 1
+            self.stdout.write(self.style.WARNING(f"Device pk={device_pk} day {fiscal_day_no}:"))
+            for m in mismatches:
+                self.stdout.write(f"  {m['key']}: stored={m['stored_cents']} expected={m['expected_cents']}")
+
+        logger.info("Reconcile fiscal day counters: %s day(s) checked, %s mismatched, fix=%s", len(days), bad_days, fix)
+        if not bad_days:
+            self.stdout.write(self.style.SUCCESS(f"{len(days)} fiscal day(s) checked; counters match."))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"{bad_days} of {len(days)} fiscal day(s) rebuilt."))
+        else:
+            self.stdout.write(self.style.ERROR(f"{bad_days} of {len(days)} fiscal day(s) mismatched. Run with --fix to rebuild."))
@@ -0,0 +1,75 @@
+"""
+Management command: Store or verify per-day receipt Merkle roots on closed FiscalDays.
+Default seals closed days that have no root yet (days closed before roots existed);
+--verify recomputes sealed roots and reports days whose receipts no longer match.
+"""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from fiscal.models import FiscalDay
+from fiscal.services.fiscal_day_merkle import compute_day_root, seal_fiscal_day
+
+logger = logging.getLogger("fiscal")
+
+
+class Command(BaseCommand):
+    help = "Seal closed fiscal days with a Merkle root over their receipt hashes, or verify sealed roots."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--device",
+            type=int,
+            default=None,
+            help="Limit to this FDMS device_id (optional).",
+        )
+        parser.add_argument(
+            "--day",
+            type=int,
+            default=None,
+            help="Limit to this fiscal day number (optional).",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Recompute sealed roots and report mismatches instead of sealing.",
+        )
+
+    def handle(self, *args, **options):
+        days = FiscalDay.objects.filter(status="FiscalDayClosed").select_related("device")
+        if options.get("device") is not None:
+            days = days.filter(device__device_id=options["device"])
+        if options.get("day") is not None:
+            days = days.filter(fiscal_day_no=options["day"])
+        days = days.order_by("device__device_id", "fiscal_day_no")
+
+        if options["verify"]:
+            self._verify(days.exclude(merkle_root=""))
+            return
+
+        sealed = failed = 0
+        for fd in days.filter(merkle_root=""):
+            _, err = seal_fiscal_day(fd.device, fd.fiscal_day_no)
+            if err:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"Device {fd.device.device_id} day {fd.fiscal_day_no}: {err}"))
+            else:
+                sealed += 1
+        logger.info("Seal fiscal days: %s sealed, %s failed", sealed, failed)
+        self.stdout.write(self.style.SUCCESS(f"{sealed} fiscal day(s) sealed, {failed} failed."))
+
+    def _verify(self, days):
+        checked = bad = 0
+        for fd in days:
+            checked += 1
+            computed, err = compute_day_root(fd.device, fd.fiscal_day_no)
+            if err or computed != (fd.merkle_root, fd.merkle_leaf_count):
+                bad += 1
+                detail = err or f"stored={fd.merkle_root} ({fd.merkle_leaf_count}) computed={computed[0]} ({computed[1]})"
+                self.stdout.write(self.style.ERROR(f"Device {fd.device.device_id} day {fd.fiscal_day_no}: {detail}"))
+        logger.info("Verify fiscal day roots: %s checked, %s mismatched", checked, bad)
+        if bad:
+            self.stdout.write(self.style.ERROR(f"{bad} of {checked} sealed fiscal day(s) do not match their receipts."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{checked} sealed fiscal day(s) match their receipts."))
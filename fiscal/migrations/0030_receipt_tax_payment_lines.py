@@ -0,0 +1,53 @@
+# Generated manually for ReceiptTaxLine and ReceiptPaymentLine
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0029_receipt_submission_response"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReceiptTaxLine",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fiscal_day_no", models.IntegerField()),
+                ("receipt_type", models.CharField(max_length=20)),
+                ("currency", models.CharField(max_length=3)),
+                ("tax_id", models.IntegerField(blank=True, null=True)),
+                ("tax_code", models.CharField(blank=True, max_length=10)),
+                ("tax_percent", models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ("tax_amount_cents", models.BigIntegerField(default=0)),
+                ("sales_amount_with_tax_cents", models.BigIntegerField(default=0)),
+                ("device", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="receipt_tax_lines", to="fiscal.fiscaldevice")),
+                ("receipt", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="tax_lines", to="fiscal.receipt")),
+            ],
+            options={
+                "verbose_name": "Receipt Tax Line",
+                "verbose_name_plural": "Receipt Tax Lines",
+                "indexes": [models.Index(fields=["device", "fiscal_day_no", "receipt_type", "tax_id"], name="fiscal_rtl_dev_day_type_tax")],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReceiptPaymentLine",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fiscal_day_no", models.IntegerField()),
+                ("receipt_type", models.CharField(max_length=20)),
+                ("currency", models.CharField(max_length=3)),
+                ("money_type", models.CharField(max_length=30)),
+                ("payment_amount_cents", models.BigIntegerField(default=0)),
+                ("device", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="receipt_payment_lines", to="fiscal.fiscaldevice")),
+                ("receipt", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="payment_lines", to="fiscal.receipt")),
+            ],
+            options={
+                "verbose_name": "Receipt Payment Line",
+                "verbose_name_plural": "Receipt Payment Lines",
+                "indexes": [models.Index(fields=["device", "fiscal_day_no", "receipt_type", "money_type"], name="fiscal_rpl_dev_day_type_money")],
+            },
+        ),
+    ]
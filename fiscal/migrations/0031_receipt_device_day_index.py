@@ -0,0 +1,17 @@
+# Generated manually for Receipt (device, fiscal_day_no) index
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0030_receipt_tax_payment_lines"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="receipt",
+            index=models.Index(fields=["device", "fiscal_day_no"], name="fiscal_receipt_dev_day"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated manually for FiscalDayCounter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0031_receipt_device_day_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FiscalDayCounter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fiscal_day_no", models.IntegerField()),
+                ("counter_key", models.CharField(max_length=100)),
+                ("counter_type", models.CharField(max_length=30)),
+                ("currency", models.CharField(max_length=3)),
+                ("tax_id", models.IntegerField(blank=True, null=True)),
+                ("tax_percent", models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ("money_type", models.CharField(blank=True, max_length=30)),
+                ("value_cents", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("device", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="fiscal_day_counters", to="fiscal.fiscaldevice")),
+            ],
+            options={
+                "verbose_name": "Fiscal Day Counter",
+                "verbose_name_plural": "Fiscal Day Counters",
+                "unique_together": {("device", "fiscal_day_no", "counter_key")},
+            },
+        ),
+    ]
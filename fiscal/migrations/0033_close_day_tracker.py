@@ -0,0 +1,52 @@
+# Generated manually for CloseDayTracker
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0032_fiscal_day_counter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CloseDayTracker",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fiscal_day_no", models.IntegerField()),
+                ("operation_id", models.CharField(blank=True, max_length=100)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("CLOSED", "Closed"),
+                            ("FAILED", "Close failed"),
+                            ("TIMED_OUT", "Timed out"),
+                        ],
+                        db_index=True,
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("last_status", models.CharField(blank=True, max_length=50)),
+                ("last_error", models.TextField(blank=True)),
+                ("closing_error_code", models.CharField(blank=True, max_length=50)),
+                ("next_check_at", models.DateTimeField(blank=True, null=True)),
+                ("deadline_at", models.DateTimeField()),
+                ("started_at", models.DateTimeField()),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("device", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="close_day_trackers", to="fiscal.fiscaldevice")),
+            ],
+            options={
+                "verbose_name": "CloseDay Tracker",
+                "verbose_name_plural": "CloseDay Trackers",
+                "unique_together": {("device", "fiscal_day_no")},
+                "indexes": [models.Index(fields=["state", "next_check_at"], name="fiscal_closetrk_due")],
+            },
+        ),
+    ]
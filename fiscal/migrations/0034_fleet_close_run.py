@@ -0,0 +1,83 @@
+# Generated manually for FleetCloseRun / FleetCloseItem
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0033_close_day_tracker"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FleetCloseRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("RUNNING", "Running"),
+                            ("COMPLETED", "Completed"),
+                            ("COMPLETED_WITH_ERRORS", "Completed with errors"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        db_index=True,
+                        default="RUNNING",
+                        max_length=30,
+                    ),
+                ),
+                ("concurrency", models.PositiveIntegerField(default=10)),
+                ("reopen", models.BooleanField(default=True)),
+                ("max_retries", models.PositiveIntegerField(default=2)),
+                ("requested_by", models.CharField(blank=True, max_length=150)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Fleet Close Run",
+                "verbose_name_plural": "Fleet Close Runs",
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FleetCloseItem",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("CLOSING", "Closing"),
+                            ("REOPENING", "Reopening"),
+                            ("CLOSED", "Closed"),
+                            ("REOPENED", "Reopened"),
+                            ("FAILED", "Failed"),
+                        ],
+                        db_index=True,
+                        default="QUEUED",
+                        max_length=20,
+                    ),
+                ),
+                ("close_attempts", models.PositiveIntegerField(default=0)),
+                ("closed_fiscal_day_no", models.IntegerField(blank=True, null=True)),
+                ("opened_fiscal_day_no", models.IntegerField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("next_attempt_at", models.DateTimeField(blank=True, null=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("device", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="fleet_close_items", to="fiscal.fiscaldevice")),
+                ("run", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="items", to="fiscal.fleetcloserun")),
+                ("tracker", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="fleet_items", to="fiscal.closedaytracker")),
+            ],
+            options={
+                "verbose_name": "Fleet Close Item",
+                "verbose_name_plural": "Fleet Close Items",
+                "unique_together": {("run", "device")},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated manually for AuditCheckpoint
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0034_fleet_close_run"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fiscal_day_no", models.IntegerField()),
+                ("receipt_counter", models.IntegerField()),
+                ("receipt_global_no", models.IntegerField()),
+                ("chain_hash", models.CharField(max_length=128)),
+                ("receipts_verified", models.BigIntegerField(default=0)),
+                ("verified_at", models.DateTimeField(auto_now=True)),
+                ("device", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="audit_checkpoint", to="fiscal.fiscaldevice")),
+            ],
+            options={
+                "verbose_name": "Audit Checkpoint",
+                "verbose_name_plural": "Audit Checkpoints",
+            },
+        ),
+    ]
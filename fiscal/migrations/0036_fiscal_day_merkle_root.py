@@ -0,0 +1,28 @@
+# Generated manually for FiscalDay Merkle root
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0035_audit_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fiscalday",
+            name="merkle_root",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="merkle_leaf_count",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="merkle_computed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated manually for FiscalDay CloseDay report fields
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0036_fiscal_day_merkle_root"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_receipt_counter",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_counters",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_canonical",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_hash",
+            field=models.CharField(blank=True, default="", max_length=128),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_signature",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_operation_id",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="fiscalday",
+            name="close_submitted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated manually for ConfigRefreshState
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0037_fiscal_day_close_report"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConfigRefreshState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("consecutive_failures", models.IntegerField(default=0)),
+                ("last_attempt_at", models.DateTimeField(blank=True, null=True)),
+                ("last_success_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("next_attempt_at", models.DateTimeField(blank=True, null=True)),
+                ("alerted_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("device", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="config_refresh_state", to="fiscal.fiscaldevice")),
+            ],
+            options={
+                "verbose_name": "Config Refresh State",
+                "verbose_name_plural": "Config Refresh States",
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated manually for QuickBooksConnection incremental sync cursors
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0038_config_refresh_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quickbooksconnection",
+            name="sync_cursors",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="quickbooksconnection",
+            name="last_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated manually for QuickBooksInvoice.fiscal_status
+
+from django.db import migrations, models
+
+
+def backfill_fiscal_status(apps, schema_editor):
+    QuickBooksInvoice = apps.get_model("fiscal", "QuickBooksInvoice")
+    QuickBooksInvoice.objects.filter(fiscalised=True).update(fiscal_status="FISCALISED")
+    QuickBooksInvoice.objects.filter(fiscalised=False).exclude(fiscal_error="").update(fiscal_status="FAILED")
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0039_quickbooks_sync_cursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quickbooksinvoice",
+            name="fiscal_status",
+            field=models.CharField(
+                max_length=20,
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("QUEUED", "Queued"),
+                    ("PROCESSING", "Processing"),
+                    ("FISCALISED", "Fiscalised"),
+                    ("FAILED", "Failed"),
+                ],
+                default="PENDING",
+                db_index=True,
+            ),
+        ),
+        migrations.RunPython(backfill_fiscal_status, noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated manually for retention (RetentionDailySummary, RetentionArchive, created_at indexes)
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fiscal", "0040_quickbooks_invoice_fiscal_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="quickbooksevent",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="activityevent",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="auditevent",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="fdmsapilog",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="receiptsubmissionresponse",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="RetentionDailySummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("table", models.CharField(max_length=50)),
+                ("day", models.DateField()),
+                ("key", models.CharField(blank=True, max_length=255)),
+                ("count", models.IntegerField(default=0)),
+                ("first_at", models.DateTimeField()),
+                ("last_at", models.DateTimeField()),
+                ("device", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="retention_summaries", to="fiscal.fiscaldevice")),
+            ],
+            options={
+                "verbose_name": "Retention Daily Summary",
+                "verbose_name_plural": "Retention Daily Summaries",
+                "ordering": ["-day", "table", "key"],
+                "indexes": [models.Index(fields=["table", "day"], name="fiscal_rete_table_d53816_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="RetentionArchive",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("table", models.CharField(max_length=50)),
+                ("path", models.CharField(max_length=500)),
+                ("sha256", models.CharField(max_length=64)),
+                ("size_bytes", models.BigIntegerField()),
+                ("row_count", models.IntegerField()),
+                ("first_id", models.BigIntegerField()),
+                ("last_id", models.BigIntegerField()),
+                ("oldest_at", models.DateTimeField()),
+                ("newest_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Retention Archive",
+                "verbose_name_plural": "Retention Archives",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
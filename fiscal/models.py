@@ -111,6 +111,19 @@ class FiscalDay(models.Model):
     opened_at = models.DateTimeField()
     closed_at = models.DateTimeField(null=True, blank=True)
     closing_error_code = models.CharField(max_length=50, null=True, blank=True)
+    # Merkle root (hex) over the day's receipt hashes in receipt_counter order, set on close.
+    # See fiscal.services.fiscal_day_merkle for the tree layout and inclusion proofs.
+    merkle_root = models.CharField(max_length=64, blank=True, default="")
+    merkle_leaf_count = models.IntegerField(null=True, blank=True)
+    merkle_computed_at = models.DateTimeField(null=True, blank=True)
+    # CloseDay report as accepted by FDMS (see fiscal.services.fiscal_day_report).
+    close_receipt_counter = models.IntegerField(null=True, blank=True)
+    close_counters = models.JSONField(null=True, blank=True)
+    close_canonical = models.TextField(blank=True, default="")
+    close_hash = models.CharField(max_length=128, blank=True, default="")
+    close_signature = models.TextField(blank=True, default="")
+    close_operation_id = models.CharField(max_length=100, blank=True, default="")
+    close_submitted_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = "Fiscal Day"
@@ -121,6 +134,128 @@ class FiscalDay(models.Model):
         return f"Day #{self.fiscal_day_no} ({self.status})"
 
 
+class CloseDayTracker(models.Model):
+    """
+    CloseDay completion tracking for one device fiscal day. PENDING until GetStatus
+    reports FiscalDayClosed / FiscalDayCloseFailed or the deadline passes; re-checks are
+    scheduled as Celery countdowns (see fiscal.services.close_day_tracker).
+    """
+
+    STATE_PENDING = "PENDING"
+    STATE_CLOSED = "CLOSED"
+    STATE_FAILED = "FAILED"
+    STATE_TIMED_OUT = "TIMED_OUT"
+    STATE_CHOICES = [
+        (STATE_PENDING, "Pending"),
+        (STATE_CLOSED, "Closed"),
+        (STATE_FAILED, "Close failed"),
+        (STATE_TIMED_OUT, "Timed out"),
+    ]
+
+    device = models.ForeignKey(
+        FiscalDevice, on_delete=models.CASCADE, related_name="close_day_trackers"
+    )
+    fiscal_day_no = models.IntegerField()
+    operation_id = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_PENDING, db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_status = models.CharField(max_length=50, blank=True)
+    last_error = models.TextField(blank=True)
+    closing_error_code = models.CharField(max_length=50, blank=True)
+    next_check_at = models.DateTimeField(null=True, blank=True)
+    deadline_at = models.DateTimeField()
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "CloseDay Tracker"
+        verbose_name_plural = "CloseDay Trackers"
+        unique_together = [["device", "fiscal_day_no"]]
+        indexes = [models.Index(fields=["state", "next_check_at"], name="fiscal_closetrk_due")]
+
+    def __str__(self):
+        return f"Close day #{self.fiscal_day_no} ({self.state})"
+
+
+class FleetCloseRun(models.Model):
+    """
+    One end-of-day run across a device set: close every device (at most `concurrency`
+    at a time), track each close to completion, optionally reopen, retry failures.
+    """
+
+    STATUS_RUNNING = "RUNNING"
+    STATUS_COMPLETED = "COMPLETED"
+    STATUS_COMPLETED_WITH_ERRORS = "COMPLETED_WITH_ERRORS"
+    STATUS_CANCELLED = "CANCELLED"
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_COMPLETED_WITH_ERRORS, "Completed with errors"),
+        (STATUS_CANCELLED, "Cancelled"),
+    ]
+
+    status = models.CharField(max_length=30, choices=STATUS_CHOICES, default=STATUS_RUNNING, db_index=True)
+    concurrency = models.PositiveIntegerField(default=10)
+    reopen = models.BooleanField(default=True)
+    max_retries = models.PositiveIntegerField(default=2)
+    requested_by = models.CharField(max_length=150, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Fleet Close Run"
+        verbose_name_plural = "Fleet Close Runs"
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"Fleet close #{self.pk} ({self.status})"
+
+
+class FleetCloseItem(models.Model):
+    """Per-device progress within a FleetCloseRun."""
+
+    STATE_QUEUED = "QUEUED"
+    STATE_CLOSING = "CLOSING"
+    STATE_REOPENING = "REOPENING"
+    STATE_CLOSED = "CLOSED"
+    STATE_REOPENED = "REOPENED"
+    STATE_FAILED = "FAILED"
+    STATE_CHOICES = [
+        (STATE_QUEUED, "Queued"),
+        (STATE_CLOSING, "Closing"),
+        (STATE_REOPENING, "Reopening"),
+        (STATE_CLOSED, "Closed"),
+        (STATE_REOPENED, "Reopened"),
+        (STATE_FAILED, "Failed"),
+    ]
+    ACTIVE_STATES = (STATE_CLOSING, STATE_REOPENING)
+    TERMINAL_STATES = (STATE_CLOSED, STATE_REOPENED, STATE_FAILED)
+
+    run = models.ForeignKey(FleetCloseRun, on_delete=models.CASCADE, related_name="items")
+    device = models.ForeignKey(FiscalDevice, on_delete=models.CASCADE, related_name="fleet_close_items")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_QUEUED, db_index=True)
+    tracker = models.ForeignKey(
+        CloseDayTracker, on_delete=models.SET_NULL, null=True, blank=True, related_name="fleet_items"
+    )
+    close_attempts = models.PositiveIntegerField(default=0)
+    closed_fiscal_day_no = models.IntegerField(null=True, blank=True)
+    opened_fiscal_day_no = models.IntegerField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Fleet Close Item"
+        verbose_name_plural = "Fleet Close Items"
+        unique_together = [["run", "device"]]
+
+    def __str__(self):
+        return f"Run #{self.run_id} device {self.device_id} ({self.state})"
+
+
 class Receipt(models.Model):
     """Receipt captured during a fiscal day (invoice, credit note, or debit note)."""
 
@@ -193,6 +328,9 @@ class Receipt(models.Model):
         verbose_name = "Receipt"
         verbose_name_plural = "Receipts"
         unique_together = [["device", "receipt_global_no"]]
+        indexes = [
+            models.Index(fields=["device", "fiscal_day_no"], name="fiscal_receipt_dev_day"),
+        ]
 
     def __str__(self):
         return f"Receipt #{self.receipt_global_no} (Day {self.fiscal_day_no})"
@@ -284,6 +422,102 @@ class Receipt(models.Model):
                 )
 
 
+class ReceiptTaxLine(models.Model):
+    """
+    Normalised receipt_taxes row, written alongside Receipt.receipt_taxes.
+    Amounts in integer cents. Used for SQL-side VAT and counter aggregation.
+    """
+
+    receipt = models.ForeignKey(
+        Receipt, on_delete=models.CASCADE, related_name="tax_lines"
+    )
+    device = models.ForeignKey(
+        FiscalDevice, on_delete=models.CASCADE, related_name="receipt_tax_lines"
+    )
+    fiscal_day_no = models.IntegerField()
+    receipt_type = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    tax_id = models.IntegerField(null=True, blank=True)
+    tax_code = models.CharField(max_length=10, blank=True)
+    tax_percent = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+    tax_amount_cents = models.BigIntegerField(default=0)
+    sales_amount_with_tax_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Receipt Tax Line"
+        verbose_name_plural = "Receipt Tax Lines"
+        indexes = [
+            models.Index(
+                fields=["device", "fiscal_day_no", "receipt_type", "tax_id"],
+                name="fiscal_rtl_dev_day_type_tax",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Receipt {self.receipt_id} taxID={self.tax_id} {self.tax_amount_cents}c"
+
+
+class ReceiptPaymentLine(models.Model):
+    """
+    Normalised receipt_payments row, written alongside Receipt.receipt_payments.
+    Amounts in integer cents. money_type is the raw method upper-cased (e.g. CASH, CARD).
+    """
+
+    receipt = models.ForeignKey(
+        Receipt, on_delete=models.CASCADE, related_name="payment_lines"
+    )
+    device = models.ForeignKey(
+        FiscalDevice, on_delete=models.CASCADE, related_name="receipt_payment_lines"
+    )
+    fiscal_day_no = models.IntegerField()
+    receipt_type = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    money_type = models.CharField(max_length=30)
+    payment_amount_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Receipt Payment Line"
+        verbose_name_plural = "Receipt Payment Lines"
+        indexes = [
+            models.Index(
+                fields=["device", "fiscal_day_no", "receipt_type", "money_type"],
+                name="fiscal_rpl_dev_day_type_money",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Receipt {self.receipt_id} {self.money_type} {self.payment_amount_cents}c"
+
+
+class FiscalDayCounter(models.Model):
+    """
+    Running CloseDay counter for a device's fiscal day, updated in the same transaction
+    that fiscalises each receipt. One row per (counter type, currency, taxID/percent or
+    money type). Values in integer cents. If any row exists for a day, the set is complete.
+    """
+
+    device = models.ForeignKey(
+        FiscalDevice, on_delete=models.CASCADE, related_name="fiscal_day_counters"
+    )
+    fiscal_day_no = models.IntegerField()
+    counter_key = models.CharField(max_length=100)
+    counter_type = models.CharField(max_length=30)
+    currency = models.CharField(max_length=3)
+    tax_id = models.IntegerField(null=True, blank=True)
+    tax_percent = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+    money_type = models.CharField(max_length=30, blank=True)
+    value_cents = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Fiscal Day Counter"
+        verbose_name_plural = "Fiscal Day Counters"
+        unique_together = [["device", "fiscal_day_no", "counter_key"]]
+
+    def __str__(self):
+        return f"Day #{self.fiscal_day_no} {self.counter_key} = {self.value_cents}c"
+
+
 class CreditNoteImport(models.Model):
     """Audit record for Excel credit note imports. Immutable."""
 
@@ -425,6 +659,32 @@ class TaxMapping(models.Model):
         return f"{self.local_code} → FDMS taxID {self.fdms_tax_id}"
 
 
+class ConfigRefreshState(models.Model):
+    """
+    Scheduled GetConfig refresh bookkeeping for a device (see fiscal.services.config_refresh).
+    next_attempt_at holds off re-enqueueing while a refresh is queued or backing off after
+    failures; alerted_at is set once per failure streak.
+    """
+
+    device = models.OneToOneField(
+        FiscalDevice, on_delete=models.CASCADE, related_name="config_refresh_state"
+    )
+    consecutive_failures = models.IntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    alerted_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Config Refresh State"
+        verbose_name_plural = "Config Refresh States"
+
+    def __str__(self):
+        return f"Device {self.device_id} config refresh ({self.consecutive_failures} failure(s))"
+
+
 class FiscalEditAttempt(models.Model):
     """Audit log for attempted edits to fiscalised invoices. Immutable."""
 
@@ -454,6 +714,9 @@ class QuickBooksConnection(models.Model):
     token_expires_at = models.DateTimeField(null=True, blank=True)
     company_name = models.CharField(max_length=255, blank=True)
     is_active = models.BooleanField(default=True)
+    # Incremental sync (fiscal.services.qb_sync): entity -> last processed MetaData.LastUpdatedTime.
+    sync_cursors = models.JSONField(default=dict, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -468,7 +731,7 @@ class QuickBooksEvent(models.Model):
 
     event_type = models.CharField(max_length=50)
     payload = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "QuickBooks Event"
@@ -477,7 +740,24 @@ class QuickBooksEvent(models.Model):
 
 
 class QuickBooksInvoice(models.Model):
-    """QB invoice snapshot. Stored before fiscalisation. Idempotency key = qb_invoice_id."""
+    """
+    QB invoice snapshot. Stored before fiscalisation. Idempotency key = qb_invoice_id.
+    fiscal_status: PENDING -> QUEUED (webhook) -> PROCESSING (claimed by one worker) ->
+    FISCALISED | FAILED (retryable).
+    """
+
+    STATUS_PENDING = "PENDING"
+    STATUS_QUEUED = "QUEUED"
+    STATUS_PROCESSING = "PROCESSING"
+    STATUS_FISCALISED = "FISCALISED"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_FISCALISED, "Fiscalised"),
+        (STATUS_FAILED, "Failed"),
+    ]
 
     qb_invoice_id = models.CharField(max_length=100, unique=True, db_index=True)
     qb_customer_id = models.CharField(max_length=100, blank=True)
@@ -493,6 +773,7 @@ class QuickBooksInvoice(models.Model):
         related_name="qb_invoices",
     )
     fiscal_error = models.TextField(blank=True)
+    fiscal_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -515,7 +796,7 @@ class ActivityEvent(models.Model):
     event_type = models.CharField(max_length=50)
     message = models.TextField(blank=True)
     level = models.CharField(max_length=20, default="info")  # info, warning, error
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "Activity Event"
@@ -535,7 +816,7 @@ class AuditEvent(models.Model):
     )
     action = models.CharField(max_length=100)  # device_registered, fiscal_day_opened, receipt_submitted, etc.
     metadata = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "Audit Event"
@@ -543,6 +824,30 @@ class AuditEvent(models.Model):
         ordering = ["-created_at"]
 
 
+class AuditCheckpoint(models.Model):
+    """
+    Last receipt whose hash chain and signature passed the integrity audit for a device.
+    Incremental audits resume the chain from here (receipts are immutable once fiscalised).
+    """
+
+    device = models.OneToOneField(
+        FiscalDevice, on_delete=models.CASCADE, related_name="audit_checkpoint"
+    )
+    fiscal_day_no = models.IntegerField()
+    receipt_counter = models.IntegerField()
+    receipt_global_no = models.IntegerField()
+    chain_hash = models.CharField(max_length=128)
+    receipts_verified = models.BigIntegerField(default=0)
+    verified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Audit Checkpoint"
+        verbose_name_plural = "Audit Checkpoints"
+
+    def __str__(self):
+        return f"Device {self.device_id} verified to receipt {self.receipt_global_no}"
+
+
 class FDMSApiLog(models.Model):
     """Audit log for FDMS API calls."""
 
@@ -553,7 +858,7 @@ class FDMSApiLog(models.Model):
     status_code = models.IntegerField(null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
     operation_id = models.CharField(max_length=128, blank=True, db_index=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "FDMS API Log"
@@ -580,7 +885,7 @@ class ReceiptSubmissionResponse(models.Model):
     status_code = models.IntegerField()
     response_payload = models.JSONField(default=dict)
     validation_errors = models.JSONField(default=list)  # list of error strings for display
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = "Receipt Submission Response"
@@ -591,6 +896,59 @@ class ReceiptSubmissionResponse(models.Model):
         return f"SubmitReceipt device={self.device_id} global_no={self.receipt_global_no} status={self.status_code}"
 
 
+class RetentionDailySummary(models.Model):
+    """
+    Daily roll-up of event/log rows removed by retention (fiscal.services.retention):
+    how many rows of `table` a device had per day and key (event type, action, status...).
+    """
+
+    table = models.CharField(max_length=50)
+    day = models.DateField()
+    device = models.ForeignKey(
+        FiscalDevice,
+        on_delete=models.CASCADE,
+        related_name="retention_summaries",
+        null=True,
+        blank=True,
+    )
+    key = models.CharField(max_length=255, blank=True)
+    count = models.IntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Retention Daily Summary"
+        verbose_name_plural = "Retention Daily Summaries"
+        ordering = ["-day", "table", "key"]
+        indexes = [models.Index(fields=["table", "day"])]
+
+    def __str__(self):
+        return f"{self.table} {self.day} {self.key}: {self.count}"
+
+
+class RetentionArchive(models.Model):
+    """One NDJSON.gz file of rows exported by retention before deletion, with its sha256."""
+
+    table = models.CharField(max_length=50)
+    path = models.CharField(max_length=500)
+    sha256 = models.CharField(max_length=64)
+    size_bytes = models.BigIntegerField()
+    row_count = models.IntegerField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    oldest_at = models.DateTimeField()
+    newest_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Retention Archive"
+        verbose_name_plural = "Retention Archives"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.table} {self.first_id}-{self.last_id} ({self.row_count} rows)"
+
+
 class DebitNote(models.Model):
     device_id = models.IntegerField()
     receipt_global_no = models.IntegerField(unique=True)
@@ -1,25 +1,94 @@
 """
 Integrity & chain validation for fiscal data.
 Rebuilds hashes, validates receipt chains, verifies signatures.
+
+Receipt chains restart every fiscal day, so the audit is split into independent work
+units of (device, fiscal_day_no). run_audit runs the units across a process pool
+(workers > 1) and merges the per-unit AuditResults in unit order.
+
+Fiscalised receipts are immutable, so a clean audit stores an AuditCheckpoint per device
+(last verified receipt and its chain hash). Incremental runs (the default for
+audit_fiscal_integrity) verify the checkpoint anchor and then only receipts after it;
+full=True re-verifies from genesis.
+
+Receipts are streamed with a server-side cursor and only the columns the hash needs.
+AuditResult keeps at most FDMS_AUDIT_MAX_FINDINGS messages per category (the rest are
+counted in findings_omitted); pass report_path to get every finding as NDJSON.
 """
 
 import base64
 import hashlib
+import json
 import logging
-from collections import defaultdict
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache, partial
 
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from django.conf import settings
 
-from fiscal.models import FiscalDay, FiscalDevice, Receipt
+from fiscal.models import AuditCheckpoint, FiscalDay, FiscalDayCounter, FiscalDevice, Receipt
 from fiscal.services.receipt_engine import build_receipt_canonical_string
 
 logger = logging.getLogger("fiscal")
 
+# Columns needed to recompute and verify a receipt hash (no lines/QR/FDMS response JSON).
+AUDIT_RECEIPT_FIELDS = (
+    "receipt_global_no",
+    "receipt_counter",
+    "fiscal_day_no",
+    "receipt_type",
+    "currency",
+    "receipt_date",
+    "receipt_total",
+    "receipt_taxes",
+    "receipt_hash",
+    "receipt_signature_hash",
+    "receipt_signature_sig",
+)
+
+# Finding kind -> AuditResult list holding its messages.
+FINDING_KINDS = {
+    "receipt_chain": "receipt_chain_errors",
+    "receipt_hash": "receipt_hash_mismatches",
+    "receipt_signature": "receipt_signature_failures",
+    "fiscal_day_counters": "fiscal_day_counter_errors",
+}
+
+
+class NdjsonReportWriter:
+    """Append-only NDJSON findings file (one JSON object per line)."""
+
+    def __init__(self, path: str, mode: str = "w"):
+        self.path = path
+        self._fh = open(path, mode, encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self._fh.write(json.dumps(record, default=str, separators=(",", ":")) + "\n")
+
+    def append_file(self, path: str) -> None:
+        """Copy another NDJSON file (a worker's part) to the end of this one."""
+        self._fh.flush()
+        with open(path, encoding="utf-8") as part:
+            shutil.copyfileobj(part, self._fh)
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
 
 def _to_cents(value) -> int:
     return int(
@@ -38,6 +107,8 @@ class AuditResult:
     devices_checked: int = 0
     receipts_checked: int = 0
     fiscal_days_checked: int = 0
+    findings_omitted: int = 0
+    sink: NdjsonReportWriter | None = field(default=None, compare=False, repr=False)
 
     @property
     def has_errors(self) -> bool:
@@ -48,6 +119,62 @@ class AuditResult:
             or self.fiscal_day_counter_errors
         )
 
+    @property
+    def findings_count(self) -> int:
+        return self.findings_omitted + sum(len(getattr(self, name)) for name in FINDING_KINDS.values())
+
+    def _keep(self, name: str, messages: list[str]) -> None:
+        kept = getattr(self, name)
+        room = max(0, getattr(settings, "FDMS_AUDIT_MAX_FINDINGS", 1000) - len(kept))
+        kept.extend(messages[:room])
+        self.findings_omitted += max(0, len(messages) - room)
+
+    def add_finding(self, kind: str, message: str, **detail) -> None:
+        """Record a finding: written to the report sink (if any), kept in memory up to the cap."""
+        if self.sink is not None:
+            self.sink.write({"kind": kind, **detail, "message": message})
+        self._keep(FINDING_KINDS[kind], [message])
+
+    def merge(self, other: "AuditResult") -> "AuditResult":
+        """Add another result's findings and counts into this one."""
+        for name in FINDING_KINDS.values():
+            self._keep(name, getattr(other, name))
+        self.findings_omitted += other.findings_omitted
+        self.devices_checked += other.devices_checked
+        self.receipts_checked += other.receipts_checked
+        self.fiscal_days_checked += other.fiscal_days_checked
+        return self
+
+
+@lru_cache(maxsize=64)
+def _public_key_from_pem(certificate_pem: str):
+    """Parse the device certificate once per process (per distinct PEM)."""
+    cert = x509.load_pem_x509_certificate(certificate_pem.encode(), default_backend())
+    return cert.public_key()
+
+
+def _verify_with_public_key(pub, canonical: str, stored_hash_b64: str, stored_sig_b64: str) -> tuple[bool, str | None]:
+    expected_hash = hashlib.sha256(canonical.encode("utf-8")).digest()
+    stored_hash = base64.b64decode(stored_hash_b64)
+    if expected_hash != stored_hash:
+        return False, "Hash mismatch: recalculated hash != stored hash"
+
+    sig_bytes = base64.b64decode(stored_sig_b64)
+
+    if isinstance(pub, ec.EllipticCurvePublicKey):
+        pub.verify(sig_bytes, canonical.encode("utf-8"), ec.ECDSA(hashes.SHA256()))
+    elif isinstance(pub, rsa.RSAPublicKey):
+        pub.verify(
+            sig_bytes,
+            canonical.encode("utf-8"),
+            padding.PKCS1v15(),
+            hashes.SHA256(),
+        )
+    else:
+        return False, "Unsupported key type"
+
+    return True, None
+
 
 def verify_receipt_signature(
     device: FiscalDevice,
@@ -60,59 +187,48 @@ def verify_receipt_signature(
     Returns (True, None) if valid, (False, error_message) otherwise.
     """
     try:
-        cert = x509.load_pem_x509_certificate(
-            device.certificate_pem.encode() if isinstance(device.certificate_pem, str)
-            else device.certificate_pem,
-            default_backend(),
-        )
-        pub = cert.public_key()
-
-        expected_hash = hashlib.sha256(canonical.encode("utf-8")).digest()
-        stored_hash = base64.b64decode(stored_hash_b64)
-        if expected_hash != stored_hash:
-            return False, "Hash mismatch: recalculated hash != stored hash"
-
-        sig_bytes = base64.b64decode(stored_sig_b64)
-
-        if isinstance(pub, ec.EllipticCurvePublicKey):
-            pub.verify(sig_bytes, canonical.encode("utf-8"), ec.ECDSA(hashes.SHA256()))
-        elif isinstance(pub, rsa.RSAPublicKey):
-            pub.verify(
-                sig_bytes,
-                canonical.encode("utf-8"),
-                padding.PKCS1v15(),
-                hashes.SHA256(),
-            )
-        else:
-            return False, "Unsupported key type"
-
-        return True, None
+        pem = device.certificate_pem
+        pem = pem.decode() if isinstance(pem, bytes) else pem
+        return _verify_with_public_key(_public_key_from_pem(pem), canonical, stored_hash_b64, stored_sig_b64)
     except Exception as e:
         return False, str(e)
 
 
-def validate_receipt_chain(device: FiscalDevice) -> AuditResult:
+def _audit_day_receipts(
+    device: FiscalDevice,
+    fiscal_day_no: int,
+    result: AuditResult,
+    after_counter: int = 0,
+    prev_hash: str | None = None,
+) -> tuple | None:
     """
-    Rebuild receipt chain, recalculate hashes, detect mismatches and broken chains.
+    Verify hashes, signatures and chain order for one fiscal day of a device, starting
+    after receipt_counter `after_counter` whose chain hash is `prev_hash`.
+    Returns the chain tail (fiscal_day_no, receipt_counter, receipt_global_no, hash) or None.
     """
-    result = AuditResult(devices_checked=1)
     receipts = (
-        Receipt.objects.filter(device=device)
-        .order_by("fiscal_day_no", "receipt_counter")
+        Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no, receipt_counter__gt=after_counter)
+        .order_by("receipt_counter")
+        .only(*AUDIT_RECEIPT_FIELDS)
     )
-
-    prev_hash_by_day: dict[int, str | None] = defaultdict(lambda: None)
-
-    for rec in receipts:
+    pub = None
+    pub_err = None
+    if device.certificate_pem:
+        try:
+            pub = _public_key_from_pem(device.certificate_pem)
+        except Exception as e:
+            pub_err = str(e)
+
+    tail = None
+    for rec in receipts.iterator(chunk_size=getattr(settings, "FDMS_AUDIT_FETCH_CHUNK", 2000)):
         result.receipts_checked += 1
+        where = {"device_id": device.device_id, "fiscal_day_no": rec.fiscal_day_no, "receipt_global_no": rec.receipt_global_no}
 
         receipt_date_str = ""
         if rec.receipt_date:
             receipt_date_str = rec.receipt_date.strftime("%Y-%m-%dT%H:%M:%S")
         receipt_total_dec = Decimal(str(rec.receipt_total or 0))
 
-        prev_hash = prev_hash_by_day[rec.fiscal_day_no]
-
         canonical = build_receipt_canonical_string(
             device_id=device.device_id,
             receipt_type=rec.receipt_type or "FiscalInvoice",
@@ -129,111 +245,300 @@ def validate_receipt_chain(device: FiscalDevice) -> AuditResult:
         ).decode()
 
         if rec.receipt_hash and rec.receipt_hash != expected_hash_b64:
-            result.receipt_hash_mismatches.append(
+            result.add_finding(
+                "receipt_hash",
                 f"Device {device.device_id} Receipt {rec.receipt_global_no} (day {rec.fiscal_day_no}): "
-                f"stored hash != recalculated"
+                f"stored hash != recalculated",
+                **where,
             )
 
         if rec.receipt_signature_hash and rec.receipt_signature_sig:
-            ok, err = verify_receipt_signature(
-                device=device,
-                canonical=canonical,
-                stored_hash_b64=rec.receipt_signature_hash,
-                stored_sig_b64=rec.receipt_signature_sig,
-            )
+            if pub is None:
+                ok, err = False, pub_err or "Device has no certificate"
+            else:
+                try:
+                    ok, err = _verify_with_public_key(
+                        pub, canonical, rec.receipt_signature_hash, rec.receipt_signature_sig
+                    )
+                except Exception as e:
+                    ok, err = False, str(e)
             if not ok:
-                result.receipt_signature_failures.append(
-                    f"Device {device.device_id} Receipt {rec.receipt_global_no}: {err}"
+                result.add_finding(
+                    "receipt_signature", f"Device {device.device_id} Receipt {rec.receipt_global_no}: {err}", **where
                 )
 
         if prev_hash is None and rec.receipt_counter != 1:
-            result.receipt_chain_errors.append(
+            result.add_finding(
+                "receipt_chain",
                 f"Device {device.device_id} Receipt {rec.receipt_global_no}: "
-                f"first receipt of day should have receipt_counter=1, got {rec.receipt_counter}"
+                f"first receipt of day should have receipt_counter=1, got {rec.receipt_counter}",
+                **where,
             )
 
-        prev_hash_by_day[rec.fiscal_day_no] = expected_hash_b64
+        prev_hash = expected_hash_b64
+        tail = (rec.fiscal_day_no, rec.receipt_counter, rec.receipt_global_no, expected_hash_b64)
 
-    return result
+    return tail
 
 
-def rebuild_fiscal_day_counters(device: FiscalDevice, fiscal_day_no: int) -> tuple[list[dict], str | None]:
-    """
-    Rebuild fiscalDayCounters from receipts for a fiscal day.
-    Returns (counters, None) or ([], error_message).
-    """
-    receipts = Receipt.objects.filter(
-        device=device, fiscal_day_no=fiscal_day_no
-    ).order_by("receipt_counter")
-
-    if not receipts.exists():
-        return [], None
-
-    totals: dict[tuple, Decimal] = {}
-    for rec in receipts:
-        currency = rec.currency or "USD"
-        for tax in rec.receipt_taxes or []:
-            percent = tax.get("taxPercent", tax.get("fiscalCounterTaxPercent"))
-            amount = tax.get("salesAmountWithTax", tax.get("fiscalCounterValue"))
-            counter_type = tax.get("fiscalCounterType", tax.get("counterType", "saleByTax"))
-            counter_type_lower = str(counter_type).lower()
-            if counter_type_lower == "creditnotebytax":
-                counter_type = "creditNoteByTax"
-            elif counter_type_lower == "salebytax":
-                counter_type = "saleByTax"
-            else:
-                counter_type = str(counter_type)
-            if percent is None or amount is None:
-                continue
-            key = (counter_type, Decimal(str(percent)), currency)
-            totals[key] = totals.get(key, Decimal("0")) + Decimal(str(amount))
+def _receipt_days(device: FiscalDevice, from_day: int | None = None) -> list[int]:
+    qs = Receipt.objects.filter(device=device)
+    if from_day is not None:
+        qs = qs.filter(fiscal_day_no__gte=from_day)
+    return list(qs.order_by("fiscal_day_no").values_list("fiscal_day_no", flat=True).distinct())
 
-    counters = []
-    for (counter_type, percent, currency), value in totals.items():
-        counters.append({
-            "fiscalCounterType": counter_type,
-            "fiscalCounterCurrency": currency,
-            "fiscalCounterTaxPercent": round(float(percent), 2),
-            "fiscalCounterValue": float(value.quantize(Decimal("0.01"), ROUND_HALF_UP)),
-        })
 
-    counters.sort(key=lambda x: (x["fiscalCounterTaxPercent"], x["fiscalCounterCurrency"]))
-    return counters, None
+def validate_receipt_chain(device: FiscalDevice) -> AuditResult:
+    """
+    Rebuild receipt chain, recalculate hashes, detect mismatches and broken chains.
+    """
+    result = AuditResult(devices_checked=1)
+    for fiscal_day_no in _receipt_days(device):
+        _audit_day_receipts(device, fiscal_day_no, result)
+    return result
 
 
 def validate_fiscal_day_counters(device: FiscalDevice) -> AuditResult:
     """
-    Rebuild fiscal day counters from receipts and validate consistency.
+    Check each fiscal day's running counters against its receipts and, once closed,
+    the submitted CloseDay report against the running counters.
     """
     result = AuditResult(devices_checked=1)
     fiscal_days = FiscalDay.objects.filter(device=device).order_by("fiscal_day_no")
 
     for fd in fiscal_days:
-        result.fiscal_days_checked += 1
-        counters, err = rebuild_fiscal_day_counters(device, fd.fiscal_day_no)
-        if err:
-            result.fiscal_day_counter_errors.append(
-                f"Device {device.device_id} FiscalDay {fd.fiscal_day_no}: {err}"
-            )
+        _check_day_counters(device, fd.fiscal_day_no, result)
 
     return result
 
 
-def run_full_audit() -> AuditResult:
-    """Run full integrity audit across all devices."""
-    combined = AuditResult()
-    devices = FiscalDevice.objects.filter(is_registered=True)
+def _check_day_counters(device: FiscalDevice, fiscal_day_no: int, result: AuditResult) -> None:
+    from fiscal.services.fiscal_day_counters import reconcile_day_counters
+
+    result.fiscal_days_checked += 1
+    problems = []
+    if FiscalDayCounter.objects.filter(device=device, fiscal_day_no=fiscal_day_no).exists():
+        problems.extend(
+            f"running counter {m['key']} stored {m['stored_cents']} cents, receipts {m['expected_cents']}"
+            for m in reconcile_day_counters(device, fiscal_day_no)
+        )
+    fiscal_day = FiscalDay.objects.filter(device=device, fiscal_day_no=fiscal_day_no).first()
+    if fiscal_day is not None and fiscal_day.close_counters is not None:
+        problems.extend(_close_day_report_problems(device, fiscal_day))
+    for problem in problems:
+        result.add_finding(
+            "fiscal_day_counters",
+            f"Device {device.device_id} FiscalDay {fiscal_day_no}: {problem}",
+            device_id=device.device_id,
+            fiscal_day_no=fiscal_day_no,
+        )
+
+
+def _close_day_report_problems(device: FiscalDevice, fiscal_day: FiscalDay) -> list[str]:
+    """Check the stored CloseDay report: signature over its canonical, and counters vs the running counters."""
+    from fiscal.services.close_day_counter_builder import get_day_receipts
+    from fiscal.services.fiscal_day_report import compare_close_day_counters, fiscal_day_date
+    from fiscal.services.fiscal_signature import build_fiscal_day_canonical_string
 
+    problems = []
+    canonical = build_fiscal_day_canonical_string(
+        device_id=device.device_id,
+        fiscal_day_no=fiscal_day.fiscal_day_no,
+        fiscal_day_date=fiscal_day_date(fiscal_day),
+        fiscal_day_counters=fiscal_day.close_counters,
+    )
+    if canonical != fiscal_day.close_canonical:
+        problems.append("stored CloseDay canonical string does not match stored counters")
+    if fiscal_day.close_hash and fiscal_day.close_signature:
+        ok, err = verify_receipt_signature(device, canonical, fiscal_day.close_hash, fiscal_day.close_signature)
+        if not ok:
+            problems.append(f"CloseDay signature: {err}")
+    receipt_count = get_day_receipts(device, fiscal_day.fiscal_day_no).count()
+    if fiscal_day.close_receipt_counter is not None and receipt_count != fiscal_day.close_receipt_counter:
+        problems.append(f"receiptCounter submitted {fiscal_day.close_receipt_counter}, receipts now {receipt_count}")
+    for m in compare_close_day_counters(fiscal_day):
+        problems.append(f"counter {m['key']} submitted {m['submitted_cents']} cents, now {m['current_cents']}")
+    return problems
+
+
+def audit_unit(
+    device_pk: int,
+    fiscal_day_no: int,
+    check_counters: bool,
+    after_counter: int = 0,
+    prev_hash: str | None = None,
+    report_path: str | None = None,
+) -> tuple[AuditResult, tuple | None]:
+    """
+    One work unit: receipt chain of a device fiscal day (optionally resumed after a
+    checkpoint), plus its counters when the day has a FiscalDay record.
+    Findings are also written to report_path (NDJSON) when given.
+    Returns (result, chain tail). Safe to run in a worker process.
+    """
+    sink = NdjsonReportWriter(report_path) if report_path else None
+    result = AuditResult(sink=sink)
+    try:
+        device = FiscalDevice.objects.get(pk=device_pk)
+        tail = _audit_day_receipts(device, fiscal_day_no, result, after_counter, prev_hash)
+        if check_counters:
+            _check_day_counters(device, fiscal_day_no, result)
+    finally:
+        if sink is not None:
+            sink.close()
+    result.sink = None
+    return result, tail
+
+
+def build_audit_units(devices, checkpoints: dict | None = None) -> list[tuple]:
+    """
+    (device_pk, fiscal_day_no, has_fiscal_day_record, after_counter, prev_hash) for every
+    day with receipts or a FiscalDay row; with a checkpoint, only days from its day on.
+    """
+    checkpoints = checkpoints or {}
+    units = []
     for device in devices:
-        combined.devices_checked += 1
-        chain_result = validate_receipt_chain(device)
-        combined.receipts_checked += chain_result.receipts_checked
-        combined.receipt_chain_errors.extend(chain_result.receipt_chain_errors)
-        combined.receipt_hash_mismatches.extend(chain_result.receipt_hash_mismatches)
-        combined.receipt_signature_failures.extend(chain_result.receipt_signature_failures)
+        cp = checkpoints.get(device.pk)
+        from_day = cp.fiscal_day_no if cp else None
+        recorded_qs = FiscalDay.objects.filter(device=device)
+        if from_day is not None:
+            recorded_qs = recorded_qs.filter(fiscal_day_no__gte=from_day)
+        recorded = set(recorded_qs.values_list("fiscal_day_no", flat=True))
+        for day in sorted(set(_receipt_days(device, from_day)) | recorded):
+            if cp and day == cp.fiscal_day_no:
+                units.append((device.pk, day, day in recorded, cp.receipt_counter, cp.chain_hash))
+            else:
+                units.append((device.pk, day, day in recorded, 0, None))
+    return units
+
+
+def _checkpoint_anchor_error(device: FiscalDevice, cp: AuditCheckpoint) -> str | None:
+    """The checkpointed receipt must still exist with the hash it was verified with."""
+    stored = (
+        Receipt.objects.filter(device=device, fiscal_day_no=cp.fiscal_day_no, receipt_counter=cp.receipt_counter)
+        .values_list("receipt_global_no", "receipt_hash")
+        .first()
+    )
+    if stored is None:
+        return f"Device {device.device_id}: checkpoint receipt {cp.receipt_global_no} no longer exists"
+    if stored[0] != cp.receipt_global_no or (stored[1] and stored[1] != cp.chain_hash):
+        return f"Device {device.device_id}: checkpoint receipt {cp.receipt_global_no} changed since last audit"
+    return None
+
+
+def _init_audit_worker() -> None:
+    """Pool initializer: set up Django (spawn) and drop DB connections inherited via fork."""
+    import django
+    from django.db import connections
+
+    django.setup()
+    connections.close_all()
+
+
+def _unit_part_path(part_dir: str | None, unit: tuple) -> str | None:
+    return os.path.join(part_dir, "unit-%s-%s.ndjson" % unit[:2]) if part_dir else None
+
+
+def _run_audit_unit(unit: tuple, part_dir: str | None = None) -> tuple[AuditResult, tuple | None]:
+    return audit_unit(*unit, report_path=_unit_part_path(part_dir, unit))
+
+
+def _map_units(units: list[tuple], workers: int, part_dir: str | None = None):
+    """Yield (unit, (result, tail)) in unit order, in-process or on a process pool."""
+    from django.db import connections
+
+    run_unit = partial(_run_audit_unit, part_dir=part_dir)
+    if workers <= 1 or len(units) <= 1:
+        for unit in units:
+            yield unit, run_unit(unit)
+        return
+    workers = min(workers, len(units))
+    chunksize = max(1, len(units) // (workers * 4))
+    # Forked children must not share the parent's database connection.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_audit_worker) as pool:
+        yield from zip(units, pool.map(run_unit, units, chunksize=chunksize))
+
+
+def _save_checkpoint(device_pk: int, tail: tuple, receipts_checked: int, full: bool) -> None:
+    fiscal_day_no, receipt_counter, receipt_global_no, chain_hash = tail
+    cp = AuditCheckpoint.objects.filter(device_id=device_pk).first()
+    verified = receipts_checked if full or cp is None else cp.receipts_verified + receipts_checked
+    AuditCheckpoint.objects.update_or_create(
+        device_id=device_pk,
+        defaults={
+            "fiscal_day_no": fiscal_day_no,
+            "receipt_counter": receipt_counter,
+            "receipt_global_no": receipt_global_no,
+            "chain_hash": chain_hash,
+            "receipts_verified": verified,
+        },
+    )
 
-        counter_result = validate_fiscal_day_counters(device)
-        combined.fiscal_days_checked += counter_result.fiscal_days_checked
-        combined.fiscal_day_counter_errors.extend(counter_result.fiscal_day_counter_errors)
 
+def run_audit(workers: int = 1, full: bool = False, report_path: str | None = None) -> AuditResult:
+    """
+    Integrity audit across all registered devices.
+    Incremental from each device's AuditCheckpoint unless full=True. workers > 1 runs the
+    (device, fiscal day) units on a process pool. Devices with no findings get their
+    checkpoint advanced to the last verified receipt.
+    With report_path, every finding is written there as NDJSON (in unit order, each unit
+    via its own part file) followed by a {"kind": "summary"} line.
+    """
+    sink = NdjsonReportWriter(report_path) if report_path else None
+    part_dir = tempfile.mkdtemp(prefix="audit-", dir=os.path.dirname(os.path.abspath(report_path))) if sink else None
+    try:
+        devices = list(FiscalDevice.objects.filter(is_registered=True).order_by("pk"))
+        combined = AuditResult(devices_checked=len(devices), sink=sink)
+        checkpoints = {}
+        if not full:
+            for cp in AuditCheckpoint.objects.filter(device__in=devices).select_related("device"):
+                err = _checkpoint_anchor_error(cp.device, cp)
+                if err:
+                    combined.add_finding("receipt_chain", err, device_id=cp.device.device_id, fiscal_day_no=cp.fiscal_day_no)
+                    logger.warning("Audit checkpoint invalid, re-verifying from genesis: %s", err)
+                else:
+                    checkpoints[cp.device_id] = cp
+        units = build_audit_units(devices, checkpoints)
+
+        # Per device: [findings, receipts_checked, chain tail]
+        per_device: dict[int, list] = {}
+        for unit, (unit_result, tail) in _map_units(units, workers, part_dir):
+            combined.merge(unit_result)
+            if part_dir:
+                part = _unit_part_path(part_dir, unit)
+                sink.append_file(part)
+                os.remove(part)
+            acc = per_device.setdefault(unit[0], [0, 0, None])
+            acc[0] += unit_result.findings_count
+            acc[1] += unit_result.receipts_checked
+            if tail is not None:
+                acc[2] = tail
+
+        for device_pk, (findings, receipts_checked, tail) in per_device.items():
+            if tail is not None and not findings:
+                _save_checkpoint(device_pk, tail, receipts_checked, full or device_pk not in checkpoints)
+        logger.info(
+            "Integrity audit (%s): %s units on %s workers, %s receipts, %s findings",
+            "full" if full else "incremental", len(units), max(1, workers),
+            combined.receipts_checked, combined.findings_count,
+        )
+        if sink is not None:
+            sink.write({
+                "kind": "summary",
+                "mode": "full" if full else "incremental",
+                "devices_checked": combined.devices_checked,
+                "receipts_checked": combined.receipts_checked,
+                "fiscal_days_checked": combined.fiscal_days_checked,
+                "findings": combined.findings_count,
+            })
+    finally:
+        if sink is not None:
+            sink.close()
+            shutil.rmtree(part_dir, ignore_errors=True)
+    combined.sink = None
     return combined
+
+
+def run_full_audit(workers: int = 1) -> AuditResult:
+    """Run full integrity audit across all devices (from genesis)."""
+    return run_audit(workers=workers, full=True)
@@ -0,0 +1,76 @@
+"""
+Shared helpers for generation-keyed caches in the Django cache backend.
+A generation counter is bumped (after commit) whenever the underlying rows change;
+cache keys embed the current generation, so stale entries are simply never read again
+and expire by TTL. Nothing is stored while inside an atomic block, so uncommitted
+state never leaks into the cache.
+"""
+
+import logging
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger("fiscal")
+
+_GEN_PREFIX = "fdms:gen:"
+
+
+def cache_enabled() -> bool:
+    """False inside transaction.atomic() (uncommitted data must not be cached)."""
+    return not connection.in_atomic_block
+
+
+def get_generation(name: str) -> int:
+    """Current generation for a cache namespace. Starts at 1."""
+    key = _GEN_PREFIX + name
+    gen = cache.get(key)
+    if gen is None:
+        cache.add(key, 1, timeout=None)
+        gen = cache.get(key) or 1
+    return int(gen)
+
+
+def bump_generation(name: str) -> None:
+    """Invalidate every entry of a namespace by moving to the next generation."""
+    key = _GEN_PREFIX + name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
+    except Exception:
+        logger.exception("Cache generation bump failed for %s", name)
+
+
+def bump_generation_on_commit(name: str) -> None:
+    """Bump once the current transaction commits (immediately if not in one)."""
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+def get_or_compute(key: str, compute, ttl: int, lock_timeout: int = 10, wait: float = 2.0):
+    """
+    Return cached value for key, computing it at most once across concurrent callers.
+    The first caller takes a short lock (cache.add) and computes; others poll for the
+    result up to `wait` seconds, then compute themselves rather than block the request.
+    """
+    if not cache_enabled():
+        return compute()
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = key + ":lock"
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout=ttl)
+            return value
+        finally:
+            cache.delete(lock_key)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
@@ -9,7 +9,11 @@ Do NOT net. Only abs() for CreditNote tax counters. BalanceByMoneyType uses sign
 from collections import defaultdict
 from decimal import Decimal, ROUND_HALF_UP
 
-from fiscal.models import FiscalDevice, Receipt
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+
+from fiscal.models import FiscalDevice, Receipt, ReceiptPaymentLine, ReceiptTaxLine
+from fiscal.services.receipt_lines import bulk_sync_receipt_lines
 
 # Map payment method/moneyTypeCode to canonical format for BALANCEBYMONEYTYPEUSDCASH (FDMS spec)
 _CLOSE_DAY_MONEY_TYPE_MAP = {
@@ -41,62 +45,130 @@ def _to_decimal(value) -> Decimal:
         return Decimal("0")
 
 
+def _to_cents_decimal(value) -> Decimal:
+    """Amount rounded to cents (ROUND_HALF_UP), as receipt lines and running counters store it."""
+    return _to_decimal(value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
 def _round2(value: Decimal) -> float:
     return float(value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
 
 
+def receipt_counter_contributions(receipt) -> dict:
+    """
+    Counter amounts contributed by one receipt (no fiscalised check). Each tax/payment amount
+    is rounded to cents first, so a rebuild from receipt JSON, the line-based build and the
+    running FiscalDayCounter rows all add up the same values.
+    Returns dict: key = (counter_type, currency, tax_id_or_money, tax_pct_or_none), value = Decimal.
+    """
+    contributions: dict[tuple, Decimal] = defaultdict(Decimal)
+    currency = (receipt.currency or "USD").strip().upper()
+    rt = (receipt.receipt_type or "").strip().upper()
+    if rt in ("FISCALINVOICE", "FISCALRECEIPT", ""):
+        counter_sales = "SaleByTax"
+        counter_tax = "SaleTaxByTax"
+    elif rt in ("CREDITNOTE",):
+        counter_sales = "CreditNoteByTax"
+        counter_tax = "CreditNoteTaxByTax"
+    elif rt in ("DEBITNOTE",):
+        counter_sales = "DebitNoteByTax"
+        counter_tax = "DebitNoteTaxByTax"
+    else:
+        return contributions
+
+    for tax in receipt.receipt_taxes or []:
+        tax_id = tax.get("taxID")
+        if tax_id is not None:
+            tax_id = int(tax_id)
+        else:
+            tax_id = 1
+        percent = tax.get("taxPercent", tax.get("fiscalCounterTaxPercent"))
+        if percent is None:
+            continue
+        pct = round(float(percent), 2)
+        sales_with_tax = _to_cents_decimal(tax.get("salesAmountWithTax", tax.get("fiscalCounterValue")) or 0)
+        tax_amt = _to_cents_decimal(tax.get("taxAmount") or 0)
+
+        contributions[(counter_sales, currency, tax_id, pct)] += sales_with_tax
+        contributions[(counter_tax, currency, tax_id, pct)] += tax_amt
+
+    for pay in receipt.receipt_payments or []:
+        amt = _to_cents_decimal(pay.get("paymentAmount", pay.get("amount")) or 0)
+        method = str(
+            pay.get("moneyTypeCode") or pay.get("moneyType") or pay.get("method") or "CASH"
+        ).strip().upper()
+        money_type = _CLOSE_DAY_MONEY_TYPE_MAP.get(method, "CASH")
+        contributions[("BalanceByMoneyType", currency, money_type, None)] += amt
+
+    return contributions
+
+
 def build_fiscal_day_counters(receipts) -> dict:
     """
     Aggregate counters by receipt type. Do NOT net invoices and credits.
     Returns dict: key = (counter_type, currency, tax_id_or_money, tax_pct_or_none), value = Decimal.
     """
     counters: dict[tuple, Decimal] = defaultdict(Decimal)
-
     for receipt in receipts:
-        currency = (receipt.currency or "USD").strip().upper()
-        rt = (receipt.receipt_type or "").strip().upper()
-        if rt in ("FISCALINVOICE", "FISCALRECEIPT", ""):
-            counter_sales = "SaleByTax"
-            counter_tax = "SaleTaxByTax"
-        elif rt in ("CREDITNOTE",):
-            counter_sales = "CreditNoteByTax"
-            counter_tax = "CreditNoteTaxByTax"
-        elif rt in ("DEBITNOTE",):
-            counter_sales = "DebitNoteByTax"
-            counter_tax = "DebitNoteTaxByTax"
-        else:
-            continue
+        for key, value in receipt_counter_contributions(receipt).items():
+            counters[key] += value
+    return counters
 
-        for tax in receipt.receipt_taxes or []:
-            tax_id = tax.get("taxID")
-            if tax_id is not None:
-                tax_id = int(tax_id)
-            else:
-                tax_id = 1
-            percent = tax.get("taxPercent", tax.get("fiscalCounterTaxPercent"))
-            if percent is None:
-                continue
-            pct = round(float(percent), 2)
-            sales_with_tax = _to_decimal(tax.get("salesAmountWithTax", tax.get("fiscalCounterValue")) or 0)
-            tax_amt = _to_decimal(tax.get("taxAmount") or 0)
-
-            if rt in ("CREDITNOTE",):
-                sales_with_tax = sales_with_tax
-                tax_amt = tax_amt
-
-            key_sales = (counter_sales, currency, tax_id, pct)
-            key_tax = (counter_tax, currency, tax_id, pct)
-            counters[key_sales] += sales_with_tax
-            counters[key_tax] += tax_amt
-
-        for pay in receipt.receipt_payments or []:
-            amt = _to_decimal(pay.get("paymentAmount", pay.get("amount")) or 0)
-            method = str(
-                pay.get("moneyTypeCode") or pay.get("moneyType") or pay.get("method") or "CASH"
-            ).strip().upper()
-            money_type = _CLOSE_DAY_MONEY_TYPE_MAP.get(method, "CASH")
-            key = ("BalanceByMoneyType", currency, money_type, None)
-            counters[key] += amt
+
+_RECEIPT_TYPE_COUNTERS = {
+    "FISCALINVOICE": ("SaleByTax", "SaleTaxByTax"),
+    "FISCALRECEIPT": ("SaleByTax", "SaleTaxByTax"),
+    "": ("SaleByTax", "SaleTaxByTax"),
+    "CREDITNOTE": ("CreditNoteByTax", "CreditNoteTaxByTax"),
+    "DEBITNOTE": ("DebitNoteByTax", "DebitNoteTaxByTax"),
+}
+
+
+def _sync_missing_lines(device: FiscalDevice, fiscal_day_no: int) -> None:
+    """Write lines for any fiscalised receipt of the day that has none (pre-backfill data)."""
+    missing = get_day_receipts(device, fiscal_day_no).filter(
+        tax_lines__isnull=True, payment_lines__isnull=True
+    )
+    bulk_sync_receipt_lines(missing)
+
+
+def build_fiscal_day_counters_from_lines(device: FiscalDevice, fiscal_day_no: int) -> dict:
+    """
+    Same result as build_fiscal_day_counters(get_day_receipts(...)), computed with two
+    GROUP BY queries over ReceiptTaxLine / ReceiptPaymentLine instead of loading receipts.
+    """
+    counters: dict[tuple, Decimal] = defaultdict(Decimal)
+    fiscalised = dict(
+        device=device,
+        fiscal_day_no=fiscal_day_no,
+        receipt__fdms_receipt_id__isnull=False,
+        receipt_type__in=tuple(_RECEIPT_TYPE_COUNTERS),
+    )
+
+    tax_rows = (
+        ReceiptTaxLine.objects.filter(**fiscalised, tax_percent__isnull=False)
+        .exclude(receipt__fdms_receipt_id=0)
+        .annotate(tid=Coalesce("tax_id", Value(1)))
+        .values("receipt_type", "currency", "tid", "tax_percent")
+        .annotate(sales=Sum("sales_amount_with_tax_cents"), tax=Sum("tax_amount_cents"))
+        .order_by("receipt_type", "currency", "tid", "tax_percent")
+    )
+    for row in tax_rows:
+        counter_sales, counter_tax = _RECEIPT_TYPE_COUNTERS[row["receipt_type"]]
+        pct = round(float(row["tax_percent"]), 2)
+        counters[(counter_sales, row["currency"], row["tid"], pct)] += Decimal(row["sales"] or 0) / 100
+        counters[(counter_tax, row["currency"], row["tid"], pct)] += Decimal(row["tax"] or 0) / 100
+
+    pay_rows = (
+        ReceiptPaymentLine.objects.filter(**fiscalised)
+        .exclude(receipt__fdms_receipt_id=0)
+        .values("currency", "money_type")
+        .annotate(amount=Sum("payment_amount_cents"))
+        .order_by("currency", "money_type")
+    )
+    for row in pay_rows:
+        money_type = _CLOSE_DAY_MONEY_TYPE_MAP.get(row["money_type"], "CASH")
+        counters[("BalanceByMoneyType", row["currency"], money_type, None)] += Decimal(row["amount"] or 0) / 100
 
     return counters
 
@@ -158,10 +230,18 @@ def sort_fiscal_counters(counters: list[dict]) -> list[dict]:
 
 def build_close_day_counters(device: FiscalDevice, fiscal_day_no: int) -> list[dict]:
     """
-    Build FDMS fiscalDayCounters from receipts for the fiscal day.
+    Build FDMS fiscalDayCounters for the fiscal day.
     Separate counters for Sale, CreditNote, DebitNote. Do NOT net.
+    Read from the running FiscalDayCounter rows; a day without rows is aggregated in SQL
+    from the normalised receipt lines and stored.
     """
-    receipts = get_day_receipts(device, fiscal_day_no)
-    counter_dict = build_fiscal_day_counters(receipts)
+    from fiscal.services.fiscal_day_counters import get_day_counters, store_day_counters
+
+    counter_dict = get_day_counters(device, fiscal_day_no)
+    if counter_dict is None:
+        _sync_missing_lines(device, fiscal_day_no)
+        counter_dict = build_fiscal_day_counters_from_lines(device, fiscal_day_no)
+        if counter_dict:
+            store_day_counters(device, fiscal_day_no, counter_dict)
     fdms_counters = convert_to_fdms_format(counter_dict)
     return sort_fiscal_counters(fdms_counters)
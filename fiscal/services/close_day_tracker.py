@@ -0,0 +1,223 @@
+"""
+CloseDay completion tracking as a persistent state machine.
+
+CloseDay only initiates closing; FDMS reports the outcome through GetStatus. Instead of
+a worker sleeping between polls, each device day gets a CloseDayTracker row and every
+re-check is a separate Celery task scheduled with a countdown:
+
+    PENDING --FiscalDayClosed------> CLOSED     (emits fiscal.closed, seals FiscalDay)
+    PENDING --FiscalDayCloseFailed-> FAILED     (emits fiscal.close_failed)
+    PENDING --deadline passed------> TIMED_OUT  (emits fiscal.close_failed)
+
+Delays back off geometrically from FDMS_CLOSE_DAY_POLL_INITIAL to FDMS_CLOSE_DAY_POLL_MAX
+seconds (GetStatus errors back off twice as fast). A check claims the tracker by moving
+next_check_at forward, so duplicate deliveries are no-ops; resume_stale_trackers
+re-enqueues trackers whose scheduled message was lost (worker restart).
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from fiscal.models import CloseDayTracker, FiscalDay, FiscalDevice
+
+logger = logging.getLogger("fiscal")
+
+# How long a claimed check may run (GetStatus timeout is 30s) before another may claim it.
+_CLAIM_LEASE_SECONDS = 60
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def next_check_delay(attempts: int, error: bool = False) -> int:
+    """Seconds until the next GetStatus for a tracker that has been checked `attempts` times."""
+    initial = _setting("FDMS_CLOSE_DAY_POLL_INITIAL", 5)
+    maximum = _setting("FDMS_CLOSE_DAY_POLL_MAX", 60)
+    factor = _setting("FDMS_CLOSE_DAY_POLL_FACTOR", 1.5)
+    if error:
+        factor *= 2
+    delay = min(maximum, initial * (factor ** max(0, attempts - 1)))
+    # +/-10% jitter so devices closed together do not poll in lockstep.
+    return max(1, int(round(delay * random.uniform(0.9, 1.1))))
+
+
+def schedule_check(tracker_id: int, countdown: int) -> None:
+    """Enqueue a status check once the current transaction commits."""
+    from fiscal.tasks import check_close_day_status_task
+
+    def _send():
+        try:
+            check_close_day_status_task.apply_async(args=[tracker_id], countdown=countdown)
+        except Exception as e:
+            logger.warning("Could not schedule CloseDay status check for tracker %s: %s", tracker_id, e)
+
+    transaction.on_commit(_send)
+
+
+def start_close_day_tracking(device: FiscalDevice, fiscal_day_no: int, operation_id: str = "") -> CloseDayTracker:
+    """Create (or restart, after a failed close) the tracker for the day and schedule the first check."""
+    now = timezone.now()
+    delay = next_check_delay(1)
+    tracker, _ = CloseDayTracker.objects.update_or_create(
+        device=device,
+        fiscal_day_no=fiscal_day_no,
+        defaults={
+            "operation_id": operation_id or "",
+            "state": CloseDayTracker.STATE_PENDING,
+            "attempts": 0,
+            "last_status": "FiscalDayCloseInitiated",
+            "last_error": "",
+            "closing_error_code": "",
+            "next_check_at": now + timedelta(seconds=delay),
+            "deadline_at": now + timedelta(seconds=_setting("FDMS_CLOSE_DAY_POLL_TIMEOUT", 900)),
+            "started_at": now,
+            "finished_at": None,
+        },
+    )
+    schedule_check(tracker.pk, delay)
+    return tracker
+
+
+def _claim(tracker_id: int) -> CloseDayTracker | None:
+    """Lock the tracker and take the due check, or None if finished / not due / already claimed."""
+    now = timezone.now()
+    with transaction.atomic():
+        tracker = (
+            CloseDayTracker.objects.select_for_update()
+            .select_related("device")
+            .filter(pk=tracker_id)
+            .first()
+        )
+        if tracker is None or tracker.state != CloseDayTracker.STATE_PENDING:
+            return None
+        if tracker.next_check_at and tracker.next_check_at > now + timedelta(seconds=1):
+            return None
+        tracker.attempts += 1
+        tracker.next_check_at = now + timedelta(seconds=_CLAIM_LEASE_SECONDS)
+        tracker.save(update_fields=["attempts", "next_check_at", "updated_at"])
+    return tracker
+
+
+def _mark_fiscal_day_closed(tracker: CloseDayTracker) -> None:
+    """Record the close on the FiscalDay row and seal its receipt Merkle root."""
+    from fiscal.services.fiscal_day_merkle import seal_fiscal_day
+
+    FiscalDay.objects.filter(device=tracker.device, fiscal_day_no=tracker.fiscal_day_no).exclude(
+        status="FiscalDayClosed"
+    ).update(status="FiscalDayClosed", closed_at=tracker.finished_at)
+    try:
+        seal_fiscal_day(tracker.device, tracker.fiscal_day_no)
+    except Exception:
+        logger.exception("Sealing fiscal day %s failed for tracker %s", tracker.fiscal_day_no, tracker.pk)
+
+
+def _finish(tracker: CloseDayTracker, state: str, status_data: dict | None = None, **fields) -> None:
+    from fiscal.services.activity_audit import log_activity, log_audit
+    from fiscal.services.fdms_events import emit_metrics_updated, emit_to_device
+
+    tracker.state = state
+    tracker.finished_at = timezone.now()
+    tracker.next_check_at = None
+    for name, value in fields.items():
+        setattr(tracker, name, value)
+    tracker.save()
+
+    device = tracker.device
+    event = {
+        "fiscal_day_no": tracker.fiscal_day_no,
+        "operation_id": tracker.operation_id,
+        "status": tracker.last_status,
+    }
+    if state == CloseDayTracker.STATE_CLOSED:
+        _mark_fiscal_day_closed(tracker)
+        emit_to_device(device.device_id, "fiscal.closed", event)
+        log_activity(device, "fiscal_day_closed", f"Fiscal day #{tracker.fiscal_day_no} closed", "info")
+        log_audit(device, "fiscal_day_closed", {"fiscal_day_no": tracker.fiscal_day_no, "attempts": tracker.attempts})
+    else:
+        error = tracker.last_error or tracker.closing_error_code or tracker.last_status
+        emit_to_device(
+            device.device_id,
+            "fiscal.close_failed",
+            {**event, "error": error, "closing_error_code": tracker.closing_error_code},
+        )
+        log_activity(device, "fiscal_close_failed", f"Fiscal day #{tracker.fiscal_day_no}: {error}", "error")
+        log_audit(device, "fiscal_day_close_failed", {
+            "fiscal_day_no": tracker.fiscal_day_no,
+            "state": state,
+            "error": error,
+            "closing_error_code": tracker.closing_error_code,
+        })
+    emit_metrics_updated()
+
+    try:
+        from fiscal.services.fleet_close import on_tracker_finished
+
+        on_tracker_finished(tracker, status_data)
+    except Exception:
+        logger.exception("Fleet close update failed for tracker %s", tracker.pk)
+
+
+def check_close_day_status(tracker_id: int) -> tuple[CloseDayTracker | None, int | None]:
+    """
+    Run one GetStatus for a pending tracker and advance its state.
+    Returns (tracker, seconds_until_next_check); the delay is None when no re-check is needed.
+    """
+    tracker = _claim(tracker_id)
+    if tracker is None:
+        return None, None
+
+    from fiscal.services.device_api import DeviceApiService
+
+    data, err = DeviceApiService().get_status(tracker.device)
+    status = (data or {}).get("fiscalDayStatus") or ""
+    if err:
+        tracker.last_error = err
+    else:
+        tracker.last_status = status
+        tracker.last_error = ""
+
+    last_day = (data or {}).get("lastFiscalDayNo")
+    reopened = status == "FiscalDayOpened" and last_day is not None and int(last_day) > tracker.fiscal_day_no
+    if status == "FiscalDayClosed" or reopened:
+        _finish(tracker, CloseDayTracker.STATE_CLOSED, status_data=data)
+        return tracker, None
+    if status == "FiscalDayCloseFailed":
+        code = (data or {}).get("fiscalDayClosingErrorCode") or ""
+        _finish(tracker, CloseDayTracker.STATE_FAILED, status_data=data, closing_error_code=str(code)[:50])
+        return tracker, None
+
+    now = timezone.now()
+    if now >= tracker.deadline_at:
+        tracker.last_error = tracker.last_error or "Polling timeout"
+        _finish(tracker, CloseDayTracker.STATE_TIMED_OUT)
+        return tracker, None
+
+    delay = next_check_delay(tracker.attempts, error=bool(err))
+    delay = max(1, min(delay, int((tracker.deadline_at - now).total_seconds()) + 1))
+    tracker.next_check_at = now + timedelta(seconds=delay)
+    tracker.save(update_fields=["last_status", "last_error", "next_check_at", "updated_at"])
+    logger.info(
+        "CloseDay pending: device=%s day=%s status=%s attempt=%s next check in %ss",
+        tracker.device.device_id, tracker.fiscal_day_no, status or err, tracker.attempts, delay,
+    )
+    return tracker, delay
+
+
+def resume_stale_trackers(grace_seconds: int = 120) -> int:
+    """Re-enqueue pending trackers whose check is overdue (lost message). Returns count."""
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    ids = list(
+        CloseDayTracker.objects.filter(state=CloseDayTracker.STATE_PENDING, next_check_at__lt=cutoff)
+        .values_list("pk", flat=True)
+    )
+    for tracker_id in ids:
+        schedule_check(tracker_id, 0)
+    if ids:
+        logger.info("Resumed %s overdue CloseDay tracker(s)", len(ids))
+    return len(ids)
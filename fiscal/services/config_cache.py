@@ -0,0 +1,127 @@
+"""
+In-process snapshot cache for FDMS configs (GetConfig) and active TaxMappings.
+
+A receipt submission reads the latest FDMSConfigs and the TaxMapping table several
+times (freshness check, validation, enrichment, recalculation). Snapshots are kept per
+process, keyed by device, and tagged with the "fdms_configs" cache generation (see
+cache_utils). Any FDMSConfigs or TaxMapping save/delete (persist_configs included) bumps
+the generation after commit via fiscal.signals, so steady-state reads cost one cache
+lookup and no database queries. With a per-process cache backend the generation does
+not cross processes, so FDMS_CONFIG_CACHE_TTL bounds how long a snapshot is reused.
+
+Snapshots are shared between callers: treat the FDMSConfigs instance as read-only.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from fiscal.models import FDMSConfigs, TaxMapping
+from fiscal.services.cache_utils import bump_generation_on_commit, cache_enabled, get_generation
+from fiscal.services.tax_resolver import TAX_CODE_MAX_LENGTH, TaxResolver
+
+CONFIG_CACHE_NAMESPACE = "fdms_configs"
+
+
+@dataclass(frozen=True)
+class TaxMappingEntry:
+    """Active TaxMapping row, normalised once."""
+
+    local_code: str  # stripped
+    fdms_tax_id: int
+    fdms_tax_code: str | None  # override, max 3 chars, None when blank
+    tax_percent: float | None
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    configs: FDMSConfigs | None
+    tax_mappings: tuple[TaxMappingEntry, ...]
+    # Tax maps precompiled from configs.tax_table + tax_mappings (see tax_resolver).
+    resolver: TaxResolver
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+_lock = threading.Lock()
+_snapshots: dict = {}
+
+
+def _ttl() -> float:
+    return getattr(settings, "FDMS_CONFIG_CACHE_TTL", 300)
+
+
+def _load_latest_configs(device_id: int | None) -> FDMSConfigs | None:
+    qs = FDMSConfigs.objects.all()
+    if device_id is not None:
+        qs = qs.filter(device_id=device_id)
+    return qs.order_by("-fetched_at").first()
+
+
+def _load_tax_mappings() -> tuple[TaxMappingEntry, ...]:
+    entries = []
+    for m in TaxMapping.objects.filter(is_active=True).order_by("sort_order", "local_code"):
+        entries.append(TaxMappingEntry(
+            local_code=str(m.local_code or "").strip(),
+            fdms_tax_id=m.fdms_tax_id,
+            fdms_tax_code=(str(m.fdms_tax_code or "").strip()[:TAX_CODE_MAX_LENGTH]) or None,
+            tax_percent=float(m.tax_percent) if m.tax_percent is not None else None,
+        ))
+    return tuple(entries)
+
+
+def _build(device_id: int | None, version: int) -> ConfigSnapshot:
+    mappings = _load_tax_mappings()
+    configs = _load_latest_configs(device_id)
+    resolver = TaxResolver.build(configs, mappings)
+    if configs is not None:
+        configs._tax_resolver = resolver
+    return ConfigSnapshot(
+        version=version,
+        configs=configs,
+        tax_mappings=mappings,
+        resolver=resolver,
+    )
+
+
+def get_config_snapshot(device_id: int | None = None) -> ConfigSnapshot:
+    """Latest configs for the device (None: latest of any device) plus active TaxMappings."""
+    if not cache_enabled():
+        # Inside a transaction: read uncommitted state directly and do not cache it.
+        return _build(device_id, 0)
+    version = get_generation(CONFIG_CACHE_NAMESPACE)
+    snapshot = _snapshots.get(device_id)
+    if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < _ttl():
+        return snapshot
+    snapshot = _build(device_id, version)
+    with _lock:
+        _snapshots[device_id] = snapshot
+    return snapshot
+
+
+def get_tax_resolver(configs: FDMSConfigs | None) -> TaxResolver:
+    """
+    Resolver for these configs. Configs returned by get_latest_configs carry the resolver
+    of their snapshot (no lookup; TaxMappings as of that snapshot), others get one built
+    against the current TaxMappings.
+    """
+    resolver = getattr(configs, "_tax_resolver", None)
+    if resolver is not None:
+        return resolver
+    snapshot = get_config_snapshot(configs.device_id if configs else None)
+    if snapshot.configs is configs:
+        return snapshot.resolver
+    return TaxResolver.build(configs, snapshot.tax_mappings)
+
+
+def invalidate_config_cache() -> None:
+    """Drop every snapshot (all processes sharing the cache) once the transaction commits."""
+    bump_generation_on_commit(CONFIG_CACHE_NAMESPACE)
+
+
+def clear_local_config_cache() -> None:
+    """Forget this process's snapshots (tests)."""
+    with _lock:
+        _snapshots.clear()
@@ -0,0 +1,154 @@
+"""
+Scheduled GetConfig refresh for every registered device.
+
+Submissions are blocked once a device's configs are 24h old (configs_are_fresh). The
+fiscal.refresh_configs_task beat entry calls schedule_config_refresh, which finds
+devices whose configs are older than FDMS_CONFIG_REFRESH_AGE (or missing) and enqueues
+one fiscal.refresh_device_config_task per device, FDMS_CONFIG_REFRESH_CONCURRENCY per
+wave, waves FDMS_CONFIG_REFRESH_SPACING seconds apart, each with up to
+FDMS_CONFIG_REFRESH_JITTER seconds of random delay.
+
+Per-device state lives in ConfigRefreshState. A failed refresh is retried with
+exponential backoff. After FDMS_CONFIG_REFRESH_ALERT_AFTER consecutive failures the
+device is alerted once per streak: an error log, an ActivityEvent and a
+config_refresh.failed dashboard event.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from fiscal.models import ConfigRefreshState, FDMSConfigs, FiscalDevice
+
+logger = logging.getLogger("fiscal")
+
+CONFIG_MAX_AGE = timedelta(hours=24)  # configs_are_fresh
+# Time allowed for a queued refresh to run before the device is considered due again.
+_QUEUE_LEASE_SECONDS = 300
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _latest_fetched_at():
+    return Subquery(
+        FDMSConfigs.objects.filter(device_id=OuterRef("device_id")).order_by("-fetched_at").values("fetched_at")[:1]
+    )
+
+
+def due_devices(now=None) -> list[FiscalDevice]:
+    """Registered devices whose configs need refreshing, oldest (or missing) first."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=_setting("FDMS_CONFIG_REFRESH_AGE", 43200))
+    devices = (
+        FiscalDevice.objects.filter(is_registered=True)
+        .annotate(configs_fetched_at=_latest_fetched_at())
+        .filter(Q(configs_fetched_at__isnull=True) | Q(configs_fetched_at__lt=cutoff))
+        .exclude(config_refresh_state__next_attempt_at__gt=now)
+    )
+    return sorted(devices, key=lambda d: (d.configs_fetched_at is not None, d.configs_fetched_at or now, d.device_id))
+
+
+def _enqueue(device_id: int, countdown: int) -> None:
+    from fiscal.tasks import refresh_device_config_task
+
+    def _send():
+        try:
+            refresh_device_config_task.apply_async(args=[device_id], countdown=countdown)
+        except Exception as e:
+            logger.warning("Could not enqueue config refresh for device %s: %s", device_id, e)
+
+    transaction.on_commit(_send)
+
+
+def schedule_config_refresh(now=None) -> list[int]:
+    """Enqueue refreshes for due devices in jittered waves. Returns the device IDs queued."""
+    now = now or timezone.now()
+    concurrency = max(1, _setting("FDMS_CONFIG_REFRESH_CONCURRENCY", 5))
+    spacing = _setting("FDMS_CONFIG_REFRESH_SPACING", 30)
+    jitter = _setting("FDMS_CONFIG_REFRESH_JITTER", 20)
+    queued = []
+    for index, device in enumerate(due_devices(now)):
+        countdown = (index // concurrency) * spacing + random.randint(0, max(0, jitter))
+        ConfigRefreshState.objects.update_or_create(
+            device=device,
+            defaults={"next_attempt_at": now + timedelta(seconds=countdown + _QUEUE_LEASE_SECONDS)},
+        )
+        _enqueue(device.device_id, countdown)
+        queued.append(device.device_id)
+    if queued:
+        logger.info("Config refresh queued for %s device(s)", len(queued))
+    return queued
+
+
+def refresh_device_config(device_id: int) -> tuple[dict | None, str | None]:
+    """GetConfig for one device and record the outcome on its ConfigRefreshState."""
+    from fiscal.services.device_api import DeviceApiService
+
+    device = FiscalDevice.objects.filter(device_id=device_id, is_registered=True).first()
+    if device is None:
+        return None, f"Device {device_id} not found or not registered"
+    state, _ = ConfigRefreshState.objects.get_or_create(device=device)
+    try:
+        data, err = DeviceApiService().get_config(device)
+    except Exception as e:
+        logger.exception("Config refresh for device %s failed", device_id)
+        data, err = None, str(e)
+
+    now = timezone.now()
+    state.last_attempt_at = now
+    if err:
+        _record_failure(state, err, now)
+    else:
+        state.consecutive_failures = 0
+        state.last_error = ""
+        state.last_success_at = now
+        state.next_attempt_at = None
+        state.alerted_at = None
+        state.save()
+    return data, err
+
+
+def _record_failure(state: ConfigRefreshState, error: str, now) -> None:
+    state.consecutive_failures += 1
+    state.last_error = error
+    delay = min(
+        _setting("FDMS_CONFIG_REFRESH_RETRY_DELAY", 300) * 2 ** (state.consecutive_failures - 1),
+        _setting("FDMS_CONFIG_REFRESH_RETRY_MAX", 3600),
+    )
+    state.next_attempt_at = now + timedelta(seconds=delay)
+    logger.warning(
+        "Config refresh for device %s failed (%s in a row), retry in %ss: %s",
+        state.device.device_id, state.consecutive_failures, delay, error,
+    )
+    if state.alerted_at is None and state.consecutive_failures >= _setting("FDMS_CONFIG_REFRESH_ALERT_AFTER", 3):
+        state.alerted_at = now
+        _alert(state)
+    state.save()
+
+
+def _alert(state: ConfigRefreshState) -> None:
+    from fiscal.services.activity_audit import log_activity
+    from fiscal.services.fdms_events import emit_to_dashboard
+
+    device = state.device
+    latest = FDMSConfigs.objects.filter(device_id=device.device_id).order_by("-fetched_at").first()
+    expires_at = latest.fetched_at + CONFIG_MAX_AGE if latest else None
+    message = (
+        f"GetConfig refresh failed {state.consecutive_failures} times in a row: {state.last_error}. "
+        + (f"Configs expire at {expires_at.isoformat()}." if expires_at else "No configs stored.")
+    )
+    logger.error("Device %s: %s", device.device_id, message)
+    log_activity(device, "config_refresh_failing", message, "error")
+    emit_to_dashboard("config_refresh.failed", {
+        "deviceId": device.device_id,
+        "failures": state.consecutive_failures,
+        "lastError": state.last_error,
+        "configsExpireAt": expires_at.isoformat() if expires_at else None,
+    })
@@ -0,0 +1,119 @@
+"""
+Response cache for the dashboard summary, receipts and errors APIs.
+Keyed by kind, device and range (plus status for receipts). Entries for a device live
+under that device's generation (dashboard:<device pk>), bumped after commit of its
+Receipt, ReceiptSubmissionResponse, FiscalDevice or FDMSApiLog writes (see
+fiscal.signals); fleet-wide and device-less entries live under the global "dashboard"
+generation, which every such write also bumps. Polling tabs of one device therefore keep
+hitting the cache while other devices are busy. Recompute is single-flight per key.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from fiscal.models import FiscalDevice
+from fiscal.services.cache_utils import bump_generation, bump_generation_on_commit, get_generation, get_or_compute
+from fiscal.services.dashboard_service import get_errors, get_fleet_summary, get_receipts, get_summary
+
+DASHBOARD_CACHE_NAMESPACE = "dashboard"
+DEVICE_MAP_NAMESPACE = "dashboard:devices"
+
+# FDMS endpoints carry the device id as a path segment: /Device/v1/<deviceID>/SubmitReceipt.
+_ENDPOINT_DEVICE_RE = re.compile(r"/(\d+)/")
+
+
+def _ttl() -> int:
+    return getattr(settings, "FDMS_DASHBOARD_CACHE_TTL", 30)
+
+
+def _device_namespace(device_pk: int) -> str:
+    return "%s:%s" % (DASHBOARD_CACHE_NAMESPACE, device_pk)
+
+
+def _device_pk(device_id: int | None) -> int | None:
+    """
+    FiscalDevice pk for an FDMS device id, as the dashboard services resolve it (registered
+    only; None otherwise, where they fall back to the first registered device).
+    """
+    if not device_id:
+        return None
+    pk = get_or_compute(
+        "fdms:dash:pk:%s:%s" % (get_generation(DEVICE_MAP_NAMESPACE), device_id),
+        lambda: FiscalDevice.objects.filter(device_id=device_id, is_registered=True)
+        .values_list("pk", flat=True).first() or 0,
+        ttl=_ttl(),
+    )
+    return pk or None
+
+
+def _key(kind: str, device_id: int | None, *parts) -> str:
+    device_pk = _device_pk(device_id)
+    namespace = _device_namespace(device_pk) if device_pk else DASHBOARD_CACHE_NAMESPACE
+    gen = get_generation(namespace)
+    return "fdms:dash:%s:%s:%s:%s" % (namespace, gen, kind, ":".join(str(p) for p in (device_id, *parts)))
+
+
+def invalidate_dashboard_cache(device_pk: int | None = None) -> None:
+    """
+    Once the current transaction commits, drop the fleet-wide and device-less entries and,
+    when given, device `device_pk`'s entries.
+    """
+    bump_generation_on_commit(DASHBOARD_CACHE_NAMESPACE)
+    if device_pk:
+        bump_generation_on_commit(_device_namespace(device_pk))
+
+
+def invalidate_dashboard_device(device_pk: int) -> None:
+    """A FiscalDevice row changed: its entries, the fleet ones and the device id map are stale."""
+    invalidate_dashboard_cache(device_pk)
+    bump_generation_on_commit(DEVICE_MAP_NAMESPACE)
+
+
+def invalidate_dashboard_for_endpoint(endpoint: str) -> None:
+    """An FDMS call was logged: invalidate the device named in its endpoint (fleet-wide if none)."""
+    match = _ENDPOINT_DEVICE_RE.search(endpoint or "")
+    if not match:
+        invalidate_dashboard_cache()
+        return
+
+    def bump():
+        bump_generation(DASHBOARD_CACHE_NAMESPACE)
+        device_pk = _device_pk(int(match.group(1)))
+        if device_pk:
+            bump_generation(_device_namespace(device_pk))
+
+    transaction.on_commit(bump)
+
+
+def cached_summary(device_id: int | None, range_key: str) -> dict:
+    return get_or_compute(
+        _key("summary", device_id, range_key),
+        lambda: get_summary(device_id, range_key),
+        ttl=_ttl(),
+    )
+
+
+def cached_receipts(device_id: int | None, range_key: str, status_filter: str | None) -> list:
+    return get_or_compute(
+        _key("receipts", device_id, range_key, status_filter),
+        lambda: get_receipts(device_id, range_key, status_filter),
+        ttl=_ttl(),
+    )
+
+
+def cached_errors(device_id: int | None, range_key: str) -> list:
+    return get_or_compute(
+        _key("errors", device_id, range_key),
+        lambda: get_errors(device_id, range_key),
+        ttl=_ttl(),
+    )
+
+
+def cached_fleet_summary(range_key: str, sort: str, page: int, page_size: int) -> dict:
+    return get_or_compute(
+        _key("fleet", None, range_key, sort, page, page_size),
+        lambda: get_fleet_summary(range_key, sort, page, page_size),
+        ttl=_ttl(),
+    )
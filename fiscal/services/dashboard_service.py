@@ -6,10 +6,33 @@ Read-only, immutable, audit-safe.
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-from django.db.models import Sum, Count, Q
+from django.db.models import (
+    BigIntegerField,
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from fiscal.models import FDMSApiLog, FiscalDay, FiscalDevice, Receipt
+from fiscal.models import (
+    FDMSApiLog,
+    FiscalDay,
+    FiscalDevice,
+    Receipt,
+    ReceiptSubmissionResponse,
+    ReceiptTaxLine,
+)
+
+# receipt_type as stored: FDMS casing (receipt_service) or the legacy/QB casing.
+_INVOICE_RECEIPT_TYPES = ("FISCALINVOICE", "FiscalInvoice")
+_CREDIT_NOTE_RECEIPT_TYPES = ("CREDITNOTE", "CreditNote")
 
 
 def _date_range(range_key: str):
@@ -51,38 +74,32 @@ def get_summary(device_id: int | None, range_key: str = "today") -> dict:
 
     fiscalised = receipts.filter(fdms_receipt_id__isnull=False).exclude(fdms_receipt_id=0)
     draft_receipts = receipts.filter(Q(fdms_receipt_id__isnull=True) | Q(fdms_receipt_id=0))
-    invoices = fiscalised.filter(receipt_type="FiscalInvoice")
-    credit_notes = fiscalised.filter(receipt_type="CreditNote")
+    invoices = fiscalised.filter(receipt_type__in=_INVOICE_RECEIPT_TYPES)
+    credit_notes = fiscalised.filter(receipt_type__in=_CREDIT_NOTE_RECEIPT_TYPES)
 
     net_result = fiscalised.aggregate(s=Sum("receipt_total"))
     net_total = net_result["s"] or Decimal("0")
 
-    vat_total = Decimal("0")
-    for r in fiscalised:
-        for t in r.receipt_taxes or []:
-            amt = t.get("taxAmount") or t.get("fiscalCounterValue") or 0
-            vat_total += Decimal(str(amt))
+    vat_cents = ReceiptTaxLine.objects.filter(receipt__in=fiscalised).aggregate(
+        s=Sum("tax_amount_cents")
+    )["s"] or 0
+    vat_total = Decimal(vat_cents) / 100
 
-    submit_failures = FDMSApiLog.objects.filter(
+    device_logs = FDMSApiLog.objects.filter(endpoint__icontains=f"/{device.device_id}/")
+    submit_failures = device_logs.filter(
         endpoint__icontains="SubmitReceipt",
         created_at__gte=start_dt,
         created_at__lte=end_dt,
     ).filter(Q(status_code__isnull=True) | Q(status_code__gte=400) | Q(error_message__isnull=False))
     failed_count = submit_failures.count()
 
-    last_open = FDMSApiLog.objects.filter(endpoint__icontains="OpenDay").order_by("-created_at").first()
-    last_close = FDMSApiLog.objects.filter(endpoint__icontains="CloseDay").order_by("-created_at").first()
+    last_open = device_logs.filter(endpoint__icontains="OpenDay").order_by("-created_at").first()
+    last_close = device_logs.filter(endpoint__icontains="CloseDay").order_by("-created_at").first()
 
-    cert_status = "VALID"
-    if device.certificate_valid_till:
-        days_left = (device.certificate_valid_till - timezone.now()).days
-        if days_left < 0:
-            cert_status = f"EXPIRED ({abs(days_left)} days ago)"
-        elif days_left < 14:
-            cert_status = f"EXPIRING ({days_left} days)"
+    cert_status = _certificate_status(device.certificate_valid_till)
 
     fdms_ok = device.fiscal_day_status not in (None, "")
-    last_log = FDMSApiLog.objects.order_by("-created_at").first()
+    last_log = device_logs.order_by("-created_at").first()
     last_sync = last_log.created_at.isoformat() if last_log and last_log.created_at else None
 
     return {
@@ -114,6 +131,18 @@ def get_summary(device_id: int | None, range_key: str = "today") -> dict:
     }
 
 
+def _certificate_status(valid_till) -> str:
+    """VALID, EXPIRING (<14 days) or EXPIRED, with day count."""
+    cert_status = "VALID"
+    if valid_till:
+        days_left = (valid_till - timezone.now()).days
+        if days_left < 0:
+            cert_status = f"EXPIRED ({abs(days_left)} days ago)"
+        elif days_left < 14:
+            cert_status = f"EXPIRING ({days_left} days)"
+    return cert_status
+
+
 def _get_alerts(device: FiscalDevice, cert_status: str, failed_count: int) -> list:
     """Build in-app alert list."""
     alerts = []
@@ -206,3 +235,116 @@ def get_quickbooks_stub() -> dict:
         "failed": qs.filter(fiscalised=False).exclude(fiscal_error="").count(),
         "lastWebhookTime": last_event,
     }
+
+
+FLEET_SORT_FIELDS = {
+    "deviceId": "device_id",
+    "status": "fiscal_day_status",
+    "receiptsFiscalised": "receipts_fiscalised",
+    "netTotal": "net_total",
+    "vatTotal": "vat_cents",
+    "failed": "failed_count",
+    "queueDepth": "queue_depth",
+    "certificateValidTill": "certificate_valid_till",
+}
+FLEET_MAX_PAGE_SIZE = 200
+
+
+def _scalar_subquery(qs, expr, output_field):
+    """Correlated per-device aggregate: one value, zero when the device has no rows."""
+    sub = qs.order_by().annotate(_one=Value(1)).values("_one").annotate(v=expr).values("v")[:1]
+    return Coalesce(Subquery(sub, output_field=output_field), Value(0), output_field=output_field)
+
+
+def get_fleet_summary(
+    range_key: str = "today",
+    sort: str = "deviceId",
+    page: int = 1,
+    page_size: int = 50,
+) -> dict:
+    """
+    Per-device status, counts, totals, failures, certificate expiry and queue depth for
+    every device, computed as correlated subqueries in one paginated SQL query (plus a count).
+    sort: any FLEET_SORT_FIELDS key, prefixed with "-" for descending.
+    """
+    from offline.models import OfflineReceiptQueue
+
+    start_dt, end_dt = _date_range(range_key)
+    page_size = max(1, min(int(page_size or 50), FLEET_MAX_PAGE_SIZE))
+    page = max(1, int(page or 1))
+
+    fiscalised = (
+        Receipt.objects.filter(device=OuterRef("pk"), created_at__gte=start_dt, created_at__lte=end_dt)
+        .filter(fdms_receipt_id__isnull=False)
+        .exclude(fdms_receipt_id=0)
+    )
+    drafts = Receipt.objects.filter(
+        device=OuterRef("pk"), created_at__gte=start_dt, created_at__lte=end_dt
+    ).filter(Q(fdms_receipt_id__isnull=True) | Q(fdms_receipt_id=0))
+    vat_lines = (
+        ReceiptTaxLine.objects.filter(
+            device=OuterRef("pk"),
+            receipt__created_at__gte=start_dt,
+            receipt__created_at__lte=end_dt,
+            receipt__fdms_receipt_id__isnull=False,
+        )
+        .exclude(receipt__fdms_receipt_id=0)
+    )
+    failures = ReceiptSubmissionResponse.objects.filter(
+        device=OuterRef("pk"), created_at__gte=start_dt, created_at__lte=end_dt, status_code__gte=400
+    )
+    queued = OfflineReceiptQueue.objects.filter(receipt__device=OuterRef("pk"), state="QUEUED")
+
+    count_field = IntegerField()
+    qs = FiscalDevice.objects.annotate(
+        receipts_fiscalised=_scalar_subquery(fiscalised, Count("pk"), count_field),
+        invoices_fiscalised=_scalar_subquery(fiscalised.filter(receipt_type__in=_INVOICE_RECEIPT_TYPES), Count("pk"), count_field),
+        credit_notes=_scalar_subquery(fiscalised.filter(receipt_type__in=_CREDIT_NOTE_RECEIPT_TYPES), Count("pk"), count_field),
+        drafts=_scalar_subquery(drafts, Count("pk"), count_field),
+        net_total=_scalar_subquery(fiscalised, Sum("receipt_total"), DecimalField(max_digits=18, decimal_places=2)),
+        vat_cents=_scalar_subquery(vat_lines, Sum("tax_amount_cents"), BigIntegerField()),
+        failed_count=_scalar_subquery(failures, Count("pk"), count_field),
+        queue_depth=_scalar_subquery(queued, Count("pk"), count_field),
+    ).only(
+        "device_id", "device_serial_no", "is_registered", "fiscal_day_status",
+        "last_fiscal_day_no", "last_receipt_global_no", "certificate_valid_till",
+    )
+
+    sort_key = sort or "deviceId"
+    descending = sort_key.startswith("-")
+    field = FLEET_SORT_FIELDS.get(sort_key.lstrip("-"), "device_id")
+    order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    qs = qs.order_by(order, "device_id")
+
+    total = FiscalDevice.objects.count()
+    offset = (page - 1) * page_size
+    devices = []
+    for d in qs[offset:offset + page_size]:
+        devices.append({
+            "deviceId": d.device_id,
+            "serialNo": d.device_serial_no,
+            "registered": d.is_registered,
+            "status": d.fiscal_day_status,
+            "fiscalDay": "OPEN" if d.fiscal_day_status == "FiscalDayOpened" else "CLOSED",
+            "fiscalDayNo": d.last_fiscal_day_no,
+            "lastReceiptGlobalNo": d.last_receipt_global_no,
+            "receiptsFiscalised": d.receipts_fiscalised,
+            "invoicesFiscalised": d.invoices_fiscalised,
+            "creditNotes": d.credit_notes,
+            "draft": d.drafts,
+            "netTotal": float(d.net_total or 0),
+            "vatTotal": float(Decimal(d.vat_cents or 0) / 100),
+            "failed": d.failed_count,
+            "queueDepth": d.queue_depth,
+            "certificate": _certificate_status(d.certificate_valid_till),
+            "certificateValidTill": d.certificate_valid_till.isoformat() if d.certificate_valid_till else None,
+        })
+    return {
+        "range": range_key,
+        "sort": sort_key,
+        "page": page,
+        "pageSize": page_size,
+        "total": total,
+        "pages": (total + page_size - 1) // page_size,
+        "devices": devices,
+    }
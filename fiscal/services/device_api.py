@@ -12,7 +12,7 @@ from decimal import Decimal
 from django.conf import settings
 
 from fiscal.models import FiscalDay, FiscalDevice, Receipt
-from fiscal.services.close_day_counter_builder import build_close_day_counters
+from fiscal.services.close_day_counter_builder import build_close_day_counters, get_day_receipts
 from fiscal.services.fdms_base import FDMSBaseService
 from fiscal.services.fdms_logger import log_fdms_call
 from fiscal.services.fiscal_signature import build_fiscal_day_canonical_string, sign_fiscal_day_report
@@ -140,7 +140,11 @@ class DeviceApiService(FDMSBaseService):
         logger.info("IssueCertificate OK for device %s", device_id)
         return device, None
 
-    def open_day(self, device: FiscalDevice) -> tuple[FiscalDay | None, str | None]:
+    def open_day(
+        self,
+        device: FiscalDevice,
+        status_data: dict | None = None,
+    ) -> tuple[FiscalDay | None, str | None]:
         """
         Open a new fiscal day. Calls getStatus first; only proceeds if FiscalDayClosed.
 
@@ -149,13 +153,16 @@ class DeviceApiService(FDMSBaseService):
 
         Args:
             device: FiscalDevice with certificate and private key.
+            status_data: GetStatus response the caller has just received (already applied
+                to device); skips the extra GetStatus call.
 
         Returns:
             tuple: (FiscalDay on success, None) or (None, error_message).
         """
-        status_data, err = self.get_status(device)
-        if err:
-            return None, f"GetStatus failed: {err}"
+        if status_data is None:
+            status_data, err = self.get_status(device)
+            if err:
+                return None, f"GetStatus failed: {err}"
         if status_data.get("fiscalDayStatus") != "FiscalDayClosed":
             status = status_data.get("fiscalDayStatus", "unknown")
             return None, f"Cannot open day: status must be FiscalDayClosed (current: {status})"
@@ -235,50 +242,14 @@ class DeviceApiService(FDMSBaseService):
         last_receipt_no: int | None,
     ) -> tuple[dict, str] | tuple[None, str]:
         """
-        Build CloseDay payload from receipts for the fiscal day.
-        Uses receipts as source of truth; never fabricates counters.
+        Build CloseDay payload for the fiscal day from the running FiscalDayCounter rows
+        (one COUNT for receiptCounter); never fabricates counters.
         """
-        receipts = Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no)
         fiscal_day_obj = FiscalDay.objects.filter(device=device, fiscal_day_no=fiscal_day_no).first()
         fiscal_day_date = fiscal_day_obj.opened_at.date() if fiscal_day_obj and fiscal_day_obj.opened_at else date.today()
 
-        if not receipts.exists():
-            receipt_counter = 0
-            counters: list[dict] = []
-            canonical = build_fiscal_day_canonical_string(
-                device_id=device.device_id,
-                fiscal_day_no=fiscal_day_no,
-                fiscal_day_date=fiscal_day_date,
-                fiscal_day_counters=counters,
-            )
-            sig = sign_fiscal_day_report(
-                device_id=device.device_id,
-                fiscal_day_no=fiscal_day_no,
-                fiscal_day_date=fiscal_day_date,
-                fiscal_day_counters=counters,
-                private_key_pem=device.get_private_key_pem_decrypted(),
-                certificate_pem=device.certificate_pem,
-            )
-            payload = {
-                "deviceID": device.device_id,
-                "fiscalDayNo": fiscal_day_no,
-                "receiptCounter": receipt_counter,
-                "fiscalDayCounters": counters,
-                "fiscalDayDeviceSignature": sig,
-            }
-            logger.debug(
-                "CloseDay (no receipts): receipt_counter=%s counters=%s canonical=%s payload=%s",
-                receipt_counter, counters, canonical, json.dumps(payload, indent=2, default=str),
-            )
-            logger.info("CloseDay canonical string: %s", canonical)
-            logger.info("CloseDay signature hash: %s", sig.get("hash"))
-            return payload, ""
-
-        counters = build_close_day_counters(device, fiscal_day_no)
-        fiscalised_receipts = Receipt.objects.filter(
-            device=device, fiscal_day_no=fiscal_day_no
-        ).exclude(fdms_receipt_id__isnull=True).exclude(fdms_receipt_id=0)
-        receipt_counter = fiscalised_receipts.count()
+        receipt_counter = get_day_receipts(device, fiscal_day_no).count()
+        counters: list[dict] = build_close_day_counters(device, fiscal_day_no) if receipt_counter else []
         if receipt_counter > 0 and not counters:
             return None, "receiptCounter > 0 but fiscalDayCounters empty; aborting before FDMS"
 
@@ -288,11 +259,16 @@ class DeviceApiService(FDMSBaseService):
             fiscal_day_date=fiscal_day_date,
             fiscal_day_counters=counters,
         )
-        receipt_global_nos = list(receipts.values_list("receipt_global_no", flat=True))
-        logger.debug(
-            "CloseDay: receipt_counter=%s counters=%s canonical=%s device.last_receipt_global_no=%s receipt_global_nos=%s",
-            receipt_counter, counters, canonical, device.last_receipt_global_no, receipt_global_nos,
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            receipt_global_nos = list(
+                Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no).values_list(
+                    "receipt_global_no", flat=True
+                )
+            )
+            logger.debug(
+                "CloseDay: receipt_counter=%s counters=%s canonical=%s device.last_receipt_global_no=%s receipt_global_nos=%s",
+                receipt_counter, counters, canonical, device.last_receipt_global_no, receipt_global_nos,
+            )
         sig = sign_fiscal_day_report(
             device_id=device.device_id,
             fiscal_day_no=fiscal_day_no,
@@ -324,7 +300,8 @@ class DeviceApiService(FDMSBaseService):
         Close fiscal day. Calls getStatus first; only proceeds if FiscalDayOpened or FiscalDayCloseFailed.
 
         Builds fiscalDayCounters (SaleByTax, CreditNoteByTax), signs with device key, calls CloseDay.
-        Does NOT poll - returns immediately after CloseDay accepts. Caller should poll getStatus.
+        Does NOT poll - returns immediately after CloseDay accepts and starts a CloseDayTracker,
+        whose scheduled GetStatus checks emit fiscal.closed / fiscal.close_failed.
 
         Args:
             device: FiscalDevice with certificate and private key.
@@ -398,6 +375,18 @@ class DeviceApiService(FDMSBaseService):
         device.fiscal_day_status = "FiscalDayCloseInitiated"
         device.save(update_fields=["fiscal_day_status"])
         logger.info("CloseDay initiated for device %s", device_id)
+        try:
+            from fiscal.services.fiscal_day_report import store_close_day_report
+
+            store_close_day_report(device, fiscal_day_no, payload, str(data.get("operationID") or ""))
+        except Exception as e:
+            logger.warning("CloseDay report not stored for device %s: %s", device_id, e)
+        try:
+            from fiscal.services.close_day_tracker import start_close_day_tracking
+
+            start_close_day_tracking(device, fiscal_day_no, str(data.get("operationID") or ""))
+        except Exception as e:
+            logger.warning("CloseDay tracking not started for device %s: %s", device_id, e)
         return data, None
 
     def poll_until_closed(
@@ -408,6 +397,8 @@ class DeviceApiService(FDMSBaseService):
     ) -> tuple[str, str | None]:
         """
         Poll getStatus every interval_seconds until FiscalDayClosed or FiscalDayCloseFailed.
+        Blocks the caller; close_day already schedules non-blocking tracking, so only use
+        this from scripts that need to wait inline.
 
         Args:
             device: FiscalDevice.
@@ -433,6 +424,9 @@ class DeviceApiService(FDMSBaseService):
                         fiscal_day.status = "FiscalDayClosed"
                         fiscal_day.closed_at = datetime.now()
                         fiscal_day.save()
+                        from fiscal.services.fiscal_day_merkle import seal_fiscal_day
+
+                        seal_fiscal_day(device, fiscal_day.fiscal_day_no)
                 return status, None
             time.sleep(interval_seconds)
         return device.fiscal_day_status or "unknown", "Polling timeout"
@@ -0,0 +1,145 @@
+"""
+Per-group event sequence numbers and bounded replay buffers for WebSocket streams.
+
+Every event sent to a device or dashboard group gets a monotonically increasing `seq`
+and is kept in a capped replay buffer. A reconnecting consumer passes `resume_from=<seq>`
+and receives only the events it missed; if the cursor is older than the buffer it gets a
+`stream.reset` and must refetch state over REST.
+
+Backends: "redis" (shared across processes; INCR + LPUSH/LTRIM in one Lua call) and
+"memory" (process-local, for development and tests). FDMS_EVENT_STREAM_BACKEND selects.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger("fiscal")
+
+_APPEND_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+local payload = string.gsub(ARGV[1], '"__SEQ__"', tostring(seq))
+redis.call('LPUSH', KEYS[2], payload)
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+return seq
+"""
+
+
+class MemoryEventStream:
+    """Process-local stream. Sequences restart with the process."""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._seq = {}
+        self._buf = {}
+
+    def append(self, group: str, event: dict) -> int:
+        with self._lock:
+            seq = self._seq.get(group, 0) + 1
+            self._seq[group] = seq
+            buf = self._buf.setdefault(group, deque(maxlen=self.maxlen))
+            buf.append({**event, "seq": seq})
+            return seq
+
+    def current(self, group: str) -> int:
+        with self._lock:
+            return self._seq.get(group, 0)
+
+    def since(self, group: str, cursor: int) -> tuple[list[dict], bool]:
+        with self._lock:
+            buf = list(self._buf.get(group, ()))
+            current = self._seq.get(group, 0)
+        return _select_since(buf, cursor, current)
+
+
+class RedisEventStream:
+    """Shared stream in Redis: fdms:stream:<group>:seq (counter) and :buf (newest first)."""
+
+    def __init__(self, url: str, maxlen: int, ttl: int):
+        import redis
+
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._append = self._client.register_script(_APPEND_LUA)
+
+    @staticmethod
+    def _keys(group: str) -> tuple[str, str]:
+        return f"fdms:stream:{group}:seq", f"fdms:stream:{group}:buf"
+
+    def append(self, group: str, event: dict) -> int:
+        payload = json.dumps({**event, "seq": "__SEQ__"}, default=str)
+        return int(self._append(keys=list(self._keys(group)), args=[payload, self.maxlen, self.ttl]))
+
+    def current(self, group: str) -> int:
+        return int(self._client.get(self._keys(group)[0]) or 0)
+
+    def since(self, group: str, cursor: int) -> tuple[list[dict], bool]:
+        seq_key, buf_key = self._keys(group)
+        pipe = self._client.pipeline()
+        pipe.get(seq_key)
+        pipe.lrange(buf_key, 0, -1)
+        current, raw = pipe.execute()
+        buf = [json.loads(item) for item in reversed(raw)]
+        return _select_since(buf, cursor, int(current or 0))
+
+
+def _select_since(buf: list[dict], cursor: int, current: int) -> tuple[list[dict], bool]:
+    """
+    Events with seq > cursor, oldest first. ok=False when events after the cursor have
+    already been evicted (or the stream restarted below the cursor): the client must reset.
+    """
+    if cursor > current:
+        return [], False
+    if cursor == current:
+        return [], True
+    events = sorted((e for e in buf if e.get("seq", 0) > cursor), key=lambda e: e["seq"])
+    if not events or events[0]["seq"] != cursor + 1:
+        return [], False
+    return events, True
+
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def get_event_stream():
+    """Configured stream backend (singleton per process)."""
+    global _stream
+    if _stream is None:
+        with _stream_lock:
+            if _stream is None:
+                maxlen = getattr(settings, "FDMS_EVENT_REPLAY_SIZE", 500)
+                backend = getattr(settings, "FDMS_EVENT_STREAM_BACKEND", "memory")
+                if backend == "redis":
+                    _stream = RedisEventStream(
+                        getattr(settings, "FDMS_EVENT_STREAM_REDIS_URL", "redis://localhost:6379/0"),
+                        maxlen,
+                        getattr(settings, "FDMS_EVENT_REPLAY_TTL", 86400),
+                    )
+                else:
+                    _stream = MemoryEventStream(maxlen)
+    return _stream
+
+
+def reset_event_stream() -> None:
+    """Drop the backend singleton (tests, settings changes)."""
+    global _stream
+    with _stream_lock:
+        _stream = None
+
+
+def stamp_event(group: str, event: dict) -> dict:
+    """Assign the next seq for the group, record the event for replay, return it with seq."""
+    try:
+        seq = get_event_stream().append(group, event)
+    except Exception as e:
+        logger.warning("Event stream append failed for %s: %s", group, e)
+        return event
+    return {**event, "seq": seq}
@@ -1,32 +1,215 @@
-"""Emit FDMS events to WebSocket groups."""
+"""
+Emit FDMS events to WebSocket groups.
 
+Events are handed to a process-local background emitter: callers (Celery tasks, views)
+enqueue and return immediately, and a daemon flush thread sends one channel-layer
+message per group per flush window. Intermediate receipt.progress frames are coalesced
+(latest per invoice wins) and are the only frames dropped when the queue is full;
+terminal events (completed/failed/error/opened/closed, metrics) are never dropped: on a
+full queue they evict queued progress frames, else wait for room, so events of a group
+are always sent in the order they were emitted.
+Set FDMS_EVENT_EMITTER_ASYNC = False to send synchronously.
+Each sent event carries a per-group `seq` (see event_stream) so clients can resume.
+"""
+
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 
 logger = logging.getLogger("fiscal")
 
+# Event types that may be coalesced or dropped under backpressure.
+DROPPABLE_EVENT_TYPES = frozenset({"receipt.progress"})
 
-def emit_to_device(device_id: int, event_type: str, data: dict) -> None:
-    """Send event to fdms_device_<device_id> WebSocket group."""
+
+def _send_now(group: str, events: list[dict]) -> None:
+    """Blocking send of events to one group. Single events keep the plain fdms_event shape."""
     try:
         from asgiref.sync import async_to_sync
         from channels.layers import get_channel_layer
 
+        from fiscal.services.event_stream import stamp_event
+
         layer = get_channel_layer()
-        if not layer:
+        if not layer or not events:
+            return
+        events = [stamp_event(group, e) for e in events]
+        if len(events) == 1:
+            message = {"type": "fdms_event", "data": events[0]}
+        else:
+            message = {"type": "fdms_event_batch", "events": events}
+        async_to_sync(layer.group_send)(group, message)
+    except Exception as e:
+        logger.warning("Emit to group %s failed: %s", group, e)
+
+
+class BackgroundEmitter:
+    """Bounded in-process queue plus a daemon thread that batches sends per group."""
+
+    def __init__(self, maxsize: int = 1000, flush_interval: float = 0.05, max_batch: int = 200):
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Fresh queue after fork (Celery prefork): the parent's thread does not exist here.
+                self._queue = queue.Queue(maxsize=self.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="fdms-event-emitter", daemon=True)
+            self._thread.start()
+
+    def submit(self, group: str, event: dict, coalesce_key=None) -> None:
+        """Enqueue an event. coalesce_key marks it as an intermediate (droppable) frame."""
+        self._ensure_started()
+        item = (group, event, coalesce_key)
+        try:
+            self._queue.put_nowait(item)
             return
-        group = f"fdms_device_{device_id}"
-        async_to_sync(layer.group_send)(
-            group,
-            {"type": "fdms_event", "data": {"type": event_type, **data}},
-        )
+        except queue.Full:
+            if coalesce_key is not None:
+                self.dropped += 1
+                return
+        self._make_room()
+        while True:
+            try:
+                self._queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                logger.warning("Event queue full, waiting to enqueue %s for %s", event.get("type"), group)
+                self._ensure_started()
+
+    def _make_room(self) -> None:
+        """Drop queued intermediate (coalescable) frames; the order of the rest is kept."""
+        q = self._queue
+        with q.mutex:
+            kept = [item for item in q.queue if item[2] is None]
+            removed = len(q.queue) - len(kept)
+            if not removed:
+                return
+            q.queue.clear()
+            q.queue.extend(kept)
+            q.unfinished_tasks -= removed
+            q.not_full.notify(removed)
+            if not q.unfinished_tasks:
+                q.all_tasks_done.notify_all()
+        self.dropped += removed
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything enqueued so far has been sent. Returns False on timeout."""
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception:
+                logger.exception("Event emitter dispatch failed")
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    @staticmethod
+    def _coalesce(batch: list) -> "OrderedDict[str, list[dict]]":
+        """Group by channel group, keeping only the latest frame per coalesce key."""
+        seen = set()
+        kept = []
+        for group, event, key in reversed(batch):
+            if key is not None:
+                if (group, key) in seen:
+                    continue
+                seen.add((group, key))
+            kept.append((group, event))
+        by_group = OrderedDict()
+        for group, event in reversed(kept):
+            by_group.setdefault(group, []).append(event)
+        return by_group
+
+    def _dispatch(self, batch: list) -> None:
+        for group, events in self._coalesce(batch).items():
+            _send_now(group, events)
+
+
+_emitter = BackgroundEmitter(
+    maxsize=getattr(settings, "FDMS_EVENT_QUEUE_SIZE", 1000),
+    flush_interval=getattr(settings, "FDMS_EVENT_FLUSH_INTERVAL", 0.05),
+)
+atexit.register(_emitter.flush, 2.0)
+
+
+def get_emitter() -> BackgroundEmitter:
+    return _emitter
+
+
+def flush_events(timeout: float = 5.0) -> bool:
+    """Block until queued events are sent (tests, task shutdown)."""
+    return _emitter.flush(timeout)
+
+
+def _emit(group: str, event: dict, coalesce_key=None) -> None:
+    if getattr(settings, "FDMS_EVENT_EMITTER_ASYNC", True):
+        _emitter.submit(group, event, coalesce_key)
+    else:
+        _send_now(group, [event])
+
+
+def emit_to_device(device_id: int, event_type: str, data: dict) -> None:
+    """Send event to fdms_device_<device_id> WebSocket group (non-blocking)."""
+    try:
+        event = {"type": event_type, **data}
+        coalesce_key = None
+        if event_type in DROPPABLE_EVENT_TYPES:
+            coalesce_key = (event_type, data.get("invoice_no", ""))
+        _emit(f"fdms_device_{device_id}", event, coalesce_key)
     except Exception as e:
         logger.warning("Emit to device %s failed: %s", device_id, e)
 
 
+def emit_to_dashboard(event_type: str, data: dict) -> None:
+    """Send event to the fdms_dashboard WebSocket group (non-blocking)."""
+    try:
+        _emit("fdms_dashboard", {"type": event_type, **data})
+    except Exception as e:
+        logger.warning("Emit %s to dashboard failed: %s", event_type, e)
+
+
 def emit_metrics_updated() -> None:
     """Broadcast metrics.updated to fdms_dashboard WebSocket group."""
     try:
-        from asgiref.sync import async_to_sync
         from channels.layers import get_channel_layer
 
         from dashboard.services.metrics_service import get_metrics
@@ -35,9 +218,6 @@ def emit_metrics_updated() -> None:
         if not layer:
             return
         metrics = get_metrics()
-        async_to_sync(layer.group_send)(
-            "fdms_dashboard",
-            {"type": "fdms_event", "data": {"type": "metrics.updated", "metrics": metrics}},
-        )
+        _emit("fdms_dashboard", {"type": "metrics.updated", "metrics": metrics})
     except Exception as e:
         logger.warning("Emit metrics.updated failed: %s", e)
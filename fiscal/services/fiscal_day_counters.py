@@ -0,0 +1,212 @@
+"""
+Running CloseDay counters per fiscal day (FiscalDayCounter).
+Each fiscalised receipt adds its contribution in the same transaction that saves it
+(see fiscal.signals), so CloseDay reads a prebuilt counter set instead of re-parsing
+every receipt of the day. Edits subtract the previous contribution; deletes subtract it.
+
+Invariant: if any row exists for (device, fiscal_day_no) the set is complete. The first
+fiscalised receipt of a day seeds the set with a full rebuild, which also covers days
+that started before this table existed. reconcile_day_counters checks the stored set
+against a full rebuild from receipt JSON.
+"""
+
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from fiscal.models import FiscalDayCounter, Receipt
+from fiscal.services.close_day_counter_builder import (
+    build_fiscal_day_counters,
+    get_day_receipts,
+    receipt_counter_contributions,
+)
+from fiscal.services.receipt_lines import LINE_SOURCE_FIELDS, to_cents
+
+logger = logging.getLogger("fiscal")
+
+# Receipt fields that change a receipt's counter contribution.
+COUNTER_SOURCE_FIELDS = LINE_SOURCE_FIELDS | {"fdms_receipt_id"}
+
+_CONTRIBUTION_FIELDS = (
+    "device_id",
+    "fiscal_day_no",
+    "fdms_receipt_id",
+    "receipt_type",
+    "currency",
+    "receipt_taxes",
+    "receipt_payments",
+)
+
+
+def is_fiscalised(receipt) -> bool:
+    return receipt is not None and receipt.fdms_receipt_id not in (None, 0)
+
+
+def counter_key(key: tuple) -> str:
+    """(SaleByTax, USD, 1, 15.0) -> "SaleByTax|USD|1|15.0"."""
+    counter_type, currency, third, pct = key
+    return "%s|%s|%s|%s" % (counter_type, currency, third, "" if pct is None else pct)
+
+
+def _row_for(device_id: int, fiscal_day_no: int, key: tuple, value_cents: int) -> FiscalDayCounter:
+    counter_type, currency, third, pct = key
+    is_money = counter_type == "BalanceByMoneyType"
+    return FiscalDayCounter(
+        device_id=device_id,
+        fiscal_day_no=fiscal_day_no,
+        counter_key=counter_key(key),
+        counter_type=counter_type,
+        currency=currency,
+        tax_id=None if is_money else third,
+        tax_percent=None if pct is None else Decimal(str(pct)),
+        money_type=third if is_money else "",
+        value_cents=value_cents,
+    )
+
+
+def _row_key(row: FiscalDayCounter) -> tuple:
+    if row.counter_type == "BalanceByMoneyType":
+        return (row.counter_type, row.currency, row.money_type, None)
+    pct = None if row.tax_percent is None else round(float(row.tax_percent), 2)
+    return (row.counter_type, row.currency, row.tax_id, pct)
+
+
+def _to_cents_dict(counters: dict) -> dict:
+    return {key: to_cents(value) for key, value in counters.items()}
+
+
+def _has_rows(device_id: int, fiscal_day_no: int) -> bool:
+    return FiscalDayCounter.objects.filter(device_id=device_id, fiscal_day_no=fiscal_day_no).exists()
+
+
+def _expected_counters(device_id: int, fiscal_day_no: int) -> dict:
+    """Full rebuild from receipt JSON (the source of truth), in cents."""
+    receipts = get_day_receipts(device_id, fiscal_day_no).only(*_CONTRIBUTION_FIELDS)
+    return _to_cents_dict(build_fiscal_day_counters(receipts.iterator()))
+
+
+def _replace_rows(device_id: int, fiscal_day_no: int, counters_cents: dict) -> int:
+    with transaction.atomic():
+        FiscalDayCounter.objects.filter(device_id=device_id, fiscal_day_no=fiscal_day_no).delete()
+        FiscalDayCounter.objects.bulk_create(
+            [_row_for(device_id, fiscal_day_no, key, cents) for key, cents in counters_cents.items()]
+        )
+    return len(counters_cents)
+
+
+def _apply_deltas(device_id: int, fiscal_day_no: int, deltas_cents: dict) -> None:
+    for key, cents in deltas_cents.items():
+        if not cents:
+            continue
+        updated = FiscalDayCounter.objects.filter(
+            device_id=device_id, fiscal_day_no=fiscal_day_no, counter_key=counter_key(key)
+        ).update(value_cents=F("value_cents") + cents)
+        if not updated:
+            _row_for(device_id, fiscal_day_no, key, cents).save(force_insert=True)
+
+
+def load_previous_state(receipt: Receipt):
+    """Stored version of the receipt (contribution fields only), or None for a new row."""
+    if receipt.pk is None or receipt._state.adding:
+        return None
+    return Receipt.objects.filter(pk=receipt.pk).only(*_CONTRIBUTION_FIELDS).first()
+
+
+def apply_receipt_to_day_counters(receipt: Receipt, previous: Receipt | None = None) -> None:
+    """
+    Move the day counters from the receipt's previous stored state to its current state.
+    Call after the receipt is saved, inside the same transaction.
+    """
+    deltas: dict[tuple, dict] = defaultdict(lambda: defaultdict(int))
+    if is_fiscalised(previous):
+        for key, cents in _to_cents_dict(receipt_counter_contributions(previous)).items():
+            deltas[(previous.device_id, previous.fiscal_day_no)][key] -= cents
+    if is_fiscalised(receipt):
+        for key, cents in _to_cents_dict(receipt_counter_contributions(receipt)).items():
+            deltas[(receipt.device_id, receipt.fiscal_day_no)][key] += cents
+
+    with transaction.atomic():
+        for (device_id, fiscal_day_no), day_deltas in deltas.items():
+            if not any(day_deltas.values()):
+                continue
+            if _has_rows(device_id, fiscal_day_no):
+                _apply_deltas(device_id, fiscal_day_no, day_deltas)
+            elif is_fiscalised(receipt) and (device_id, fiscal_day_no) == (receipt.device_id, receipt.fiscal_day_no):
+                # First receipt of the day (or a day predating this table): seed from a full rebuild.
+                _replace_rows(device_id, fiscal_day_no, _expected_counters(device_id, fiscal_day_no))
+
+
+def remove_receipt_from_day_counters(receipt: Receipt) -> None:
+    """Subtract a deleted receipt's contribution, if its day has counters."""
+    if not is_fiscalised(receipt):
+        return
+    with transaction.atomic():
+        if not _has_rows(receipt.device_id, receipt.fiscal_day_no):
+            return
+        deltas = {k: -c for k, c in _to_cents_dict(receipt_counter_contributions(receipt)).items()}
+        _apply_deltas(receipt.device_id, receipt.fiscal_day_no, deltas)
+
+
+def invalidate_day_counters(device, fiscal_day_no: int) -> None:
+    """
+    Drop the day's rows after an incremental update failed. The day then counts as
+    never seeded: the next fiscalised receipt or CloseDay rebuilds it from receipt JSON.
+    """
+    device_id = getattr(device, "pk", device)
+    FiscalDayCounter.objects.filter(device_id=device_id, fiscal_day_no=fiscal_day_no).delete()
+
+
+def get_day_counters(device, fiscal_day_no: int) -> dict | None:
+    """
+    Stored counters for the day as {key: Decimal}, same shape as build_fiscal_day_counters.
+    None when the day has no rows (never seeded).
+    """
+    device_id = getattr(device, "pk", device)
+    rows = list(FiscalDayCounter.objects.filter(device_id=device_id, fiscal_day_no=fiscal_day_no))
+    if not rows:
+        return None
+    return {_row_key(row): Decimal(row.value_cents) / 100 for row in rows}
+
+
+def store_day_counters(device, fiscal_day_no: int, counters: dict) -> int:
+    """Replace the day's rows with counters ({key: Decimal}). Returns rows written."""
+    return _replace_rows(getattr(device, "pk", device), fiscal_day_no, _to_cents_dict(counters))
+
+
+def rebuild_day_counters(device, fiscal_day_no: int) -> int:
+    """Recompute the day's rows from receipt JSON. Returns rows written."""
+    device_id = getattr(device, "pk", device)
+    return _replace_rows(device_id, fiscal_day_no, _expected_counters(device_id, fiscal_day_no))
+
+
+def reconcile_day_counters(device, fiscal_day_no: int, fix: bool = False) -> list[dict]:
+    """
+    Compare stored counters with a full rebuild from receipt JSON.
+    Returns one dict per differing counter: {"key", "stored_cents", "expected_cents"}.
+    With fix=True the day's rows are replaced by the rebuild when they differ.
+    """
+    device_id = getattr(device, "pk", device)
+    expected = _expected_counters(device_id, fiscal_day_no)
+    stored = {
+        _row_key(row): row.value_cents
+        for row in FiscalDayCounter.objects.filter(device_id=device_id, fiscal_day_no=fiscal_day_no)
+    }
+    mismatches = []
+    for key in sorted(set(expected) | set(stored), key=counter_key):
+        if expected.get(key, 0) != stored.get(key, 0):
+            mismatches.append({
+                "key": counter_key(key),
+                "stored_cents": stored.get(key, 0),
+                "expected_cents": expected.get(key, 0),
+            })
+    if mismatches:
+        logger.warning(
+            "Fiscal day counters mismatch: device_pk=%s day=%s mismatches=%s",
+            device_id, fiscal_day_no, len(mismatches),
+        )
+        if fix:
+            _replace_rows(device_id, fiscal_day_no, expected)
+    return mismatches
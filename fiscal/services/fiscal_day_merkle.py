@@ -0,0 +1,156 @@
+"""
+Per-fiscal-day Merkle tree over receipt hashes.
+
+Leaves are the day's receipt hashes in receipt_counter order; a single receipt can then
+be checked against FiscalDay.merkle_root with O(log n) hashes instead of re-walking the
+previousReceiptHash chain, and two copies of a day compare with one root.
+
+    leaf = SHA256(0x00 || receipt_hash bytes)
+    node = SHA256(0x01 || left || right)
+
+Pairs are hashed level by level; an unpaired last node is carried up unchanged (no
+duplication, so different receipt sets cannot share a root). Hashes are hex strings.
+The root is stored when the day closes (seal_fiscal_day).
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+
+from django.utils import timezone
+
+from fiscal.models import FiscalDay, Receipt
+
+logger = logging.getLogger("fiscal")
+
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(receipt_hash: str) -> bytes:
+    """Leaf for a stored receipt hash (base64 SHA-256; other strings are hashed as UTF-8)."""
+    try:
+        raw = base64.b64decode(receipt_hash, validate=True)
+    except (binascii.Error, ValueError):
+        raw = receipt_hash.encode("utf-8")
+    return hashlib.sha256(_LEAF_PREFIX + raw).digest()
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+def build_levels(leaves: list[bytes]) -> list[list[bytes]]:
+    """All tree levels, leaves first and [root] last. Empty input gives []."""
+    if not leaves:
+        return []
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_root(leaves: list[bytes]) -> str:
+    levels = build_levels(leaves)
+    return levels[-1][0].hex() if levels else ""
+
+
+def inclusion_path(levels: list[list[bytes]], index: int) -> list[dict]:
+    """Sibling hashes from leaf `index` up to the root: [{"side": "left"|"right", "hash"}]."""
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append({"side": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+        index //= 2
+    return path
+
+
+def verify_inclusion(receipt_hash: str, path: list[dict], root: str) -> bool:
+    """Recompute the root from a receipt hash and its inclusion path."""
+    node = leaf_hash(receipt_hash)
+    for step in path:
+        sibling = bytes.fromhex(step["hash"])
+        node = _node_hash(sibling, node) if step["side"] == "left" else _node_hash(node, sibling)
+    return bool(root) and node.hex() == root
+
+
+def _day_receipt_hashes(device, fiscal_day_no: int) -> tuple[list[tuple], str | None]:
+    """[(pk, receipt_global_no, receipt_hash)] in chain order, or error if any hash is missing."""
+    rows = list(
+        Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no)
+        .order_by("receipt_counter")
+        .values_list("pk", "receipt_global_no", "receipt_hash")
+    )
+    missing = [global_no for _, global_no, h in rows if not h]
+    if missing:
+        return [], f"Receipt(s) without hash in fiscal day {fiscal_day_no}: {missing[:10]}"
+    return rows, None
+
+
+def compute_day_root(device, fiscal_day_no: int) -> tuple[tuple[str, int] | None, str | None]:
+    """(root_hex, leaf_count) for a device fiscal day from its stored receipt hashes."""
+    rows, err = _day_receipt_hashes(device, fiscal_day_no)
+    if err:
+        return None, err
+    return (merkle_root([leaf_hash(h) for _, _, h in rows]), len(rows)), None
+
+
+def seal_fiscal_day(device, fiscal_day_no: int) -> tuple[FiscalDay | None, str | None]:
+    """Compute and store the day's Merkle root on its FiscalDay row."""
+    fiscal_day = FiscalDay.objects.filter(device=device, fiscal_day_no=fiscal_day_no).first()
+    if fiscal_day is None:
+        return None, f"No FiscalDay record for day {fiscal_day_no}"
+    computed, err = compute_day_root(device, fiscal_day_no)
+    if err:
+        logger.warning("Merkle root not stored for device %s: %s", device.device_id, err)
+        return None, err
+    root, count = computed
+    if fiscal_day.merkle_root and fiscal_day.merkle_root != root:
+        logger.warning(
+            "Merkle root changed for device %s day %s: %s -> %s",
+            device.device_id, fiscal_day_no, fiscal_day.merkle_root, root,
+        )
+    fiscal_day.merkle_root = root
+    fiscal_day.merkle_leaf_count = count
+    fiscal_day.merkle_computed_at = timezone.now()
+    fiscal_day.save(update_fields=["merkle_root", "merkle_leaf_count", "merkle_computed_at"])
+    return fiscal_day, None
+
+
+def get_receipt_inclusion_proof(receipt: Receipt) -> tuple[dict | None, str | None]:
+    """
+    Inclusion proof of a receipt in its fiscal day tree. The path is verified against the
+    stored root (rootMatches); when the day has no stored root yet, the current one is used.
+    """
+    if not receipt.receipt_hash:
+        return None, "Receipt has no hash"
+    rows, err = _day_receipt_hashes(receipt.device, receipt.fiscal_day_no)
+    if err:
+        return None, err
+    index = next((i for i, (pk, _, _) in enumerate(rows) if pk == receipt.pk), None)
+    if index is None:
+        return None, "Receipt not found in its fiscal day"
+    levels = build_levels([leaf_hash(h) for _, _, h in rows])
+    path = inclusion_path(levels, index)
+    computed_root = levels[-1][0].hex()
+    fiscal_day = FiscalDay.objects.filter(device=receipt.device, fiscal_day_no=receipt.fiscal_day_no).first()
+    stored_root = fiscal_day.merkle_root if fiscal_day else ""
+    root = stored_root or computed_root
+    return {
+        "deviceId": receipt.device.device_id,
+        "fiscalDayNo": receipt.fiscal_day_no,
+        "receiptGlobalNo": receipt.receipt_global_no,
+        "receiptHash": receipt.receipt_hash,
+        "leafIndex": index,
+        "leafCount": len(rows),
+        "path": path,
+        "root": root,
+        "rootSealed": bool(stored_root),
+        "rootMatches": verify_inclusion(receipt.receipt_hash, path, root),
+    }, None
@@ -0,0 +1,109 @@
+"""
+Submitted CloseDay report stored on FiscalDay.
+
+When FDMS accepts CloseDay, the payload's receiptCounter, fiscalDayCounters and
+fiscalDayDeviceSignature are stored with the canonical string they were signed over
+(FiscalDay.close_*). Audits and re-displays compare against these stored values instead
+of digging through FDMSApiLog request JSON.
+"""
+
+import logging
+
+from django.utils import timezone
+
+from fiscal.models import FiscalDay
+from fiscal.services.close_day_counter_builder import (
+    build_fiscal_day_counters,
+    convert_to_fdms_format,
+    get_day_receipts,
+    sort_fiscal_counters,
+)
+from fiscal.services.fiscal_day_counters import counter_key, get_day_counters
+from fiscal.services.fiscal_signature import build_fiscal_day_canonical_string
+from fiscal.services.receipt_lines import to_cents
+
+logger = logging.getLogger("fiscal")
+
+
+def fiscal_day_date(fiscal_day: FiscalDay):
+    """Date signed into the CloseDay canonical string (see DeviceApiService._build_close_day_payload)."""
+    return (fiscal_day.opened_at or timezone.now()).date()
+
+
+def store_close_day_report(device, fiscal_day_no: int, payload: dict, operation_id: str = "") -> tuple[FiscalDay | None, str | None]:
+    """Store an accepted CloseDay payload (counters, signature, canonical) on the FiscalDay row."""
+    fiscal_day = FiscalDay.objects.filter(device=device, fiscal_day_no=fiscal_day_no).first()
+    if fiscal_day is None:
+        logger.warning("CloseDay report not stored: no FiscalDay %s for device %s", fiscal_day_no, device.device_id)
+        return None, f"No FiscalDay record for day {fiscal_day_no}"
+    counters = payload.get("fiscalDayCounters") or []
+    signature = payload.get("fiscalDayDeviceSignature") or {}
+    fiscal_day.close_receipt_counter = payload.get("receiptCounter")
+    fiscal_day.close_counters = counters
+    fiscal_day.close_canonical = build_fiscal_day_canonical_string(
+        device_id=device.device_id,
+        fiscal_day_no=fiscal_day_no,
+        fiscal_day_date=fiscal_day_date(fiscal_day),
+        fiscal_day_counters=counters,
+    )
+    fiscal_day.close_hash = signature.get("hash") or ""
+    fiscal_day.close_signature = signature.get("signature") or ""
+    fiscal_day.close_operation_id = (operation_id or "")[:100]
+    fiscal_day.close_submitted_at = timezone.now()
+    fiscal_day.save(update_fields=[
+        "close_receipt_counter",
+        "close_counters",
+        "close_canonical",
+        "close_hash",
+        "close_signature",
+        "close_operation_id",
+        "close_submitted_at",
+    ])
+    return fiscal_day, None
+
+
+def _counters_by_key(counters: list[dict]) -> dict:
+    """FDMS counter list -> {(type, currency, taxID|moneyType, taxPercent): cents}."""
+    out = {}
+    for c in counters:
+        if c.get("fiscalCounterType") == "BalanceByMoneyType":
+            key = (c["fiscalCounterType"], c.get("fiscalCounterCurrency"), c.get("fiscalCounterMoneyType"), None)
+        else:
+            pct = c.get("fiscalCounterTaxPercent")
+            key = (
+                c.get("fiscalCounterType"),
+                c.get("fiscalCounterCurrency"),
+                c.get("fiscalCounterTaxID"),
+                None if pct is None else round(float(pct), 2),
+            )
+        out[key] = out.get(key, 0) + to_cents(c.get("fiscalCounterValue"))
+    return {k: v for k, v in out.items() if v}
+
+
+def current_day_counters(device, fiscal_day_no: int) -> list[dict]:
+    """
+    FDMS fiscalDayCounters for the day's receipts as they are now: the maintained
+    FiscalDayCounter rows, or a rebuild from receipt JSON when the day has none.
+    Read-only (audits must not seed rows or lines).
+    """
+    counters = get_day_counters(device, fiscal_day_no)
+    if counters is None:
+        counters = build_fiscal_day_counters(get_day_receipts(device, fiscal_day_no).iterator())
+    return sort_fiscal_counters(convert_to_fdms_format(counters))
+
+
+def compare_close_day_counters(fiscal_day: FiscalDay) -> list[dict]:
+    """
+    Differences between the submitted counters and the day's current counters.
+    One dict per differing counter: {"key", "submitted_cents", "current_cents"}; [] when
+    they match or nothing was stored.
+    """
+    if fiscal_day.close_counters is None:
+        return []
+    submitted = _counters_by_key(fiscal_day.close_counters)
+    current = _counters_by_key(current_day_counters(fiscal_day.device, fiscal_day.fiscal_day_no))
+    return [
+        {"key": counter_key(key), "submitted_cents": submitted.get(key, 0), "current_cents": current.get(key, 0)}
+        for key in sorted(set(submitted) | set(current), key=counter_key)
+        if submitted.get(key, 0) != current.get(key, 0)
+    ]
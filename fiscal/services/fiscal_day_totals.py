@@ -5,54 +5,16 @@ for a given fiscal day. Includes breakdown (subtotal, tax) and tax-inclusive fla
 
 from decimal import Decimal
 
-from django.db.models import Sum, Q
+from django.db.models import Sum
 
-from fiscal.models import FiscalDevice, Receipt
+from fiscal.models import FiscalDevice, Receipt, ReceiptTaxLine
 
 
-def _sum_receipt_total(receipts) -> Decimal:
-    """Sum receipt_total from a queryset."""
-    r = receipts.aggregate(s=Sum("receipt_total"))
-    return r["s"] or Decimal("0")
-
-
-def _sum_line_totals(receipts) -> Decimal:
-    """Sum line totals from receipt_lines across receipts."""
-    total = Decimal("0")
-    for r in receipts:
-        for line in r.receipt_lines or []:
-            amt = line.get("receiptLineTotal") or line.get("lineAmount") or 0
-            total += Decimal(str(amt))
-    return total
-
-
-def _sum_tax_amounts(receipts) -> Decimal:
-    """Sum tax amounts from receipt_taxes across receipts."""
-    total = Decimal("0")
-    for r in receipts:
-        for t in r.receipt_taxes or []:
-            amt = t.get("taxAmount") or t.get("fiscalCounterValue") or 0
-            total += Decimal(str(amt))
-    return total
-
-
-def _describe_tax_inclusive(receipts) -> dict:
+def _summarise_tax_inclusive(inclusive_count: int, exclusive_count: int) -> dict:
     """
-    Describe whether line totals are tax inclusive across receipts.
-    Returns: {
-        "all_inclusive": bool,
-        "all_exclusive": bool,
-        "mixed": bool,
-        "summary": str,
-    }
+    Describe whether line totals are tax inclusive, from receipt counts.
+    Returns: {"all_inclusive": bool, "all_exclusive": bool, "mixed": bool, "summary": str}
     """
-    inclusive_count = 0
-    exclusive_count = 0
-    for r in receipts:
-        if getattr(r, "receipt_lines_tax_inclusive", True):
-            inclusive_count += 1
-        else:
-            exclusive_count += 1
     all_inclusive = exclusive_count == 0 and inclusive_count > 0
     all_exclusive = inclusive_count == 0 and exclusive_count > 0
     mixed = inclusive_count > 0 and exclusive_count > 0
@@ -74,6 +36,33 @@ def _describe_tax_inclusive(receipts) -> dict:
     }
 
 
+_CREDIT_RECEIPT_TYPES = ("CreditNote", "CREDITNOTE")
+_DEBIT_RECEIPT_TYPES = ("DebitNote", "DEBITNOTE")
+
+
+def _buckets_for(document_type: str, receipt_type: str) -> tuple[str, ...]:
+    """
+    Buckets a receipt counts towards: document_type first, receipt_type for legacy records;
+    a receipt can fall in more than one (e.g. legacy document_type=INVOICE credit notes).
+    """
+    buckets = []
+    if document_type == "INVOICE" or (document_type == "" and receipt_type == "FiscalInvoice"):
+        buckets.append("invoices")
+    if document_type == "CREDIT_NOTE" or receipt_type in _CREDIT_RECEIPT_TYPES:
+        buckets.append("credit_notes")
+    if document_type == "DEBIT_NOTE" or receipt_type in _DEBIT_RECEIPT_TYPES:
+        buckets.append("debit_notes")
+    return tuple(buckets)
+
+
+def _line_total(receipt_lines) -> Decimal:
+    total = Decimal("0")
+    for line in receipt_lines or []:
+        amt = line.get("receiptLineTotal") or line.get("lineAmount") or 0
+        total += Decimal(str(amt))
+    return total
+
+
 def get_fiscal_day_totals(device: FiscalDevice | None, fiscal_day_no: int | None) -> dict:
     """
     Compute totals for a fiscal day considering invoices, credit notes, and debit notes.
@@ -83,6 +72,7 @@ def get_fiscal_day_totals(device: FiscalDevice | None, fiscal_day_no: int | None
     - debit_notes: count, total, subtotal, tax, tax_inclusive_info
     - net_total: invoices - credit_notes + debit_notes
     - currency: from first receipt if any
+    Two queries: one streaming pass over the day's receipts and one grouped tax-line sum.
     """
     if not device or fiscal_day_no is None:
         return {
@@ -94,63 +84,66 @@ def get_fiscal_day_totals(device: FiscalDevice | None, fiscal_day_no: int | None
             "has_data": False,
         }
 
-    base_qs = Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no)
-    # Use document_type as primary; fall back to receipt_type for legacy records
-    invoices_qs = base_qs.filter(
-        Q(document_type="INVOICE") | (Q(document_type="") & Q(receipt_type="FiscalInvoice"))
-    )
-    credit_notes_qs = base_qs.filter(
-        Q(document_type="CREDIT_NOTE") | Q(receipt_type__in=("CreditNote", "CREDITNOTE"))
-    )
-    debit_notes_qs = base_qs.filter(
-        Q(document_type="DEBIT_NOTE") | Q(receipt_type__in=("DebitNote", "DEBITNOTE"))
+    acc = {
+        name: {"count": 0, "total": Decimal("0"), "subtotal": Decimal("0"), "tax": Decimal("0"), "inc": 0, "exc": 0}
+        for name in ("invoices", "credit_notes", "debit_notes")
+    }
+    currency = "USD"
+    has_data = False
+
+    rows = (
+        Receipt.objects.filter(device=device, fiscal_day_no=fiscal_day_no)
+        .order_by("pk")
+        .values_list(
+            "document_type", "receipt_type", "receipt_total",
+            "receipt_lines", "receipt_lines_tax_inclusive", "currency",
+        )
     )
-
-    inv_total = _sum_receipt_total(invoices_qs)
-    inv_subtotal = _sum_line_totals(invoices_qs)
-    inv_tax = _sum_tax_amounts(invoices_qs)
-    cn_total = _sum_receipt_total(credit_notes_qs)
-    cn_subtotal = _sum_line_totals(credit_notes_qs)
-    cn_tax = _sum_tax_amounts(credit_notes_qs)
-    dn_total = _sum_receipt_total(debit_notes_qs)
-    dn_subtotal = _sum_line_totals(debit_notes_qs)
-    dn_tax = _sum_tax_amounts(debit_notes_qs)
+    for document_type, receipt_type, receipt_total, receipt_lines, tax_inclusive, curr in rows.iterator(chunk_size=2000):
+        if not has_data:
+            has_data = True
+            if curr:
+                currency = curr
+        buckets = _buckets_for(document_type, receipt_type)
+        if not buckets:
+            continue
+        subtotal = _line_total(receipt_lines)
+        for name in buckets:
+            b = acc[name]
+            b["count"] += 1
+            if receipt_total is not None:
+                b["total"] += receipt_total
+            b["subtotal"] += subtotal
+            if tax_inclusive:
+                b["inc"] += 1
+            else:
+                b["exc"] += 1
+
+    if has_data:
+        tax_rows = (
+            ReceiptTaxLine.objects.filter(receipt__device=device, receipt__fiscal_day_no=fiscal_day_no)
+            .values("receipt__document_type", "receipt__receipt_type")
+            .annotate(cents=Sum("tax_amount_cents"))
+            .order_by()
+        )
+        for row in tax_rows:
+            for name in _buckets_for(row["receipt__document_type"], row["receipt__receipt_type"]):
+                acc[name]["tax"] += Decimal(row["cents"] or 0) / 100
 
     # Credit notes are stored with negative receipt_total; net = invoices - credits + debits
-    net_total = inv_total + cn_total + dn_total
-
-    currency = "USD"
-    first = base_qs.first()
-    if first and first.currency:
-        currency = first.currency
-
-    inv_tax_info = _describe_tax_inclusive(invoices_qs) if invoices_qs.exists() else None
-    cn_tax_info = _describe_tax_inclusive(credit_notes_qs) if credit_notes_qs.exists() else None
-    dn_tax_info = _describe_tax_inclusive(debit_notes_qs) if debit_notes_qs.exists() else None
-
-    return {
-        "invoices": {
-            "count": invoices_qs.count(),
-            "total": float(inv_total),
-            "subtotal": float(inv_subtotal),
-            "tax": float(inv_tax),
-            "tax_inclusive": inv_tax_info,
-        },
-        "credit_notes": {
-            "count": credit_notes_qs.count(),
-            "total": float(cn_total),
-            "subtotal": float(cn_subtotal),
-            "tax": float(cn_tax),
-            "tax_inclusive": cn_tax_info,
-        },
-        "debit_notes": {
-            "count": debit_notes_qs.count(),
-            "total": float(dn_total),
-            "subtotal": float(dn_subtotal),
-            "tax": float(dn_tax),
-            "tax_inclusive": dn_tax_info,
-        },
-        "net_total": float(net_total),
-        "currency": currency,
-        "has_data": base_qs.exists(),
+    net_total = acc["invoices"]["total"] + acc["credit_notes"]["total"] + acc["debit_notes"]["total"]
+
+    result = {
+        name: {
+            "count": b["count"],
+            "total": float(b["total"]),
+            "subtotal": float(b["subtotal"]),
+            "tax": float(b["tax"]),
+            "tax_inclusive": _summarise_tax_inclusive(b["inc"], b["exc"]) if b["count"] else None,
+        }
+        for name, b in acc.items()
     }
+    result["net_total"] = float(net_total)
+    result["currency"] = currency
+    result["has_data"] = has_data
+    return result
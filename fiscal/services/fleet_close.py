@@ -0,0 +1,288 @@
+"""
+Fleet end-of-day orchestration: close (and reopen) many devices with a concurrency limit.
+
+A FleetCloseRun holds one FleetCloseItem per device. dispatch_run starts at most
+run.concurrency items at a time (QUEUED -> CLOSING) as fleet_close_device_task jobs.
+Each job calls CloseDay; completion arrives through the device's CloseDayTracker
+(see close_day_tracker), which calls on_tracker_finished:
+
+    CLOSING --FiscalDayClosed--> REOPENING --OpenDay ok--> REOPENED   (run.reopen)
+    CLOSING --FiscalDayClosed--> CLOSED                               (no reopen)
+    CLOSING --close failed-----> QUEUED (retry after backoff) ... --> FAILED
+
+Every transition frees a slot and re-dispatches; the run finishes when no item is
+queued or active. Progress is broadcast as fleet_close.progress on the dashboard group
+and available from get_fleet_close_status (stragglers = items active for too long).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from fiscal.models import CloseDayTracker, FiscalDevice, FleetCloseItem, FleetCloseRun
+
+logger = logging.getLogger("fiscal")
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _enqueue(task, args: list, countdown: int = 0) -> None:
+    """apply_async once the current transaction commits."""
+    def _send():
+        try:
+            task.apply_async(args=args, countdown=countdown)
+        except Exception as e:
+            logger.warning("Could not enqueue %s%s: %s", task.name, args, e)
+
+    transaction.on_commit(_send)
+
+
+def _schedule_dispatch(run_id: int, countdown: int = 0) -> None:
+    from fiscal.tasks import fleet_close_dispatch_task
+
+    _enqueue(fleet_close_dispatch_task, [run_id], countdown)
+
+
+def start_fleet_close(
+    devices=None,
+    concurrency: int | None = None,
+    reopen: bool = True,
+    max_retries: int | None = None,
+    requested_by: str = "",
+) -> FleetCloseRun:
+    """Create a run over `devices` (default: all registered devices) and start dispatching."""
+    if devices is None:
+        devices = FiscalDevice.objects.filter(is_registered=True).order_by("device_id")
+    with transaction.atomic():
+        run = FleetCloseRun.objects.create(
+            concurrency=max(1, concurrency or _setting("FDMS_FLEET_CLOSE_CONCURRENCY", 10)),
+            reopen=reopen,
+            max_retries=_setting("FDMS_FLEET_CLOSE_MAX_RETRIES", 2) if max_retries is None else max_retries,
+            requested_by=requested_by[:150],
+        )
+        FleetCloseItem.objects.bulk_create([FleetCloseItem(run=run, device=d) for d in devices])
+        _schedule_dispatch(run.pk)
+    logger.info("Fleet close run #%s started: %s device(s), concurrency=%s", run.pk, run.items.count(), run.concurrency)
+    return run
+
+
+def dispatch_run(run_id: int) -> list[int]:
+    """Fill free concurrency slots with due queued items. Returns the item ids started."""
+    from fiscal.tasks import fleet_close_device_task
+
+    now = timezone.now()
+    with transaction.atomic():
+        run = FleetCloseRun.objects.select_for_update().filter(pk=run_id).first()
+        if run is None or run.status != FleetCloseRun.STATUS_RUNNING:
+            return []
+        items = run.items.all()
+        active = items.filter(state__in=FleetCloseItem.ACTIVE_STATES).count()
+        queued = items.filter(state=FleetCloseItem.STATE_QUEUED)
+        due = queued.filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+        free = max(0, run.concurrency - active)
+        started = list(due.order_by("pk").values_list("pk", flat=True)[:free])
+        if started:
+            FleetCloseItem.objects.filter(pk__in=started).update(state=FleetCloseItem.STATE_CLOSING, next_attempt_at=None)
+            FleetCloseItem.objects.filter(pk__in=started, started_at__isnull=True).update(started_at=now)
+            for item_id in started:
+                _enqueue(fleet_close_device_task, [item_id])
+
+        waiting = queued.exclude(pk__in=started).aggregate(n=Count("pk"), soonest=Min("next_attempt_at"))
+        if waiting["soonest"] is not None:
+            _schedule_dispatch(run.pk, max(1, int((waiting["soonest"] - now).total_seconds()) + 1))
+        elif not started and not active and not waiting["n"]:
+            _finalize(run)
+    if started:
+        _emit_progress(run_id)
+    return started
+
+
+def _finalize(run: FleetCloseRun) -> None:
+    failed = run.items.filter(state=FleetCloseItem.STATE_FAILED).count()
+    run.status = FleetCloseRun.STATUS_COMPLETED_WITH_ERRORS if failed else FleetCloseRun.STATUS_COMPLETED
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "finished_at"])
+    logger.info("Fleet close run #%s finished: %s (%s failed)", run.pk, run.status, failed)
+    transaction.on_commit(lambda: _emit_progress(run.pk))
+
+
+def _transition(item: FleetCloseItem, state: str, **fields) -> None:
+    item.state = state
+    if state in FleetCloseItem.TERMINAL_STATES:
+        item.finished_at = timezone.now()
+    for name, value in fields.items():
+        setattr(item, name, value)
+    item.save()
+    _schedule_dispatch(item.run_id)
+    _emit_progress(item.run_id)
+
+
+def close_device(item_id: int) -> None:
+    """Run CloseDay for one claimed item; completion continues in on_tracker_finished."""
+    from fiscal.services.device_api import DeviceApiService
+
+    item = FleetCloseItem.objects.select_related("run", "device").filter(pk=item_id).first()
+    if item is None or item.state != FleetCloseItem.STATE_CLOSING:
+        return
+    device = item.device
+    item.close_attempts += 1
+    item.save(update_fields=["close_attempts", "updated_at"])
+    fiscal_day_no = device.last_fiscal_day_no
+
+    data, err = DeviceApiService().close_day(device)
+    if not err:
+        # close_day starts the tracker; none started since this attempt began means it failed.
+        tracker = CloseDayTracker.objects.filter(
+            device=device, fiscal_day_no=fiscal_day_no, started_at__gte=item.updated_at
+        ).first()
+        _track_close(item, fiscal_day_no, tracker, str(data.get("operationID") or "") if data else "")
+        return
+
+    # close_day's GetStatus refreshed the device: handle days closed or closing elsewhere.
+    if device.fiscal_day_status == "FiscalDayClosed":
+        item.closed_fiscal_day_no = device.last_fiscal_day_no
+        _after_closed(item, None)
+    elif device.fiscal_day_status == "FiscalDayCloseInitiated" and device.last_fiscal_day_no is not None:
+        tracker = CloseDayTracker.objects.filter(
+            device=device, fiscal_day_no=device.last_fiscal_day_no, state=CloseDayTracker.STATE_PENDING
+        ).first()
+        _track_close(item, device.last_fiscal_day_no, tracker)
+    else:
+        _close_failed(item, err)
+
+
+def _track_close(item: FleetCloseItem, fiscal_day_no: int, tracker: CloseDayTracker | None, operation_id: str = "") -> None:
+    """
+    Attach the item to the day's close tracker, starting one if needed. Without a tracker
+    nothing would ever advance the item, so a failure to start one counts as a failed
+    close attempt (retried: CloseDay then finds the day FiscalDayCloseInitiated).
+    """
+    from fiscal.services.close_day_tracker import start_close_day_tracking
+
+    if tracker is None:
+        try:
+            tracker = start_close_day_tracking(item.device, fiscal_day_no, operation_id)
+        except Exception as e:
+            logger.warning(
+                "Fleet close run #%s device %s: close tracking not started: %s",
+                item.run_id, item.device.device_id, e,
+            )
+            _close_failed(item, f"Close tracking not started: {e}")
+            return
+    FleetCloseItem.objects.filter(pk=item.pk).update(tracker=tracker, closed_fiscal_day_no=fiscal_day_no)
+
+
+def on_tracker_finished(tracker: CloseDayTracker, status_data: dict | None = None) -> None:
+    """Advance fleet items waiting on this device's close."""
+    items = FleetCloseItem.objects.select_related("run", "device").filter(
+        device_id=tracker.device_id,
+        state=FleetCloseItem.STATE_CLOSING,
+        run__status=FleetCloseRun.STATUS_RUNNING,
+    )
+    for item in items:
+        item.tracker = tracker
+        item.closed_fiscal_day_no = tracker.fiscal_day_no
+        if tracker.state == CloseDayTracker.STATE_CLOSED:
+            _after_closed(item, status_data)
+        else:
+            _close_failed(item, tracker.last_error or tracker.closing_error_code or tracker.state)
+
+
+def _after_closed(item: FleetCloseItem, status_data: dict | None) -> None:
+    from fiscal.services.device_api import DeviceApiService
+
+    if not item.run.reopen:
+        _transition(item, FleetCloseItem.STATE_CLOSED, last_error="")
+        return
+    if status_data and status_data.get("fiscalDayStatus") == "FiscalDayOpened":
+        # Already reopened (by another operator) by the time the close was confirmed.
+        _transition(item, FleetCloseItem.STATE_REOPENED, opened_fiscal_day_no=status_data.get("lastFiscalDayNo"))
+        return
+    item.state = FleetCloseItem.STATE_REOPENING
+    item.save(update_fields=["state", "tracker", "closed_fiscal_day_no", "updated_at"])
+    if status_data is not None and status_data.get("fiscalDayStatus") != "FiscalDayClosed":
+        status_data = None
+    fiscal_day, err = DeviceApiService().open_day(item.device, status_data=status_data)
+    if err:
+        _transition(item, FleetCloseItem.STATE_FAILED, last_error=f"Reopen failed: {err}")
+    else:
+        _transition(item, FleetCloseItem.STATE_REOPENED, opened_fiscal_day_no=fiscal_day.fiscal_day_no, last_error="")
+
+
+def _close_failed(item: FleetCloseItem, error: str) -> None:
+    if item.close_attempts <= item.run.max_retries:
+        delay = _setting("FDMS_FLEET_CLOSE_RETRY_DELAY", 60) * item.close_attempts
+        logger.info(
+            "Fleet close run #%s device %s: close failed (%s), retry %s in %ss",
+            item.run_id, item.device.device_id, error, item.close_attempts, delay,
+        )
+        _transition(
+            item,
+            FleetCloseItem.STATE_QUEUED,
+            last_error=error,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+    else:
+        _transition(item, FleetCloseItem.STATE_FAILED, last_error=error)
+
+
+def get_fleet_close_status(run_id: int | None = None) -> dict | None:
+    """Progress of a run (latest by default): counts per state, stragglers and failures."""
+    runs = FleetCloseRun.objects.all()
+    run = runs.filter(pk=run_id).first() if run_id is not None else runs.first()
+    if run is None:
+        return None
+    counts = dict(run.items.values_list("state").annotate(n=Count("pk")).order_by())
+    total = sum(counts.values())
+    done = sum(counts.get(s, 0) for s in FleetCloseItem.TERMINAL_STATES)
+    cutoff = timezone.now() - timedelta(seconds=_setting("FDMS_FLEET_CLOSE_STRAGGLER_SECONDS", 600))
+    attention = run.items.filter(
+        Q(state=FleetCloseItem.STATE_FAILED)
+        | Q(state__in=FleetCloseItem.ACTIVE_STATES, started_at__lt=cutoff)
+        | Q(state=FleetCloseItem.STATE_QUEUED, close_attempts__gt=0)
+    ).select_related("device").order_by("started_at")
+    stragglers, failed = [], []
+    for item in attention:
+        row = {
+            "deviceId": item.device.device_id,
+            "state": item.state,
+            "closeAttempts": item.close_attempts,
+            "fiscalDayNo": item.closed_fiscal_day_no,
+            "lastError": item.last_error,
+            "startedAt": item.started_at.isoformat() if item.started_at else None,
+        }
+        (failed if item.state == FleetCloseItem.STATE_FAILED else stragglers).append(row)
+    return {
+        "runId": run.pk,
+        "status": run.status,
+        "reopen": run.reopen,
+        "concurrency": run.concurrency,
+        "startedAt": run.started_at.isoformat() if run.started_at else None,
+        "finishedAt": run.finished_at.isoformat() if run.finished_at else None,
+        "total": total,
+        "completed": done,
+        "progress": round(done * 100.0 / total, 1) if total else 100.0,
+        "counts": {state: counts.get(state, 0) for state, _ in FleetCloseItem.STATE_CHOICES},
+        "stragglers": stragglers,
+        "failed": failed,
+    }
+
+
+def _emit_progress(run_id: int) -> None:
+    from fiscal.services.fdms_events import emit_to_dashboard
+
+    try:
+        status = get_fleet_close_status(run_id)
+    except Exception as e:
+        logger.warning("Fleet close progress for run %s failed: %s", run_id, e)
+        return
+    if status:
+        emit_to_dashboard("fleet_close.progress", {
+            k: status[k] for k in ("runId", "status", "total", "completed", "progress", "counts")
+        })
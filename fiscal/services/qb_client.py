@@ -1,20 +1,40 @@
 """
 QuickBooks API client. Fetch Invoices and SalesReceipts.
+All API requests are throttled per realm by qb_rate_limit.
 """
 
+import functools
+import importlib
 import logging
 
 from fiscal.models import QuickBooksConnection
-from fiscal.services.key_storage import decrypt_string
-from fiscal.services.qb_oauth import get_qb_credentials, refresh_tokens
+from fiscal.services import qb_rate_limit
+from fiscal.services.qb_oauth import get_decrypted_tokens, get_qb_credentials
 
 logger = logging.getLogger("fiscal")
 
 
+@functools.cache
+def _client_class():
+    """python-quickbooks client whose HTTP requests go through qb_rate_limit (per realm)."""
+    from quickbooks import QuickBooks
+
+    class RateLimitedQuickBooks(QuickBooks):
+        def process_request(self, request_type, url, headers="", params="", data=""):
+            parent = super().process_request
+            return qb_rate_limit.send(
+                self.company_id,
+                lambda: parent(request_type, url, headers=dict(headers or {}), params=params, data=data),
+            )
+
+    return RateLimitedQuickBooks
+
+
 def get_quickbooks_client(conn=None):
-    """Return python-quickbooks QuickBooks client or None."""
+    """Return python-quickbooks QuickBooks client or None. Tokens come from qb_oauth (locked refresh)."""
     try:
-        from quickbooks import QuickBooks
+        client_class = _client_class()
+        from requests_oauthlib import OAuth2Session
     except ImportError:
         logger.warning("python-quickbooks not installed")
         return None
@@ -27,28 +47,15 @@ def get_quickbooks_client(conn=None):
     if not conn or not conn.access_token_encrypted:
         return None
 
-    from django.utils import timezone
-    if conn.token_expires_at and conn.token_expires_at <= timezone.now():
-        ok, err = refresh_tokens(conn)
-        if not ok:
-            logger.warning("QB token refresh failed: %s", err)
-            return None
-
-    try:
-        access = decrypt_string(conn.access_token_encrypted)
-        refresh = decrypt_string(conn.refresh_token_encrypted)
-    except Exception as e:
-        logger.warning("QB token decrypt failed: %s", e)
+    tokens, err = get_decrypted_tokens(conn)
+    if not tokens:
+        logger.warning("QB token unavailable: %s", err)
         return None
+    access, refresh = tokens
 
-    return QuickBooks(
-        sandbox=False,
-        consumer_key=client_id,
-        consumer_secret=client_secret,
-        access_token=access,
-        access_token_secret=refresh,
-        company_id=conn.realm_id,
-    )
+    qb = client_class(sandbox=False, company_id=conn.realm_id)
+    qb.session = OAuth2Session(client_id, token={"access_token": access, "refresh_token": refresh})
+    return qb
 
 
 def _obj_to_dict(obj):
@@ -97,6 +104,57 @@ def fetch_sales_receipts(qb, max_results=50):
         return []
 
 
+_ENTITY_CLASSES = {
+    "Invoice": ("quickbooks.objects.invoice", "Invoice"),
+    "SalesReceipt": ("quickbooks.objects.salesreceipt", "SalesReceipt"),
+}
+
+
+def _entity_class(entity):
+    module_name, class_name = _ENTITY_CLASSES[entity]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def query_changed_since(qb, entity, since=None, start_position=1, max_results=100, where=""):
+    """
+    One page of `entity` ("Invoice" | "SalesReceipt") rows with MetaData.LastUpdatedTime >= since
+    (QBO timestamp string; None: all), oldest first. Raises on API errors so callers keep
+    their cursor.
+    """
+    cls = _entity_class(entity)
+    conditions = [f"MetaData.LastUpdatedTime >= '{since}'"] if since else []
+    if where:
+        conditions.append(where)
+    sql = "SELECT * FROM {}{} ORDERBY MetaData.LastUpdatedTime STARTPOSITION {} MAXRESULTS {}".format(
+        entity,
+        " WHERE " + " AND ".join(conditions) if conditions else "",
+        int(start_position),
+        int(max_results),
+    )
+    return [_obj_to_dict(row) for row in (cls.query(sql, qb=qb) or [])]
+
+
+def fetch_by_ids(qb, entity, ids, where=""):
+    """
+    `entity` rows whose Id is in `ids` (and matching the extra `where` clause), one query
+    (caller bounds len(ids)). Raises on API errors.
+    """
+    ids = [str(i) for i in ids if str(i).isdigit()]  # QBO Ids are numeric; never quote-inject
+    if not ids:
+        return []
+    cls = _entity_class(entity)
+    sql = "SELECT * FROM {} WHERE Id IN ({}){} MAXRESULTS {}".format(
+        entity, ", ".join(f"'{i}'" for i in ids), f" AND {where}" if where else "", len(ids)
+    )
+    return [_obj_to_dict(row) for row in (cls.query(sql, qb=qb) or [])]
+
+
+def last_updated_time(row) -> str:
+    """MetaData.LastUpdatedTime of a fetched row ("" when missing)."""
+    meta = row.get("MetaData") or {}
+    return str(meta.get("LastUpdatedTime") or "") if isinstance(meta, dict) else ""
+
+
 def qb_sale_to_invoice_payload(sale):
     """Normalize QB Invoice or SalesReceipt for map_qb_invoice_to_fdms."""
     if not sale:
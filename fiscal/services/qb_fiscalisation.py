@@ -1,13 +1,20 @@
 """
 QuickBooks → FDMS Auto-Fiscalisation.
 Map QB invoice to FDMS receipt, submit, store. Idempotent by qb_invoice_id.
+Webhooks queue the work (queue_qb_fiscalisation -> fiscal.fiscalise_qb_invoice_task)
+instead of calling FDMS inside the request.
 """
 
+import functools
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from fiscal.models import FiscalDevice, QuickBooksInvoice, Receipt
 from fiscal.services.config_service import get_latest_configs, validate_against_configs
@@ -137,15 +144,8 @@ def map_qb_invoice_to_fdms(qb_payload: dict, device: FiscalDevice) -> tuple[dict
     }, None
 
 
-def fiscalise_qb_invoice(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBooksInvoice | None, str | None]:
-    """
-    Store QB invoice, map to FDMS, submit, store receipt. Idempotent.
-    Returns (QuickBooksInvoice, None) or (None, error_message).
-    """
-    device = FiscalDevice.objects.filter(is_registered=True).first()
-    if not device:
-        return None, "No registered fiscal device"
-
+def _snapshot_fields(qb_payload: dict) -> dict:
+    """QuickBooksInvoice fields taken from a QB payload."""
     cust_ref = qb_payload.get("CustomerRef")
     qb_customer_id = ""
     if isinstance(cust_ref, dict):
@@ -156,28 +156,96 @@ def fiscalise_qb_invoice(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBoo
         currency = str(curr_ref.get("value", "USD"))[:10]
     elif isinstance(curr_ref, str):
         currency = str(curr_ref)[:10]
-    total = Decimal(str(qb_payload.get("TotalAmt") or qb_payload.get("total_amount") or 0))
+    return {
+        "qb_customer_id": qb_customer_id,
+        "currency": currency,
+        "total_amount": Decimal(str(qb_payload.get("TotalAmt") or qb_payload.get("total_amount") or 0)),
+        "raw_payload": qb_payload,
+    }
 
-    with transaction.atomic():
-        qb_inv, created = QuickBooksInvoice.objects.get_or_create(
-            qb_invoice_id=qb_invoice_id,
-            defaults={
-                "qb_customer_id": qb_customer_id,
-                "currency": currency,
-                "total_amount": total,
-                "raw_payload": qb_payload,
-            },
-        )
 
-        if qb_inv.fiscalised and qb_inv.fiscal_receipt_id:
-            return qb_inv, None
+def _claim(qb_inv: QuickBooksInvoice) -> bool:
+    """
+    Move the invoice to PROCESSING unless it is fiscalised or another worker holds it.
+    A PROCESSING claim older than FDMS_QB_FISCALISE_STALE_SECONDS (crashed worker) is taken over.
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, "FDMS_QB_FISCALISE_STALE_SECONDS", 600))
+    claimed = (
+        QuickBooksInvoice.objects.filter(pk=qb_inv.pk)
+        .exclude(fiscalised=True, fiscal_receipt__isnull=False)
+        .filter(~Q(fiscal_status=QuickBooksInvoice.STATUS_PROCESSING) | Q(updated_at__lt=stale))
+        .update(fiscal_status=QuickBooksInvoice.STATUS_PROCESSING, updated_at=timezone.now())
+    )
+    if claimed:
+        qb_inv.fiscal_status = QuickBooksInvoice.STATUS_PROCESSING
+    return bool(claimed)
 
-    payload, err = map_qb_invoice_to_fdms(qb_payload, device)
-    if err:
-        qb_inv.fiscal_error = err
-        qb_inv.save(update_fields=["fiscal_error", "updated_at"])
-        return qb_inv, err
 
+def _fail(qb_inv: QuickBooksInvoice, err: str) -> None:
+    qb_inv.fiscal_error = err
+    qb_inv.fiscal_status = QuickBooksInvoice.STATUS_FAILED
+    qb_inv.save(update_fields=["fiscal_error", "fiscal_status", "updated_at"])
+
+
+def fiscalise_qb_invoice(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBooksInvoice | None, str | None]:
+    """
+    Store QB invoice, map to FDMS, submit, store receipt. Idempotent: only one caller at a
+    time gets to submit a given qb_invoice_id (fiscal_status PROCESSING claim).
+    Returns (QuickBooksInvoice, None) or (None, error_message).
+    """
+    return fiscalise_qb_invoices([(qb_invoice_id, qb_payload)])[qb_invoice_id]
+
+
+def fiscalise_qb_invoices(items) -> dict[str, tuple[QuickBooksInvoice | None, str | None]]:
+    """
+    fiscalise_qb_invoice for many (qb_invoice_id, qb_payload) pairs, e.g. one sync page.
+    Existing rows are loaded with one IN query and the missing ones bulk-inserted; the
+    unfiscalised invoices are then claimed and submitted in order, sharing one device
+    lookup and one fiscal day status fetch. An exception while submitting one invoice marks
+    it FAILED and becomes its error. Returns {qb_invoice_id: (invoice, error)}.
+    """
+    items = dict(items)
+    if not items:
+        return {}
+    device = FiscalDevice.objects.filter(is_registered=True).first()
+    if not device:
+        return {inv_id: (None, "No registered fiscal device") for inv_id in items}
+
+    rows = QuickBooksInvoice.objects.in_bulk(list(items), field_name="qb_invoice_id")
+    missing = [inv_id for inv_id in items if inv_id not in rows]
+    if missing:
+        QuickBooksInvoice.objects.bulk_create(
+            [QuickBooksInvoice(qb_invoice_id=inv_id, **_snapshot_fields(items[inv_id])) for inv_id in missing],
+            ignore_conflicts=True,
+        )
+        rows.update(QuickBooksInvoice.objects.in_bulk(missing, field_name="qb_invoice_id"))
+
+    fiscal_day = functools.cache(lambda: _fiscal_day(device))
+    outcomes = {}
+    for inv_id, qb_payload in items.items():
+        qb_inv = rows[inv_id]
+        if qb_inv.fiscalised and qb_inv.fiscal_receipt_id:
+            outcomes[inv_id] = (qb_inv, None)
+        elif not _claim(qb_inv):
+            qb_inv.refresh_from_db()
+            if qb_inv.fiscalised and qb_inv.fiscal_receipt_id:
+                outcomes[inv_id] = (qb_inv, None)
+            else:
+                outcomes[inv_id] = (qb_inv, "Fiscalisation already in progress")
+        else:
+            try:
+                outcomes[inv_id] = _submit_claimed(qb_inv, qb_payload, device, fiscal_day)
+            except Exception as e:
+                # One bad invoice must not abort the rest of the batch (or lose their outcomes).
+                logger.exception("Fiscalising QB invoice %s failed", inv_id)
+                err = str(e) or e.__class__.__name__
+                _fail(qb_inv, err)
+                outcomes[inv_id] = (qb_inv, err)
+    return outcomes
+
+
+def _fiscal_day(device: FiscalDevice) -> tuple[int, str]:
+    """(fiscal_day_no, fiscal_day_status) from FDMS GetStatus, falling back to the device row."""
     status_data, status_err = None, None
     try:
         from fiscal.services.fdms_device_service import FDMSDeviceService
@@ -185,15 +253,22 @@ def fiscalise_qb_invoice(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBoo
     except Exception as e:
         status_err = str(e)
     if status_err or not status_data:
-        fiscal_day_no = device.last_fiscal_day_no or 1
-    else:
-        fiscal_day_no = status_data.get("lastFiscalDayNo") or device.last_fiscal_day_no or 1
+        return device.last_fiscal_day_no or 1, device.fiscal_day_status
+    fiscal_day_no = status_data.get("lastFiscalDayNo") or device.last_fiscal_day_no or 1
+    return fiscal_day_no, status_data.get("fiscalDayStatus", device.fiscal_day_status)
 
-    status = status_data.get("fiscalDayStatus", device.fiscal_day_status) if status_data else device.fiscal_day_status
+
+def _submit_claimed(qb_inv: QuickBooksInvoice, qb_payload: dict, device: FiscalDevice, fiscal_day) -> tuple[QuickBooksInvoice, str | None]:
+    qb_invoice_id = qb_inv.qb_invoice_id
+    payload, err = map_qb_invoice_to_fdms(qb_payload, device)
+    if err:
+        _fail(qb_inv, err)
+        return qb_inv, err
+
+    fiscal_day_no, status = fiscal_day()
     if status not in ("FiscalDayOpened", "FiscalDayCloseFailed"):
         err = f"Cannot submit: fiscal day status must be FiscalDayOpened or FiscalDayCloseFailed (current: {status})"
-        qb_inv.fiscal_error = err
-        qb_inv.save(update_fields=["fiscal_error", "updated_at"])
+        _fail(qb_inv, err)
         return qb_inv, err
 
     receipt, err = submit_receipt(
@@ -214,10 +289,71 @@ def fiscalise_qb_invoice(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBoo
         qb_inv.fiscalised = True
         qb_inv.fiscal_receipt = receipt
         qb_inv.fiscal_error = ""
-        qb_inv.save(update_fields=["fiscalised", "fiscal_receipt", "fiscal_error", "updated_at"])
+        qb_inv.fiscal_status = QuickBooksInvoice.STATUS_FISCALISED
+        qb_inv.save(update_fields=["fiscalised", "fiscal_receipt", "fiscal_error", "fiscal_status", "updated_at"])
         logger.info("QB invoice %s fiscalised: receipt_global_no=%s", qb_invoice_id, receipt.receipt_global_no)
         return qb_inv, None
 
-    qb_inv.fiscal_error = err or "Unknown error"
-    qb_inv.save(update_fields=["fiscal_error", "updated_at"])
+    _fail(qb_inv, err or "Unknown error")
     return qb_inv, err
+
+
+def _dedupe_key(qb_invoice_id: str) -> str:
+    return f"fdms:qb_fiscalise:{qb_invoice_id}"
+
+
+def queue_qb_fiscalisation(qb_invoice_id: str, qb_payload: dict) -> tuple[QuickBooksInvoice, bool]:
+    """
+    Store the QB payload and enqueue fiscalise_qb_invoice_task once per qb_invoice_id
+    (FDMS_QB_FISCALISE_DEDUPE_SECONDS window; the task clears it). Returns (invoice, queued).
+    A newer payload for an invoice not yet being processed replaces the stored one.
+    The row only becomes QUEUED once the task is handed to the broker; if that fails it is
+    left PENDING for the sync retry sweep.
+    """
+    with transaction.atomic():
+        fields = _snapshot_fields(qb_payload)
+        qb_inv, created = QuickBooksInvoice.objects.get_or_create(qb_invoice_id=qb_invoice_id, defaults=fields)
+        if qb_inv.fiscalised and qb_inv.fiscal_receipt_id:
+            return qb_inv, False
+        if not created and qb_inv.fiscal_status != QuickBooksInvoice.STATUS_PROCESSING:
+            for name, value in fields.items():
+                setattr(qb_inv, name, value)
+            qb_inv.save(update_fields=[*fields, "updated_at"])
+
+    if not cache.add(_dedupe_key(qb_invoice_id), 1, timeout=getattr(settings, "FDMS_QB_FISCALISE_DEDUPE_SECONDS", 300)):
+        return qb_inv, False
+
+    from fiscal.tasks import fiscalise_qb_invoice_task
+
+    waiting = QuickBooksInvoice.objects.filter(pk=qb_inv.pk, fiscalised=False)
+
+    def _send():
+        marked = waiting.filter(
+            fiscal_status__in=(QuickBooksInvoice.STATUS_PENDING, QuickBooksInvoice.STATUS_FAILED)
+        ).update(fiscal_status=QuickBooksInvoice.STATUS_QUEUED, updated_at=timezone.now())
+        try:
+            fiscalise_qb_invoice_task.apply_async(args=[qb_invoice_id])
+        except Exception as e:
+            cache.delete(_dedupe_key(qb_invoice_id))
+            if marked:
+                waiting.filter(fiscal_status=QuickBooksInvoice.STATUS_QUEUED).update(
+                    fiscal_status=QuickBooksInvoice.STATUS_PENDING, updated_at=timezone.now()
+                )
+            logger.warning("Could not enqueue fiscalisation of QB invoice %s: %s", qb_invoice_id, e)
+            return
+        if marked:
+            qb_inv.fiscal_status = QuickBooksInvoice.STATUS_QUEUED
+
+    transaction.on_commit(_send)
+    return qb_inv, True
+
+
+def run_queued_qb_fiscalisation(qb_invoice_id: str) -> tuple[QuickBooksInvoice | None, str | None]:
+    """Worker side of queue_qb_fiscalisation: fiscalise the stored payload."""
+    try:
+        qb_inv = QuickBooksInvoice.objects.filter(qb_invoice_id=qb_invoice_id).first()
+        if qb_inv is None:
+            return None, f"QB invoice {qb_invoice_id} not found"
+        return fiscalise_qb_invoice(qb_invoice_id, qb_inv.raw_payload or {})
+    finally:
+        cache.delete(_dedupe_key(qb_invoice_id))
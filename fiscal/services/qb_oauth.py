@@ -1,12 +1,32 @@
 """
 QuickBooks OAuth 2.0 client. Authorize, callback, token refresh.
+
+Token refresh is shared by web requests, the sync job and webhook workers. QB rotates the
+refresh token on every refresh, so only one refresh per realm may run at a time:
+refresh_tokens takes a per-realm lock and re-reads the tokens under it, so callers queued
+behind a refresh reuse its tokens instead of refreshing again. The lock is the realm's
+QuickBooksConnection row (SELECT ... FOR UPDATE) on databases that support it. SQLite
+does not: there a cache lock is used when the cache is shared (CACHE_REDIS_URL), which
+holds no transaction over the Intuit call, else SQLite's database write lock (taken up
+front, as BEGIN IMMEDIATE would), which also holds off other writers for the call.
+get_decrypted_tokens refreshes FDMS_QB_TOKEN_REFRESH_MARGIN seconds before expiry and keeps
+the decrypted tokens per realm in process memory, keyed by the stored ciphertext.
 """
 
 import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection as db_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
 from fiscal.models import QuickBooksConnection
 from fiscal.services.key_storage import decrypt_string, encrypt_string
@@ -86,7 +106,6 @@ def exchange_code_for_tokens(code: str, redirect_uri: str, realm_id: str) -> tup
     if not access or not refresh:
         return None, "Missing access_token or refresh_token"
 
-    from django.utils import timezone
     expires_at = timezone.now() + timedelta(seconds=expires_in)
 
     conn, _ = QuickBooksConnection.objects.update_or_create(
@@ -102,8 +121,88 @@ def exchange_code_for_tokens(code: str, redirect_uri: str, realm_id: str) -> tup
     return {"realm_id": realm_id}, None
 
 
-def refresh_tokens(conn: QuickBooksConnection) -> tuple[bool, str | None]:
-    """Refresh access token. Returns (success, error_message)."""
+_TOKEN_FIELDS = ["access_token_encrypted", "refresh_token_encrypted", "token_expires_at", "updated_at"]
+
+# Cache lock (SQLite with a shared cache): held at most LOCK_TTL seconds (> the 30s token
+# request timeout), waited on for at most LOCK_WAIT seconds.
+_REFRESH_LOCK_TTL = 60
+_REFRESH_LOCK_WAIT = 35
+
+# realm_id -> (access_token_encrypted, access, refresh)
+_decrypted: dict[str, tuple[str, str, str]] = {}
+_decrypted_lock = threading.Lock()
+
+
+def refresh_due(conn: QuickBooksConnection) -> bool:
+    """True once the access token is within FDMS_QB_TOKEN_REFRESH_MARGIN seconds of expiry."""
+    if not conn.token_expires_at:
+        return False
+    margin = timedelta(seconds=getattr(settings, "FDMS_QB_TOKEN_REFRESH_MARGIN", 300))
+    return conn.token_expires_at - timezone.now() <= margin
+
+
+def _expired(conn: QuickBooksConnection) -> bool:
+    return bool(conn.token_expires_at and conn.token_expires_at <= timezone.now())
+
+
+class _RefreshLockTimeout(Exception):
+    pass
+
+
+def _cache_is_shared() -> bool:
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    return not backend.endswith(("LocMemCache", "DummyCache"))
+
+
+@contextmanager
+def _realm_refresh_lock(conn: QuickBooksConnection):
+    """Hold the realm's refresh lock (see module docstring); yields its token fields re-read under it, or None."""
+    if db_connection.features.has_select_for_update:
+        with transaction.atomic():
+            yield QuickBooksConnection.objects.select_for_update().filter(pk=conn.pk).only(*_TOKEN_FIELDS).first()
+        return
+    rows = QuickBooksConnection.objects.filter(pk=conn.pk).only(*_TOKEN_FIELDS)
+    if _cache_is_shared():
+        key = f"fdms:qb_oauth:refresh:{conn.realm_id}"
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + _REFRESH_LOCK_WAIT
+        while not cache.add(key, owner, timeout=_REFRESH_LOCK_TTL):
+            if time.monotonic() >= deadline:
+                raise _RefreshLockTimeout
+            time.sleep(0.1)
+        try:
+            yield rows.first()
+        finally:
+            if cache.get(key) == owner:
+                cache.delete(key)
+        return
+    with transaction.atomic():
+        rows.update(refresh_token_encrypted=F("refresh_token_encrypted"))
+        yield rows.first()
+
+
+def refresh_tokens(conn: QuickBooksConnection, force: bool = False) -> tuple[bool, str | None]:
+    """
+    Refresh access token under the realm's refresh lock. Returns (success, error_message).
+    conn is reloaded under the lock: tokens another process refreshed meanwhile are reused
+    (also with force, when they changed while we waited for the lock).
+    """
+    before = conn.access_token_encrypted
+    try:
+        with _realm_refresh_lock(conn) as locked:
+            if locked is None:
+                return False, "QuickBooks connection not found"
+            for name in _TOKEN_FIELDS:
+                setattr(conn, name, getattr(locked, name))
+            if conn.access_token_encrypted != before or (not force and not refresh_due(conn)):
+                return True, None
+            return _request_refresh(conn)
+    except _RefreshLockTimeout:
+        return False, "Timed out waiting for another QuickBooks token refresh"
+
+
+def _request_refresh(conn: QuickBooksConnection) -> tuple[bool, str | None]:
+    """Call Intuit's refresh_token grant and store the rotated tokens. Caller holds the realm's refresh lock."""
     client_id, client_secret = get_qb_credentials()
     if not client_id or not client_secret:
         return False, "QB credentials not configured"
@@ -136,10 +235,38 @@ def refresh_tokens(conn: QuickBooksConnection) -> tuple[bool, str | None]:
     refresh = data.get("refresh_token") or refresh_token
     expires_in = int(data.get("expires_in", 3600))
 
-    from django.utils import timezone
     conn.access_token_encrypted = encrypt_string(access)
     conn.refresh_token_encrypted = encrypt_string(refresh)
     conn.token_expires_at = timezone.now() + timedelta(seconds=expires_in)
-    conn.save(update_fields=["access_token_encrypted", "refresh_token_encrypted", "token_expires_at", "updated_at"])
+    conn.save(update_fields=_TOKEN_FIELDS)
+    with _decrypted_lock:
+        _decrypted[conn.realm_id] = (conn.access_token_encrypted, access, refresh)
     logger.info("QB OAuth: tokens refreshed for realm %s", conn.realm_id)
     return True, None
+
+
+def get_decrypted_tokens(conn: QuickBooksConnection) -> tuple[tuple[str, str] | None, str | None]:
+    """
+    ((access_token, refresh_token), None) for API calls, refreshing ahead of expiry.
+    A failed early refresh keeps using the current token until it actually expires.
+    Returns (None, error_message) when no usable token is available.
+    """
+    if refresh_due(conn):
+        ok, err = refresh_tokens(conn)
+        if not ok:
+            if _expired(conn):
+                return None, err
+            logger.warning("QB token refresh for realm %s failed, token still valid: %s", conn.realm_id, err)
+
+    with _decrypted_lock:
+        cached = _decrypted.get(conn.realm_id)
+    if cached and cached[0] == conn.access_token_encrypted:
+        return (cached[1], cached[2]), None
+    try:
+        access = decrypt_string(conn.access_token_encrypted)
+        refresh = decrypt_string(conn.refresh_token_encrypted)
+    except Exception as e:
+        return None, f"QB token decrypt failed: {e}"
+    with _decrypted_lock:
+        _decrypted[conn.realm_id] = (conn.access_token_encrypted, access, refresh)
+    return (access, refresh), None
@@ -0,0 +1,252 @@
+"""
+QuickBooks request layer: every QBO API call of a realm goes through send().
+
+Intuit throttles per realm (about 500 requests per minute and 10 in flight) and answers
+HTTP 429 beyond that. The limits below are shared by all web and Celery processes, so a
+sync, a webhook burst and a backfill draw on the same allowance. Their keys live in Redis
+(FDMS_QB_RATE_LIMIT_BACKEND "redis", at FDMS_QB_RATE_LIMIT_REDIS_URL); "cache" uses Django's
+cache instead, which is only shared when it is Redis too (CACHE_REDIS_URL):
+- budget: FDMS_QB_RATE_PER_MINUTE requests, handed out per FDMS_QB_RATE_WINDOW_SECONDS
+  window (a token bucket refilled at each window start); callers over budget wait for
+  the next window.
+- concurrency: at most FDMS_QB_MAX_CONCURRENCY requests in flight per realm (slots
+  with a lease, so a crashed worker cannot hold one forever).
+- backoff: a 429/503 pauses the whole realm for Retry-After seconds (exponential from
+  FDMS_QB_BACKOFF_BASE when absent) and the request is retried up to FDMS_QB_MAX_RETRIES
+  times; after that the throttled response is returned to the client library.
+Counters per realm (requests, throttled, retries, wait_seconds, errors) are kept in
+process memory, see qb_request_metrics.
+"""
+
+import email.utils
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("fiscal")
+
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Indirection so tests can drive a fake clock.
+_clock = time.time
+_sleep = time.sleep
+
+_metrics: dict[str, Counter] = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+
+# Increment an existing key only: a counter whose window expired must be re-created with a TTL.
+_INCR_EXISTING_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return redis.call('INCR', KEYS[1])
+end
+return nil
+"""
+
+
+class QbRequestTimeout(Exception):
+    """No budget or request slot became free within FDMS_QB_ACQUIRE_TIMEOUT seconds."""
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+class _RedisStore:
+    """The cache operations the limiter uses, on a Redis client (values come back as str)."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2, decode_responses=True)
+        self._incr = self._client.register_script(_INCR_EXISTING_LUA)
+
+    def add(self, key, value, timeout):
+        return bool(self._client.set(key, value, nx=True, ex=max(1, math.ceil(timeout))))
+
+    def set(self, key, value, timeout):
+        self._client.set(key, value, ex=max(1, math.ceil(timeout)))
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def incr(self, key):
+        value = self._incr(keys=[key])
+        if value is None:
+            raise ValueError(f"Key {key!r} not found")
+        return int(value)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    """Configured key store (singleton per process): Redis, or Django's cache."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if _setting("FDMS_QB_RATE_LIMIT_BACKEND", "redis") == "redis":
+                    _store = _RedisStore(_setting("FDMS_QB_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"))
+                else:
+                    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+                    if backend.endswith(("LocMemCache", "DummyCache")):
+                        logger.warning(
+                            "QuickBooks rate limits use a per-process cache (%s): each process gets "
+                            "its own allowance. Use FDMS_QB_RATE_LIMIT_BACKEND=redis or CACHE_REDIS_URL.",
+                            backend,
+                        )
+                    _store = cache
+    return _store
+
+
+def reset_qb_rate_limit_store() -> None:
+    """Drop the store singleton (tests, settings changes)."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def _record(realm_id: str, **values) -> None:
+    with _metrics_lock:
+        _metrics[realm_id].update(values)
+
+
+def qb_request_metrics(realm_id: str | None = None) -> dict:
+    """Counters of this process: {realm_id: {...}}, or one realm's counters."""
+    with _metrics_lock:
+        if realm_id is not None:
+            return dict(_metrics.get(str(realm_id), {}))
+        return {realm: dict(counts) for realm, counts in _metrics.items()}
+
+
+def reset_qb_request_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def retry_after_seconds(value) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date); None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - _clock())
+
+
+def _cooldown_key(realm_id: str) -> str:
+    return f"fdms:qb_cooldown:{realm_id}"
+
+
+def _pause_realm(realm_id: str, delay: float) -> None:
+    store = _get_store()
+    until = _clock() + delay
+    current = float(store.get(_cooldown_key(realm_id)) or 0)
+    if until > current:
+        store.set(_cooldown_key(realm_id), until, timeout=math.ceil(delay) + 1)
+
+
+def _wait_cooldown(realm_id: str, deadline: float) -> None:
+    until = _get_store().get(_cooldown_key(realm_id))
+    delay = float(until or 0) - _clock()
+    if delay > 0:
+        if _clock() + delay > deadline:
+            raise QbRequestTimeout(f"QuickBooks realm {realm_id} throttled for {delay:.0f}s")
+        _sleep(delay)
+
+
+def _take_budget(realm_id: str, deadline: float) -> None:
+    window = max(1, _setting("FDMS_QB_RATE_WINDOW_SECONDS", 10))
+    budget = max(1, int(_setting("FDMS_QB_RATE_PER_MINUTE", 450) * window / 60))
+    store = _get_store()
+    while True:
+        now = _clock()
+        start = int(now // window) * window
+        key = f"fdms:qb_rate:{realm_id}:{start}"
+        store.add(key, 0, timeout=window * 2)
+        try:
+            used = store.incr(key)
+        except ValueError:  # expired between add and incr
+            continue
+        if used <= budget:
+            return
+        wait = start + window - now
+        if now + wait > deadline:
+            raise QbRequestTimeout(f"QuickBooks request budget for realm {realm_id} exhausted")
+        _sleep(wait)
+
+
+def _acquire_slot(realm_id: str, deadline: float) -> tuple[str, str]:
+    owner = uuid.uuid4().hex
+    lease = _setting("FDMS_QB_SLOT_LEASE_SECONDS", 120)
+    store = _get_store()
+    while True:
+        for i in range(max(1, _setting("FDMS_QB_MAX_CONCURRENCY", 4))):
+            key = f"fdms:qb_slot:{realm_id}:{i}"
+            if store.add(key, owner, timeout=lease):
+                return key, owner
+        if _clock() >= deadline:
+            raise QbRequestTimeout(f"No free QuickBooks request slot for realm {realm_id}")
+        _sleep(_setting("FDMS_QB_SLOT_POLL_INTERVAL", 0.05))
+
+
+def _release_slot(key: str, owner: str) -> None:
+    store = _get_store()
+    if store.get(key) == owner:
+        store.delete(key)
+
+
+def send(realm_id, request):
+    """
+    Run request() (returns a requests.Response) for realm_id within the realm's limits,
+    retrying throttled responses. Raises QbRequestTimeout when no capacity frees up in time.
+    """
+    realm_id = str(realm_id)
+    retries = _setting("FDMS_QB_MAX_RETRIES", 5)
+    for attempt in range(retries + 1):
+        started = _clock()
+        deadline = started + _setting("FDMS_QB_ACQUIRE_TIMEOUT", 120)
+        _wait_cooldown(realm_id, deadline)
+        _take_budget(realm_id, deadline)
+        slot = _acquire_slot(realm_id, deadline)
+        _record(realm_id, requests=1, wait_seconds=_clock() - started)
+        try:
+            response = request()
+        except Exception:
+            _record(realm_id, errors=1)
+            raise
+        finally:
+            _release_slot(*slot)
+
+        if response.status_code not in THROTTLE_STATUS_CODES:
+            return response
+        _record(realm_id, throttled=1)
+        if attempt >= retries:
+            logger.warning("QB realm %s still throttled after %d retries", realm_id, retries)
+            return response
+        delay = retry_after_seconds(response.headers.get("Retry-After"))
+        if delay is None:
+            base = _setting("FDMS_QB_BACKOFF_BASE", 1.0) * 2 ** attempt
+            delay = min(base, _setting("FDMS_QB_BACKOFF_MAX", 60)) * random.uniform(1.0, 1.25)
+        logger.warning(
+            "QB realm %s throttled (HTTP %s), retry %d/%d in %.1fs",
+            realm_id, response.status_code, attempt + 1, retries, delay,
+        )
+        _pause_realm(realm_id, delay)
+        _record(realm_id, retries=1)
@@ -1,49 +1,189 @@
 """
 QuickBooks sync: fetch sales from QB, fiscalise via FDMS.
+
+Incremental: each QuickBooksConnection keeps a cursor per entity (sync_cursors, the last
+processed MetaData.LastUpdatedTime). A run pages through Invoices (paid only) and
+SalesReceipts changed since the cursor, oldest first, FDMS_QB_SYNC_PAGE_SIZE rows per
+query, and saves the cursor after every page. So an interrupted run resumes where it
+stopped, and cost follows new activity. Pages are keyed on LastUpdatedTime (>= the last
+timestamp, skipping rows already seen at it), which stays correct while documents are
+edited mid-run. Each run restarts FDMS_QB_SYNC_OVERLAP_SECONDS before the cursor to
+absorb clock skew and ties. Already-fiscalised documents are skipped (one IN query per
+page), so that overlap is cheap; the rest of a page is fiscalised as one batch. A run stops after FDMS_QB_SYNC_MAX_PAGES pages per entity ("more" in the result).
+The first run starts FDMS_QB_SYNC_INITIAL_LOOKBACK_DAYS back, not at the start of the
+company's history.
+The cursor moves past documents whose fiscalisation failed, so each run first retries up
+to FDMS_QB_SYNC_RETRY_LIMIT unfiscalised FAILED/PENDING snapshots (oldest attempt first)
+from their stored raw_payload.
+Runs in the worker as fiscal.qb_sync_task: every 5 minutes on beat, and when queued from
+the QB invoices page (api_qb_sync, polled via its status_url).
 """
 
 import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from fiscal.models import QuickBooksConnection, QuickBooksInvoice
-from fiscal.services.qb_client import fetch_invoices, fetch_sales_receipts, get_quickbooks_client, qb_sale_to_invoice_payload
-from fiscal.services.qb_fiscalisation import fiscalise_qb_invoice
+from fiscal.services.qb_client import get_quickbooks_client, last_updated_time, qb_sale_to_invoice_payload, query_changed_since
+from fiscal.services.qb_fiscalisation import fiscalise_qb_invoices
 
 logger = logging.getLogger("fiscal")
 
+# entity -> (result counter, extra WHERE clause)
+SYNC_ENTITIES = {
+    "Invoice": ("invoices_fetched", "Balance = '0'"),
+    "SalesReceipt": ("sales_receipts_fetched", ""),
+}
 
-def sync_from_quickbooks(conn: QuickBooksConnection | None = None, max_per_type: int = 50) -> dict:
-    """
-    Fetch Invoices and SalesReceipts from QB, fiscalise unfiscalised.
-    Returns { "invoices_fetched", "sales_receipts_fetched", "fiscalised", "skipped", "errors" }.
-    """
-    qb = get_quickbooks_client(conn)
-    if not qb:
-        return {"error": "QuickBooks not connected", "fiscalised": 0, "skipped": 0, "errors": []}
 
-    result = {"invoices_fetched": 0, "sales_receipts_fetched": 0, "fiscalised": 0, "skipped": 0, "errors": []}
+def _setting(name: str, default):
+    return getattr(settings, name, default)
 
-    invoices = fetch_invoices(qb, max_results=max_per_type)
-    result["invoices_fetched"] = len(invoices)
 
-    sales = fetch_sales_receipts(qb, max_results=max_per_type)
-    result["sales_receipts_fetched"] = len(sales)
+def _qb_timestamp(value) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _start_timestamp(cursor: str | None) -> str:
+    """Query start for a stored cursor: cursor minus the overlap, or the initial lookback."""
+    parsed = parse_datetime(cursor) if cursor else None
+    if parsed is None:
+        return _qb_timestamp(timezone.now() - timedelta(days=_setting("FDMS_QB_SYNC_INITIAL_LOOKBACK_DAYS", 7)))
+    return _qb_timestamp(parsed - timedelta(seconds=_setting("FDMS_QB_SYNC_OVERLAP_SECONDS", 300)))
+
+
+def iter_changed_pages(qb, entity: str, since: str, page_size: int, where: str = ""):
+    """
+    Yield (rows, last_timestamp) pages of `entity` changed at or after `since`, oldest first.
+    Each query starts at the last timestamp seen and skips the rows already seen at it, so
+    rows moving to the end (edited mid-run) cannot shift others out of a page.
+    """
+    cursor, skip = since, 0
+    seen = set()
+    while True:
+        rows = query_changed_since(qb, entity, since=cursor, start_position=skip + 1, max_results=page_size, where=where)
+        fresh = [r for r in rows if str(r.get("Id", "")) not in seen]
+        seen.update(str(r.get("Id", "")) for r in rows)
+        last = last_updated_time(rows[-1]) if rows else ""
+        if fresh:
+            yield fresh, last or cursor
+        if len(rows) < page_size or not last:
+            return
+        tied = sum(1 for r in rows if last_updated_time(r) == last)
+        if last == cursor:
+            skip += tied
+        else:
+            cursor, skip = last, tied
 
-    seen_ids = set()
-    for inv in invoices + sales:
+
+def _fiscalise_rows(rows: list[dict], result: dict) -> None:
+    """Fiscalise one page: one IN query finds the already-fiscalised Ids, the rest go in one batch."""
+    payloads = {}
+    for inv in rows:
         inv_id = str(inv.get("Id", ""))
-        if not inv_id or inv_id in seen_ids:
-            continue
-        seen_ids.add(inv_id)
+        if inv_id:
+            payloads.setdefault(inv_id, inv)
+    done = set(
+        QuickBooksInvoice.objects.filter(qb_invoice_id__in=list(payloads), fiscalised=True)
+        .values_list("qb_invoice_id", flat=True)
+    )
+    result["skipped"] += len(done)
+    pending = [(inv_id, qb_sale_to_invoice_payload(inv)) for inv_id, inv in payloads.items() if inv_id not in done]
+    _record_outcomes(fiscalise_qb_invoices(pending), result)
 
-        if QuickBooksInvoice.objects.filter(qb_invoice_id=inv_id, fiscalised=True).exists():
-            result["skipped"] += 1
-            continue
 
-        payload = qb_sale_to_invoice_payload(inv)
-        qb_inv, err = fiscalise_qb_invoice(inv_id, payload)
+def _record_outcomes(outcomes: dict, result: dict) -> None:
+    for inv_id, (qb_inv, err) in outcomes.items():
         if qb_inv and qb_inv.fiscalised:
             result["fiscalised"] += 1
         elif err:
             result["errors"].append(f"{inv_id}: {err}")
 
+
+def _retry_unfiscalised(result: dict) -> None:
+    """Re-fiscalise snapshots that failed (or were never claimed) in earlier runs."""
+    limit = _setting("FDMS_QB_SYNC_RETRY_LIMIT", 100)
+    if limit <= 0:
+        return
+    rows = list(
+        QuickBooksInvoice.objects.filter(
+            fiscalised=False,
+            fiscal_status__in=(QuickBooksInvoice.STATUS_FAILED, QuickBooksInvoice.STATUS_PENDING),
+        )
+        .exclude(raw_payload={})
+        .order_by("updated_at")
+        .values_list("qb_invoice_id", "raw_payload")[:limit]
+    )
+    if not rows:
+        return
+    result["retried"] += len(rows)
+    try:
+        _record_outcomes(fiscalise_qb_invoices(rows), result)
+    except Exception as e:
+        logger.exception("QB sync retry of failed fiscalisations failed")
+        result["errors"].append(f"Retrying failed fiscalisations failed: {e}")
+
+
+def sync_from_quickbooks(
+    conn: QuickBooksConnection | None = None,
+    page_size: int | None = None,
+    max_pages: int | None = None,
+) -> dict:
+    """
+    Retry earlier failures, then fetch Invoices and SalesReceipts changed since the
+    connection's cursors and fiscalise unfiscalised.
+    Returns { "invoices_fetched", "sales_receipts_fetched", "retried", "fiscalised", "skipped",
+    "errors" (per-document fiscalisation errors), "pages", "more", "cursors" }; "error" when QB
+    is not connected, a fetch failed or a page could not be fiscalised.
+    """
+    conn = conn or QuickBooksConnection.objects.filter(is_active=True).first()
+    qb = get_quickbooks_client(conn) if conn else None
+    if not qb:
+        return {"error": "QuickBooks not connected", "fiscalised": 0, "skipped": 0, "errors": []}
+
+    page_size = max(1, min(page_size or _setting("FDMS_QB_SYNC_PAGE_SIZE", 100), 1000))  # QBO MAXRESULTS <= 1000
+    max_pages = max_pages or _setting("FDMS_QB_SYNC_MAX_PAGES", 50)
+    result = {
+        "invoices_fetched": 0, "sales_receipts_fetched": 0, "retried": 0, "fiscalised": 0, "skipped": 0,
+        "errors": [], "pages": 0, "more": False,
+    }
+    cursors = dict(conn.sync_cursors or {})
+    _retry_unfiscalised(result)
+
+    for entity, (counter, where) in SYNC_ENTITIES.items():
+        pages = 0
+        page_iter = iter_changed_pages(qb, entity, _start_timestamp(cursors.get(entity)), page_size, where)
+        while pages < max_pages:
+            try:
+                page = next(page_iter, None)
+            except Exception as e:
+                logger.exception("QB sync of %s failed", entity)
+                result["error"] = f"Fetching {entity} failed: {e}"
+                break
+            if page is None:
+                break
+            rows, last = page
+            result[counter] += len(rows)
+            try:
+                _fiscalise_rows(rows, result)
+            except Exception as e:
+                # The page keeps the cursor; the next run fetches it again.
+                logger.exception("QB sync fiscalisation of %s failed", entity)
+                result["error"] = f"Fiscalising {entity} failed: {e}"
+                break
+            cursors[entity] = last
+            conn.sync_cursors = cursors
+            conn.save(update_fields=["sync_cursors", "updated_at"])
+            pages += 1
+        else:
+            result["more"] = True
+        result["pages"] += pages
+
+    if "error" not in result:
+        conn.last_synced_at = timezone.now()
+        conn.save(update_fields=["last_synced_at", "updated_at"])
+    result["cursors"] = cursors
     return result
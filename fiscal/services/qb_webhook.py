@@ -0,0 +1,124 @@
+"""
+QuickBooks webhook fan-out.
+
+A notification can carry many entities across realms, in the legacy eventNotifications
+format or as a CloudEvents list. extract_entity_refs collects every Invoice and
+SalesReceipt create/update. process_webhook_event (fiscal.process_qb_webhook_task) then
+fetches their bodies with one `Id IN (...)` query per realm, entity and batch of
+FDMS_QB_WEBHOOK_FETCH_BATCH ids, and queues each for fiscalisation
+(queue_qb_fiscalisation, deduped by invoice Id). Fetches apply the same filters as the
+sync (Invoices: paid only), so unpaid invoices are not fiscalised. Entities that cannot be
+fetched are picked up by the next incremental sync (qb_sync). Each notification is handled
+with its own realm's connection; a realm without an active connection is an error.
+"""
+
+import logging
+
+from django.conf import settings
+
+from fiscal.models import QuickBooksConnection, QuickBooksEvent
+from fiscal.services.qb_client import fetch_by_ids, get_quickbooks_client, qb_sale_to_invoice_payload
+from fiscal.services.qb_sync import SYNC_ENTITIES
+
+logger = logging.getLogger("fiscal")
+
+WEBHOOK_ENTITIES = {"invoice": "Invoice", "salesreceipt": "SalesReceipt"}
+WEBHOOK_OPERATIONS = {"create": "Create", "created": "Create", "update": "Update", "updated": "Update"}
+
+
+def extract_entity_refs(body) -> list[tuple[str, str, str]]:
+    """[(realm_id, entity, id)] for every Invoice/SalesReceipt create or update, in order, deduped."""
+    refs = []
+    if isinstance(body, list):
+        # CloudEvents: type "qbo.<entity>.<operation>.v1"
+        for ev in body:
+            if not isinstance(ev, dict):
+                continue
+            parts = str(ev.get("type", "")).lower().split(".")
+            entity = WEBHOOK_ENTITIES.get(parts[1]) if len(parts) > 2 else None
+            operation = WEBHOOK_OPERATIONS.get(parts[2]) if len(parts) > 2 else None
+            entity_id = ev.get("intuitentityid") or ev.get("intuitEntityId")
+            if entity and operation and entity_id:
+                refs.append((str(ev.get("intuitaccountid") or ev.get("intuitAccountId") or ""), entity, str(entity_id)))
+    elif isinstance(body, dict):
+        for notif in body.get("eventNotifications") or []:
+            realm_id = str(notif.get("realmId") or "")
+            for ent in (notif.get("dataChangeEvent") or {}).get("entities") or []:
+                entity = WEBHOOK_ENTITIES.get(str(ent.get("name", "")).lower())
+                operation = WEBHOOK_OPERATIONS.get(str(ent.get("operation", "")).lower())
+                if entity and operation and ent.get("id"):
+                    refs.append((realm_id, entity, str(ent["id"])))
+    return list(dict.fromkeys(refs))
+
+
+def webhook_event_type(body) -> str:
+    """Label stored on QuickBooksEvent: first CloudEvent type or first notification "Name.Operation"."""
+    if isinstance(body, list):
+        first = body[0] if body and isinstance(body[0], dict) else {}
+        return str(first.get("type") or "unknown")
+    if isinstance(body, dict):
+        for notif in body.get("eventNotifications") or []:
+            for ent in (notif.get("dataChangeEvent") or {}).get("entities") or []:
+                return f"{ent.get('name', '')}.{ent.get('operation', '')}"
+    return "unknown"
+
+
+def _connection(realm_id: str) -> QuickBooksConnection | None:
+    """The realm's active connection; only a notification without a realm uses the default one."""
+    qs = QuickBooksConnection.objects.filter(is_active=True)
+    return qs.filter(realm_id=realm_id).first() if realm_id else qs.first()
+
+
+def process_webhook_event(event_id: int) -> dict:
+    """
+    Fetch and queue every entity of a stored webhook event.
+    Returns {"entities", "fetched", "queued", "missing", "fetch_calls", "errors"}; "missing"
+    lists entities QBO did not return (deleted, or Invoices not yet paid).
+    """
+    from fiscal.services.qb_fiscalisation import queue_qb_fiscalisation
+
+    result = {"entities": 0, "fetched": 0, "queued": 0, "missing": [], "fetch_calls": 0, "errors": []}
+    event = QuickBooksEvent.objects.filter(pk=event_id).first()
+    if event is None:
+        result["errors"].append(f"Webhook event {event_id} not found")
+        return result
+    payload = event.payload
+    refs = extract_entity_refs(payload.get("_cloud_events", payload) if isinstance(payload, dict) else payload)
+    result["entities"] = len(refs)
+
+    groups: dict[tuple[str, str], list[str]] = {}
+    for realm_id, entity, entity_id in refs:
+        groups.setdefault((realm_id, entity), []).append(entity_id)
+
+    batch_size = max(1, getattr(settings, "FDMS_QB_WEBHOOK_FETCH_BATCH", 50))
+    clients = {}
+    for (realm_id, entity), ids in groups.items():
+        if realm_id not in clients:
+            conn = _connection(realm_id)
+            clients[realm_id] = get_quickbooks_client(conn) if conn else None
+        qb = clients[realm_id]
+        if qb is None:
+            result["errors"].append(f"QuickBooks not connected for realm {realm_id or '?'}")
+            continue
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            try:
+                rows = fetch_by_ids(qb, entity, batch, SYNC_ENTITIES[entity][1])
+            except Exception as e:
+                logger.warning("QB webhook fetch of %s %s failed: %s", entity, batch, e)
+                result["errors"].append(f"Fetching {entity} {batch[0]}..{batch[-1]} failed: {e}")
+                continue
+            finally:
+                result["fetch_calls"] += 1
+            by_id = {str(row.get("Id", "")): row for row in rows}
+            for entity_id in batch:
+                row = by_id.get(entity_id)
+                if row is None:
+                    result["missing"].append(f"{entity}:{entity_id}")
+                    continue
+                result["fetched"] += 1
+                _, queued = queue_qb_fiscalisation(entity_id, qb_sale_to_invoice_payload(row))
+                result["queued"] += int(queued)
+    if result["errors"] or result["missing"]:
+        logger.warning("QB webhook event %s: %s", event_id, {k: result[k] for k in ("missing", "errors")})
+    return result
@@ -0,0 +1,148 @@
+"""
+Normalised receipt tax/payment lines.
+Mirrors Receipt.receipt_taxes and Receipt.receipt_payments into ReceiptTaxLine and
+ReceiptPaymentLine (integer cents) so dashboard, metrics and CloseDay aggregations
+can run as GROUP BY queries instead of iterating JSON in Python.
+The JSON fields remain the source of truth; lines are rebuilt whenever they change.
+"""
+
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from fiscal.models import Receipt, ReceiptPaymentLine, ReceiptTaxLine
+
+logger = logging.getLogger("fiscal")
+
+# Receipt fields that feed the normalised lines. A save() with update_fields outside
+# this set (e.g. qr_code_value) does not need the lines rebuilt.
+LINE_SOURCE_FIELDS = frozenset({
+    "receipt_taxes",
+    "receipt_payments",
+    "currency",
+    "receipt_type",
+    "fiscal_day_no",
+    "device",
+    "device_id",
+})
+
+
+def to_cents(value) -> int:
+    """Convert a JSON amount (float/str/int/None) to integer cents, ROUND_HALF_UP."""
+    if value is None or value == "":
+        return 0
+    try:
+        d = Decimal(str(value))
+    except Exception:
+        return 0
+    return int((d * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def normalise_currency(currency) -> str:
+    return (currency or "USD").strip().upper()[:3]
+
+
+def normalise_receipt_type(receipt_type) -> str:
+    """FiscalInvoice -> FISCALINVOICE, CreditNote -> CREDITNOTE, etc."""
+    return (receipt_type or "").strip().upper()[:20]
+
+
+def build_tax_lines(receipt: Receipt) -> list[ReceiptTaxLine]:
+    """Build unsaved ReceiptTaxLine rows from receipt.receipt_taxes."""
+    currency = normalise_currency(receipt.currency)
+    rt = normalise_receipt_type(receipt.receipt_type)
+    rows = []
+    for tax in receipt.receipt_taxes or []:
+        if not isinstance(tax, dict):
+            continue
+        tax_id = tax.get("taxID")
+        try:
+            tax_id = int(tax_id) if tax_id is not None else None
+        except (TypeError, ValueError):
+            tax_id = None
+        percent = tax.get("taxPercent", tax.get("fiscalCounterTaxPercent"))
+        if percent is not None and percent != "":
+            try:
+                percent = Decimal(str(round(float(percent), 2)))
+            except (TypeError, ValueError):
+                percent = None
+        else:
+            percent = None
+        rows.append(ReceiptTaxLine(
+            receipt_id=receipt.pk,
+            device_id=receipt.device_id,
+            fiscal_day_no=receipt.fiscal_day_no,
+            receipt_type=rt,
+            currency=currency,
+            tax_id=tax_id,
+            tax_code=str(tax.get("taxCode") or "")[:10],
+            tax_percent=percent,
+            tax_amount_cents=to_cents(tax.get("taxAmount") or 0),
+            sales_amount_with_tax_cents=to_cents(
+                tax.get("salesAmountWithTax", tax.get("fiscalCounterValue")) or 0
+            ),
+        ))
+    return rows
+
+
+def build_payment_lines(receipt: Receipt) -> list[ReceiptPaymentLine]:
+    """Build unsaved ReceiptPaymentLine rows from receipt.receipt_payments."""
+    currency = normalise_currency(receipt.currency)
+    rt = normalise_receipt_type(receipt.receipt_type)
+    rows = []
+    for pay in receipt.receipt_payments or []:
+        if not isinstance(pay, dict):
+            continue
+        method = str(
+            pay.get("moneyTypeCode") or pay.get("moneyType") or pay.get("method") or "CASH"
+        ).strip().upper()
+        rows.append(ReceiptPaymentLine(
+            receipt_id=receipt.pk,
+            device_id=receipt.device_id,
+            fiscal_day_no=receipt.fiscal_day_no,
+            receipt_type=rt,
+            currency=currency,
+            money_type=method[:30],
+            payment_amount_cents=to_cents(pay.get("paymentAmount", pay.get("amount")) or 0),
+        ))
+    return rows
+
+
+def sync_receipt_lines(receipt: Receipt) -> tuple[int, int]:
+    """
+    Replace the normalised tax/payment lines for a receipt.
+    Returns (tax_line_count, payment_line_count).
+    """
+    tax_rows = build_tax_lines(receipt)
+    pay_rows = build_payment_lines(receipt)
+    with transaction.atomic():
+        ReceiptTaxLine.objects.filter(receipt_id=receipt.pk).delete()
+        ReceiptPaymentLine.objects.filter(receipt_id=receipt.pk).delete()
+        if tax_rows:
+            ReceiptTaxLine.objects.bulk_create(tax_rows)
+        if pay_rows:
+            ReceiptPaymentLine.objects.bulk_create(pay_rows)
+    return len(tax_rows), len(pay_rows)
+
+
+def bulk_sync_receipt_lines(receipts) -> tuple[int, int]:
+    """
+    Rebuild lines for a batch of receipts with one delete and one insert per table.
+    Used by the backfill command. Returns (tax_line_count, payment_line_count).
+    """
+    receipts = list(receipts)
+    if not receipts:
+        return 0, 0
+    ids = [r.pk for r in receipts]
+    tax_rows = []
+    pay_rows = []
+    for r in receipts:
+        tax_rows.extend(build_tax_lines(r))
+        pay_rows.extend(build_payment_lines(r))
+    with transaction.atomic():
+        ReceiptTaxLine.objects.filter(receipt_id__in=ids).delete()
+        ReceiptPaymentLine.objects.filter(receipt_id__in=ids).delete()
+        ReceiptTaxLine.objects.bulk_create(tax_rows, batch_size=1000)
+        ReceiptPaymentLine.objects.bulk_create(pay_rows, batch_size=1000)
+    return len(tax_rows), len(pay_rows)
@@ -23,13 +23,10 @@ from fiscal.services.tax_calculator import extract_net_from_inclusive, extract_t
 from fiscal.services.config_service import (
     TAX_CODE_MAX_LENGTH,
     configs_are_fresh,
-    enrich_receipt_taxes_with_tax_id,
     get_latest_configs,
-    get_local_code_to_fdms_tax,
-    get_tax_id_to_code,
-    get_tax_id_to_percent,
     validate_against_configs,
 )
+from fiscal.services.config_cache import get_tax_resolver
 from fiscal.services.fdms_device_service import FDMSDeviceService
 from fiscal.services.receipt_engine import build_receipt_canonical_string, sign_receipt
 
@@ -696,8 +693,9 @@ def _do_submit_receipt(
         default_tax_id = next((int(t.get("taxID")) for t in receipt_taxes if t.get("taxID") is not None), 1)
         strict_tax = True
     else:
-        tax_id_to_code = dict(get_tax_id_to_code(configs))
-        tax_id_to_percent = dict(get_tax_id_to_percent(configs))
+        resolver = get_tax_resolver(configs)
+        tax_id_to_code = dict(resolver.id_to_code)
+        tax_id_to_percent = dict(resolver.id_to_percent)
         for t in receipt_taxes or []:
             tid = t.get("taxID")
             if tid is None:
@@ -709,8 +707,8 @@ def _do_submit_receipt(
             code = (str(t.get("taxCode") or "").strip()[:TAX_CODE_MAX_LENGTH]) or None
             if code:
                 tax_id_to_code[tid_int] = code
-        local_to_fdms = get_local_code_to_fdms_tax(configs)
-        taxes_enriched = enrich_receipt_taxes_with_tax_id(configs, receipt_taxes)
+        local_to_fdms = resolver.local_overrides
+        taxes_enriched = resolver.enrich_taxes(receipt_taxes)
         code_to_tax_id = {str(t.get("taxCode", "") or "").strip().upper(): t.get("taxID", 1) for t in taxes_enriched if t.get("taxID") is not None}
         default_tax_id = next((t.get("taxID") for t in taxes_enriched if t.get("taxID") is not None), 1)
         strict_tax = False
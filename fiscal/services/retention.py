@@ -0,0 +1,252 @@
+"""
+Retention for the event and log tables.
+
+Rows older than FDMS_RETENTION_DAYS[<table>] days (0: keep forever) are removed oldest
+first, FDMS_RETENTION_BATCH_SIZE rows at a time. For each batch:
+1. the raw rows are written to FDMS_RETENTION_ARCHIVE_DIR/<table>/<YYYY-MM>/
+   <table>_<first_id>-<last_id>.ndjson.gz, one JSON object per row, with a sha256sum
+   sidecar (.sha256). The file is fsynced before anything is deleted.
+2. one short transaction adds the batch to RetentionDailySummary (count, first/last seen
+   per day, device and key), records the RetentionArchive and deletes the rows by id.
+A crash between 1 and 2 leaves the rows in place; the next run rewrites the same file.
+Runs are serialised by a cache lock. Should two runs still overlap (cache not shared
+between hosts), a batch is only summarised and archived by the run whose delete removed
+all of its rows; the other rolls back and re-reads. Entry points: apply_retention_task (daily beat) and
+`manage.py apply_retention`.
+Rows a table's `keep` rule still needs are never expired: for ReceiptSubmissionResponse,
+the latest response of a receipt when it carries validation errors (shown on the invoice,
+see get_validation_errors_for_receipt).
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from fiscal.models import (
+    ActivityEvent,
+    AuditEvent,
+    FDMSApiLog,
+    QuickBooksEvent,
+    ReceiptSubmissionResponse,
+    RetentionArchive,
+    RetentionDailySummary,
+)
+
+logger = logging.getLogger("fiscal")
+
+LOCK_KEY = "fdms:retention"
+
+
+@dataclass(frozen=True)
+class RetentionTable:
+    model: type
+    key_fields: tuple[str, ...]  # summary key, joined with ":"
+    device_field: str | None = None  # FiscalDevice FK attname
+    keep: Callable | None = None  # queryset -> rows of it that must not expire
+
+
+def _latest_response_with_errors(qs):
+    """Responses that are the latest for their receipt (device, receipt_global_no) and carry validation errors."""
+    newer = ReceiptSubmissionResponse.objects.filter(
+        device_id=OuterRef("device_id"),
+        receipt_global_no=OuterRef("receipt_global_no"),
+        created_at__gt=OuterRef("created_at"),
+    )
+    return qs.exclude(validation_errors=[]).filter(~Exists(newer))
+
+
+RETENTION_TABLES = {
+    "QuickBooksEvent": RetentionTable(QuickBooksEvent, ("event_type",)),
+    "ActivityEvent": RetentionTable(ActivityEvent, ("event_type", "level"), "device_id"),
+    "AuditEvent": RetentionTable(AuditEvent, ("action",), "device_id"),
+    "ReceiptSubmissionResponse": RetentionTable(
+        ReceiptSubmissionResponse, ("status_code",), "device_id", keep=_latest_response_with_errors
+    ),
+    "FDMSApiLog": RetentionTable(FDMSApiLog, ("method", "endpoint", "status_code")),
+}
+
+
+def retention_days(table: str) -> int:
+    return int(getattr(settings, "FDMS_RETENTION_DAYS", {}).get(table, 0) or 0)
+
+
+def _archive_dir() -> Path:
+    return Path(getattr(settings, "FDMS_RETENTION_ARCHIVE_DIR", "") or Path(settings.BASE_DIR) / "archives")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_archive(table: str, rows: list[dict]) -> dict:
+    """Write rows as NDJSON.gz (+ .sha256 sidecar) atomically; return RetentionArchive fields."""
+    first_id, last_id = rows[0]["id"], rows[-1]["id"]
+    oldest = min(r["created_at"] for r in rows)
+    path = _archive_dir() / table / oldest.strftime("%Y-%m") / f"{table}_{first_id}-{last_id}.ndjson.gz"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(filename=path.name[:-3], mode="wb", fileobj=raw, mtime=0) as gz:
+            for row in rows:
+                gz.write(json.dumps(row, cls=DjangoJSONEncoder, sort_keys=True).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    sha256 = _sha256(path)
+    path.with_name(path.name + ".sha256").write_text(f"{sha256}  {path.name}\n")
+    return {
+        "table": table,
+        "path": str(path),
+        "sha256": sha256,
+        "size_bytes": path.stat().st_size,
+        "row_count": len(rows),
+        "first_id": first_id,
+        "last_id": last_id,
+        "oldest_at": oldest,
+        "newest_at": max(r["created_at"] for r in rows),
+    }
+
+
+def _discard_archive(fields: dict) -> None:
+    """Remove an archive file written for a batch that was not committed (unless another run recorded it)."""
+    if RetentionArchive.objects.filter(path=fields["path"]).exists():
+        return
+    path = Path(fields["path"])
+    path.unlink(missing_ok=True)
+    path.with_name(path.name + ".sha256").unlink(missing_ok=True)
+
+
+def _summarise(table: str, spec: RetentionTable, rows: list[dict]) -> int:
+    """Add rows to RetentionDailySummary. Caller holds the transaction. Returns summary rows touched."""
+    groups: dict[tuple, list] = {}
+    for row in rows:
+        key = ":".join(str(row.get(f) if row.get(f) is not None else "") for f in spec.key_fields)[:255]
+        device_id = row.get(spec.device_field) if spec.device_field else None
+        group = (timezone.localdate(row["created_at"]), device_id, key)
+        entry = groups.setdefault(group, [0, row["created_at"], row["created_at"]])
+        entry[0] += 1
+        entry[1] = min(entry[1], row["created_at"])
+        entry[2] = max(entry[2], row["created_at"])
+    for (day, device_id, key), (count, first_at, last_at) in groups.items():
+        summary, created = RetentionDailySummary.objects.select_for_update().get_or_create(
+            table=table, day=day, device_id=device_id, key=key,
+            defaults={"count": count, "first_at": first_at, "last_at": last_at},
+        )
+        if not created:
+            RetentionDailySummary.objects.filter(pk=summary.pk).update(
+                count=F("count") + count,
+                first_at=min(summary.first_at, first_at),
+                last_at=max(summary.last_at, last_at),
+            )
+    return len(groups)
+
+
+def apply_table_retention(
+    table: str,
+    now=None,
+    batch_size: int | None = None,
+    max_batches: int | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Archive, summarise and delete one table's expired rows.
+    Returns {"table", "days", "cutoff", "expired"(dry run), "deleted", "archives", "summaries", "more"}.
+    """
+    spec = RETENTION_TABLES[table]
+    days = retention_days(table)
+    result = {"table": table, "days": days, "cutoff": None, "deleted": 0, "archives": 0, "summaries": 0, "more": False}
+    if days <= 0:
+        return result
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    result["cutoff"] = cutoff.isoformat()
+    expired = spec.model.objects.filter(created_at__lt=cutoff)
+    if spec.keep is not None:
+        expired = expired.exclude(pk__in=spec.keep(expired).values("pk"))
+    if dry_run:
+        result["expired"] = expired.count()
+        return result
+
+    batch_size = batch_size or getattr(settings, "FDMS_RETENTION_BATCH_SIZE", 500)
+    max_batches = max_batches or getattr(settings, "FDMS_RETENTION_MAX_BATCHES", 200)
+    archive = getattr(settings, "FDMS_RETENTION_ARCHIVE", True)
+    for _ in range(max_batches):
+        rows = list(expired.order_by("pk").values()[:batch_size])
+        if not rows:
+            return result
+        archive_fields = _write_archive(table, rows) if archive else None
+        with transaction.atomic():
+            # Delete first: only a batch this run removed in full is summarised and archived,
+            # so a concurrent run (another worker/host) cannot double-count it.
+            _, per_model = spec.model.objects.filter(pk__in=[r["id"] for r in rows]).delete()
+            deleted = per_model.get(spec.model._meta.label, 0)
+            if deleted != len(rows):
+                transaction.set_rollback(True)
+            else:
+                result["summaries"] += _summarise(table, spec, rows)
+                if archive_fields:
+                    RetentionArchive.objects.create(**archive_fields)
+                    result["archives"] += 1
+                result["deleted"] += deleted
+        if deleted != len(rows):
+            logger.warning("Retention batch of %s changed under us (%s of %s rows); retrying", table, deleted, len(rows))
+            if archive_fields:
+                _discard_archive(archive_fields)
+    result["more"] = expired.exists()
+    return result
+
+
+def apply_retention(tables=None, now=None, batch_size=None, max_batches=None, dry_run=False) -> dict:
+    """Apply retention to `tables` (default: all). Returns {table: result}, or {"error"} when a run is in progress."""
+    owner = uuid.uuid4().hex
+    if not dry_run and not cache.add(LOCK_KEY, owner, timeout=getattr(settings, "FDMS_RETENTION_LOCK_SECONDS", 3600)):
+        return {"error": "Retention run already in progress"}
+    try:
+        results = {}
+        for table in tables or RETENTION_TABLES:
+            try:
+                results[table] = apply_table_retention(table, now, batch_size, max_batches, dry_run)
+            except Exception as e:
+                logger.exception("Retention of %s failed", table)
+                results[table] = {"table": table, "error": str(e)}
+        deleted = {t: r.get("deleted", 0) for t, r in results.items() if r.get("deleted")}
+        if deleted:
+            logger.info("Retention removed %s", deleted)
+        return results
+    finally:
+        if not dry_run and cache.get(LOCK_KEY) == owner:
+            cache.delete(LOCK_KEY)
+
+
+def verify_archive(archive: RetentionArchive) -> tuple[bool, str | None]:
+    """Check an archive file against its recorded sha256 and row count. Returns (ok, error)."""
+    path = Path(archive.path)
+    if not path.exists():
+        return False, f"Missing archive file {path}"
+    if _sha256(path) != archive.sha256:
+        return False, f"Checksum mismatch for {path}"
+    try:
+        with gzip.open(path, "rb") as gz:
+            rows = sum(1 for _ in gz)
+    except (OSError, EOFError) as e:
+        return False, f"Unreadable archive {path}: {e}"
+    if rows != archive.row_count:
+        return False, f"{path} has {rows} rows, expected {archive.row_count}"
+    return True, None
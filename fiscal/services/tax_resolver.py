@@ -0,0 +1,144 @@
+"""
+Precompiled tax resolution tables for one config version.
+
+TaxResolver is built once from a GetConfig tax table plus the active TaxMappings and
+cached on the ConfigSnapshot (see config_cache), so validation, enrichment and
+server-side recalculation share the same immutable maps instead of rebuilding them
+from configs.tax_table / TaxMapping on every call. Codes are normalised once at build.
+"""
+
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.core.exceptions import ValidationError
+
+TAX_CODE_MAX_LENGTH = 3  # FDMS ReceiptLineDto/ReceiptTaxDto taxCode maxLength
+DEFAULT_TAX_PERCENT = 15.0
+
+
+def normalise_code(value) -> str:
+    """Tax code as compared everywhere: stripped, upper case."""
+    return str(value or "").strip().upper()
+
+
+@dataclass(frozen=True)
+class TaxResolver:
+    # GetConfig taxIDs as given (validation); {1} when the table has none.
+    valid_tax_ids: frozenset
+    # GetConfig taxCodes, normalised.
+    valid_tax_codes: frozenset
+    allowed_currencies: tuple
+    # taxCode (normalised, max 3) -> taxID, first occurrence wins.
+    code_to_id: MappingProxyType
+    # taxPercent -> taxID, last occurrence wins.
+    percent_to_id: MappingProxyType
+    # taxID -> taxCode (taxName fallback, max 3); empty without a tax table.
+    id_to_code: MappingProxyType
+    # taxID -> taxPercent (2 dp); {1: 15.0} without a tax table.
+    id_to_percent: MappingProxyType
+    # TaxMapping local code (normalised) -> (fdms_tax_id, fdms_tax_code override or None).
+    local_overrides: MappingProxyType
+    # TaxMapping per fdms_tax_id (first by sort order) -> (taxCode, taxPercent).
+    mapping_by_id: MappingProxyType
+    default_tax_id: int
+
+    @classmethod
+    def build(cls, configs, tax_mappings=()) -> "TaxResolver":
+        """From an FDMSConfigs (or None) and config_cache.TaxMappingEntry rows."""
+        tax_table = list((configs.tax_table or []) if configs else [])
+        valid_ids = frozenset(t.get("taxID") for t in tax_table if t.get("taxID") is not None)
+        code_to_id, percent_to_id, id_to_code, id_to_percent = {}, {}, {}, {}
+        for t in tax_table:
+            tid = t.get("taxID")
+            if tid is None:
+                continue
+            tid = int(tid)
+            if t.get("taxCode") is not None:
+                code = normalise_code(t["taxCode"])[:TAX_CODE_MAX_LENGTH]
+                if code and code not in code_to_id:
+                    code_to_id[code] = tid
+            raw = t.get("taxCode") or t.get("taxName")
+            if raw:
+                display = str(raw).strip()[:TAX_CODE_MAX_LENGTH]
+                if display:
+                    id_to_code[tid] = display
+            pct = t.get("taxPercent") or t.get("fiscalCounterTaxPercent")
+            if pct is not None:
+                percent_to_id[float(pct)] = tid
+            id_to_percent[tid] = round(float(pct) if pct is not None else DEFAULT_TAX_PERCENT, 2)
+
+        mapping_by_id = {}
+        for m in tax_mappings:
+            if m.fdms_tax_id not in mapping_by_id:
+                code = (m.fdms_tax_code or m.local_code[:TAX_CODE_MAX_LENGTH]) or "VAT"
+                pct = m.tax_percent if m.tax_percent is not None else DEFAULT_TAX_PERCENT
+                mapping_by_id[m.fdms_tax_id] = (code, round(pct, 2))
+
+        return cls(
+            valid_tax_ids=valid_ids or frozenset({1}),
+            valid_tax_codes=frozenset(normalise_code(t.get("taxCode")) for t in tax_table if t.get("taxCode")),
+            allowed_currencies=tuple(configs.allowed_currencies or ()) if configs else (),
+            code_to_id=MappingProxyType(code_to_id),
+            percent_to_id=MappingProxyType(percent_to_id),
+            id_to_code=MappingProxyType(id_to_code),
+            id_to_percent=MappingProxyType(id_to_percent or {1: DEFAULT_TAX_PERCENT}),
+            local_overrides=MappingProxyType({
+                m.local_code.upper(): (m.fdms_tax_id, m.fdms_tax_code) for m in tax_mappings if m.local_code
+            }),
+            mapping_by_id=MappingProxyType(mapping_by_id),
+            default_tax_id=next((t.get("taxID") for t in tax_table if t.get("taxID") is not None), 1),
+        )
+
+    def validate(self, receipt_currency: str, receipt_taxes: list[dict], receipt_lines: list[dict]) -> None:
+        """Raise ValidationError for a currency, taxID or taxCode the config does not allow."""
+        if self.allowed_currencies and receipt_currency not in self.allowed_currencies:
+            raise ValidationError(
+                f"Currency '{receipt_currency}' not allowed by FDMS configs. Allowed: {list(self.allowed_currencies)}"
+            )
+        valid_ids, valid_codes = self.valid_tax_ids, self.valid_tax_codes
+        for tax in receipt_taxes or []:
+            tid = tax.get("taxID")
+            if tid is not None and tid not in valid_ids:
+                raise ValidationError(f"Invalid taxID {tid} per FDMS configs. Valid: {set(valid_ids)}")
+            tax_code = tax.get("taxCode")
+            if tax_code and valid_codes and tid is None and normalise_code(tax_code) not in valid_codes:
+                raise ValidationError(f"Invalid taxCode '{tax_code}' per FDMS configs. Valid: {set(valid_codes)}")
+        for line in receipt_lines or []:
+            tid = line.get("taxID")
+            if tid is not None and tid not in valid_ids:
+                raise ValidationError(f"Invalid taxID {tid} in receipt line per FDMS configs")
+            tax_code = line.get("taxCode") or line.get("receiptLineTaxCode")
+            if tax_code and valid_codes and normalise_code(tax_code) not in valid_codes:
+                raise ValidationError(f"Invalid taxCode '{tax_code}' per FDMS configs. Valid: {set(valid_codes)}")
+
+    def resolve_tax_id(self, code: str, percent=None) -> int:
+        """taxID for a normalised local/FDMS code: TaxMapping, then taxCode, then percent, then default."""
+        if code in self.local_overrides:
+            return self.local_overrides[code][0]
+        return (
+            self.code_to_id.get(code)
+            or (self.percent_to_id.get(float(percent)) if percent is not None else None)
+            or self.default_tax_id
+        )
+
+    def enrich_taxes(self, receipt_taxes: list[dict]) -> list[dict]:
+        """Copies of receipt_taxes with taxID resolved and taxCode set from TaxMapping/GetConfig."""
+        result = []
+        for tax in receipt_taxes or []:
+            out = dict(tax)
+            code = normalise_code(out.get("taxCode"))[:TAX_CODE_MAX_LENGTH]
+            if out.get("taxID") is None:
+                out["taxID"] = self.resolve_tax_id(code, out.get("taxPercent"))
+            tid = out.get("taxID")
+            if tid is not None:
+                override = self.local_overrides.get(code, (None, None))[1] if code else None
+                out["taxCode"] = override or self.id_to_code.get(tid) or str(tid)
+            result.append(out)
+        return result
+
+    def code_and_percent(self, tax_id: int) -> tuple[str, float]:
+        """(taxCode, taxPercent) for a taxID: TaxMapping first, else GetConfig."""
+        if tax_id in self.mapping_by_id:
+            return self.mapping_by_id[tax_id]
+        pct = self.id_to_percent.get(tax_id, DEFAULT_TAX_PERCENT)
+        return self.id_to_code.get(tax_id) or ("EXM" if pct == 0 else "VAT"), pct
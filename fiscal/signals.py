@@ -1,12 +1,165 @@
 """Signals for cascade delete and related cleanup."""
 
-from django.db.models.signals import pre_delete
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import FDMSConfigs, FiscalDevice
+from .models import FDMSApiLog, FDMSConfigs, FiscalDevice, Receipt, ReceiptSubmissionResponse, TaxMapping
+
+logger = logging.getLogger("fiscal")
 
 
 @receiver(pre_delete, sender=FiscalDevice)
 def delete_device_configs(sender, instance, **kwargs):
     """Cascade delete FDMSConfigs when FiscalDevice is deleted."""
     FDMSConfigs.objects.filter(device_id=instance.device_id).delete()
+
+
+@receiver(post_save, sender=Receipt)
+def sync_receipt_tax_payment_lines(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep ReceiptTaxLine / ReceiptPaymentLine in step with the receipt JSON."""
+    if raw:
+        return
+    from fiscal.services.receipt_lines import LINE_SOURCE_FIELDS, sync_receipt_lines
+
+    if update_fields is not None and not created and not (set(update_fields) & LINE_SOURCE_FIELDS):
+        return
+    sync_receipt_lines(instance)
+
+
+_PREVIOUS_ATTR = "_fdms_counter_previous"
+_PREVIOUS_UNKNOWN = object()
+
+
+def _counter_days(*receipts) -> set[tuple[int, int]]:
+    return {(r.device_id, r.fiscal_day_no) for r in receipts if r is not None and r.device_id is not None}
+
+
+def _guard_counter_update(action: str, receipt, update, days) -> None:
+    """
+    Run a day-counter update in a savepoint. A failure must not fail the receipt save
+    (the receipt JSON is the source of truth): log it and invalidate the affected days
+    so they are rebuilt from receipt JSON on next use.
+    """
+    try:
+        with transaction.atomic():
+            update()
+        return
+    except Exception:
+        logger.exception("Fiscal day counter %s failed for receipt pk=%s", action, receipt.pk)
+    from fiscal.services.fiscal_day_counters import invalidate_day_counters
+
+    for device_id, fiscal_day_no in days:
+        try:
+            with transaction.atomic():
+                invalidate_day_counters(device_id, fiscal_day_no)
+        except Exception:
+            logger.exception(
+                "Invalidating fiscal day counters failed: device_pk=%s day=%s", device_id, fiscal_day_no
+            )
+
+
+@receiver(pre_save, sender=Receipt)
+def capture_receipt_counter_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember the stored receipt so post_save can move its day-counter contribution."""
+    if raw:
+        return
+    from fiscal.services.fiscal_day_counters import COUNTER_SOURCE_FIELDS, load_previous_state
+
+    if update_fields is not None and not (set(update_fields) & COUNTER_SOURCE_FIELDS):
+        setattr(instance, _PREVIOUS_ATTR, False)
+        return
+    try:
+        with transaction.atomic():
+            previous = load_previous_state(instance)
+    except Exception:
+        logger.exception("Loading counter state failed for receipt pk=%s", instance.pk)
+        previous = _PREVIOUS_UNKNOWN
+    setattr(instance, _PREVIOUS_ATTR, previous)
+
+
+@receiver(post_save, sender=Receipt)
+def update_fiscal_day_counters(sender, instance, raw=False, **kwargs):
+    """Apply the receipt's counter delta in the transaction that saved it."""
+    if raw:
+        return
+    previous = instance.__dict__.pop(_PREVIOUS_ATTR, None)
+    if previous is False:
+        return
+    from fiscal.services.fiscal_day_counters import apply_receipt_to_day_counters, invalidate_day_counters
+
+    if previous is _PREVIOUS_UNKNOWN:
+        # Without the old contribution there is no delta; rebuild the current day instead.
+        _guard_counter_update(
+            "invalidation",
+            instance,
+            lambda: invalidate_day_counters(instance.device_id, instance.fiscal_day_no),
+            (),
+        )
+        return
+    _guard_counter_update(
+        "update",
+        instance,
+        lambda: apply_receipt_to_day_counters(instance, previous),
+        _counter_days(instance, previous),
+    )
+
+
+@receiver(post_delete, sender=Receipt)
+def remove_receipt_from_fiscal_day_counters(sender, instance, **kwargs):
+    from fiscal.services.fiscal_day_counters import remove_receipt_from_day_counters
+
+    _guard_counter_update(
+        "removal",
+        instance,
+        lambda: remove_receipt_from_day_counters(instance),
+        _counter_days(instance),
+    )
+
+
+@receiver(post_save, sender=Receipt)
+@receiver(post_delete, sender=Receipt)
+@receiver(post_save, sender=ReceiptSubmissionResponse)
+def invalidate_dashboard_on_change(sender, instance, raw=False, **kwargs):
+    """The device's dashboard summary/receipts/errors caches are stale once these rows commit."""
+    if raw:
+        return
+    from fiscal.services.dashboard_cache import invalidate_dashboard_cache
+
+    invalidate_dashboard_cache(instance.device_id)
+
+
+@receiver(post_save, sender=FiscalDevice)
+@receiver(post_delete, sender=FiscalDevice)
+def invalidate_dashboard_on_device_change(sender, instance, raw=False, **kwargs):
+    """Device status, certificate and registration feed its summary and the fleet view."""
+    if raw:
+        return
+    from fiscal.services.dashboard_cache import invalidate_dashboard_device
+
+    invalidate_dashboard_device(instance.pk)
+
+
+@receiver(post_save, sender=FDMSApiLog)
+def invalidate_dashboard_on_api_log(sender, instance, created, raw=False, **kwargs):
+    """New FDMS calls feed failures, last sync and open/close times in the device's summary."""
+    if raw or not created:
+        return
+    from fiscal.services.dashboard_cache import invalidate_dashboard_for_endpoint
+
+    invalidate_dashboard_for_endpoint(instance.endpoint)
+
+
+@receiver(post_save, sender=FDMSConfigs)
+@receiver(post_delete, sender=FDMSConfigs)
+@receiver(post_save, sender=TaxMapping)
+@receiver(post_delete, sender=TaxMapping)
+def invalidate_config_snapshots(sender, raw=False, **kwargs):
+    """Cached config snapshots (configs + tax mappings) are stale once these rows commit."""
+    if raw:
+        return
+    from fiscal.services.config_cache import invalidate_config_cache
+
+    invalidate_config_cache()
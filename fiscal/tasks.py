@@ -1,7 +1,10 @@
 """
 Celery tasks for FDMS fiscal engine.
 
-Tasks: submit_receipt_task, open_day_task, close_day_task.
+Tasks: submit_receipt_task, open_day_task, close_day_task, check_close_day_status_task,
+resume_close_day_trackers_task, fleet_close_day_task (+ dispatch/device steps),
+refresh_configs_task (+ refresh_device_config_task), fiscalise_qb_invoice_task,
+process_qb_webhook_task, qb_sync_task, apply_retention_task.
 Each task logs ActivityEvent, AuditEvent, and emits WebSocket events.
 """
 
@@ -159,9 +162,9 @@ def open_day_task(self, device_id: int) -> dict[str, Any]:
 @shared_task(bind=True, name="fiscal.close_day_task")
 def close_day_task(self, device_id: int) -> dict[str, Any]:
     """
-    Close fiscal day via Celery. Emits fiscal.closed and logs activity/audit.
+    Close fiscal day via Celery. Emits fiscal.close_initiated and logs activity/audit.
     Returns {"success": True, "operation_id": X} or {"success": False, "error": str}.
-    Note: CloseDay initiates async; call poll_until_closed separately or poll via status.
+    Completion is tracked by check_close_day_status_task (fiscal.closed / fiscal.close_failed).
     """
     try:
         device = FiscalDevice.objects.get(device_id=device_id)
@@ -184,10 +187,130 @@ def close_day_task(self, device_id: int) -> dict[str, Any]:
     operation_id = data.get("operationID", "")
     emit_to_device(
         device_id,
-        "fiscal.closed",
+        "fiscal.close_initiated",
         {"operation_id": operation_id, "status": "FiscalDayCloseInitiated"},
     )
     log_activity(device, "fiscal_day_close_initiated", f"Close initiated (op {operation_id})", "info")
     log_audit(device, "fiscal_day_close_initiated", {"operation_id": operation_id})
     emit_metrics_updated()
     return {"success": True, "operation_id": operation_id}
+
+
+@shared_task(bind=True, name="fiscal.check_close_day_status_task")
+def check_close_day_status_task(self, tracker_id: int) -> dict[str, Any]:
+    """
+    One GetStatus check for a CloseDayTracker; re-schedules itself with a backoff
+    countdown while the close is pending. Never sleeps in the worker.
+    """
+    from fiscal.services.close_day_tracker import check_close_day_status
+
+    tracker, delay = check_close_day_status(tracker_id)
+    if delay is not None and not self.request.is_eager:
+        self.apply_async(args=[tracker_id], countdown=delay)
+    return {
+        "tracker_id": tracker_id,
+        "state": tracker.state if tracker else None,
+        "next_check_in": delay,
+    }
+
+
+@shared_task(bind=True, name="fiscal.resume_close_day_trackers_task")
+def resume_close_day_trackers_task(self) -> dict[str, Any]:
+    """Periodic: re-enqueue pending CloseDay trackers whose scheduled check was lost."""
+    from fiscal.services.close_day_tracker import resume_stale_trackers
+
+    return {"resumed": resume_stale_trackers()}
+
+
+@shared_task(bind=True, name="fiscal.fleet_close_day_task")
+def fleet_close_day_task(
+    self,
+    device_ids: list[int] | None = None,
+    concurrency: int | None = None,
+    reopen: bool = True,
+) -> dict[str, Any]:
+    """
+    Start a fleet end-of-day run (close, track, reopen) over device_ids (FDMS device IDs)
+    or every registered device. Suitable for a beat entry at the cut-off time.
+    """
+    from fiscal.services.fleet_close import start_fleet_close
+
+    devices = None
+    if device_ids:
+        devices = FiscalDevice.objects.filter(device_id__in=device_ids, is_registered=True).order_by("device_id")
+    run = start_fleet_close(devices, concurrency=concurrency, reopen=reopen, requested_by="celery")
+    return {"run_id": run.pk}
+
+
+@shared_task(bind=True, name="fiscal.fleet_close_dispatch_task")
+def fleet_close_dispatch_task(self, run_id: int) -> dict[str, Any]:
+    """Start queued devices of a fleet close run up to its concurrency limit."""
+    from fiscal.services.fleet_close import dispatch_run
+
+    return {"run_id": run_id, "started": dispatch_run(run_id)}
+
+
+@shared_task(bind=True, name="fiscal.fleet_close_device_task")
+def fleet_close_device_task(self, item_id: int) -> dict[str, Any]:
+    """CloseDay for one device of a fleet run; completion is driven by its CloseDayTracker."""
+    from fiscal.services.fleet_close import close_device
+
+    close_device(item_id)
+    return {"item_id": item_id}
+
+
+@shared_task(bind=True, name="fiscal.refresh_configs_task")
+def refresh_configs_task(self) -> dict[str, Any]:
+    """Periodic: queue GetConfig refreshes for devices whose configs near expiry."""
+    from fiscal.services.config_refresh import schedule_config_refresh
+
+    return {"queued": schedule_config_refresh()}
+
+
+@shared_task(bind=True, name="fiscal.refresh_device_config_task")
+def refresh_device_config_task(self, device_id: int) -> dict[str, Any]:
+    """GetConfig for one device; failures back off and alert (see config_refresh)."""
+    from fiscal.services.config_refresh import refresh_device_config
+
+    _, err = refresh_device_config(device_id)
+    return {"device_id": device_id, "success": err is None, "error": err}
+
+
+@shared_task(bind=True, name="fiscal.fiscalise_qb_invoice_task")
+def fiscalise_qb_invoice_task(self, qb_invoice_id: str) -> dict[str, Any]:
+    """Fiscalise a QB invoice stored by the webhook (see qb_fiscalisation.queue_qb_fiscalisation)."""
+    from fiscal.services.qb_fiscalisation import run_queued_qb_fiscalisation
+
+    qb_inv, err = run_queued_qb_fiscalisation(qb_invoice_id)
+    return {
+        "qb_invoice_id": qb_invoice_id,
+        "fiscal_status": qb_inv.fiscal_status if qb_inv else None,
+        "error": err,
+    }
+
+
+@shared_task(bind=True, name="fiscal.process_qb_webhook_task")
+def process_qb_webhook_task(self, event_id: int) -> dict[str, Any]:
+    """Fetch every entity of a QB webhook notification in batches and queue them (see qb_webhook)."""
+    from fiscal.services.qb_webhook import process_webhook_event
+
+    return {"event_id": event_id, **process_webhook_event(event_id)}
+
+
+@shared_task(bind=True, name="fiscal.qb_sync_task")
+def qb_sync_task(self) -> dict[str, Any]:
+    """
+    One bounded incremental QuickBooks sync (see qb_sync). Beat: every 5 minutes; a run
+    that stops at FDMS_QB_SYNC_MAX_PAGES ("more") is continued from its cursors by the next.
+    """
+    from fiscal.services.qb_sync import sync_from_quickbooks
+
+    return sync_from_quickbooks()
+
+
+@shared_task(bind=True, name="fiscal.apply_retention_task")
+def apply_retention_task(self) -> dict[str, Any]:
+    """Archive, summarise and delete expired event/log rows (see retention). Beat: daily."""
+    from fiscal.services.retention import apply_retention
+
+    return apply_retention()
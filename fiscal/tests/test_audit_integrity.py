@@ -4,6 +4,9 @@ Tests for signature verification and receipt chain validation.
 
 import base64
 import hashlib
+import json
+import os
+import tempfile
 from decimal import Decimal
 from datetime import datetime, timedelta
 
@@ -15,13 +18,30 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.x509.oid import NameOID
 
-from django.test import TestCase
+from contextlib import nullcontext
+from unittest.mock import MagicMock, patch
 
-from fiscal.models import FiscalDevice, Receipt
+from django.test import TestCase, override_settings
+
+from fiscal.models import (
+    AuditCheckpoint,
+    FiscalDay,
+    FiscalDayCounter,
+    FiscalDevice,
+    Receipt,
+    ReceiptPaymentLine,
+    ReceiptTaxLine,
+)
+from fiscal.services import audit_integrity
 from fiscal.services.audit_integrity import (
+    build_audit_units,
+    run_audit,
+    run_full_audit,
+    validate_fiscal_day_counters,
     validate_receipt_chain,
     verify_receipt_signature,
 )
+from fiscal.services.device_api import DeviceApiService
 from fiscal.services.receipt_engine import build_receipt_canonical_string
 from fiscal.services.signature_engine import SignatureEngine
 
@@ -245,3 +265,254 @@ class ReceiptChainValidationTests(TestCase):
         self.assertTrue(result.has_errors)
         self.assertEqual(len(result.receipt_chain_errors), 1)
         self.assertIn("got 2", result.receipt_chain_errors[0])
+
+
+def _signed_day(device: FiscalDevice, fiscal_day_no: int, first_global_no: int, count: int) -> None:
+    """Create a valid signed chain of `count` receipts for one fiscal day."""
+    engine = SignatureEngine(
+        certificate_pem=device.certificate_pem,
+        private_key_pem=device.get_private_key_pem_decrypted(),
+    )
+    prev_hash = None
+    for i in range(count):
+        global_no = first_global_no + i
+        canonical = build_receipt_canonical_string(
+            device_id=device.device_id,
+            receipt_type="FiscalInvoice",
+            receipt_currency="USD",
+            receipt_global_no=global_no,
+            receipt_date="2025-02-11T10:30:00",
+            receipt_total=Decimal("15.00"),
+            receipt_tax_lines=[],
+            previous_receipt_hash=prev_hash,
+        )
+        sig = engine.sign(canonical)
+        Receipt.objects.create(
+            device=device,
+            fiscal_day_no=fiscal_day_no,
+            receipt_global_no=global_no,
+            receipt_counter=i + 1,
+            currency="USD",
+            receipt_taxes=[],
+            receipt_type="FiscalInvoice",
+            receipt_total=15.00,
+            receipt_hash=sig["hash"],
+            receipt_signature_hash=sig["hash"],
+            receipt_signature_sig=sig["signature"],
+            receipt_date=timezone.make_aware(datetime(2025, 2, 11, 10, 30, 0)),
+        )
+        prev_hash = sig["hash"]
+
+
+class _InlineExecutor:
+    """Stands in for ProcessPoolExecutor: the test database is not visible to child processes."""
+
+    instances = []
+
+    def __init__(self, max_workers, initializer=None):
+        self.max_workers = max_workers
+        _InlineExecutor.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, items, chunksize=1):
+        return [fn(item) for item in items]
+
+
+class ParallelAuditTests(TestCase):
+    """Audit split into (device, fiscal day) units and merged."""
+
+    def setUp(self):
+        self.device = _make_test_device(99001)
+        _signed_day(self.device, 1, 1, 3)
+        _signed_day(self.device, 2, 4, 2)
+        FiscalDay.objects.create(device=self.device, fiscal_day_no=3, status="FiscalDayClosed", opened_at=timezone.now())
+        Receipt.objects.filter(device=self.device, receipt_global_no=5).update(receipt_total=99)
+
+    def test_units_per_device_day(self):
+        self.assertEqual(
+            build_audit_units([self.device]),
+            [(self.device.pk, 1, False, 0, None), (self.device.pk, 2, False, 0, None), (self.device.pk, 3, True, 0, None)],
+        )
+
+    def test_pool_results_merge_like_serial_run(self):
+        serial = run_full_audit(workers=1)
+        _InlineExecutor.instances = []
+        with patch.object(audit_integrity, "ProcessPoolExecutor", _InlineExecutor):
+            parallel = run_full_audit(workers=4)
+        self.assertEqual(_InlineExecutor.instances[0].max_workers, 3)
+        self.assertEqual(parallel, serial)
+        self.assertEqual((parallel.devices_checked, parallel.receipts_checked, parallel.fiscal_days_checked), (1, 5, 1))
+        self.assertEqual(len(parallel.receipt_hash_mismatches), 1)
+        self.assertIn("Receipt 5 (day 2)", parallel.receipt_hash_mismatches[0])
+
+    def test_certificate_parsed_once(self):
+        audit_integrity._public_key_from_pem.cache_clear()
+        with patch.object(audit_integrity.x509, "load_pem_x509_certificate", wraps=x509.load_pem_x509_certificate) as load:
+            result = validate_receipt_chain(self.device)
+        self.assertEqual(result.receipts_checked, 5)
+        self.assertEqual(load.call_count, 1)
+
+
+class IncrementalAuditTests(TestCase):
+    """AuditCheckpoint: clean runs advance it, later runs verify only new receipts."""
+
+    def setUp(self):
+        self.device = _make_test_device(99002)
+        _signed_day(self.device, 1, 1, 3)
+
+    def test_clean_run_saves_checkpoint(self):
+        result = run_audit()
+        self.assertFalse(result.has_errors)
+        cp = AuditCheckpoint.objects.get(device=self.device)
+        last = Receipt.objects.get(device=self.device, receipt_global_no=3)
+        self.assertEqual((cp.fiscal_day_no, cp.receipt_counter, cp.receipt_global_no), (1, 3, 3))
+        self.assertEqual(cp.chain_hash, last.receipt_hash)
+        self.assertEqual(cp.receipts_verified, 3)
+
+    def test_second_run_checks_only_new_receipts(self):
+        run_audit()
+        self.assertEqual(run_audit().receipts_checked, 0)
+        _signed_day(self.device, 2, 4, 2)
+        result = run_audit()
+        self.assertFalse(result.has_errors)
+        self.assertEqual(result.receipts_checked, 2)
+        cp = AuditCheckpoint.objects.get(device=self.device)
+        self.assertEqual((cp.fiscal_day_no, cp.receipt_global_no, cp.receipts_verified), (2, 5, 5))
+
+    def test_findings_do_not_advance_checkpoint(self):
+        run_audit()
+        _signed_day(self.device, 2, 4, 2)
+        Receipt.objects.filter(device=self.device, receipt_global_no=5).update(receipt_total=99)
+        result = run_audit()
+        self.assertEqual(len(result.receipt_hash_mismatches), 1)
+        self.assertEqual(AuditCheckpoint.objects.get(device=self.device).receipt_global_no, 3)
+
+    def test_tampered_anchor_falls_back_to_full_audit(self):
+        run_audit()
+        Receipt.objects.filter(device=self.device, receipt_global_no=3).update(receipt_hash="tampered")
+        result = run_audit()
+        self.assertEqual(result.receipts_checked, 3)
+        self.assertTrue(any("changed since last audit" in e for e in result.receipt_chain_errors))
+        self.assertEqual(len(result.receipt_hash_mismatches), 1)
+
+    def test_full_run_rechecks_everything(self):
+        run_audit()
+        Receipt.objects.filter(device=self.device, receipt_global_no=2).update(receipt_total=99)
+        self.assertFalse(run_audit().has_errors)
+        full = run_full_audit()
+        self.assertEqual(full.receipts_checked, 3)
+        self.assertIn("Receipt 2 (day 1)", full.receipt_hash_mismatches[0])
+
+
+class StreamingAuditReportTests(TestCase):
+    """Findings streamed to NDJSON; in-memory findings capped."""
+
+    def setUp(self):
+        self.device = _make_test_device(99003)
+        _signed_day(self.device, 1, 1, 2)
+        _signed_day(self.device, 2, 3, 3)
+        Receipt.objects.filter(device=self.device, receipt_global_no__in=[2, 4, 5]).update(receipt_hash="bad")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.report = os.path.join(tmp.name, "audit.ndjson")
+
+    def _records(self):
+        with open(self.report, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_report_lists_every_finding_in_unit_order(self):
+        with patch.object(audit_integrity, "ProcessPoolExecutor", _InlineExecutor):
+            result = run_audit(workers=2, full=True, report_path=self.report)
+        records = self._records()
+        self.assertEqual([(r["kind"], r.get("receipt_global_no")) for r in records[:-1]], [
+            ("receipt_hash", 2), ("receipt_hash", 4), ("receipt_hash", 5),
+        ])
+        self.assertEqual(records[-1]["kind"], "summary")
+        self.assertEqual((records[-1]["receipts_checked"], records[-1]["findings"]), (5, 3))
+        self.assertEqual(len(result.receipt_hash_mismatches), 3)
+        self.assertEqual(os.listdir(self.tmp), ["audit.ndjson"])
+
+    @override_settings(FDMS_AUDIT_MAX_FINDINGS=1)
+    def test_in_memory_findings_capped(self):
+        result = run_audit(full=True, report_path=self.report)
+        self.assertEqual(len(result.receipt_hash_mismatches), 1)
+        self.assertEqual(result.findings_omitted, 2)
+        self.assertEqual(result.findings_count, 3)
+        self.assertTrue(result.has_errors)
+        self.assertEqual(len(self._records()), 4)
+
+
+class CloseDayReportTests(TestCase):
+    """CloseDay counters/signature stored on FiscalDay and checked by the counters audit."""
+
+    def setUp(self):
+        self.device = _make_test_device(99004)
+        self.device.last_fiscal_day_no = 6
+        self.device.save(update_fields=["last_fiscal_day_no"])
+        FiscalDay.objects.create(device=self.device, fiscal_day_no=6, status="FiscalDayOpened", opened_at=timezone.now())
+        for n in (1, 2):
+            Receipt.objects.create(
+                device=self.device,
+                fiscal_day_no=6,
+                receipt_global_no=n,
+                receipt_counter=n,
+                currency="USD",
+                receipt_type="FiscalInvoice",
+                receipt_total=115,
+                receipt_taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+                receipt_payments=[{"moneyTypeCode": "Cash", "paymentAmount": 115}],
+                fdms_receipt_id=n,
+            )
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"operationID": "op-close"}
+        with patch.object(DeviceApiService, "get_status", return_value=({"fiscalDayStatus": "FiscalDayOpened"}, None)), \
+                patch("fiscal.services.device_api.fdms_request", return_value=response), \
+                patch("fiscal.services.device_api.cert_files_for_device", return_value=nullcontext(("c", "k"))), \
+                self.captureOnCommitCallbacks(execute=False):
+            data, err = DeviceApiService().close_day(self.device)
+        self.assertIsNone(err)
+
+    def test_close_day_stores_report(self):
+        fd = FiscalDay.objects.get(device=self.device, fiscal_day_no=6)
+        self.assertEqual(fd.close_receipt_counter, 2)
+        self.assertEqual(fd.close_operation_id, "op-close")
+        sale = [c for c in fd.close_counters if c["fiscalCounterType"] == "SaleByTax"]
+        self.assertEqual(sale[0]["fiscalCounterValue"], 230.0)
+        self.assertTrue(fd.close_canonical.startswith("990046"))
+        self.assertTrue(verify_receipt_signature(self.device, fd.close_canonical, fd.close_hash, fd.close_signature)[0])
+        self.assertFalse(validate_fiscal_day_counters(self.device).has_errors)
+
+    def test_audit_reports_receipts_changed_after_close(self):
+        receipt = Receipt.objects.get(device=self.device, receipt_global_no=2)
+        receipt.receipt_taxes = [{"taxID": 1, "taxPercent": 15, "taxAmount": 30, "salesAmountWithTax": 230}]
+        receipt.save()
+        errors = validate_fiscal_day_counters(self.device).fiscal_day_counter_errors
+        self.assertTrue(any("counter SaleByTax|USD|1|15.0 submitted 23000 cents, now 34500" in e for e in errors), errors)
+        self.assertFalse(any("running counter" in e for e in errors), errors)
+
+    def test_audit_reports_receipts_changed_behind_running_counters(self):
+        Receipt.objects.filter(device=self.device, receipt_global_no=2).update(
+            receipt_taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 30, "salesAmountWithTax": 230}]
+        )
+        errors = validate_fiscal_day_counters(self.device).fiscal_day_counter_errors
+        self.assertTrue(any("running counter SaleByTax|USD|1|15.0 stored 23000 cents, receipts 34500" in e for e in errors), errors)
+
+    def test_audit_without_running_counters_writes_nothing(self):
+        FiscalDayCounter.objects.filter(device=self.device).delete()
+        ReceiptTaxLine.objects.filter(receipt__device=self.device).delete()
+        ReceiptPaymentLine.objects.filter(receipt__device=self.device).delete()
+        self.assertFalse(validate_fiscal_day_counters(self.device).has_errors)
+        self.assertFalse(FiscalDayCounter.objects.filter(device=self.device).exists())
+        self.assertFalse(ReceiptTaxLine.objects.filter(receipt__device=self.device).exists())
+        self.assertFalse(ReceiptPaymentLine.objects.filter(receipt__device=self.device).exists())
+
+    def test_audit_reports_bad_signature(self):
+        FiscalDay.objects.filter(device=self.device, fiscal_day_no=6).update(close_hash=base64.b64encode(b"x" * 32).decode())
+        errors = validate_fiscal_day_counters(self.device).fiscal_day_counter_errors
+        self.assertTrue(any("CloseDay signature" in e for e in errors), errors)
@@ -0,0 +1,111 @@
+"""CloseDay completion tracking: scheduled GetStatus checks with backoff, no sleeping."""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from fiscal.models import CloseDayTracker, FiscalDevice
+from fiscal.services.close_day_tracker import (
+    check_close_day_status,
+    next_check_delay,
+    resume_stale_trackers,
+    start_close_day_tracking,
+)
+from fiscal.tasks import check_close_day_status_task
+
+GET_STATUS = "fiscal.services.device_api.DeviceApiService.get_status"
+EMIT = "fiscal.services.fdms_events.emit_to_device"
+
+
+@override_settings(FDMS_CLOSE_DAY_POLL_INITIAL=5, FDMS_CLOSE_DAY_POLL_MAX=60, FDMS_CLOSE_DAY_POLL_FACTOR=2)
+class CloseDayTrackerTests(TestCase):
+    def setUp(self):
+        patcher = patch("fiscal.services.fdms_events.emit_metrics_updated")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.device = FiscalDevice.objects.create(
+            device_id=77201, device_serial_no="CLOSE", is_registered=True, last_fiscal_day_no=9
+        )
+        with self.captureOnCommitCallbacks(execute=False):
+            self.tracker = start_close_day_tracking(self.device, 9, "op-1")
+
+    def _make_due(self):
+        CloseDayTracker.objects.filter(pk=self.tracker.pk).update(next_check_at=timezone.now())
+
+    def test_backoff_grows_to_cap(self):
+        with patch("fiscal.services.close_day_tracker.random.uniform", return_value=1.0):
+            delays = [next_check_delay(n) for n in range(1, 8)]
+            self.assertEqual(delays, [5, 10, 20, 40, 60, 60, 60])
+            self.assertEqual(next_check_delay(2, error=True), 20)
+
+    def test_start_schedules_first_check_on_commit(self):
+        with patch.object(check_close_day_status_task, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                tracker = start_close_day_tracking(self.device, 9, "op-2")
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs["args"], [tracker.pk])
+        self.assertGreaterEqual(apply_async.call_args.kwargs["countdown"], 4)
+        self.assertEqual(CloseDayTracker.objects.get().operation_id, "op-2")
+
+    def test_pending_status_reschedules_then_closed_emits(self):
+        self._make_due()
+        with patch(GET_STATUS, return_value=({"fiscalDayStatus": "FiscalDayCloseInitiated"}, None)), \
+                patch(EMIT) as emit:
+            tracker, delay = check_close_day_status(self.tracker.pk)
+        self.assertEqual(tracker.state, CloseDayTracker.STATE_PENDING)
+        self.assertIsNotNone(delay)
+        self.assertFalse([c for c in emit.call_args_list if c.args[1].startswith("fiscal.")])
+
+        # A duplicate delivery before the next check is due is a no-op.
+        self.assertEqual(check_close_day_status(self.tracker.pk), (None, None))
+
+        self._make_due()
+        with patch(GET_STATUS, return_value=({"fiscalDayStatus": "FiscalDayClosed"}, None)), \
+                patch(EMIT) as emit:
+            tracker, delay = check_close_day_status(self.tracker.pk)
+        self.assertIsNone(delay)
+        self.assertEqual(tracker.state, CloseDayTracker.STATE_CLOSED)
+        self.assertEqual(tracker.attempts, 2)
+        emit.assert_any_call(
+            77201, "fiscal.closed", {"fiscal_day_no": 9, "operation_id": "op-1", "status": "FiscalDayClosed"}
+        )
+
+    def test_close_failed_emits_with_error_code(self):
+        self._make_due()
+        status = {"fiscalDayStatus": "FiscalDayCloseFailed", "fiscalDayClosingErrorCode": "CountersMismatch"}
+        with patch(GET_STATUS, return_value=(status, None)), patch(EMIT) as emit:
+            tracker, delay = check_close_day_status(self.tracker.pk)
+        self.assertIsNone(delay)
+        self.assertEqual(tracker.state, CloseDayTracker.STATE_FAILED)
+        self.assertEqual(tracker.closing_error_code, "CountersMismatch")
+        types = [c.args[1] for c in emit.call_args_list]
+        self.assertIn("fiscal.close_failed", types)
+
+    def test_deadline_times_out(self):
+        CloseDayTracker.objects.filter(pk=self.tracker.pk).update(
+            next_check_at=timezone.now(), deadline_at=timezone.now() - timedelta(seconds=1)
+        )
+        with patch(GET_STATUS, return_value=(None, "Connection refused")), patch(EMIT):
+            tracker, delay = check_close_day_status(self.tracker.pk)
+        self.assertIsNone(delay)
+        self.assertEqual(tracker.state, CloseDayTracker.STATE_TIMED_OUT)
+        self.assertEqual(tracker.last_error, "Connection refused")
+
+    def test_task_reschedules_itself_with_countdown(self):
+        self._make_due()
+        with patch(GET_STATUS, return_value=({"fiscalDayStatus": "FiscalDayCloseInitiated"}, None)), \
+                patch.object(check_close_day_status_task, "apply_async") as apply_async:
+            result = check_close_day_status_task.run(self.tracker.pk)
+        self.assertEqual(result["state"], CloseDayTracker.STATE_PENDING)
+        apply_async.assert_called_once_with(args=[self.tracker.pk], countdown=result["next_check_in"])
+
+    def test_resume_requeues_overdue_trackers(self):
+        CloseDayTracker.objects.filter(pk=self.tracker.pk).update(
+            next_check_at=timezone.now() - timedelta(minutes=10)
+        )
+        with patch.object(check_close_day_status_task, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(resume_stale_trackers(), 1)
+        apply_async.assert_called_once_with(args=[self.tracker.pk], countdown=0)
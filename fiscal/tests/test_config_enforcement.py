@@ -4,19 +4,26 @@ from datetime import timedelta
 from decimal import Decimal
 
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 
-from fiscal.models import FDMSConfigs, FiscalDevice, Receipt
+from fiscal.models import FDMSConfigs, FiscalDevice, Receipt, TaxMapping
+from fiscal.services.config_cache import clear_local_config_cache, get_tax_resolver
 from fiscal.services.config_service import (
     configs_are_fresh,
     enrich_receipt_taxes_with_tax_id,
     get_config_status,
     get_latest_configs,
+    get_local_code_to_fdms_tax,
+    get_tax_code_and_percent_for_id,
+    get_tax_id_to_code,
+    get_tax_id_to_percent,
     persist_configs,
     validate_against_configs,
 )
 from fiscal.services.receipt_service import submit_receipt
+from fiscal.services.tax_resolver import TaxResolver
 
 
 class ConfigServiceTests(TestCase):
@@ -196,3 +203,95 @@ class SubmitReceiptBlockedTests(TestCase):
         )
         self.assertIsNone(receipt_obj)
         self.assertIn("stale", (err or "").lower())
+
+
+class ConfigSnapshotCacheTests(TransactionTestCase):
+    """Configs and TaxMappings are read once per version; commits invalidate them."""
+
+    def setUp(self):
+        cache.clear()
+        clear_local_config_cache()
+        self.addCleanup(clear_local_config_cache)
+        persist_configs(501, {"applicableTaxes": [{"taxID": 1, "taxCode": "A", "taxPercent": 15}]})
+        TaxMapping.objects.create(local_code="vat", fdms_tax_id=1, fdms_tax_code="517", tax_percent=Decimal("15.00"))
+
+    def test_steady_state_reads_do_not_query(self):
+        configs = get_latest_configs(501)
+        with self.assertNumQueries(0):
+            self.assertIs(get_latest_configs(501), configs)
+            self.assertEqual(get_local_code_to_fdms_tax(configs), {"VAT": (1, "517")})
+            self.assertEqual(get_tax_code_and_percent_for_id(501, 1), ("517", 15.0))
+            enrich_receipt_taxes_with_tax_id(configs, [{"taxCode": "VAT", "taxPercent": 15}])
+
+    def test_resolver_is_built_once_per_version(self):
+        configs = get_latest_configs(501)
+        resolver = get_tax_resolver(configs)
+        self.assertIs(get_tax_resolver(get_latest_configs(501)), resolver)
+        TaxMapping.objects.create(local_code="ZR", fdms_tax_id=2)
+        self.assertIsNot(get_tax_resolver(get_latest_configs(501)), resolver)
+
+    def test_persist_configs_invalidates(self):
+        self.assertEqual(get_latest_configs(501).tax_table[0]["taxCode"], "A")
+        persist_configs(501, {"applicableTaxes": [{"taxID": 2, "taxCode": "B", "taxPercent": 0}]})
+        self.assertEqual(get_latest_configs(501).tax_table[0]["taxCode"], "B")
+
+    def test_tax_mapping_save_invalidates(self):
+        self.assertIn("VAT", get_local_code_to_fdms_tax(get_latest_configs(501)))
+        TaxMapping.objects.create(local_code="ZR", fdms_tax_id=2)
+        TaxMapping.objects.filter(local_code="vat").get().delete()
+        self.assertEqual(get_local_code_to_fdms_tax(get_latest_configs(501)), {"ZR": (2, None)})
+
+
+class TaxResolverTests(TestCase):
+    TAX_TABLE = [
+        {"taxID": 1, "taxCode": "vat15", "taxPercent": 15},
+        {"taxID": 2, "taxName": "Exempt"},
+        {"taxID": 3, "taxCode": "ZR", "fiscalCounterTaxPercent": 0},
+        {"taxID": 4, "taxCode": "VAT", "taxPercent": 15},
+    ]
+
+    def setUp(self):
+        self.cfg = FDMSConfigs.objects.create(
+            device_id=502,
+            raw_response={},
+            tax_table=self.TAX_TABLE,
+            allowed_currencies=["USD"],
+            fetched_at=timezone.now(),
+        )
+        TaxMapping.objects.create(local_code="std", fdms_tax_id=4, fdms_tax_code="517", tax_percent=Decimal("15.50"))
+        self.resolver = get_tax_resolver(self.cfg)
+
+    def test_maps_match_config_table(self):
+        self.assertEqual(get_tax_id_to_code(self.cfg), {1: "vat", 2: "Exe", 3: "ZR", 4: "VAT"})
+        self.assertEqual(get_tax_id_to_percent(self.cfg), {1: 15.0, 2: 15.0, 3: 0.0, 4: 15.0})
+        # First taxCode wins; percent maps to the last taxID with that percent.
+        self.assertEqual(self.resolver.code_to_id["VAT"], 1)
+        self.assertEqual(self.resolver.percent_to_id[15.0], 4)
+        self.assertEqual(self.resolver.default_tax_id, 1)
+
+    def test_enrich_prefers_mapping_then_code_then_percent(self):
+        enriched = enrich_receipt_taxes_with_tax_id(self.cfg, [
+            {"taxCode": "std"},
+            {"taxCode": "zr "},
+            {"taxCode": "X", "taxPercent": 15},
+            {"taxCode": "X"},
+            {"taxID": 2},
+        ])
+        self.assertEqual(
+            [(t["taxID"], t["taxCode"]) for t in enriched],
+            [(4, "517"), (3, "ZR"), (4, "VAT"), (1, "vat"), (2, "Exe")],
+        )
+
+    def test_code_and_percent(self):
+        self.assertEqual(get_tax_code_and_percent_for_id(502, 4), ("517", 15.5))
+        self.assertEqual(get_tax_code_and_percent_for_id(502, 3), ("ZR", 0.0))
+        self.assertEqual(self.resolver.code_and_percent(9), ("VAT", 15.0))
+
+    def test_empty_configs(self):
+        resolver = TaxResolver.build(None)
+        self.assertEqual(dict(resolver.id_to_percent), {1: 15.0})
+        self.assertEqual(dict(resolver.id_to_code), {})
+        self.assertEqual(resolver.enrich_taxes([{"taxCode": "A"}]), [{"taxCode": "1", "taxID": 1}])
+        resolver.validate("ZWL", [{"taxID": 1}], [])
+        with self.assertRaises(ValidationError):
+            resolver.validate("ZWL", [{"taxID": 2}], [])
@@ -0,0 +1,86 @@
+"""Scheduled GetConfig refresh: due selection, waves with jitter, backoff and alerting."""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from fiscal.models import ActivityEvent, ConfigRefreshState, FDMSConfigs, FiscalDevice
+from fiscal.services.config_refresh import due_devices, refresh_device_config, schedule_config_refresh
+from fiscal.tasks import refresh_device_config_task
+
+API = "fiscal.services.device_api.DeviceApiService"
+
+
+@override_settings(
+    FDMS_CONFIG_REFRESH_AGE=3600,
+    FDMS_CONFIG_REFRESH_CONCURRENCY=2,
+    FDMS_CONFIG_REFRESH_SPACING=30,
+    FDMS_CONFIG_REFRESH_JITTER=5,
+    FDMS_CONFIG_REFRESH_RETRY_DELAY=60,
+    FDMS_CONFIG_REFRESH_RETRY_MAX=200,
+    FDMS_CONFIG_REFRESH_ALERT_AFTER=2,
+)
+class ConfigRefreshTests(TestCase):
+    def setUp(self):
+        patcher = patch("fiscal.services.fdms_events._emit")
+        self.emit = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+        self.devices = [
+            FiscalDevice.objects.create(device_id=77400 + i, device_serial_no=f"CFG{i}", is_registered=True)
+            for i in range(4)
+        ]
+        # 0: fresh, 1: 2h old, 2: 5h old, 3: never fetched.
+        for device, age in zip(self.devices[:3], (10, 7200, 18000)):
+            FDMSConfigs.objects.create(
+                device_id=device.device_id, raw_response={}, fetched_at=self.now - timedelta(seconds=age)
+            )
+        FiscalDevice.objects.create(device_id=77499, device_serial_no="UNREG", is_registered=False)
+
+    def test_due_devices_oldest_first(self):
+        self.assertEqual(
+            [d.device_id for d in due_devices(self.now)],
+            [77403, 77402, 77401],
+        )
+
+    def test_schedule_spreads_waves_and_holds_queued_devices(self):
+        with patch.object(refresh_device_config_task, "apply_async") as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            queued = schedule_config_refresh(self.now)
+        self.assertEqual(queued, [77403, 77402, 77401])
+        countdowns = [c.kwargs["countdown"] for c in apply_async.call_args_list]
+        self.assertTrue(all(0 <= c <= 5 for c in countdowns[:2]), countdowns)
+        self.assertTrue(30 <= countdowns[2] <= 35, countdowns)
+        self.assertEqual(ConfigRefreshState.objects.filter(next_attempt_at__gt=self.now).count(), 3)
+        # Already queued: the next beat tick does not enqueue them again.
+        self.assertEqual(due_devices(self.now), [])
+
+    def test_failures_back_off_and_alert_once(self):
+        device = self.devices[1]
+        with patch(f"{API}.get_config", return_value=(None, "timeout")):
+            for expected_delay in (60, 120, 200):
+                before = timezone.now()
+                self.assertEqual(refresh_device_config(device.device_id), (None, "timeout"))
+                state = ConfigRefreshState.objects.get(device=device)
+                delay = (state.next_attempt_at - before).total_seconds()
+                self.assertAlmostEqual(delay, expected_delay, delta=2)
+        self.assertEqual(state.consecutive_failures, 3)
+        self.assertIsNotNone(state.alerted_at)
+        self.assertEqual(ActivityEvent.objects.filter(device=device, event_type="config_refresh_failing").count(), 1)
+        alerts = [c.args[1] for c in self.emit.call_args_list if c.args[1].get("type") == "config_refresh.failed"]
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]["deviceId"], device.device_id)
+
+        with patch(f"{API}.get_config", return_value=({"taxTable": []}, None)):
+            refresh_device_config(device.device_id)
+        state.refresh_from_db()
+        self.assertEqual((state.consecutive_failures, state.alerted_at, state.next_attempt_at), (0, None, None))
+        self.assertIsNotNone(state.last_success_at)
+
+    def test_exception_counts_as_failure(self):
+        with patch(f"{API}.get_config", side_effect=ConnectionError("down")):
+            _, err = refresh_device_config(self.devices[3].device_id)
+        self.assertEqual(err, "down")
+        self.assertEqual(ConfigRefreshState.objects.get(device=self.devices[3]).consecutive_failures, 1)
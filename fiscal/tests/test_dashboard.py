@@ -2,7 +2,7 @@
 
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from fiscal.models import FDMSApiLog, FiscalDevice, Receipt
 from fiscal.services.dashboard_service import get_errors, get_receipts, get_summary
@@ -56,6 +56,22 @@ class DashboardTotalsTests(TestCase):
         self.assertEqual(data["metrics"]["netTotal"], 80.0)
         self.assertEqual(data["metrics"]["vatTotal"], 12.0)
 
+    def test_fdms_cased_receipt_types_are_counted(self):
+        """receipt_service stores FISCALINVOICE/CREDITNOTE; they count like FiscalInvoice/CreditNote."""
+        for n, (receipt_type, total) in enumerate((("FISCALINVOICE", "100.00"), ("CREDITNOTE", "-20.00")), start=1):
+            Receipt.objects.create(
+                device=self.device,
+                fiscal_day_no=1,
+                receipt_global_no=n,
+                receipt_counter=n,
+                currency="USD",
+                receipt_type=receipt_type,
+                receipt_total=Decimal(total),
+                fdms_receipt_id=100 + n,
+            )
+        data = get_summary(self.device.device_id, "today")
+        self.assertEqual((data["metrics"]["invoicesFiscalised"], data["metrics"]["creditNotes"]), (1, 1))
+
     def test_draft_receipts_excluded_from_totals(self):
         """Receipts without fdms_receipt_id must NOT affect metrics."""
         from django.utils import timezone
@@ -241,3 +257,149 @@ class DashboardRoleBasedTests(TestCase):
         self.assertEqual(filtered["status"].get("certificate"), "***")
         self.assertEqual(filtered["status"].get("lastSync"), "***")
         self.assertEqual(filtered["compliance"].get("lastReceiptGlobalNo"), "***")
+
+
+class DashboardCacheTests(TransactionTestCase):
+    """Summary/receipts/errors are served from cache until a relevant row commits."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.device = FiscalDevice.objects.create(
+            device_id=44444,
+            device_serial_no="CACHE",
+            is_registered=True,
+        )
+
+    def test_summary_cached_until_receipt_commit(self):
+        from fiscal.services.dashboard_cache import cached_summary
+
+        first = cached_summary(self.device.device_id, "today")
+        self.assertEqual(first["pipeline"]["draft"], 0)
+        with self.assertNumQueries(0):
+            cached_summary(self.device.device_id, "today")
+
+        Receipt.objects.create(
+            device=self.device,
+            fiscal_day_no=1,
+            receipt_global_no=1,
+            receipt_counter=1,
+            receipt_type="FiscalInvoice",
+            receipt_total=Decimal("10.00"),
+        )
+        self.assertEqual(cached_summary(self.device.device_id, "today")["pipeline"]["draft"], 1)
+
+    def test_errors_invalidated_by_api_log(self):
+        from fiscal.services.dashboard_cache import cached_errors
+
+        self.assertEqual(cached_errors(self.device.device_id, "today"), [])
+        FDMSApiLog.objects.create(
+            endpoint=f"/Device/v1/{self.device.device_id}/SubmitReceipt",
+            method="POST",
+            status_code=422,
+            error_message="RCPT020",
+        )
+        self.assertEqual(len(cached_errors(self.device.device_id, "today")), 1)
+
+    def test_writes_for_another_device_keep_this_device_cached(self):
+        from fiscal.services.dashboard_cache import cached_errors, cached_fleet_summary, cached_summary
+
+        other = FiscalDevice.objects.create(device_id=44445, device_serial_no="CACHE2", is_registered=True)
+        cached_summary(self.device.device_id, "today")
+        cached_errors(self.device.device_id, "today")
+        fleet = cached_fleet_summary("today", "deviceId", 1, 50)
+        Receipt.objects.create(
+            device=other,
+            fiscal_day_no=1,
+            receipt_global_no=1,
+            receipt_counter=1,
+            receipt_type="FiscalInvoice",
+            receipt_total=Decimal("10.00"),
+        )
+        FDMSApiLog.objects.create(
+            endpoint=f"/Device/v1/{other.device_id}/SubmitReceipt",
+            method="POST",
+            status_code=422,
+            error_message="RCPT020",
+        )
+        with self.assertNumQueries(0):
+            cached_summary(self.device.device_id, "today")
+            cached_errors(self.device.device_id, "today")
+        self.assertNotEqual(cached_fleet_summary("today", "deviceId", 1, 50), fleet)
+        self.assertEqual(len(cached_errors(other.device_id, "today")), 1)
+
+    def test_waiter_falls_back_to_compute_when_lock_held(self):
+        from django.core.cache import cache
+        from fiscal.services.cache_utils import get_or_compute
+
+        cache.add("fdms:test:k:lock", 1, timeout=10)
+        self.assertEqual(get_or_compute("fdms:test:k", lambda: "v", ttl=5, wait=0.1), "v")
+        self.assertIsNone(cache.get("fdms:test:k"))
+
+
+class FleetSummaryTests(TestCase):
+    """Fleet view: every device in a fixed number of queries, sortable and paginated."""
+
+    def setUp(self):
+        from django.utils import timezone
+        from offline.models import OfflineReceiptQueue
+        from fiscal.models import ReceiptSubmissionResponse
+
+        self.devices = []
+        for i in range(6):
+            self.devices.append(FiscalDevice.objects.create(
+                device_id=81000 + i,
+                device_serial_no=f"FLEET{i}",
+                is_registered=True,
+                fiscal_day_status="FiscalDayOpened" if i % 2 == 0 else "FiscalDayClosed",
+                certificate_valid_till=timezone.now() + timezone.timedelta(days=5 + i * 10),
+            ))
+        busy = self.devices[3]
+        for n in range(3):
+            Receipt.objects.create(
+                device=busy,
+                fiscal_day_no=1,
+                receipt_global_no=n + 1,
+                receipt_counter=n + 1,
+                receipt_type="FISCALINVOICE" if n == 0 else "FiscalInvoice",
+                receipt_total=Decimal("115.00"),
+                receipt_taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+                fdms_receipt_id=500 + n,
+            )
+        draft = Receipt.objects.create(
+            device=busy,
+            fiscal_day_no=1,
+            receipt_global_no=10,
+            receipt_counter=10,
+            receipt_type="FiscalInvoice",
+            receipt_total=Decimal("5.00"),
+        )
+        OfflineReceiptQueue.objects.create(receipt=draft)
+        ReceiptSubmissionResponse.objects.create(device=busy, receipt_global_no=10, status_code=422)
+
+    def test_fleet_counts_and_totals(self):
+        from fiscal.services.dashboard_service import get_fleet_summary
+
+        with self.assertNumQueries(2):
+            data = get_fleet_summary("today", "-receiptsFiscalised", 1, 50)
+        self.assertEqual(data["total"], 6)
+        top = data["devices"][0]
+        self.assertEqual(top["deviceId"], 81003)
+        self.assertEqual(top["receiptsFiscalised"], 3)
+        self.assertEqual(top["invoicesFiscalised"], 3)
+        self.assertEqual(top["draft"], 1)
+        self.assertEqual(top["netTotal"], 345.0)
+        self.assertEqual(top["vatTotal"], 45.0)
+        self.assertEqual(top["failed"], 1)
+        self.assertEqual(top["queueDepth"], 1)
+        self.assertTrue(data["devices"][1]["receiptsFiscalised"] == 0)
+        self.assertTrue(
+            next(d for d in data["devices"] if d["deviceId"] == 81000)["certificate"].startswith("EXPIRING")
+        )
+
+    def test_fleet_pagination(self):
+        from fiscal.services.dashboard_service import get_fleet_summary
+
+        data = get_fleet_summary("today", "deviceId", 2, 4)
+        self.assertEqual(data["pages"], 2)
+        self.assertEqual([d["deviceId"] for d in data["devices"]], [81004, 81005])
@@ -0,0 +1,238 @@
+"""Background WebSocket event emitter (batching, coalescing, backpressure) and resumable streams."""
+
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from fiscal.consumers import FDMSDeviceConsumer
+from fiscal.services.event_stream import MemoryEventStream, get_event_stream, reset_event_stream, stamp_event
+from fiscal.services.fdms_events import BackgroundEmitter, emit_to_device, flush_events
+
+
+class _FakeLayer:
+    def __init__(self, gate=None):
+        self.sent = []
+        self.gate = gate
+
+    async def group_send(self, group, message):
+        if self.gate is not None:
+            self.gate.wait(2)
+        self.sent.append((group, message))
+
+
+def _events(sent):
+    out = []
+    for group, message in sent:
+        if message["type"] == "fdms_event":
+            out.append((group, message["data"]))
+        else:
+            out.extend((group, e) for e in message["events"])
+    return [(g, {k: v for k, v in e.items() if k != "seq"}) for g, e in out]
+
+
+@override_settings(FDMS_EVENT_STREAM_BACKEND="memory")
+class BackgroundEmitterTests(SimpleTestCase):
+    def setUp(self):
+        reset_event_stream()
+
+    def test_emit_returns_without_waiting_for_layer(self):
+        gate = threading.Event()
+        layer = _FakeLayer(gate)
+        with patch("channels.layers.get_channel_layer", return_value=layer):
+            emit_to_device(1, "receipt.completed", {"invoice_no": "INV-1"})
+            self.assertEqual(layer.sent, [])
+            gate.set()
+            self.assertTrue(flush_events())
+        self.assertEqual(_events(layer.sent), [("fdms_device_1", {"type": "receipt.completed", "invoice_no": "INV-1"})])
+
+    def test_progress_frames_coalesced_per_invoice(self):
+        layer = _FakeLayer()
+        emitter = BackgroundEmitter(flush_interval=0.2)
+        with patch("channels.layers.get_channel_layer", return_value=layer):
+            for pct in (10, 30, 60):
+                emitter.submit("fdms_device_2", {"type": "receipt.progress", "percent": pct}, ("receipt.progress", "A"))
+            emitter.submit("fdms_device_2", {"type": "receipt.completed"})
+            emitter.submit("fdms_device_3", {"type": "activity"})
+            self.assertTrue(emitter.flush())
+        events = _events(layer.sent)
+        self.assertEqual(
+            events,
+            [
+                ("fdms_device_2", {"type": "receipt.progress", "percent": 60}),
+                ("fdms_device_2", {"type": "receipt.completed"}),
+                ("fdms_device_3", {"type": "activity"}),
+            ],
+        )
+        self.assertEqual(len(layer.sent), 2)
+
+    def test_backpressure_drops_progress_but_not_terminal_events(self):
+        gate = threading.Event()
+        layer = _FakeLayer(gate)
+        emitter = BackgroundEmitter(maxsize=1, flush_interval=0)
+        with patch("channels.layers.get_channel_layer", return_value=layer):
+            emitter.submit("g", {"type": "activity", "n": 0})
+            # Wait for the flush thread to pick it up and block on the gate.
+            for _ in range(200):
+                if emitter._queue.empty():
+                    break
+                threading.Event().wait(0.005)
+            emitter.submit("g", {"type": "activity", "n": 1})
+            emitter.submit("g", {"type": "receipt.progress", "percent": 50}, ("receipt.progress", "B"))
+            self.assertEqual(emitter.dropped, 1)
+            gate.set()
+            t = threading.Thread(target=emitter.submit, args=("g", {"type": "receipt.completed"}))
+            t.start()
+            t.join(2)
+            self.assertTrue(emitter.flush())
+        types = [e["type"] for _, e in _events(layer.sent)]
+        self.assertEqual(types, ["activity", "activity", "receipt.completed"])
+
+    def test_terminal_event_on_full_queue_evicts_progress_and_keeps_order(self):
+        gate = threading.Event()
+        layer = _FakeLayer(gate)
+        emitter = BackgroundEmitter(maxsize=2, flush_interval=0)
+        with patch("channels.layers.get_channel_layer", return_value=layer):
+            emitter.submit("g", {"type": "activity", "n": 0})
+            for _ in range(200):
+                if emitter._queue.empty():
+                    break
+                threading.Event().wait(0.005)
+            emitter.submit("g", {"type": "receipt.progress", "percent": 50}, ("receipt.progress", "B"))
+            emitter.submit("g", {"type": "activity", "n": 1})
+            emitter.submit("g", {"type": "receipt.completed"})
+            self.assertEqual(emitter.dropped, 1)
+            self.assertEqual(layer.sent, [])
+            gate.set()
+            self.assertTrue(emitter.flush())
+        events = [e for _, e in _events(layer.sent)]
+        self.assertEqual(
+            [(e["type"], e.get("n")) for e in events],
+            [("activity", 0), ("activity", 1), ("receipt.completed", None)],
+        )
+
+
+class _StaffUser:
+    is_authenticated = True
+    is_staff = True
+
+
+@override_settings(
+    FDMS_EVENT_STREAM_BACKEND="memory",
+    FDMS_EVENT_REPLAY_SIZE=5,
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+)
+class ResumableStreamTests(SimpleTestCase):
+    """Sequence numbers, replay on resume_from, and reset when the cursor is too old."""
+
+    def setUp(self):
+        reset_event_stream()
+        self.layer = InMemoryChannelLayer()
+        patcher = patch("channels.layers.get_channel_layer", return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _publish(self, n, start=0):
+        for i in range(start, start + n):
+            emit_to_device(7, "activity", {"n": i})
+            self.assertTrue(flush_events())
+
+    async def _connect(self, query=""):
+        app = FDMSDeviceConsumer.as_asgi(channel_layer_alias="default")
+        comm = WebsocketCommunicator(app, f"/ws/fdms/device/7/{query}")
+        comm.scope["user"] = _StaffUser()
+        comm.scope["url_route"] = {"kwargs": {"device_id": "7"}}
+        connected, _ = await comm.connect()
+        self.assertTrue(connected)
+        return comm
+
+    def test_events_carry_increasing_seq(self):
+        self._publish(3)
+        stream = get_event_stream()
+        self.assertIsInstance(stream, MemoryEventStream)
+        events, ok = stream.since("fdms_device_7", 0)
+        self.assertTrue(ok)
+        self.assertEqual([e["seq"] for e in events], [1, 2, 3])
+        self.assertEqual([e["n"] for e in events], [0, 1, 2])
+
+    def test_resume_replays_only_missed_events(self):
+        self._publish(4)
+
+        async def run():
+            comm = await self._connect("?resume_from=2")
+            first = await comm.receive_json_from()
+            second = await comm.receive_json_from()
+            self.assertTrue(await comm.receive_nothing())
+            await comm.disconnect()
+            return first, second
+
+        first, second = async_to_sync(run)()
+        self.assertEqual((first["seq"], first["n"]), (3, 2))
+        self.assertEqual((second["seq"], second["n"]), (4, 3))
+
+    def test_stale_cursor_gets_reset(self):
+        self._publish(8)
+
+        async def run():
+            comm = await self._connect("?resume_from=1")
+            frame = await comm.receive_json_from()
+            await comm.disconnect()
+            return frame
+
+        frame = async_to_sync(run)()
+        self.assertEqual(frame, {"type": "stream.reset", "seq": 8})
+
+    def test_fresh_connect_gets_hello(self):
+        self._publish(2)
+
+        async def run():
+            comm = await self._connect()
+            frame = await comm.receive_json_from()
+            await comm.disconnect()
+            return frame
+
+        self.assertEqual(async_to_sync(run)(), {"type": "stream.hello", "seq": 2})
+
+    async def _group_send(self, data):
+        await channel_layers["default"].group_send("fdms_device_7", {"type": "fdms_event", "data": data})
+
+    def test_out_of_order_frames_are_reordered_from_buffer(self):
+        self._publish(1)
+
+        async def run():
+            comm = await self._connect()
+            hello = await comm.receive_json_from()
+            first = await sync_to_async(stamp_event)("fdms_device_7", {"type": "activity", "n": "a"})
+            second = await sync_to_async(stamp_event)("fdms_device_7", {"type": "activity", "n": "b"})
+            # The producer of seq 3 publishes before the producer of seq 2.
+            await self._group_send(second)
+            await self._group_send(first)
+            frames = [hello, await comm.receive_json_from(), await comm.receive_json_from()]
+            self.assertTrue(await comm.receive_nothing())
+            await comm.disconnect()
+            return frames
+
+        hello, *frames = async_to_sync(run)()
+        self.assertEqual(hello, {"type": "stream.hello", "seq": 1})
+        self.assertEqual([(f["seq"], f["n"]) for f in frames], [(2, "a"), (3, "b")])
+
+    def test_gap_outside_buffer_resets_then_continues_live(self):
+        self._publish(1)
+
+        async def run():
+            comm = await self._connect()
+            await comm.receive_json_from()
+            for i in range(6):
+                await sync_to_async(stamp_event)("fdms_device_7", {"type": "activity", "n": i})
+            late = await sync_to_async(stamp_event)("fdms_device_7", {"type": "activity", "n": "late"})
+            await self._group_send(late)
+            frames = [await comm.receive_json_from(), await comm.receive_json_from()]
+            await comm.disconnect()
+            return frames
+
+        reset, frame = async_to_sync(run)()
+        self.assertEqual(reset, {"type": "stream.reset", "seq": 7})
+        self.assertEqual((frame["seq"], frame["n"]), (8, "late"))
@@ -0,0 +1,161 @@
+"""Running FiscalDayCounter rows maintained on receipt save, and reconciliation."""
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from fiscal.models import FiscalDayCounter, FiscalDevice, Receipt
+from fiscal.services.close_day_counter_builder import (
+    build_close_day_counters,
+    build_fiscal_day_counters,
+    convert_to_fdms_format,
+    get_day_receipts,
+    sort_fiscal_counters,
+)
+from fiscal.services.fiscal_day_counters import get_day_counters, reconcile_day_counters
+
+
+class FiscalDayCounterTests(TestCase):
+    def setUp(self):
+        self.device = FiscalDevice.objects.create(
+            device_id=77101,
+            device_serial_no="COUNTERS",
+            is_registered=True,
+            last_fiscal_day_no=5,
+        )
+        self._global_no = 0
+
+    def _receipt(self, receipt_type="FiscalInvoice", taxes=None, payments=None, fdms_id=1, day=5):
+        self._global_no += 1
+        return Receipt.objects.create(
+            device=self.device,
+            fiscal_day_no=day,
+            receipt_global_no=self._global_no,
+            receipt_counter=self._global_no,
+            currency="USD",
+            receipt_type=receipt_type,
+            receipt_taxes=taxes or [],
+            receipt_payments=payments or [],
+            fdms_receipt_id=fdms_id,
+        )
+
+    def _values(self, day=5):
+        return {
+            c.counter_key: c.value_cents
+            for c in FiscalDayCounter.objects.filter(device=self.device, fiscal_day_no=day)
+        }
+
+    def test_counters_accumulate_per_receipt(self):
+        self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": 115}],
+        )
+        self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 1.5, "salesAmountWithTax": 11.5}],
+            payments=[{"moneyTypeCode": "CARD", "paymentAmount": 11.5}],
+        )
+        self._receipt(
+            receipt_type="CreditNote",
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": -1.5, "salesAmountWithTax": -11.5}],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": -11.5}],
+        )
+        self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 9, "salesAmountWithTax": 99}], fdms_id=None)
+        self.assertEqual(
+            self._values(),
+            {
+                "SaleByTax|USD|1|15.0": 12650,
+                "SaleTaxByTax|USD|1|15.0": 1650,
+                "CreditNoteByTax|USD|1|15.0": -1150,
+                "CreditNoteTaxByTax|USD|1|15.0": -150,
+                "BalanceByMoneyType|USD|CASH|": 10350,
+                "BalanceByMoneyType|USD|CARD|": 1150,
+            },
+        )
+        self.assertEqual(reconcile_day_counters(self.device, 5), [])
+
+    def test_fiscalising_and_editing_moves_contribution(self):
+        pending = self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}], fdms_id=None
+        )
+        self.assertFalse(FiscalDayCounter.objects.exists())
+        pending.fdms_receipt_id = 42
+        pending.save()
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 11500)
+
+        pending.receipt_taxes = [{"taxID": 1, "taxPercent": 15, "taxAmount": 3, "salesAmountWithTax": 23}]
+        pending.save()
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 2300)
+
+        pending.save(update_fields=["qr_code_value"])
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 2300)
+
+        other = self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 1, "salesAmountWithTax": 7}])
+        other.delete()
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 2300)
+        self.assertEqual(reconcile_day_counters(self.device, 5), [])
+
+    def test_close_day_reads_stored_counters(self):
+        self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+            payments=[{"moneyTypeCode": "ECOCASH", "paymentAmount": 115}],
+        )
+        expected = sort_fiscal_counters(
+            convert_to_fdms_format(build_fiscal_day_counters(get_day_receipts(self.device, 5)))
+        )
+        with self.assertNumQueries(1):
+            counters = build_close_day_counters(self.device, 5)
+        self.assertEqual(counters, expected)
+        self.assertEqual(get_day_counters(self.device, 5)[("SaleByTax", "USD", 1, 15.0)], Decimal("115"))
+
+    def test_close_day_seeds_days_without_rows(self):
+        self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}])
+        FiscalDayCounter.objects.all().delete()
+        self.assertIsNone(get_day_counters(self.device, 5))
+        self.assertEqual(len(build_close_day_counters(self.device, 5)), 2)
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 11500)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}])
+        FiscalDayCounter.objects.filter(counter_key="SaleByTax|USD|1|15.0").update(value_cents=1)
+        mismatches = reconcile_day_counters(self.device, 5)
+        self.assertEqual(
+            mismatches, [{"key": "SaleByTax|USD|1|15.0", "stored_cents": 1, "expected_cents": 11500}]
+        )
+        out = StringIO()
+        call_command("reconcile_fiscal_day_counters", "--device", "77101", stdout=out)
+        self.assertIn("mismatched", out.getvalue())
+        call_command("reconcile_fiscal_day_counters", "--fix", stdout=StringIO())
+        self.assertEqual(reconcile_day_counters(self.device, 5), [])
+
+    def test_sub_cent_amounts_reconcile(self):
+        for _ in range(2):
+            self._receipt(
+                taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 0.005, "salesAmountWithTax": 0.035}],
+                payments=[{"moneyTypeCode": "CASH", "paymentAmount": 0.035}],
+            )
+        self.assertEqual(self._values()["SaleTaxByTax|USD|1|15.0"], 2)
+        self.assertEqual(reconcile_day_counters(self.device, 5), [])
+        rebuilt = sort_fiscal_counters(convert_to_fdms_format(build_fiscal_day_counters(get_day_receipts(self.device, 5))))
+        self.assertEqual(rebuilt, build_close_day_counters(self.device, 5))
+        self.assertIn(0.08, [c["fiscalCounterValue"] for c in rebuilt if c["fiscalCounterType"] == "SaleByTax"])
+
+    def test_failed_counter_update_keeps_receipt_and_invalidates_day(self):
+        receipt = self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}])
+        receipt.receipt_taxes = [{"taxID": 1, "taxPercent": 15, "taxAmount": 30, "salesAmountWithTax": 230}]
+        with patch(
+            "fiscal.services.fiscal_day_counters.receipt_counter_contributions",
+            side_effect=ValueError("bad taxes"),
+        ), self.assertLogs("fiscal", "ERROR") as logs:
+            with transaction.atomic():
+                receipt.save()
+                self.assertEqual(Receipt.objects.filter(pk=receipt.pk).count(), 1)
+        self.assertIn("Fiscal day counter update failed", logs.output[0])
+        receipt.refresh_from_db()
+        self.assertEqual(receipt.receipt_taxes[0]["salesAmountWithTax"], 230)
+        self.assertIsNone(get_day_counters(self.device, 5))
+        build_close_day_counters(self.device, 5)
+        self.assertEqual(self._values()["SaleByTax|USD|1|15.0"], 23000)
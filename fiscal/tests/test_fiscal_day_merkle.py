@@ -0,0 +1,116 @@
+"""Per-fiscal-day Merkle roots over receipt hashes and single-receipt inclusion proofs."""
+
+import base64
+import hashlib
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from fiscal.models import CloseDayTracker, FiscalDay, FiscalDevice, Receipt
+from fiscal.services.close_day_tracker import check_close_day_status, start_close_day_tracking
+from fiscal.services.fiscal_day_merkle import (
+    build_levels,
+    compute_day_root,
+    get_receipt_inclusion_proof,
+    inclusion_path,
+    leaf_hash,
+    merkle_root,
+    seal_fiscal_day,
+    verify_inclusion,
+)
+
+
+def _hash(n: int) -> str:
+    return base64.b64encode(hashlib.sha256(str(n).encode()).digest()).decode()
+
+
+class MerkleTreeTests(TestCase):
+    def test_every_leaf_proves_for_odd_and_even_sizes(self):
+        for size in (1, 2, 3, 5, 8, 13):
+            hashes = [_hash(i) for i in range(size)]
+            levels = build_levels([leaf_hash(h) for h in hashes])
+            root = levels[-1][0].hex()
+            for index, h in enumerate(hashes):
+                path = inclusion_path(levels, index)
+                self.assertTrue(verify_inclusion(h, path, root), (size, index))
+                self.assertFalse(verify_inclusion(_hash(99), path, root))
+
+    def test_root_depends_on_order_and_count(self):
+        leaves = [leaf_hash(_hash(i)) for i in range(3)]
+        self.assertNotEqual(merkle_root(leaves), merkle_root(list(reversed(leaves))))
+        # No last-leaf duplication: [a, b, c] and [a, b, c, c] differ.
+        self.assertNotEqual(merkle_root(leaves), merkle_root(leaves + leaves[-1:]))
+        self.assertEqual(merkle_root([]), "")
+
+
+class FiscalDayMerkleTests(TestCase):
+    def setUp(self):
+        patcher = patch("fiscal.services.fdms_events.emit_metrics_updated")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.device = FiscalDevice.objects.create(
+            device_id=77301, device_serial_no="MERKLE", is_registered=True, last_fiscal_day_no=4
+        )
+        self.day = FiscalDay.objects.create(
+            device=self.device, fiscal_day_no=4, status="FiscalDayOpened", opened_at=timezone.now()
+        )
+        self.receipts = [
+            Receipt.objects.create(
+                device=self.device,
+                fiscal_day_no=4,
+                receipt_global_no=100 + i,
+                receipt_counter=i + 1,
+                receipt_type="FiscalInvoice",
+                currency="USD",
+                receipt_total=10,
+                receipt_hash=_hash(i),
+            )
+            for i in range(5)
+        ]
+
+    def test_tracker_close_seals_day(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            tracker = start_close_day_tracking(self.device, 4, "op-m")
+        CloseDayTracker.objects.filter(pk=tracker.pk).update(next_check_at=timezone.now())
+        with patch(
+            "fiscal.services.device_api.DeviceApiService.get_status",
+            return_value=({"fiscalDayStatus": "FiscalDayClosed"}, None),
+        ), patch("fiscal.services.fdms_events.emit_to_device"):
+            check_close_day_status(tracker.pk)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.status, "FiscalDayClosed")
+        self.assertIsNotNone(self.day.closed_at)
+        self.assertEqual((self.day.merkle_root, self.day.merkle_leaf_count), compute_day_root(self.device, 4)[0])
+        self.assertEqual(self.day.merkle_leaf_count, 5)
+
+    def test_proof_detects_tampered_receipt(self):
+        seal_fiscal_day(self.device, 4)
+        proof, err = get_receipt_inclusion_proof(self.receipts[3])
+        self.assertIsNone(err)
+        self.assertEqual((proof["leafIndex"], proof["leafCount"]), (3, 5))
+        self.assertTrue(proof["rootSealed"])
+        self.assertTrue(proof["rootMatches"])
+
+        Receipt.objects.filter(pk=self.receipts[3].pk).update(receipt_hash=_hash(42))
+        proof, err = get_receipt_inclusion_proof(Receipt.objects.get(pk=self.receipts[3].pk))
+        self.assertIsNone(err)
+        self.assertFalse(proof["rootMatches"])
+
+    def test_missing_hash_is_an_error(self):
+        Receipt.objects.filter(pk=self.receipts[0].pk).update(receipt_hash="")
+        self.assertEqual(seal_fiscal_day(self.device, 4)[0], None)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.merkle_root, "")
+
+    def test_proof_api(self):
+        seal_fiscal_day(self.device, 4)
+        staff = get_user_model().objects.create_user("auditor", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(f"/api/fdms/receipts/{self.receipts[1].pk}/proof/")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body["rootMatches"])
+        self.assertTrue(verify_inclusion(body["receiptHash"], body["path"], body["root"]))
+        self.assertEqual(self.client.get("/api/fdms/receipts/999999/proof/").status_code, 404)
@@ -0,0 +1,82 @@
+"""Fiscal day totals: single-pass aggregation over invoices, credit notes and debit notes."""
+
+from decimal import Decimal
+
+from django.test import TestCase
+
+from fiscal.models import FiscalDevice, Receipt
+from fiscal.services.fiscal_day_totals import get_fiscal_day_totals
+
+
+class FiscalDayTotalsTests(TestCase):
+    def setUp(self):
+        self.device = FiscalDevice.objects.create(
+            device_id=77002,
+            device_serial_no="TOTALS",
+            is_registered=True,
+        )
+        self._global_no = 0
+
+    def _receipt(self, document_type, receipt_type, total, lines, taxes, inclusive=True, currency="ZWG"):
+        self._global_no += 1
+        return Receipt.objects.create(
+            device=self.device,
+            fiscal_day_no=5,
+            receipt_global_no=self._global_no,
+            receipt_counter=self._global_no,
+            currency=currency,
+            document_type=document_type,
+            receipt_type=receipt_type,
+            receipt_total=Decimal(total),
+            receipt_lines=lines,
+            receipt_taxes=taxes,
+            receipt_lines_tax_inclusive=inclusive,
+        )
+
+    def test_totals_by_document_type(self):
+        self._receipt("INVOICE", "FiscalInvoice", "115.00",
+                      [{"receiptLineTotal": 100}, {"lineAmount": 15}],
+                      [{"taxAmount": 15, "salesAmountWithTax": 115}])
+        self._receipt("", "FiscalInvoice", "50.00",
+                      [{"receiptLineTotal": 50}],
+                      [{"taxAmount": 6.52, "salesAmountWithTax": 50}], inclusive=False, currency="USD")
+        self._receipt("CREDIT_NOTE", "CreditNote", "-23.00",
+                      [{"receiptLineTotal": -23}],
+                      [{"taxAmount": -3, "salesAmountWithTax": -23}])
+        self._receipt("DEBIT_NOTE", "DebitNote", "11.50",
+                      [{"receiptLineTotal": 11.5}],
+                      [{"taxAmount": 1.5, "salesAmountWithTax": 11.5}])
+        # Legacy credit note stored with default document_type counts in both buckets.
+        self._receipt("INVOICE", "CREDITNOTE", "-5.00", [], [{"taxAmount": -0.65}])
+
+        with self.assertNumQueries(2):
+            totals = get_fiscal_day_totals(self.device, 5)
+
+        inv = totals["invoices"]
+        self.assertEqual(inv["count"], 3)
+        self.assertEqual(inv["total"], 160.0)
+        self.assertEqual(inv["subtotal"], 165.0)
+        self.assertAlmostEqual(inv["tax"], 20.87)
+        self.assertTrue(inv["tax_inclusive"]["mixed"])
+        self.assertEqual(inv["tax_inclusive"]["inclusive_count"], 2)
+
+        cn = totals["credit_notes"]
+        self.assertEqual(cn["count"], 2)
+        self.assertEqual(cn["total"], -28.0)
+        self.assertAlmostEqual(cn["tax"], -3.65)
+        self.assertTrue(cn["tax_inclusive"]["all_inclusive"])
+
+        dn = totals["debit_notes"]
+        self.assertEqual(dn["count"], 1)
+        self.assertEqual(dn["tax"], 1.5)
+
+        self.assertEqual(totals["net_total"], 143.5)
+        self.assertEqual(totals["currency"], "ZWG")
+        self.assertTrue(totals["has_data"])
+
+    def test_empty_day(self):
+        totals = get_fiscal_day_totals(self.device, 99)
+        self.assertFalse(totals["has_data"])
+        self.assertEqual(totals["invoices"]["count"], 0)
+        self.assertIsNone(totals["credit_notes"]["tax_inclusive"])
+        self.assertEqual(totals["currency"], "USD")
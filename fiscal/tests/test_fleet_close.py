@@ -0,0 +1,153 @@
+"""Fleet end-of-day orchestration: concurrency limit, reopen after close, retries, status."""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from fiscal.models import CloseDayTracker, FiscalDay, FiscalDevice, FleetCloseItem, FleetCloseRun
+from fiscal.services.close_day_tracker import check_close_day_status, start_close_day_tracking
+from fiscal.services.fleet_close import close_device, dispatch_run, get_fleet_close_status, start_fleet_close
+from fiscal.tasks import check_close_day_status_task, fleet_close_device_task, fleet_close_dispatch_task
+
+API = "fiscal.services.device_api.DeviceApiService"
+
+
+@override_settings(FDMS_FLEET_CLOSE_RETRY_DELAY=30)
+class FleetCloseTests(TestCase):
+    def setUp(self):
+        for target in (
+            patch.object(fleet_close_dispatch_task, "apply_async"),
+            patch.object(fleet_close_device_task, "apply_async"),
+            patch.object(check_close_day_status_task, "apply_async"),
+            patch("fiscal.services.fdms_events._emit"),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+        self.devices = [
+            FiscalDevice.objects.create(
+                device_id=77300 + i,
+                device_serial_no=f"EOD{i}",
+                is_registered=True,
+                last_fiscal_day_no=4,
+                fiscal_day_status="FiscalDayOpened",
+            )
+            for i in range(3)
+        ]
+
+    def _close_ok(self, device, *args, **kwargs):
+        start_close_day_tracking(device, device.last_fiscal_day_no, "op")
+        return {"operationID": "op"}, None
+
+    def _item(self, device):
+        return FleetCloseItem.objects.get(device=device)
+
+    def test_concurrency_limit_and_reopen_after_closed(self):
+        run = start_fleet_close(concurrency=2)
+        self.assertEqual(dispatch_run(run.pk), [self._item(d).pk for d in self.devices[:2]])
+        self.assertEqual(self._item(self.devices[2]).state, FleetCloseItem.STATE_QUEUED)
+        self.assertEqual(dispatch_run(run.pk), [])
+
+        first = self.devices[0]
+        with patch(f"{API}.close_day", side_effect=self._close_ok):
+            close_device(self._item(first).pk)
+        tracker = CloseDayTracker.objects.get(device=first)
+        self.assertEqual(self._item(first).tracker, tracker)
+
+        CloseDayTracker.objects.filter(pk=tracker.pk).update(next_check_at=timezone.now())
+        opened = FiscalDay(device=first, fiscal_day_no=5, status="FiscalDayOpened", opened_at=timezone.now())
+        with patch(f"{API}.get_status", return_value=({"fiscalDayStatus": "FiscalDayClosed"}, None)), \
+                patch(f"{API}.open_day", return_value=(opened, None)) as open_day:
+            check_close_day_status(tracker.pk)
+        open_day.assert_called_once()
+        self.assertEqual(open_day.call_args.kwargs["status_data"], {"fiscalDayStatus": "FiscalDayClosed"})
+        item = self._item(first)
+        self.assertEqual((item.state, item.closed_fiscal_day_no, item.opened_fiscal_day_no), ("REOPENED", 4, 5))
+
+        # The freed slot goes to the queued device.
+        self.assertEqual(dispatch_run(run.pk), [self._item(self.devices[2]).pk])
+
+    def test_close_failure_retries_then_fails(self):
+        run = start_fleet_close([self.devices[0]], max_retries=1)
+        item = self._item(self.devices[0])
+        dispatch_run(run.pk)
+        with patch(f"{API}.close_day", return_value=(None, "FDMS unavailable")):
+            close_device(item.pk)
+        item.refresh_from_db()
+        self.assertEqual(item.state, FleetCloseItem.STATE_QUEUED)
+        self.assertEqual(item.last_error, "FDMS unavailable")
+        self.assertGreater(item.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+        self.assertEqual(dispatch_run(run.pk), [])
+        FleetCloseItem.objects.filter(pk=item.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_run(run.pk), [item.pk])
+        with patch(f"{API}.close_day", return_value=(None, "FDMS unavailable")):
+            close_device(item.pk)
+        item.refresh_from_db()
+        self.assertEqual((item.state, item.close_attempts), (FleetCloseItem.STATE_FAILED, 2))
+
+        dispatch_run(run.pk)
+        run.refresh_from_db()
+        self.assertEqual(run.status, FleetCloseRun.STATUS_COMPLETED_WITH_ERRORS)
+        status = get_fleet_close_status()
+        self.assertEqual(status["failed"][0]["deviceId"], 77300)
+        self.assertEqual(status["progress"], 100.0)
+
+    def test_tracker_failure_after_close_is_retried(self):
+        run = start_fleet_close([self.devices[0]], max_retries=1)
+        item = self._item(self.devices[0])
+        dispatch_run(run.pk)
+        with patch(f"{API}.close_day", return_value=({"operationID": "op"}, None)), \
+                patch("fiscal.services.close_day_tracker.start_close_day_tracking", side_effect=RuntimeError("db down")):
+            close_device(item.pk)
+        item.refresh_from_db()
+        self.assertEqual(item.state, FleetCloseItem.STATE_QUEUED)
+        self.assertIn("Close tracking not started", item.last_error)
+
+        # The retry finds the close already initiated and attaches a tracker.
+        FleetCloseItem.objects.filter(pk=item.pk).update(next_attempt_at=timezone.now())
+        dispatch_run(run.pk)
+
+        def initiated(dev, *args, **kwargs):
+            dev.fiscal_day_status = "FiscalDayCloseInitiated"
+            return None, "Cannot close day: status must be FiscalDayOpened or FiscalDayCloseFailed"
+
+        with patch(f"{API}.close_day", side_effect=initiated):
+            close_device(item.pk)
+        item.refresh_from_db()
+        self.assertEqual(item.state, FleetCloseItem.STATE_CLOSING)
+        self.assertEqual(item.tracker, CloseDayTracker.objects.get(device=self.devices[0], fiscal_day_no=4))
+
+    def test_already_closed_device_is_reopened_directly(self):
+        run = start_fleet_close([self.devices[1]])
+        dispatch_run(run.pk)
+        device = self.devices[1]
+
+        def refused(dev, *args, **kwargs):
+            dev.fiscal_day_status = "FiscalDayClosed"
+            return None, "Cannot close day: status must be FiscalDayOpened or FiscalDayCloseFailed"
+
+        opened = FiscalDay(device=device, fiscal_day_no=5, status="FiscalDayOpened", opened_at=timezone.now())
+        with patch(f"{API}.close_day", side_effect=refused), patch(f"{API}.open_day", return_value=(opened, None)):
+            close_device(self._item(device).pk)
+        self.assertEqual(self._item(device).state, FleetCloseItem.STATE_REOPENED)
+        dispatch_run(run.pk)
+        run.refresh_from_db()
+        self.assertEqual(run.status, FleetCloseRun.STATUS_COMPLETED)
+
+    def test_status_api_and_command(self):
+        out = StringIO()
+        call_command("close_fleet_day", "--device", "77301", "--concurrency", "3", stdout=out)
+        self.assertIn("started for 1 device", out.getvalue())
+        run = FleetCloseRun.objects.get()
+        self.assertEqual((run.concurrency, run.items.count()), (3, 1))
+
+        self.client.force_login(User.objects.create_user("eod", is_staff=True))
+        data = self.client.get("/api/dashboard/fleet-close/").json()["run"]
+        self.assertEqual(data["runId"], run.pk)
+        self.assertEqual(data["counts"]["QUEUED"], 1)
+        self.assertEqual(data["status"], "RUNNING")
@@ -1,12 +1,17 @@
 """Tests for QB → FDMS auto-fiscalisation."""
 
+import json
+from datetime import timedelta
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils.timezone import now
 
-from fiscal.models import FDMSConfigs, FiscalDevice, QuickBooksInvoice
-from fiscal.services.qb_fiscalisation import fiscalise_qb_invoice, map_qb_invoice_to_fdms
+from fiscal.models import FDMSConfigs, FiscalDevice, QuickBooksEvent, QuickBooksInvoice, Receipt
+from fiscal.services.qb_fiscalisation import fiscalise_qb_invoice, fiscalise_qb_invoices, map_qb_invoice_to_fdms
+from fiscal.tasks import fiscalise_qb_invoice_task
 
 
 def _make_device():
@@ -66,3 +71,137 @@ class FiscaliseQbInvoiceTests(TestCase):
         self.assertIsNotNone(inv2)
         self.assertEqual(inv1.pk, inv2.pk)
         self.assertEqual(QuickBooksInvoice.objects.filter(qb_invoice_id="dup-1").count(), 1)
+
+
+@patch("fiscal.services.fdms_device_service.FDMSDeviceService")
+class QueuedQbFiscalisationTests(TestCase):
+    INVOICE = {"Id": "wh-1", "TotalAmt": 50, "CurrencyRef": {"value": "USD"}, "Line": [{"Amount": 50, "Qty": 1}]}
+
+    def setUp(self):
+        cache.clear()
+        self.device = _make_device()
+        FDMSConfigs.objects.create(
+            device_id=self.device.device_id,
+            tax_table=[{"taxID": 1, "taxCode": "VAT"}],
+            allowed_currencies=["USD"],
+            fetched_at=now(),
+        )
+        patcher = patch.object(fiscalise_qb_invoice_task, "apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/integrations/quickbooks/webhook/", json.dumps(body), content_type="application/json")
+
+    def _receipt(self, **kwargs):
+        return Receipt.objects.create(
+            device=self.device, fiscal_day_no=1, receipt_global_no=7, receipt_counter=1,
+            receipt_type="FiscalInvoice", currency="USD", receipt_total=50,
+        ), None
+
+    def test_webhook_acks_without_fiscalising_and_dedupes(self, mock_fdms_cls):
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt") as submit:
+            first = self._post(self.INVOICE)
+            second = self._post(self.INVOICE)
+        submit.assert_not_called()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["status"], "queued")
+        self.assertEqual(first.json()["status_url"], "/api/integrations/quickbooks/invoices/wh-1/status/")
+        self.assertEqual(second.json()["status"], "received")
+        self.apply_async.assert_called_once_with(args=["wh-1"])
+        self.assertEqual(QuickBooksEvent.objects.count(), 2)
+        self.assertEqual(QuickBooksInvoice.objects.get(qb_invoice_id="wh-1").fiscal_status, QuickBooksInvoice.STATUS_QUEUED)
+
+    def test_task_fiscalises_and_status_reports_outcome(self, mock_fdms_cls):
+        mock_fdms_cls.return_value.get_status.return_value = ({"lastFiscalDayNo": 1, "fiscalDayStatus": "FiscalDayOpened"}, None)
+        self._post(self.INVOICE)
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt", side_effect=self._receipt):
+            result = fiscalise_qb_invoice_task.apply(args=["wh-1"]).get()
+        self.assertEqual(result["fiscal_status"], QuickBooksInvoice.STATUS_FISCALISED)
+        self.assertEqual(self.client.get("/api/integrations/quickbooks/invoices/wh-1/status/").status_code, 302)
+        self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        body = self.client.get("/api/integrations/quickbooks/invoices/wh-1/status/").json()
+        self.assertEqual((body["fiscal_status"], body["fiscalised"], body["receipt_global_no"]), ("FISCALISED", True, 7))
+        self.assertEqual(self.client.get("/api/integrations/quickbooks/invoices/nope/status/").status_code, 404)
+        # Dedupe window released: a later update for a fiscalised invoice is not queued.
+        self.assertEqual(self._post(self.INVOICE).json()["status"], "received")
+        self.apply_async.assert_called_once()
+
+    def test_failed_enqueue_leaves_invoice_pending(self, mock_fdms_cls):
+        self.apply_async.side_effect = ConnectionError("broker down")
+        with patch("fiscal.services.qb_fiscalisation.logger"):
+            self._post(self.INVOICE)
+        self.assertEqual(QuickBooksInvoice.objects.get(qb_invoice_id="wh-1").fiscal_status, QuickBooksInvoice.STATUS_PENDING)
+        # The dedupe key was released, so the next delivery enqueues again.
+        self.apply_async.side_effect = None
+        self.assertEqual(self._post(self.INVOICE).json()["status"], "queued")
+        self.assertEqual(QuickBooksInvoice.objects.get(qb_invoice_id="wh-1").fiscal_status, QuickBooksInvoice.STATUS_QUEUED)
+
+    def test_processing_claim_blocks_second_worker(self, mock_fdms_cls):
+        mock_fdms_cls.return_value.get_status.return_value = ({"lastFiscalDayNo": 1, "fiscalDayStatus": "FiscalDayOpened"}, None)
+        inv = QuickBooksInvoice.objects.create(
+            qb_invoice_id="wh-1", raw_payload=self.INVOICE, fiscal_status=QuickBooksInvoice.STATUS_PROCESSING
+        )
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt", side_effect=self._receipt) as submit:
+            _, err = fiscalise_qb_invoice("wh-1", self.INVOICE)
+            self.assertEqual(err, "Fiscalisation already in progress")
+            submit.assert_not_called()
+
+            QuickBooksInvoice.objects.filter(pk=inv.pk).update(updated_at=now() - timedelta(hours=1))
+            qb_inv, err = fiscalise_qb_invoice("wh-1", self.INVOICE)
+        self.assertIsNone(err)
+        self.assertEqual(qb_inv.fiscal_status, QuickBooksInvoice.STATUS_FISCALISED)
+
+    def test_submit_exception_marks_failed(self, mock_fdms_cls):
+        mock_fdms_cls.return_value.get_status.return_value = ({"lastFiscalDayNo": 1, "fiscalDayStatus": "FiscalDayOpened"}, None)
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt", side_effect=RuntimeError("boom")), \
+                self.assertLogs("fiscal", "ERROR"):
+            _, err = fiscalise_qb_invoice("wh-1", self.INVOICE)
+        self.assertEqual(err, "boom")
+        inv = QuickBooksInvoice.objects.get(qb_invoice_id="wh-1")
+        self.assertEqual((inv.fiscal_status, inv.fiscal_error), (QuickBooksInvoice.STATUS_FAILED, "boom"))
+
+    def test_batch_continues_after_submit_exception(self, mock_fdms_cls):
+        mock_fdms_cls.return_value.get_status.return_value = ({"lastFiscalDayNo": 1, "fiscalDayStatus": "FiscalDayOpened"}, None)
+        calls = iter([RuntimeError("boom"), self._receipt()])
+
+        def _submit(**kwargs):
+            outcome = next(calls)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        items = [("e-1", {**self.INVOICE, "Id": "e-1"}), ("e-2", {**self.INVOICE, "Id": "e-2"})]
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt", side_effect=_submit), \
+                self.assertLogs("fiscal", "ERROR"):
+            outcomes = fiscalise_qb_invoices(items)
+        self.assertEqual(outcomes["e-1"][1], "boom")
+        self.assertEqual(outcomes["e-1"][0].fiscal_status, QuickBooksInvoice.STATUS_FAILED)
+        self.assertIsNone(outcomes["e-2"][1])
+        self.assertEqual(outcomes["e-2"][0].fiscal_status, QuickBooksInvoice.STATUS_FISCALISED)
+
+    def test_batch_loads_rows_once_and_shares_day_status(self, mock_fdms_cls):
+        mock_fdms_cls.return_value.get_status.return_value = ({"lastFiscalDayNo": 1, "fiscalDayStatus": "FiscalDayOpened"}, None)
+        done = QuickBooksInvoice.objects.create(
+            qb_invoice_id="b-0", fiscalised=True, fiscal_receipt=self._receipt()[0],
+            fiscal_status=QuickBooksInvoice.STATUS_FISCALISED,
+        )
+        counter = iter(range(100, 110))
+
+        def _submit(**kwargs):
+            return Receipt.objects.create(
+                device=self.device, fiscal_day_no=1, receipt_global_no=next(counter), receipt_counter=1,
+                receipt_type="FiscalInvoice", currency="USD", receipt_total=50,
+            ), None
+
+        items = [(f"b-{i}", {**self.INVOICE, "Id": f"b-{i}"}) for i in range(4)]
+        with patch("fiscal.services.qb_fiscalisation.submit_receipt", side_effect=_submit) as submit:
+            outcomes = fiscalise_qb_invoices(items)
+        self.assertEqual(list(outcomes), ["b-0", "b-1", "b-2", "b-3"])
+        self.assertEqual(outcomes["b-0"][0].pk, done.pk)
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual(mock_fdms_cls.return_value.get_status.call_count, 1)
+        self.assertEqual(
+            QuickBooksInvoice.objects.filter(fiscal_status=QuickBooksInvoice.STATUS_FISCALISED).count(), 4
+        )
@@ -0,0 +1,117 @@
+"""QuickBooks token manager: one row-locked refresh per realm, early refresh, cached decrypted tokens."""
+
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from fiscal.models import QuickBooksConnection
+from fiscal.services import qb_oauth
+from fiscal.services.qb_oauth import get_decrypted_tokens, refresh_tokens
+
+POST = "fiscal.services.qb_oauth.requests.post"
+
+
+def _token_response(n):
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {"access_token": f"access-{n}", "refresh_token": f"refresh-{n}", "expires_in": 3600}
+    return resp
+
+
+@override_settings(QB_CLIENT_ID="id", QB_CLIENT_SECRET="secret", FDMS_QB_TOKEN_REFRESH_MARGIN=300)
+class QuickBooksTokenTests(TestCase):
+    def setUp(self):
+        qb_oauth._decrypted.clear()
+        self.conn = QuickBooksConnection.objects.create(
+            realm_id="realm-1",
+            access_token_encrypted="access-0",
+            refresh_token_encrypted="refresh-0",
+            token_expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def _expire_in(self, seconds):
+        self.conn.token_expires_at = timezone.now() + timedelta(seconds=seconds)
+        self.conn.save()
+
+    def test_fresh_token_is_decrypted_once(self):
+        with patch(POST) as post, patch("fiscal.services.qb_oauth.decrypt_string", side_effect=lambda s: s) as decrypt:
+            self.assertEqual(get_decrypted_tokens(self.conn), (("access-0", "refresh-0"), None))
+            self.assertEqual(get_decrypted_tokens(self.conn), (("access-0", "refresh-0"), None))
+        post.assert_not_called()
+        self.assertEqual(decrypt.call_count, 2)
+
+    def test_refreshes_ahead_of_expiry(self):
+        self._expire_in(120)
+        with patch(POST, return_value=_token_response(1)) as post:
+            tokens, err = get_decrypted_tokens(self.conn)
+        self.assertIsNone(err)
+        self.assertEqual(tokens, ("access-1", "refresh-1"))
+        self.assertEqual(post.call_args.kwargs["data"]["refresh_token"], "refresh-0")
+        self.conn.refresh_from_db()
+        self.assertEqual(self.conn.refresh_token_encrypted, "refresh-1")
+
+    def test_stale_instance_reuses_refresh_done_elsewhere(self):
+        stale = QuickBooksConnection.objects.get(pk=self.conn.pk)
+        stale.token_expires_at = timezone.now() - timedelta(seconds=1)
+        with patch(POST) as post:
+            self.assertEqual(refresh_tokens(stale), (True, None))
+        post.assert_not_called()
+        self.assertEqual(stale.token_expires_at, self.conn.token_expires_at)
+
+    def test_refresh_runs_under_row_lock(self):
+        self._expire_in(-10)
+        manager = QuickBooksConnection.objects
+        with patch.object(connection.features, "has_select_for_update", True), \
+                patch.object(manager, "select_for_update", side_effect=manager.all) as lock, \
+                patch(POST, return_value=_token_response(2)) as post:
+            self.assertEqual(refresh_tokens(self.conn), (True, None))
+        lock.assert_called_once_with()
+        self.assertEqual(post.call_count, 1)
+
+    def test_sqlite_refresh_takes_the_write_lock_first(self):
+        self._expire_in(-10)
+        with CaptureQueriesContext(connection) as queries, patch(POST, return_value=_token_response(2)):
+            self.assertEqual(refresh_tokens(self.conn), (True, None))
+        first = next(q["sql"] for q in queries.captured_queries if "fiscal_quickbooksconnection" in q["sql"])
+        self.assertTrue(first.startswith('UPDATE "fiscal_quickbooksconnection"'), first)
+
+    def test_shared_cache_lock_when_no_row_locks(self):
+        self._expire_in(-10)
+        key = "fdms:qb_oauth:refresh:realm-1"
+        cache.delete(key)
+        with patch("fiscal.services.qb_oauth._cache_is_shared", return_value=True):
+            cache.add(key, "other-worker", 60)
+            with patch.object(qb_oauth, "_REFRESH_LOCK_WAIT", 0.2), patch(POST) as post:
+                ok, err = refresh_tokens(self.conn)
+            self.assertFalse(ok)
+            self.assertIn("Timed out", err)
+            post.assert_not_called()
+
+            cache.delete(key)
+            with patch(POST, return_value=_token_response(2)):
+                self.assertEqual(refresh_tokens(self.conn), (True, None))
+        self.assertIsNone(cache.get(key))
+
+    def test_forced_refresh_reuses_tokens_rotated_while_waiting(self):
+        # Another process refreshed while this caller was queued on the row lock.
+        QuickBooksConnection.objects.filter(pk=self.conn.pk).update(
+            access_token_encrypted="access-9", refresh_token_encrypted="refresh-9",
+        )
+        with patch(POST) as post:
+            self.assertEqual(refresh_tokens(self.conn, force=True), (True, None))
+        post.assert_not_called()
+        self.assertEqual(self.conn.refresh_token_encrypted, "refresh-9")
+        with patch(POST, return_value=_token_response(3)) as post:
+            self.assertEqual(refresh_tokens(self.conn, force=True), (True, None))
+        self.assertEqual(post.call_args.kwargs["data"]["refresh_token"], "refresh-9")
+
+    def test_failed_early_refresh_keeps_valid_token(self):
+        self._expire_in(120)
+        with patch(POST, return_value=MagicMock(status_code=400, json=lambda: {"error": "invalid_grant"})):
+            self.assertEqual(get_decrypted_tokens(self.conn), (("access-0", "refresh-0"), None))
+            self._expire_in(-1)
+            self.assertEqual(get_decrypted_tokens(self.conn), (None, "invalid_grant"))
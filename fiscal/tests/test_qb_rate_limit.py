@@ -0,0 +1,173 @@
+"""QuickBooks request layer against a local stub QBO server that throttles like Intuit."""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from fiscal.models import QuickBooksConnection
+from fiscal.services import qb_rate_limit
+from fiscal.services.qb_client import get_quickbooks_client, query_changed_since
+
+
+class StubQbo:
+    """QBO query endpoint: answers 429 (Retry-After) to the first `throttle` requests."""
+
+    def __init__(self, throttle=0, retry_after="3", delay=0.0):
+        self.throttle, self.retry_after, self.delay = throttle, retry_after, delay
+        self.requests = 0
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    throttled = stub.throttle > 0
+                    stub.throttle -= 1
+                time.sleep(stub.delay)
+                if throttled:
+                    body = {"Fault": {"Error": [{"Message": "ThrottleExceeded", "code": "3001"}]}}
+                    self._reply(429, body, {"Retry-After": stub.retry_after} if stub.retry_after else {})
+                else:
+                    self._reply(200, {"QueryResponse": {"Invoice": [{"Id": "1", "TotalAmt": 10}]}})
+                with stub.lock:
+                    stub.in_flight -= 1
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in {"Content-Type": "application/json", **(headers or {})}.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v3"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@override_settings(
+    QB_CLIENT_ID="id", QB_CLIENT_SECRET="secret",
+    FDMS_QB_RATE_PER_MINUTE=6000, FDMS_QB_RATE_WINDOW_SECONDS=10, FDMS_QB_MAX_CONCURRENCY=4,
+    FDMS_QB_MAX_RETRIES=5, FDMS_QB_SLOT_POLL_INTERVAL=0.005, FDMS_QB_RATE_LIMIT_BACKEND="cache",
+)
+@patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+class QuickBooksRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        qb_rate_limit.reset_qb_request_metrics()
+        qb_rate_limit.reset_qb_rate_limit_store()
+        self.addCleanup(qb_rate_limit.reset_qb_rate_limit_store)
+        conn = QuickBooksConnection.objects.create(realm_id="realm-1", access_token_encrypted="a", refresh_token_encrypted="r")
+        self.qb = get_quickbooks_client(conn)
+        self.clock = FakeClock()
+
+    def _stub(self, **kwargs):
+        stub = StubQbo(**kwargs)
+        self.addCleanup(stub.close)
+        self.qb.api_url_v3 = stub.url
+        return stub
+
+    def _fake_clock(self):
+        for name, fake in (("_clock", self.clock.time), ("_sleep", self.clock.sleep)):
+            patcher = patch.object(qb_rate_limit, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retry_after_is_honoured(self):
+        stub = self._stub(throttle=2, retry_after="3")
+        self._fake_clock()
+        rows = query_changed_since(self.qb, "Invoice")
+        self.assertEqual([r["Id"] for r in rows], ["1"])
+        self.assertEqual(stub.requests, 3)
+        self.assertEqual(self.clock.sleeps, [3.0, 3.0])
+        metrics = qb_rate_limit.qb_request_metrics("realm-1")
+        self.assertEqual((metrics["requests"], metrics["throttled"], metrics["retries"]), (3, 2, 2))
+
+    def test_backoff_without_retry_after(self):
+        self._stub(throttle=3, retry_after="")
+        self._fake_clock()
+        query_changed_since(self.qb, "Invoice")
+        self.assertEqual(len(self.clock.sleeps), 3)
+        for slept, base in zip(self.clock.sleeps, (1, 2, 4)):
+            self.assertTrue(base <= slept <= base * 1.25, self.clock.sleeps)
+
+    @override_settings(FDMS_QB_MAX_RETRIES=2)
+    def test_gives_up_after_max_retries(self):
+        stub = self._stub(throttle=100)
+        self._fake_clock()
+        with self.assertRaises(Exception):
+            query_changed_since(self.qb, "Invoice")
+        self.assertEqual(stub.requests, 3)
+        self.assertEqual(qb_rate_limit.qb_request_metrics("realm-1")["throttled"], 3)
+
+    @override_settings(FDMS_QB_RATE_PER_MINUTE=60)
+    def test_budget_spreads_requests_over_windows(self):
+        stub = self._stub()
+        self._fake_clock()
+        start = self.clock.now
+        for _ in range(25):
+            query_changed_since(self.qb, "Invoice")
+        self.assertEqual(stub.requests, 25)
+        # 10 requests per 10s window: the 11th and 21st wait for the next window.
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertGreaterEqual(self.clock.now - start, 20)
+
+    @override_settings(FDMS_QB_MAX_CONCURRENCY=2)
+    def test_concurrency_is_bounded_per_realm(self):
+        stub = self._stub(delay=0.05)
+        results = []
+
+        def worker():
+            results.append(len(query_changed_since(self.qb, "Invoice")))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(stub.max_in_flight, 2)
+        self.assertGreater(qb_rate_limit.qb_request_metrics("realm-1")["wait_seconds"], 0)
+
+    @override_settings(FDMS_QB_RATE_LIMIT_BACKEND="redis", FDMS_QB_RATE_LIMIT_REDIS_URL="redis://qb-limits:6380/2")
+    def test_limits_default_to_redis(self):
+        store = qb_rate_limit._get_store()
+        self.assertIsInstance(store, qb_rate_limit._RedisStore)
+        self.assertEqual(store._client.connection_pool.connection_kwargs["host"], "qb-limits")
+
+    def test_per_process_cache_is_reported(self):
+        with self.assertLogs("fiscal", "WARNING") as logs:
+            self.assertIs(qb_rate_limit._get_store(), cache)
+        self.assertIn("per-process cache", logs.output[0])
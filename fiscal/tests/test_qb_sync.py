@@ -0,0 +1,219 @@
+"""Incremental QuickBooks sync: LastUpdatedTime cursors, full pagination, bounded runs."""
+
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from fiscal.models import QuickBooksConnection, QuickBooksInvoice
+from fiscal.services.qb_sync import sync_from_quickbooks
+from fiscal.tasks import qb_sync_task
+
+
+class FakeQbo:
+    """In-memory QBO query semantics for query_changed_since."""
+
+    def __init__(self):
+        self.rows = {"Invoice": [], "SalesReceipt": []}
+        self.fail = False
+
+    def add(self, entity, row_id, when, balance=0):
+        self.rows[entity].append({
+            "Id": row_id,
+            "Balance": balance,
+            "TotalAmt": 10,
+            "MetaData": {"LastUpdatedTime": when.isoformat(timespec="seconds")},
+        })
+
+    def query(self, qb, entity, since=None, start_position=1, max_results=100, where=""):
+        if self.fail:
+            raise ConnectionError("throttled")
+        rows = self.rows[entity]
+        if since:
+            rows = [r for r in rows if parse_datetime(r["MetaData"]["LastUpdatedTime"]) >= parse_datetime(since)]
+        if "Balance" in where:
+            rows = [r for r in rows if r["Balance"] == 0]
+        rows = sorted(rows, key=lambda r: parse_datetime(r["MetaData"]["LastUpdatedTime"]))
+        return rows[start_position - 1:start_position - 1 + max_results]
+
+
+def _fiscalise(items):
+    outcomes = {}
+    for inv_id, payload in items:
+        inv, _ = QuickBooksInvoice.objects.update_or_create(qb_invoice_id=inv_id, defaults={"fiscalised": True})
+        outcomes[inv_id] = (inv, None)
+    return outcomes
+
+
+@override_settings(FDMS_QB_SYNC_PAGE_SIZE=100, FDMS_QB_SYNC_MAX_PAGES=50, FDMS_QB_SYNC_OVERLAP_SECONDS=300)
+class QuickBooksSyncTests(TestCase):
+    def setUp(self):
+        self.qbo = FakeQbo()
+        for target in (
+            patch("fiscal.services.qb_sync.get_quickbooks_client", return_value=object()),
+            patch("fiscal.services.qb_sync.query_changed_since", side_effect=self.qbo.query),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+        fiscalise = patch("fiscal.services.qb_sync.fiscalise_qb_invoices", side_effect=_fiscalise)
+        self.fiscalise = fiscalise.start()
+        self.addCleanup(fiscalise.stop)
+        self.conn = QuickBooksConnection.objects.create(realm_id="realm-1", access_token_encrypted="x")
+        self.base = timezone.now() - timedelta(days=2)
+
+    def test_pages_through_all_changes_then_only_new_activity(self):
+        for i in range(250):
+            self.qbo.add("Invoice", f"I{i}", self.base + timedelta(minutes=i))
+        self.qbo.add("Invoice", "unpaid", self.base, balance=5)
+        for i in range(30):
+            self.qbo.add("SalesReceipt", f"S{i}", self.base + timedelta(minutes=i))
+
+        result = sync_from_quickbooks(self.conn)
+        self.assertNotIn("error", result)
+        self.assertEqual((result["invoices_fetched"], result["sales_receipts_fetched"]), (250, 30))
+        self.assertEqual(result["fiscalised"], 280)
+        self.assertFalse(result["more"])
+        self.conn.refresh_from_db()
+        self.assertEqual(
+            self.conn.sync_cursors["Invoice"],
+            (self.base + timedelta(minutes=249)).isoformat(timespec="seconds"),
+        )
+        self.assertIsNotNone(self.conn.last_synced_at)
+
+        # Next run: only the overlap window is re-read (and skipped), plus new activity.
+        self.qbo.add("SalesReceipt", "S-new", timezone.now())
+        result = sync_from_quickbooks(self.conn)
+        self.assertEqual(result["fiscalised"], 1)
+        # Overlap of 300s re-reads minutes 244..249 and 24..29 (inclusive).
+        self.assertEqual(result["invoices_fetched"], 6)
+        self.assertEqual(result["skipped"], 6 + 6)
+
+    def test_rows_sharing_a_timestamp_span_pages(self):
+        for i in range(7):
+            self.qbo.add("SalesReceipt", f"T{i}", self.base)
+        self.qbo.add("SalesReceipt", "later", self.base + timedelta(minutes=1))
+        result = sync_from_quickbooks(self.conn, page_size=3)
+        self.assertEqual(result["sales_receipts_fetched"], 8)
+        self.assertEqual(QuickBooksInvoice.objects.count(), 8)
+
+    def test_bounded_run_resumes_from_cursor(self):
+        for i in range(25):
+            self.qbo.add("Invoice", f"I{i}", self.base + timedelta(hours=i))
+        result = sync_from_quickbooks(self.conn, page_size=10, max_pages=2)
+        self.assertTrue(result["more"])
+        self.assertEqual(result["fiscalised"], 20)
+        result = sync_from_quickbooks(self.conn, page_size=10, max_pages=2)
+        self.assertFalse(result["more"])
+        self.assertEqual(result["fiscalised"], 5)
+        self.assertEqual(QuickBooksInvoice.objects.count(), 25)
+
+    def test_fetch_error_keeps_cursor(self):
+        self.conn.sync_cursors = {"Invoice": self.base.isoformat(timespec="seconds")}
+        self.conn.save()
+        self.qbo.fail = True
+        result = sync_from_quickbooks(self.conn)
+        self.assertIn("throttled", result["error"])
+        self.conn.refresh_from_db()
+        self.assertEqual(self.conn.sync_cursors, {"Invoice": self.base.isoformat(timespec="seconds")})
+        self.assertIsNone(self.conn.last_synced_at)
+
+    def test_fiscalisation_error_is_not_reported_as_fetch_error(self):
+        self.conn.sync_cursors = {"Invoice": self.base.isoformat(timespec="seconds")}
+        self.conn.save()
+        self.qbo.add("Invoice", "I1", self.base + timedelta(minutes=1))
+        self.fiscalise.side_effect = RuntimeError("database is locked")
+        with self.assertLogs("fiscal", "ERROR"):
+            result = sync_from_quickbooks(self.conn)
+        self.assertEqual(result["error"], "Fiscalising Invoice failed: database is locked")
+        self.assertEqual(result["invoices_fetched"], 1)
+        self.conn.refresh_from_db()
+        self.assertEqual(self.conn.sync_cursors["Invoice"], self.base.isoformat(timespec="seconds"))
+
+    def test_first_run_uses_lookback(self):
+        self.qbo.add("Invoice", "ancient", timezone.now() - timedelta(days=400))
+        self.qbo.add("Invoice", "recent", timezone.now() - timedelta(days=1))
+        result = sync_from_quickbooks(self.conn)
+        self.assertEqual(result["invoices_fetched"], 1)
+        self.assertFalse(QuickBooksInvoice.objects.filter(qb_invoice_id="ancient").exists())
+
+    def test_fiscalised_lookup_is_one_query_per_page(self):
+        for i in range(250):
+            self.qbo.add("Invoice", f"I{i}", self.base + timedelta(minutes=i))
+            if i % 2:
+                QuickBooksInvoice.objects.create(qb_invoice_id=f"I{i}", fiscalised=True)
+        with CaptureQueriesContext(connection) as ctx:
+            result = sync_from_quickbooks(self.conn)
+        self.assertEqual((result["skipped"], result["fiscalised"]), (125, 125))
+        lookups = [q for q in ctx.captured_queries if '"qb_invoice_id" IN' in q["sql"]]
+        self.assertEqual(len(lookups), 3)
+        batches = [len(c.args[0]) for c in self.fiscalise.call_args_list]
+        self.assertEqual(batches, [50, 50, 25])
+
+    def test_failed_fiscalisation_is_retried_next_run(self):
+        for i in range(3):
+            self.qbo.add("Invoice", f"I{i}", self.base + timedelta(minutes=i))
+        down = {"I1"}
+
+        def flaky(items):
+            outcomes = {}
+            for inv_id, payload in items:
+                if inv_id in down:
+                    inv, _ = QuickBooksInvoice.objects.update_or_create(
+                        qb_invoice_id=inv_id,
+                        defaults={"raw_payload": payload, "fiscal_status": QuickBooksInvoice.STATUS_FAILED},
+                    )
+                    outcomes[inv_id] = (inv, "FDMS unavailable")
+                else:
+                    outcomes.update(_fiscalise([(inv_id, payload)]))
+            return outcomes
+
+        self.fiscalise.side_effect = flaky
+        result = sync_from_quickbooks(self.conn)
+        self.assertEqual(result["fiscalised"], 2)
+        self.assertEqual(result["errors"], ["I1: FDMS unavailable"])
+        self.conn.refresh_from_db()
+        self.assertEqual(self.conn.sync_cursors["Invoice"], (self.base + timedelta(minutes=2)).isoformat(timespec="seconds"))
+
+        # I1 is now behind the cursor (and its overlap window); the next run retries it.
+        self.conn.sync_cursors = {"Invoice": timezone.now().isoformat(timespec="seconds")}
+        self.conn.save()
+        down.clear()
+        result = sync_from_quickbooks(self.conn)
+        self.assertEqual((result["retried"], result["fiscalised"], result["errors"]), (1, 1, []))
+        self.assertEqual([inv_id for inv_id, _ in self.fiscalise.call_args_list[1].args[0]], ["I1"])
+        self.assertTrue(QuickBooksInvoice.objects.get(qb_invoice_id="I1").fiscalised)
+
+
+class QuickBooksSyncViewTests(TestCase):
+    """The sync button queues fiscal.qb_sync_task (also on beat) instead of syncing in the request."""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user("qbsync", is_staff=True))
+
+    def test_sync_is_queued_and_pollable(self):
+        with patch.object(qb_sync_task, "apply_async", return_value=MagicMock(id="sync-1")) as enqueue:
+            r = self.client.post("/api/integrations/quickbooks/sync/")
+        enqueue.assert_called_once_with()
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json()["task_id"], "sync-1")
+
+        done = MagicMock(state="SUCCESS", result={"fiscalised": 3, "more": False})
+        done.successful.return_value = True
+        with patch.object(qb_sync_task, "AsyncResult", return_value=done):
+            status = self.client.get(r.json()["status_url"]).json()
+        self.assertEqual(status, {"task_id": "sync-1", "state": "SUCCESS", "result": {"fiscalised": 3, "more": False}})
+
+    def test_eager_run_returns_the_result(self):
+        with patch("fiscal.services.qb_sync.sync_from_quickbooks", return_value={"error": "QuickBooks not connected"}), \
+                patch.object(qb_sync_task, "apply_async", side_effect=lambda: qb_sync_task.apply()):
+            r = self.client.post("/api/integrations/quickbooks/sync/")
+        self.assertEqual((r.status_code, r.json()), (400, {"error": "QuickBooks not connected"}))
+
+    def test_sync_runs_on_beat(self):
+        self.assertIn("fiscal.qb_sync_task", [e["task"] for e in settings.CELERY_BEAT_SCHEDULE.values()])
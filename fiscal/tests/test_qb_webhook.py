@@ -0,0 +1,135 @@
+"""QuickBooks webhook fan-out: every entity of a notification, batched fetches, one enqueue."""
+
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from fiscal.models import QuickBooksConnection, QuickBooksEvent, QuickBooksInvoice
+from fiscal.services.qb_webhook import extract_entity_refs, process_webhook_event
+from fiscal.tasks import fiscalise_qb_invoice_task, process_qb_webhook_task
+
+
+def _notification(realm_id, entities):
+    return {"realmId": realm_id, "dataChangeEvent": {"entities": [
+        {"name": name, "id": entity_id, "operation": op} for name, entity_id, op in entities
+    ]}}
+
+
+def _fetch(qb, entity, ids, where=""):
+    # QBO knows every id except "404"; invoice "77" is unpaid.
+    rows = [{"Id": i, "TotalAmt": 10, "Balance": 5 if i == "77" else 0, "Line": [], "entity": entity} for i in ids if i != "404"]
+    if "Balance = '0'" in where:
+        rows = [r for r in rows if r["Balance"] == 0]
+    return rows
+
+
+@override_settings(FDMS_QB_WEBHOOK_FETCH_BATCH=50)
+class QuickBooksWebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        QuickBooksConnection.objects.create(realm_id="realm-1", access_token_encrypted="x")
+        for target in (
+            patch("fiscal.services.qb_webhook.get_quickbooks_client", return_value=object()),
+            patch.object(fiscalise_qb_invoice_task, "apply_async"),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+        fetch = patch("fiscal.services.qb_webhook.fetch_by_ids", side_effect=_fetch)
+        self.fetch = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def _body(self):
+        invoices = [("Invoice", str(i), "Create") for i in range(1, 31)]
+        receipts = [("SalesReceipt", str(i), "Update") for i in range(100, 120)]
+        return {"eventNotifications": [
+            _notification("realm-1", invoices[:15] + receipts[:5] + [("Customer", "9", "Create")]),
+            _notification("realm-1", invoices[15:] + receipts[5:] + [("Invoice", "1", "Update"), ("Invoice", "404", "Create")]),
+        ]}
+
+    def test_webhook_enqueues_notification_once(self):
+        with patch.object(process_qb_webhook_task, "apply_async") as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                "/api/integrations/quickbooks/webhook/", json.dumps(self._body()), content_type="application/json"
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["entities"], 51)
+        event = QuickBooksEvent.objects.get()
+        self.assertEqual(event.event_type, "Invoice.Create")
+        apply_async.assert_called_once_with(args=[event.pk])
+        self.fetch.assert_not_called()
+
+    def test_process_fetches_once_per_entity_type_and_queues_all(self):
+        event = QuickBooksEvent.objects.create(event_type="Invoice.Create", payload=self._body())
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_webhook_event(event.pk)
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(result["fetch_calls"], 2)
+        self.assertEqual((result["entities"], result["fetched"], result["queued"]), (51, 50, 50))
+        self.assertEqual(result["missing"], ["Invoice:404"])
+        self.assertEqual(QuickBooksInvoice.objects.filter(fiscal_status=QuickBooksInvoice.STATUS_QUEUED).count(), 50)
+        self.assertEqual(fiscalise_qb_invoice_task.apply_async.call_count, 50)
+
+        # Redelivered notification: nothing is queued twice.
+        result = process_webhook_event(event.pk)
+        self.assertEqual(result["queued"], 0)
+
+    @override_settings(FDMS_QB_WEBHOOK_FETCH_BATCH=20)
+    def test_fetches_are_batched(self):
+        event = QuickBooksEvent.objects.create(event_type="Invoice.Create", payload=self._body())
+        result = process_webhook_event(event.pk)
+        self.assertEqual([len(c.args[2]) for c in self.fetch.call_args_list], [20, 11, 20])
+        self.assertEqual(result["fetch_calls"], 3)
+
+    def test_cloud_events_are_parsed(self):
+        body = [
+            {"type": "qbo.invoice.created.v1", "intuitentityid": "5", "intuitaccountid": "realm-1"},
+            {"type": "qbo.salesreceipt.updated.v1", "intuitentityid": "6", "intuitaccountid": "realm-1"},
+            {"type": "qbo.customer.created.v1", "intuitentityid": "7", "intuitaccountid": "realm-1"},
+        ]
+        self.assertEqual(
+            extract_entity_refs(body),
+            [("realm-1", "Invoice", "5"), ("realm-1", "SalesReceipt", "6")],
+        )
+        with patch.object(process_qb_webhook_task, "apply_async"), self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post("/api/integrations/quickbooks/webhook/", json.dumps(body), content_type="application/json")
+        self.assertEqual(resp.json()["event_type"], "qbo.invoice.created.v1")
+        result = process_webhook_event(QuickBooksEvent.objects.get().pk)
+        self.assertEqual((result["fetched"], result["queued"]), (2, 2))
+
+    def test_missing_connection_is_reported(self):
+        QuickBooksConnection.objects.all().delete()
+        event = QuickBooksEvent.objects.create(event_type="Invoice.Create", payload=self._body())
+        result = process_webhook_event(event.pk)
+        self.assertEqual(result["queued"], 0)
+        self.assertIn("QuickBooks not connected for realm realm-1", result["errors"])
+
+    def test_unpaid_invoices_are_not_queued(self):
+        body = {"eventNotifications": [_notification("realm-1", [("Invoice", "77", "Update"), ("SalesReceipt", "77", "Create")])]}
+        event = QuickBooksEvent.objects.create(event_type="Invoice.Update", payload=body)
+        result = process_webhook_event(event.pk)
+        self.assertEqual(self.fetch.call_args_list[0].args[3], "Balance = '0'")
+        self.assertEqual((result["fetched"], result["queued"], result["missing"]), (1, 1, ["Invoice:77"]))
+
+    def test_each_realm_uses_its_own_connection(self):
+        other = QuickBooksConnection.objects.create(realm_id="realm-2", access_token_encrypted="y")
+        clients = {}
+
+        def client_for(conn):
+            return clients.setdefault(conn.realm_id, object())
+
+        body = {"eventNotifications": [
+            _notification("realm-1", [("Invoice", "1", "Create")]),
+            _notification("realm-2", [("Invoice", "2", "Create")]),
+            _notification("realm-9", [("Invoice", "3", "Create")]),
+        ]}
+        event = QuickBooksEvent.objects.create(event_type="Invoice.Create", payload=body)
+        with patch("fiscal.services.qb_webhook.get_quickbooks_client", side_effect=client_for):
+            result = process_webhook_event(event.pk)
+        fetched = {c.args[2][0]: c.args[0] for c in self.fetch.call_args_list}
+        self.assertEqual(fetched, {"1": clients["realm-1"], "2": clients[other.realm_id]})
+        self.assertEqual(result["queued"], 2)
+        self.assertEqual(result["errors"], ["QuickBooks not connected for realm realm-9"])
+        self.assertFalse(QuickBooksInvoice.objects.filter(qb_invoice_id="3").exists())
@@ -0,0 +1,139 @@
+"""Normalised receipt tax/payment lines and SQL-side aggregation."""
+
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from dashboard.services.metrics_service import get_metrics
+from fiscal.models import FiscalDayCounter, FiscalDevice, Receipt, ReceiptPaymentLine, ReceiptTaxLine
+from fiscal.services.close_day_counter_builder import (
+    build_close_day_counters,
+    build_fiscal_day_counters,
+    build_fiscal_day_counters_from_lines,
+    convert_to_fdms_format,
+    get_day_receipts,
+    sort_fiscal_counters,
+)
+
+
+class ReceiptLinesTests(TestCase):
+    def setUp(self):
+        self.device = FiscalDevice.objects.create(
+            device_id=77001,
+            device_serial_no="LINES",
+            is_registered=True,
+            last_fiscal_day_no=3,
+        )
+        self._global_no = 0
+
+    def _receipt(self, receipt_type="FiscalInvoice", taxes=None, payments=None, fdms_id=1, currency="usd", total="0"):
+        self._global_no += 1
+        return Receipt.objects.create(
+            device=self.device,
+            fiscal_day_no=3,
+            receipt_global_no=self._global_no,
+            receipt_counter=self._global_no,
+            currency=currency,
+            receipt_type=receipt_type,
+            receipt_total=Decimal(total),
+            receipt_taxes=taxes or [],
+            receipt_payments=payments or [],
+            fdms_receipt_id=fdms_id,
+        )
+
+    def test_lines_written_in_cents_on_save(self):
+        r = self._receipt(
+            taxes=[{"taxID": 517, "taxCode": "C", "taxPercent": 15.5, "taxAmount": 1.55, "salesAmountWithTax": 11.55}],
+            payments=[{"moneyTypeCode": "card", "paymentAmount": 11.55}],
+        )
+        tl = ReceiptTaxLine.objects.get(receipt=r)
+        self.assertEqual(tl.tax_amount_cents, 155)
+        self.assertEqual(tl.sales_amount_with_tax_cents, 1155)
+        self.assertEqual(tl.tax_percent, Decimal("15.50"))
+        self.assertEqual(tl.receipt_type, "FISCALINVOICE")
+        self.assertEqual(tl.currency, "USD")
+        pl = ReceiptPaymentLine.objects.get(receipt=r)
+        self.assertEqual(pl.money_type, "CARD")
+        self.assertEqual(pl.payment_amount_cents, 1155)
+
+    def test_lines_replaced_when_taxes_change(self):
+        r = self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 1, "salesAmountWithTax": 10}])
+        r.receipt_taxes = [
+            {"taxID": 1, "taxPercent": 15, "taxAmount": 2, "salesAmountWithTax": 20},
+            {"taxID": 2, "taxPercent": 0, "taxAmount": 0, "salesAmountWithTax": 5},
+        ]
+        r.save()
+        self.assertEqual(ReceiptTaxLine.objects.filter(receipt=r).count(), 2)
+        r.receipt_taxes = []
+        r.save(update_fields=["qr_code_value"])
+        self.assertEqual(ReceiptTaxLine.objects.filter(receipt=r).count(), 2)
+
+    def test_grouped_counters_match_python_builder(self):
+        self._receipt(
+            taxes=[
+                {"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115},
+                {"taxPercent": 0, "taxAmount": 0, "salesAmountWithTax": 20.1},
+            ],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": 100}, {"moneyType": "ECOCASH", "paymentAmount": 35.1}],
+        )
+        self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 7.5, "salesAmountWithTax": 57.5}],
+            payments=[{"method": "bank_transfer", "paymentAmount": 57.5}],
+        )
+        self._receipt(
+            receipt_type="CreditNote",
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": -1.5, "salesAmountWithTax": -11.5}],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": -11.5}],
+        )
+        self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 99, "salesAmountWithTax": 999}], fdms_id=None)
+        self._receipt(receipt_type="Unknown", taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 3, "salesAmountWithTax": 3}])
+
+        expected = build_fiscal_day_counters(get_day_receipts(self.device, 3))
+        actual = build_fiscal_day_counters_from_lines(self.device, 3)
+        self.assertEqual(
+            {k: v for k, v in expected.items() if v},
+            {k: v for k, v in actual.items() if v},
+        )
+        key = lambda c: sorted(c.items())
+        self.assertEqual(
+            sorted(build_close_day_counters(self.device, 3), key=key),
+            sorted(sort_fiscal_counters(convert_to_fdms_format(expected)), key=key),
+        )
+
+    def test_close_day_counters_heal_receipts_without_lines(self):
+        r = self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": 115}],
+        )
+        ReceiptTaxLine.objects.all().delete()
+        ReceiptPaymentLine.objects.all().delete()
+        FiscalDayCounter.objects.all().delete()
+        counters = build_close_day_counters(self.device, 3)
+        self.assertEqual(len(counters), 3)
+        self.assertEqual(ReceiptTaxLine.objects.filter(receipt=r).count(), 1)
+
+    def test_metrics_tax_breakdown_grouped(self):
+        self._receipt(taxes=[
+            {"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115},
+            {"taxID": 2, "taxPercent": 0, "taxAmount": 0, "salesAmountWithTax": 40},
+        ], total="155")
+        self._receipt(taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 5, "salesAmountWithTax": 38.33}], total="38.33")
+        data = get_metrics(self.device.device_id)
+        bands = {b["band"]: b["amount"] for b in data["taxBreakdown"]}
+        self.assertEqual(bands, {"15%": 20.0, "0%": 40.0})
+        self.assertEqual(data["sales"], {"usd": 193.33})
+
+    def test_backfill_command(self):
+        r = self._receipt(
+            taxes=[{"taxID": 1, "taxPercent": 15, "taxAmount": 15, "salesAmountWithTax": 115}],
+            payments=[{"moneyTypeCode": "CASH", "paymentAmount": 115}],
+        )
+        ReceiptTaxLine.objects.all().delete()
+        ReceiptPaymentLine.objects.all().delete()
+        call_command("backfill_receipt_lines", "--dry-run", stdout=StringIO())
+        self.assertFalse(ReceiptTaxLine.objects.exists())
+        call_command("backfill_receipt_lines", stdout=StringIO())
+        self.assertEqual(ReceiptTaxLine.objects.filter(receipt=r).count(), 1)
+        self.assertEqual(ReceiptPaymentLine.objects.filter(receipt=r).count(), 1)
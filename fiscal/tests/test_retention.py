@@ -0,0 +1,173 @@
+"""Retention: archive to NDJSON.gz with checksums, daily roll-ups, batched deletes."""
+
+import gzip
+import json
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+
+from fiscal.models import (
+    ActivityEvent,
+    AuditEvent,
+    FiscalDevice,
+    QuickBooksEvent,
+    ReceiptSubmissionResponse,
+    RetentionArchive,
+    RetentionDailySummary,
+)
+from fiscal.services.retention import LOCK_KEY, _write_archive, apply_retention, verify_archive
+
+NOW = datetime(2026, 6, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _at(model, when, **fields):
+    obj = model.objects.create(**fields)
+    model.objects.filter(pk=obj.pk).update(created_at=when)
+    return obj
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        overrides = override_settings(
+            FDMS_RETENTION_DAYS={"ActivityEvent": 30, "AuditEvent": 0, "QuickBooksEvent": 30},
+            FDMS_RETENTION_ARCHIVE_DIR=tmp.name,
+            FDMS_RETENTION_ARCHIVE=True,
+            FDMS_RETENTION_BATCH_SIZE=2,
+            FDMS_RETENTION_MAX_BATCHES=50,
+            TIME_ZONE="UTC",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.device = FiscalDevice.objects.create(device_id=88100, device_serial_no="RET")
+        self.old = [
+            _at(ActivityEvent, datetime(2026, 3, 1, 9, tzinfo=dt_timezone.utc), device=self.device, event_type="receipt_submitted"),
+            _at(ActivityEvent, datetime(2026, 3, 1, 17, tzinfo=dt_timezone.utc), device=self.device, event_type="receipt_submitted"),
+            _at(ActivityEvent, datetime(2026, 3, 1, 18, tzinfo=dt_timezone.utc), device=self.device, event_type="receipt_submitted", level="error"),
+            _at(ActivityEvent, datetime(2026, 3, 2, 8, tzinfo=dt_timezone.utc), event_type="fleet_close"),
+            _at(ActivityEvent, datetime(2026, 3, 2, 9, tzinfo=dt_timezone.utc), device=self.device, event_type="receipt_submitted"),
+        ]
+        self.recent = _at(ActivityEvent, datetime(2026, 5, 20, tzinfo=dt_timezone.utc), event_type="receipt_submitted")
+        self.audit = _at(AuditEvent, datetime(2020, 1, 1, tzinfo=dt_timezone.utc), action="device_registered")
+
+    def test_archives_summarises_and_deletes_in_batches(self):
+        results = apply_retention(now=NOW)
+        activity = results["ActivityEvent"]
+        self.assertEqual((activity["deleted"], activity["archives"], activity["more"]), (5, 3, False))
+        self.assertEqual(list(ActivityEvent.objects.values_list("pk", flat=True)), [self.recent.pk])
+        # Kept forever (0 days) and nothing expired.
+        self.assertTrue(AuditEvent.objects.filter(pk=self.audit.pk).exists())
+        self.assertEqual(results["AuditEvent"]["deleted"], 0)
+
+        summaries = {
+            (s.day, s.device_id, s.key): s
+            for s in RetentionDailySummary.objects.filter(table="ActivityEvent")
+        }
+        self.assertEqual({k: s.count for k, s in summaries.items()}, {
+            (date(2026, 3, 1), self.device.pk, "receipt_submitted:info"): 2,
+            (date(2026, 3, 1), self.device.pk, "receipt_submitted:error"): 1,
+            (date(2026, 3, 2), None, "fleet_close:info"): 1,
+            (date(2026, 3, 2), self.device.pk, "receipt_submitted:info"): 1,
+        })
+        busy = summaries[(date(2026, 3, 1), self.device.pk, "receipt_submitted:info")]
+        self.assertEqual((busy.first_at.hour, busy.last_at.hour), (9, 17))
+
+        archived_ids = []
+        for archive in RetentionArchive.objects.filter(table="ActivityEvent").order_by("first_id"):
+            self.assertEqual(verify_archive(archive), (True, None))
+            path = Path(archive.path)
+            self.assertTrue(path.is_relative_to(self.dir / "ActivityEvent" / "2026-03"))
+            self.assertEqual(path.with_name(path.name + ".sha256").read_text().split()[0], archive.sha256)
+            with gzip.open(path, "rt") as f:
+                archived_ids += [json.loads(line)["id"] for line in f]
+        self.assertEqual(archived_ids, [e.pk for e in self.old])
+
+    def test_tampered_archive_fails_verification(self):
+        apply_retention(now=NOW, tables=["ActivityEvent"])
+        archive = RetentionArchive.objects.order_by("first_id").first()
+        Path(archive.path).write_bytes(b"tampered")
+        ok, err = verify_archive(archive)
+        self.assertFalse(ok)
+        self.assertIn("Checksum mismatch", err)
+        out = StringIO()
+        call_command("apply_retention", "--verify", stdout=out)
+        self.assertIn("3 archive(s) checked, 1 failed.", out.getvalue())
+
+    def test_repeat_run_merges_into_existing_summary(self):
+        apply_retention(now=NOW, tables=["ActivityEvent"])
+        _at(ActivityEvent, datetime(2026, 3, 1, 20, tzinfo=dt_timezone.utc), device=self.device, event_type="receipt_submitted")
+        apply_retention(now=NOW, tables=["ActivityEvent"])
+        summary = RetentionDailySummary.objects.get(
+            table="ActivityEvent", day=date(2026, 3, 1), device=self.device, key="receipt_submitted:info"
+        )
+        self.assertEqual((summary.count, summary.first_at.hour, summary.last_at.hour), (3, 9, 20))
+
+    def test_bounded_run_and_dry_run(self):
+        self.assertEqual(apply_retention(now=NOW, tables=["ActivityEvent"], dry_run=True)["ActivityEvent"]["expired"], 5)
+        self.assertEqual(ActivityEvent.objects.count(), 6)
+        result = apply_retention(now=NOW, tables=["ActivityEvent"], max_batches=1)["ActivityEvent"]
+        self.assertEqual((result["deleted"], result["more"]), (2, True))
+
+    def test_concurrent_run_is_refused(self):
+        cache.add(LOCK_KEY, "other", 60)
+        self.assertEqual(apply_retention(now=NOW), {"error": "Retention run already in progress"})
+        self.assertEqual(ActivityEvent.objects.count(), 6)
+
+    def test_rows_deleted_by_an_overlapping_run_are_not_counted_twice(self):
+        taken = []
+
+        def racing_write(table, rows):
+            if not taken:
+                # Another run (its own cache lock) deletes and summarises the first row meanwhile.
+                taken.append(rows[0]["id"])
+                ActivityEvent.objects.filter(pk=rows[0]["id"]).delete()
+            return _write_archive(table, rows)
+
+        with patch("fiscal.services.retention._write_archive", side_effect=racing_write):
+            result = apply_retention(now=NOW, tables=["ActivityEvent"])["ActivityEvent"]
+        self.assertEqual((result["deleted"], result["archives"], result["more"]), (4, 2, False))
+        busy = RetentionDailySummary.objects.get(
+            table="ActivityEvent", day=date(2026, 3, 1), device=self.device, key="receipt_submitted:info"
+        )
+        self.assertEqual(busy.count, 1)
+        self.assertEqual(RetentionArchive.objects.aggregate(n=Sum("row_count"))["n"], 4)
+        self.assertEqual(len(list(self.dir.rglob("*.ndjson.gz"))), 2)
+
+    @override_settings(FDMS_RETENTION_ARCHIVE=False)
+    def test_without_archive_rows_are_only_summarised(self):
+        _at(QuickBooksEvent, datetime(2026, 1, 5, tzinfo=dt_timezone.utc), event_type="Invoice.Create", payload={"a": 1})
+        result = apply_retention(now=NOW, tables=["QuickBooksEvent"])["QuickBooksEvent"]
+        self.assertEqual((result["deleted"], result["archives"]), (1, 0))
+        self.assertEqual(RetentionDailySummary.objects.get(table="QuickBooksEvent").key, "Invoice.Create")
+        self.assertFalse(RetentionArchive.objects.exists())
+
+    def test_latest_submission_errors_outlive_retention(self):
+        old = datetime(2026, 1, 5, tzinfo=dt_timezone.utc)
+
+        def response(global_no, hour, errors):
+            return _at(
+                ReceiptSubmissionResponse, old.replace(hour=hour),
+                device=self.device, receipt_global_no=global_no, status_code=422 if errors else 200,
+                validation_errors=errors,
+            )
+
+        superseded = response(1, 9, ["RCPT020: invoice total mismatch"])
+        shown = response(1, 10, ["RCPT025: tax invalid"])
+        fixed_error = response(2, 9, ["RCPT020: invoice total mismatch"])
+        fixed = response(2, 10, [])
+        with override_settings(FDMS_RETENTION_DAYS={"ReceiptSubmissionResponse": 30}):
+            self.assertEqual(apply_retention(now=NOW, dry_run=True)["ReceiptSubmissionResponse"]["expired"], 3)
+            result = apply_retention(now=NOW)["ReceiptSubmissionResponse"]
+        self.assertEqual(result["deleted"], 3)
+        self.assertEqual(list(ReceiptSubmissionResponse.objects.values_list("pk", flat=True)), [shown.pk])
+        self.assertFalse(ReceiptSubmissionResponse.objects.filter(pk__in=[superseded.pk, fixed_error.pk, fixed.pk]).exists())
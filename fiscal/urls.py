@@ -47,10 +47,13 @@ urlpatterns = [
     path("api/dashboard/summary/", views_dashboard.api_dashboard_summary, name="api_dashboard_summary"),
     path("api/dashboard/receipts/", views_dashboard.api_dashboard_receipts, name="api_dashboard_receipts"),
     path("api/dashboard/errors/", views_dashboard.api_dashboard_errors, name="api_dashboard_errors"),
+    path("api/dashboard/fleet/", views_dashboard.api_dashboard_fleet, name="api_dashboard_fleet"),
+    path("api/dashboard/fleet-close/", views_dashboard.api_dashboard_fleet_close, name="api_dashboard_fleet_close"),
     path("api/dashboard/quickbooks/", views_dashboard.api_dashboard_quickbooks, name="api_dashboard_quickbooks"),
     path("api/dashboard/export/pdf/", views_dashboard.api_dashboard_export_pdf, name="api_dashboard_export_pdf"),
     path("api/dashboard/export/excel/", views_dashboard.api_dashboard_export_excel, name="api_dashboard_export_excel"),
     path("api/fdms/receipts/", views_api.api_fdms_receipts, name="api_fdms_receipts"),
+    path("api/fdms/receipts/<int:pk>/proof/", views_api.api_fdms_receipt_proof, name="api_fdms_receipt_proof"),
     path("api/fdms/fiscal/", views_api.api_fdms_fiscal, name="api_fdms_fiscal"),
     path("api/integrations/quickbooks/validate-update/", views_api.api_qb_validate_invoice_update, name="api_qb_validate_invoice_update"),
     path("api/integrations/quickbooks/webhook/", views_api.api_qb_webhook, name="api_qb_webhook"),
@@ -58,7 +61,9 @@ urlpatterns = [
     path("api/integrations/quickbooks/oauth/connect/", views_api.api_qb_oauth_connect, name="api_qb_oauth_connect"),
     path("api/integrations/quickbooks/oauth/callback/", views_api.api_qb_oauth_callback, name="api_qb_oauth_callback"),
     path("api/integrations/quickbooks/sync/", views_api.api_qb_sync, name="api_qb_sync"),
+    path("api/integrations/quickbooks/sync/<str:task_id>/", views_api.api_qb_sync_status, name="api_qb_sync_status"),
     path("api/integrations/quickbooks/invoices/", views_api.api_qb_invoices, name="api_qb_invoices"),
+    path("api/integrations/quickbooks/invoices/<str:qb_invoice_id>/status/", views_api.api_qb_invoice_status, name="api_qb_invoice_status"),
     path("api/integrations/quickbooks/retry/", views_api.api_qb_retry_fiscalise, name="api_qb_retry_fiscalise"),
     path("logs/", views.fdms_logs, name="fdms_logs"),
     path("receipts/", views.receipt_history, name="receipt_history"),
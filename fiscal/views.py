@@ -33,9 +33,9 @@ def _get_device(device_id=None):
     return FiscalDevice.objects.filter(is_registered=True).first()
 
 
-def get_device_for_request(request):
+def get_selected_device_id(request):
     """
-    Return the device for this request: from GET, POST, or session (system-wide selection).
+    Return the selected device_id (int or None) from GET, POST, or session.
     When device_id is in GET or POST, saves to session so selection persists.
     """
     device_id = request.GET.get("device_id") or request.POST.get("device_id") or request.session.get(SESSION_DEVICE_KEY)
@@ -49,7 +49,15 @@ def get_device_for_request(request):
             request.session[SESSION_DEVICE_KEY] = device_id
         elif SESSION_DEVICE_KEY in request.session:
             del request.session[SESSION_DEVICE_KEY]
-    return _get_device(device_id)
+    return device_id
+
+
+def get_device_for_request(request):
+    """
+    Return the device for this request: from GET, POST, or session (system-wide selection).
+    When device_id is in GET or POST, saves to session so selection persists.
+    """
+    return _get_device(get_selected_device_id(request))
 
 
 def _fetch_status_for_dashboard(device):
@@ -1,9 +1,12 @@
 """JSON API endpoints for React dashboard. Never return private key or decrypted key."""
 
 import json
+import logging
 
 from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
@@ -11,6 +14,8 @@ from fiscal.models import FiscalDevice, QuickBooksEvent, QuickBooksInvoice, Rece
 
 from .views import _fetch_status_for_dashboard, get_device_for_request
 
+logger = logging.getLogger("fiscal")
+
 
 @staff_member_required
 def api_devices_list(request):
@@ -84,6 +89,20 @@ def api_fdms_receipts(request):
     return JsonResponse({"receipts": receipts})
 
 
+@staff_member_required
+def api_fdms_receipt_proof(request, pk):
+    """GET /api/fdms/receipts/<pk>/proof/ - Merkle inclusion proof of a receipt in its fiscal day."""
+    from fiscal.services.fiscal_day_merkle import get_receipt_inclusion_proof
+
+    receipt = Receipt.objects.select_related("device").filter(pk=pk).first()
+    if receipt is None:
+        return JsonResponse({"error": "Receipt not found"}, status=404)
+    proof, err = get_receipt_inclusion_proof(receipt)
+    if err:
+        return JsonResponse({"error": err}, status=409)
+    return JsonResponse(proof)
+
+
 @staff_member_required
 def api_fdms_fiscal(request):
     """GET /api/fdms/fiscal/ - JSON fiscal day status."""
@@ -152,60 +171,75 @@ def api_qb_webhook(request):
     QuickBooks webhook. POST /api/integrations/quickbooks/webhook
     Accepts: (a) QB webhook format with eventNotifications or CloudEvents
     (b) Full invoice JSON for direct fiscalisation (adapter forwards invoice).
-    ACK fast. Persist raw payload. If full invoice present, fiscalise.
+    ACK fast. Persist raw payload. Notifications: every Invoice/SalesReceipt create/update is
+    fetched in batches and queued by fiscal.process_qb_webhook_task (see qb_webhook).
+    Full invoice: queue its fiscalisation (deduped by invoice Id); poll status_url for the outcome.
     """
+    from fiscal.services.qb_webhook import extract_entity_refs, webhook_event_type
+
     try:
         body = json.loads(request.body or "{}")
     except json.JSONDecodeError:
         return JsonResponse({"status": "error", "message": "Invalid JSON"}, status=400)
 
+    refs = extract_entity_refs(body)
+    event_type = webhook_event_type(body)
     if isinstance(body, list):
         body = {"_cloud_events": body}
-
-    event_type = "unknown"
-    invoice_id = None
+    invoice_id = refs[0][2] if refs else None
     invoice_payload = None
 
-    if "_cloud_events" in body:
-        events = body["_cloud_events"]
-        if events:
-            ev = events[0]
-            event_type = ev.get("type", "unknown")
-            invoice_id = ev.get("intuitentityid") or ev.get("intuitEntityId")
-    elif "eventNotifications" in body:
-        for notif in body.get("eventNotifications", []):
-            dce = notif.get("dataChangeEvent", {})
-            for ent in dce.get("entities", []):
-                if ent.get("name") == "Invoice" and ent.get("operation") == "Create":
-                    event_type = "Invoice.Create"
-                    invoice_id = ent.get("id")
-                    break
-
-    if (body.get("Line") or body.get("TotalAmt") or body.get("Id")) and not invoice_id:
+    if (body.get("Line") or body.get("TotalAmt") or body.get("Id")) and not refs:
         invoice_payload = body
         invoice_id = str(body.get("Id", ""))
         event_type = "Invoice.Create" if invoice_id else "unknown"
 
-    QuickBooksEvent.objects.create(event_type=event_type, payload=body)
+    event = QuickBooksEvent.objects.create(event_type=event_type, payload=body)
 
     if invoice_payload and invoice_id:
-        from fiscal.services.qb_fiscalisation import fiscalise_qb_invoice
-        qb_inv, err = fiscalise_qb_invoice(invoice_id, invoice_payload)
-        if qb_inv and qb_inv.fiscalised:
-            return JsonResponse({
-                "status": "ok",
-                "fiscalised": True,
-                "qb_invoice_id": invoice_id,
-                "receipt_global_no": qb_inv.fiscal_receipt.receipt_global_no if qb_inv.fiscal_receipt else None,
-            })
+        from fiscal.services.qb_fiscalisation import queue_qb_fiscalisation
+        qb_inv, queued = queue_qb_fiscalisation(invoice_id, invoice_payload)
         return JsonResponse({
-            "status": "received",
-            "fiscalised": False,
+            "status": "queued" if queued else "received",
             "qb_invoice_id": invoice_id,
-            "error": err or qb_inv.fiscal_error if qb_inv else None,
+            "fiscal_status": qb_inv.fiscal_status,
+            "status_url": reverse("api_qb_invoice_status", args=[invoice_id]),
         })
 
-    return JsonResponse({"status": "received", "event_type": event_type, "invoice_id": invoice_id})
+    if refs:
+        from fiscal.tasks import process_qb_webhook_task
+
+        def _send():
+            try:
+                process_qb_webhook_task.apply_async(args=[event.pk])
+            except Exception as e:
+                logger.warning("Could not enqueue QB webhook event %s: %s", event.pk, e)
+
+        transaction.on_commit(_send)
+
+    return JsonResponse({
+        "status": "received",
+        "event_type": event_type,
+        "invoice_id": invoice_id,
+        "entities": len(refs),
+    })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def api_qb_invoice_status(request, qb_invoice_id):
+    """GET /api/integrations/quickbooks/invoices/<qb_invoice_id>/status - Fiscalisation outcome for polling."""
+    inv = QuickBooksInvoice.objects.select_related("fiscal_receipt").filter(qb_invoice_id=qb_invoice_id).first()
+    if not inv:
+        return JsonResponse({"error": "QB invoice not found"}, status=404)
+    return JsonResponse({
+        "qb_invoice_id": inv.qb_invoice_id,
+        "fiscal_status": inv.fiscal_status,
+        "fiscalised": inv.fiscalised,
+        "receipt_global_no": inv.fiscal_receipt.receipt_global_no if inv.fiscal_receipt else None,
+        "fiscal_error": inv.fiscal_error or None,
+        "updated_at": inv.updated_at.isoformat() if inv.updated_at else None,
+    })
 
 
 @csrf_exempt
@@ -259,6 +293,7 @@ def api_qb_invoices(request):
             "id": inv.id,
             "qb_invoice_id": inv.qb_invoice_id,
             "fiscalised": inv.fiscalised,
+            "fiscal_status": inv.fiscal_status,
             "receipt_global_no": inv.fiscal_receipt.receipt_global_no if inv.fiscal_receipt else None,
             "receipt_id": inv.fiscal_receipt.fdms_receipt_id if inv.fiscal_receipt else None,
             "fiscal_error": inv.fiscal_error or None,
@@ -298,12 +333,39 @@ def api_qb_oauth_callback(request):
 @staff_member_required
 @require_http_methods(["POST"])
 def api_qb_sync(request):
-    """Trigger sync from QuickBooks - fetch and fiscalise."""
-    from fiscal.services.qb_sync import sync_from_quickbooks
-    result = sync_from_quickbooks(max_per_type=50)
-    if "error" in result:
-        return JsonResponse(result, status=400)
-    return JsonResponse(result)
+    """
+    Queue a QuickBooks sync (fiscal.qb_sync_task) - fetch changes since the last sync and
+    fiscalise. 202 with task_id and status_url to poll; 200 with the result if it ran eagerly.
+    """
+    from celery.result import EagerResult
+    from fiscal.tasks import qb_sync_task
+    try:
+        task = qb_sync_task.apply_async()
+    except Exception as e:
+        logger.warning("Could not enqueue QuickBooks sync: %s", e)
+        return JsonResponse({"error": "Could not queue QuickBooks sync"}, status=503)
+    if isinstance(task, EagerResult):
+        result = task.result if task.successful() else {"error": str(task.result)}
+        return JsonResponse(result, status=400 if "error" in result else 200)
+    return JsonResponse({
+        "status": "queued",
+        "task_id": task.id,
+        "status_url": reverse("api_qb_sync_status", args=[task.id]),
+    }, status=202)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def api_qb_sync_status(request, task_id):
+    """GET /api/integrations/quickbooks/sync/<task_id>/ - state of a queued sync; its result once finished."""
+    from fiscal.tasks import qb_sync_task
+    res = qb_sync_task.AsyncResult(task_id)
+    body = {"task_id": task_id, "state": res.state}
+    if res.successful():
+        body["result"] = res.result
+    elif res.failed():
+        body["error"] = str(res.result)
+    return JsonResponse(body)
 
 
 @staff_member_required
@@ -4,12 +4,19 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.http import HttpResponse, JsonResponse
 
 from dashboard.services.metrics_service import get_metrics
+from fiscal.services.dashboard_cache import (
+    cached_errors,
+    cached_fleet_summary,
+    cached_receipts,
+    cached_summary,
+)
 from fiscal.services.dashboard_service import (
-    get_errors,
+    FLEET_MAX_PAGE_SIZE,
+    FLEET_SORT_FIELDS,
     get_quickbooks_stub,
-    get_receipts,
     get_summary,
 )
+from fiscal.services.fleet_close import get_fleet_close_status
 
 
 def _get_user_role(request):
@@ -64,7 +71,7 @@ def api_dashboard_summary(request):
         device_id = int(device_id)
     else:
         device_id = None
-    data = get_summary(device_id, range_key)
+    data = cached_summary(device_id, range_key)
     role = _get_user_role(request)
     data = _apply_role_filter(data, role)
     return JsonResponse(data)
@@ -84,7 +91,7 @@ def api_dashboard_receipts(request):
         device_id = int(device_id)
     else:
         device_id = None
-    receipts = get_receipts(device_id, range_key, status_filter)
+    receipts = cached_receipts(device_id, range_key, status_filter)
     return JsonResponse({"receipts": receipts})
 
 
@@ -99,10 +106,46 @@ def api_dashboard_errors(request):
         device_id = int(device_id)
     else:
         device_id = None
-    errors = get_errors(device_id, range_key)
+    errors = cached_errors(device_id, range_key)
     return JsonResponse({"errors": errors})
 
 
+@staff_member_required
+def api_dashboard_fleet(request):
+    """GET /api/dashboard/fleet?range=today|week|month&sort=-receiptsFiscalised&page=1&page_size=50"""
+    range_key = request.GET.get("range", "today")
+    if range_key not in ("today", "week", "month"):
+        range_key = "today"
+    sort = request.GET.get("sort", "deviceId")
+    if sort.lstrip("-") not in FLEET_SORT_FIELDS:
+        sort = "deviceId"
+    page = request.GET.get("page", "1")
+    page = int(page) if str(page).isdigit() and int(page) > 0 else 1
+    page_size = request.GET.get("page_size", "50")
+    page_size = min(int(page_size), FLEET_MAX_PAGE_SIZE) if str(page_size).isdigit() and int(page_size) > 0 else 50
+    data = cached_fleet_summary(range_key, sort, page, page_size)
+    if _get_user_role(request) == "cashier":
+        data["devices"] = [
+            {k: "***" if k in ("certificate", "certificateValidTill", "lastReceiptGlobalNo") else v for k, v in d.items()}
+            for d in data["devices"]
+        ]
+    return JsonResponse(data)
+
+
+@staff_member_required
+def api_dashboard_fleet_close(request):
+    """GET /api/dashboard/fleet-close?run=<id> - progress of the latest (or given) fleet end-of-day run."""
+    run_id = request.GET.get("run")
+    run_id = int(run_id) if run_id and str(run_id).isdigit() else None
+    data = get_fleet_close_status(run_id)
+    if data is None:
+        return JsonResponse({"run": None})
+    if _get_user_role(request) == "cashier":
+        for row in data["stragglers"] + data["failed"]:
+            row["lastError"] = "***"
+    return JsonResponse({"run": data})
+
+
 @staff_member_required
 def api_dashboard_quickbooks(request):
     """GET /api/dashboard/quickbooks - stub when no QB integration."""
@@ -47,17 +47,22 @@ export function DashboardProvider({ children, selectedDeviceId, token }) {
           setReceiptProgress(null);
           setActivity((prev) => [{ ...data, ts: new Date().toISOString() }, ...prev].slice(0, 50));
         }
-        if (data.type === "fiscal.opened" || data.type === "fiscal.closed") {
+        if (
+          data.type === "fiscal.opened" ||
+          data.type === "fiscal.close_initiated" ||
+          data.type === "fiscal.closed" ||
+          data.type === "fiscal.close_failed"
+        ) {
           setActivity((prev) => [{ ...data, ts: new Date().toISOString() }, ...prev].slice(0, 50));
         }
         if (data.type === "activity" || data.type === "certificate.updated") {
           setActivity((prev) => [{ ...data, ts: new Date().toISOString() }, ...prev].slice(0, 50));
         }
       },
-      { deviceId, token }
+      { deviceId, token, onReset: loadMetrics }
     );
     return () => ws.close();
-  }, [selectedDeviceId, token]);
+  }, [selectedDeviceId, token, loadMetrics]);
 
   return (
     <DashboardContext.Provider
@@ -2,34 +2,85 @@
  * Create WebSocket for dashboard - connects to fdms_dashboard group (all devices) or device-specific.
  * When deviceId provided, connects to ws/fdms/device/<device_id>/ for device-specific events.
  * Pass token for JWT auth (required when using JWT, no session).
+ *
+ * Events carry a per-group `seq`. On an unexpected close the socket reconnects with
+ * ?resume_from=<last seq> and the server replays only missed events. A `stream.reset`
+ * frame means the gap was too large: onReset is called so the caller can refetch via REST.
+ * The server delivers frames in seq order; a gap seen here triggers a resume reconnect.
+ * Returns a handle with close().
  */
 export function createDashboardWebSocket(onMessage, options = {}) {
-  const { deviceId, token } = options;
+  const { deviceId, token, onReset } = options;
   const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
   const host = window.location.host;
+  const path = deviceId ? `/ws/fdms/device/${deviceId}/` : "/ws/fdms/dashboard/";
 
-  let url;
-  if (deviceId) {
-    const qs = token ? `?token=${encodeURIComponent(token)}` : "";
-    url = `${protocol}//${host}/ws/fdms/device/${deviceId}/${qs}`;
-  } else {
-    const qs = token ? `?token=${encodeURIComponent(token)}` : "";
-    url = `${protocol}//${host}/ws/fdms/dashboard/${qs}`;
-  }
-
-  const ws = new WebSocket(url);
-
-  ws.onmessage = (e) => {
-    try {
-      const data = JSON.parse(e.data);
-      onMessage(data);
-    } catch (err) {
-      console.warn("WebSocket parse error:", err);
-    }
+  let lastSeq = null;
+  let ws = null;
+  let closed = false;
+  let retryMs = 1000;
+  let retryTimer = null;
+
+  const buildUrl = () => {
+    const params = new URLSearchParams();
+    if (token) params.set("token", token);
+    if (lastSeq !== null) params.set("resume_from", String(lastSeq));
+    const qs = params.toString();
+    return `${protocol}//${host}${path}${qs ? `?${qs}` : ""}`;
   };
 
-  ws.onerror = (e) => console.warn("WebSocket error:", e);
-  ws.onclose = () => console.log("WebSocket closed");
+  const connect = () => {
+    ws = new WebSocket(buildUrl());
+
+    ws.onopen = () => {
+      retryMs = 1000;
+    };
 
-  return ws;
+    ws.onmessage = (e) => {
+      try {
+        const data = JSON.parse(e.data);
+        if (typeof data.seq === "number") {
+          const control = data.type === "stream.reset" || data.type === "stream.hello";
+          if (!control && lastSeq !== null) {
+            // Duplicate of an event already received through a resume replay.
+            if (data.seq <= lastSeq) return;
+            // Gap: reconnect with resume_from=lastSeq so the server replays it in order.
+            if (data.seq > lastSeq + 1) {
+              ws.close();
+              return;
+            }
+          }
+          lastSeq = data.seq;
+        }
+        if (data.type === "stream.hello") return;
+        if (data.type === "stream.reset") {
+          if (onReset) onReset();
+          return;
+        }
+        onMessage(data);
+      } catch (err) {
+        console.warn("WebSocket parse error:", err);
+      }
+    };
+
+    ws.onerror = (e) => console.warn("WebSocket error:", e);
+    ws.onclose = () => {
+      if (closed) {
+        console.log("WebSocket closed");
+        return;
+      }
+      retryTimer = setTimeout(connect, retryMs);
+      retryMs = Math.min(retryMs * 2, 30000);
+    };
+  };
+
+  connect();
+
+  return {
+    close() {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      if (ws) ws.close();
+    },
+  };
 }